@@ -3,26 +3,136 @@ Advanced RAG System z Query Decomposition, Hybrid Search, i Context Awareness.
 Professional Local RAG Agent - Initial Release"""
 
 import sys
+import asyncio
+import contextvars
+import functools
+import hashlib
 import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from typing import Optional, Dict, Any, List
 from pathlib import Path
 
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.llms import Ollama
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.documents import Document
+import numpy as np
 from colorama import Fore, Style, init
-from rank_bm25 import BM25Okapi
 
 import config
+from compression import SentenceCompressor
+from context_packer import ContextPacker
+from corpus_store import CorpusStore
+from coarse_index import CoarseIndex
+from deadline import QueryDeadline
+from dense_index import DenseIndex, DenseRetriever
+from index_version import read_version
+from ollama_client import OllamaCancelled, OllamaDeadlineExceeded, get_scheduler
+from ollama_manager import OllamaModelManager
+from partitions import SourcePartitions
+import profiling
+from reduction import EmbeddingReducer
+from retrieval_cache import RetrievalCache, cache_key
+from scheduler import llm_priority
+from sparse_index import SparseIndex, tokenizer_signature
+from text_utils import estimate_tokens, normalize_query
+from tokenizer import create_tokenizer
 
 init(autoreset=True)
 
 
+_SUBQUERIES_START_RE = re.compile(r'"subqueries"\s*:\s*\[')
+# Ostatnie embeddingi zapytań z retrievalu (kompresja kontekstu nie liczy ich ponownie)
+_RECENT_EMBEDDINGS = 64
+_JSON_STRING_RE = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*([,\]])')
+# Atrybuty agenta zależne od indeksu (podmieniane razem przez refresh_index)
+_INDEX_ATTRIBUTES = (
+    "vectorstore", "store", "dense_index", "sparse_index", "partitions",
+    "coarse_index", "retriever", "prompt_template", "qa_chain", "context_packer",
+)
+
+
+def _version_key(state: Dict[str, Any]) -> tuple:
+    """Wersja indeksu z chwilą zatwierdzenia (pełna ingestia usuwa bazę razem z licznikiem wersji)."""
+    return state.get("version"), state.get("committed_at")
+
+
+def _reset_chroma_clients() -> None:
+    """Zapomina klientów Chroma procesu - nowy klient wczyta segmenty zapisane przez inny proces."""
+    try:
+        from chromadb.api.client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+    except (ImportError, AttributeError):
+        pass
+
+
+class SubqueryStream:
+    """
+    Wyłuskuje kolejne sub-queries z odpowiedzi dekompozycji w trakcie streamingu.
+
+    Sub-query jest gotowe, gdy jego napis JSON jest zamknięty i po nim
+    występuje ',' lub ']' - można wtedy zacząć retrieval, zanim LLM skończy.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self._offset: Optional[int] = None
+        self._done = False
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Dokłada fragment odpowiedzi.
+
+        Returns:
+            Sub-queries, które właśnie zostały domknięte.
+        """
+        self.buffer += text
+        if self._done:
+            return []
+        if self._offset is None:
+            match = _SUBQUERIES_START_RE.search(self.buffer)
+            if not match:
+                return []
+            self._offset = match.end()
+
+        found = []
+        while True:
+            match = _JSON_STRING_RE.match(self.buffer, self._offset)
+            if not match:
+                break
+            try:
+                found.append(json.loads(f'"{match.group(1)}"'))
+            except ValueError:
+                pass
+            self._offset = match.end()
+            if match.group(2) == "]":
+                self._done = True
+                break
+        return [q for q in found if q.strip()]
+
+
+def rank_fusion(rankings: List[List[Any]], weights: List[float]) -> Dict[Any, float]:
+    """
+    Łączy rankingi wg pozycji: element na miejscu i z n dostaje wagę * (n - i) / n.
+
+    Args:
+        rankings: Listy kluczy od najlepszego.
+        weights: Waga każdego rankingu.
+
+    Returns:
+        Klucz -> łączny score.
+    """
+    scores: Dict[Any, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for idx, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0) + weight * (len(ranking) - idx) / len(ranking)
+    return scores
+
+
 class HybridRetriever:
     """
     Custom Hybrid Retriever łączący Vector Search i BM25.
@@ -31,69 +141,238 @@ class HybridRetriever:
     słów kluczowych (BM25) z równymi wagami [0.5, 0.5].
     """
     
-    def __init__(self, vector_retriever, bm25_retriever, weights=None):
+    def __init__(
+        self,
+        vector_retriever,
+        sparse_index,
+        store,
+        weights=None,
+        partitions=None,
+        bm25_k=config.RETRIEVER_K,
+        coarse_index=None,
+        embeddings=None,
+        coarse_top=config.COARSE_TOP_DOCS,
+        cache=None,
+    ):
         """
         Args:
             vector_retriever: Vector search retriever (Chroma MMR)
-            bm25_retriever: BM25 keyword search retriever
+            sparse_index: Indeks BM25 (SparseIndex) zbudowany na treściach z magazynu
+            store: CorpusStore - treść i metadane chunków po pozycji
             weights: Wagi [vector_weight, bm25_weight], domyślnie [0.5, 0.5]
+            partitions: SourcePartitions (pozycje jak w store), wymagane dla filtrów
+            bm25_k: Liczba wyników BM25 brana do fuzji
+            coarse_index: Opcjonalny CoarseIndex (centroidy dokumentów) - wyszukiwanie dwuetapowe
+            embeddings: Model embeddingów zapytań, wymagany dla coarse_index
+            coarse_top: Liczba dokumentów, których chunki są przeszukiwane (0 = płasko)
+            cache: Opcjonalny RetrievalCache (wersja ustawiona dla tego indeksu)
         """
         self.vector_retriever = vector_retriever
-        self.bm25_retriever = bm25_retriever
+        self.sparse_index = sparse_index
+        self.store = store
+        self.partitions = partitions
+        self.bm25_k = bm25_k
+        self.coarse_index = coarse_index
+        self.embeddings = embeddings
+        self.coarse_top = coarse_top
+        self.cache = cache
         self.weights = weights or [0.5, 0.5]
+        self._recent_embeddings: "OrderedDict[str, Any]" = OrderedDict()
+        self._recent_lock = threading.Lock()
         
         # Normalizuj wagi
         total = sum(self.weights)
         self.weights = [w / total for w in self.weights]
     
-    def invoke(self, query: str, k: int = 8):
+    def invoke(self, query: str, k: int = 8, filters=None):
         """
         Hybrid Search: zwraca topowe dokumenty łącząc oba retrievers.
         
         Args:
             query: Zapytanie
             k: Liczba dokumentów do zwrócenia
+            filters: Opcjonalny MetadataFilter (plik, katalog, strony, typ)
             
         Returns:
             Lista dokumentów posortowanych wg hybrid score
         """
-        # Vector search
+        return [doc for doc, _ in self.invoke_with_scores(query, k, filters)]
+
+    def _remember_embedding(self, query: str, embedding) -> None:
+        with self._recent_lock:
+            self._recent_embeddings[normalize_query(query)] = embedding
+            self._recent_embeddings.move_to_end(normalize_query(query))
+            while len(self._recent_embeddings) > _RECENT_EMBEDDINGS:
+                self._recent_embeddings.popitem(last=False)
+
+    def recent_embedding(self, query: str):
+        """Embedding zapytania policzony przy ostatnim wyszukiwaniu (albo None)."""
+        with self._recent_lock:
+            return self._recent_embeddings.get(normalize_query(query))
+
+    def _cache_key(self, query: str, k: int, filters, search_k, vector: bool) -> str:
+        """Klucz RetrievalCache - wszystko, od czego zależy ranking poza wersją indeksu."""
+        return cache_key(
+            query,
+            k=k,
+            filters=filters.cache_key() if filters is not None else None,
+            search_k=search_k,
+            vector=vector,
+            bm25_k=self.bm25_k,
+            weights=self.weights,
+            coarse_top=self.coarse_top if self.coarse_index is not None else 0,
+        )
+
+    def cached_scores(self, query: str, k: int = 8, filters=None, search_k=None, vector: bool = True):
+        """
+        Wynik invoke_with_scores z RetrievalCache bez wyszukiwania (None przy braku).
+
+        Pozwala pominąć embedding zapytania, zanim zostanie policzony (asearch).
+        """
+        if self.cache is None:
+            return None
+        ranking = self.cache.get(self._cache_key(query, k, filters, search_k, vector))
+        if ranking is None:
+            return None
+        return [(self.store.document(position), score) for position, score in ranking]
+
+    def _vector_search(self, query: str, where=None, positions=None, query_embedding=None, search_k=None):
+        """
+        Vector search, z klauzulą `where` Chroma (lub listą pozycji) przy filtrze.
+
+        query_embedding pozwala pominąć embedding zapytania, a search_k zmienia
+        liczbę wyników (np. małe wyszukiwanie "delta" w sesji).
+        """
+        if getattr(self.vector_retriever, "supports_positions", False):
+            return self.vector_retriever.invoke(query, positions=positions, embedding=query_embedding, k=search_k)
+        if where is None and query_embedding is None and search_k is None:
+            return self.vector_retriever.invoke(query)
+        search_kwargs = dict(self.vector_retriever.search_kwargs)
+        if search_k is not None:
+            search_kwargs["k"] = search_k
+            search_kwargs["fetch_k"] = max(search_kwargs.get("fetch_k", search_k), search_k)
+        if query_embedding is not None:
+            return self.vector_retriever.vectorstore.max_marginal_relevance_search_by_vector(
+                query_embedding, filter=where, **search_kwargs
+            )
+        if where is not None:
+            search_kwargs["filter"] = where
+        filtered = self.vector_retriever.vectorstore.as_retriever(
+            search_type=self.vector_retriever.search_type,
+            search_kwargs=search_kwargs,
+        )
+        return filtered.invoke(query)
+
+    def _coarse_stage(self, query: str, query_embedding=None, indices=None):
+        """
+        Pierwszy etap wyszukiwania dwuetapowego: dokumenty najbliższe wg centroidów.
+
+        Args:
+            query: Zapytanie
+            query_embedding: Opcjonalny gotowy embedding zapytania
+            indices: Pozycje spełniające filtr (None bez filtra)
+
+        Returns:
+            Krotka (embedding zapytania, pozycje chunków wybranych dokumentów,
+            ich źródła) - pozycje i źródła są None, gdy etap jest pominięty
+            (brak centroidów albo nie więcej dokumentów niż coarse_top)
+        """
+        if self.coarse_index is None or self.coarse_top <= 0 or len(self.coarse_index) <= self.coarse_top:
+            return query_embedding, None, None
         try:
-            vector_docs = self.vector_retriever.invoke(query)
-            vector_dict = {doc.page_content: doc for doc in vector_docs}
-        except:
-            vector_dict = {}
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(query)
+            groups = self.coarse_index.select(query_embedding, self.coarse_top + 1, indices)
+        except Exception:
+            return query_embedding, None, None
+        if len(groups) <= self.coarse_top:
+            # Filtr zostawia najwyżej coarse_top dokumentów - pierwszy etap nic nie zawęża
+            return query_embedding, None, None
+        groups = groups[:self.coarse_top]
+        positions = self.coarse_index.positions(groups)
+        if indices is not None:
+            positions = np.intersect1d(positions, np.asarray(indices, dtype=np.int64), assume_unique=True)
+        return query_embedding, positions.tolist(), self.coarse_index.sources(groups)
+
+    def invoke_with_scores(self, query: str, k: int = 8, filters=None, query_embedding=None, search_k=None, vector: bool = True, cached: bool = True):
+        """
+        Hybrid Search z zachowaniem hybrid score dla każdego dokumentu.
         
-        # BM25 search
+        Args:
+            query: Zapytanie
+            k: Liczba dokumentów do zwrócenia
+            filters: Opcjonalny MetadataFilter (plik, katalog, strony, typ)
+            query_embedding: Opcjonalny gotowy embedding zapytania
+            search_k: Opcjonalna liczba wyników każdego z retrieverów (domyślnie z config)
+            vector: False = tylko BM25 (np. gdy embedding zapytania się nie powiódł)
+            cached: False = bez sprawdzania cache (sprawdził go już wywołujący); wynik jest zapisywany
+            
+        Returns:
+            Lista krotek (dokument, score) posortowanych malejąco wg score
+        """
+        # Powtórzone zapytanie dla tej samej wersji indeksu: bez embeddingu, wektorów i BM25
+        if self.cache is not None:
+            version = self.cache.version
+            ranking_key = self._cache_key(query, k, filters, search_k, vector)
+            ranking = self.cache.get(ranking_key, version) if cached else None
+            if ranking is not None:
+                return [(self.store.document(position), score) for position, score in ranking]
+
+        where = indices = None
+        if filters is not None:
+            if self.partitions is None:
+                raise ValueError("Filtry wymagają partycji źródeł (partitions)")
+            indices = self.partitions.select(filters)
+            if not indices:
+                return []
+            where = filters.chroma_where(self.partitions.matching_sources(filters))
+
+        # Wyszukiwanie dwuetapowe: chunki tylko z dokumentów najbliższych wg centroidów
+        if vector:
+            query_embedding, coarse_positions, coarse_sources = self._coarse_stage(query, query_embedding, indices)
+            if coarse_positions is not None:
+                indices = coarse_positions
+                where = filters.chroma_where(coarse_sources) if filters is not None else {"source": {"$in": coarse_sources}}
+            if query_embedding is not None:
+                self._remember_embedding(query, query_embedding)
+
+        # Vector search - klucz fuzji to pozycja w magazynie (treść, gdy chunka w nim nie ma)
+        vector_dict = {}
+        complete = True
         try:
-            bm25_docs = self.bm25_retriever.invoke(query)
-            bm25_dict = {doc.page_content: doc for doc in bm25_docs}
-        except:
-            bm25_dict = {}
-        
-        # Merge z wagami
-        scores = {}
+            for doc in self._vector_search(query, where, indices, query_embedding, search_k) if vector else []:
+                position = self.store.position_of(doc)
+                vector_dict.setdefault(doc.page_content if position is None else position, doc)
+        except OllamaCancelled:
+            raise
+        except Exception:
+            vector_dict = {}
+            complete = False
         
-        # Vector scores - rank based (1.0 dla pierwszego, maleje)
-        for idx, (content, doc) in enumerate(vector_dict.items()):
-            score = (len(vector_dict) - idx) / len(vector_dict) if vector_dict else 0
-            scores[content] = scores.get(content, 0) + self.weights[0] * score
+        # BM25 search (przy filtrze tylko pozycje z pasujących partycji)
+        try:
+            bm25_positions = [pos for pos, _ in self.sparse_index.top_k(query, search_k or self.bm25_k, indices)]
+        except Exception:
+            bm25_positions = []
+            complete = False
         
-        # BM25 scores
-        for idx, (content, doc) in enumerate(bm25_dict.items()):
-            score = (len(bm25_dict) - idx) / len(bm25_dict) if bm25_dict else 0
-            scores[content] = scores.get(content, 0) + self.weights[1] * score
+        # Merge z wagami - rank based (1.0 dla pierwszego, maleje)
+        scores = rank_fusion([list(vector_dict), bm25_positions], self.weights)
         
         # Sort i zwróć top k
-        sorted_contents = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+        sorted_keys = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
         
-        # Zwróć dokumenty w oryginalnej formie
+        # Dokumenty z Chroma lub odtworzone z magazynu (tylko dla wyniku)
         results = []
-        for content, _ in sorted_contents:
-            if content in vector_dict:
-                results.append(vector_dict[content])
-            elif content in bm25_dict:
-                results.append(bm25_dict[content])
+        for key, score in sorted_keys:
+            if key in vector_dict:
+                results.append((vector_dict[key], score))
+            else:
+                results.append((self.store.document(key), score))
+
+        # Zapamiętywany jest tylko pełny wynik z chunkami obecnymi w magazynie
+        if self.cache is not None and complete and all(isinstance(key, (int, np.integer)) for key, _ in sorted_keys):
+            self.cache.put(ranking_key, sorted_keys, version)
         
         return results
 
@@ -107,21 +386,63 @@ class AdvancedRAGAgent:
     i Context Expansion.
     """
 
-    def __init__(self) -> None:
-        """Inicjalizuje advanced RAG agent."""
+    def __init__(
+        self,
+        shared_index=None,
+        base_url: str = config.OLLAMA_BASE_URL,
+        warm_up: bool = True,
+        speculative: bool = config.SPECULATIVE_ENABLED,
+        compress: bool = config.COMPRESSION_ENABLED,
+        cache_retrieval: bool = config.RETRIEVAL_CACHE_ENABLED,
+    ) -> None:
+        """
+        Inicjalizuje advanced RAG agent.
+
+        Args:
+            shared_index: Opcjonalny serving.SharedIndex (korpus, BM25 i embeddingi przez mmap).
+                Agent nie łączy się wtedy z ChromaDB ani nie buduje indeksów.
+            base_url: Adres serwera Ollama.
+            warm_up: Rozgrzewanie modeli w tle (w procesach roboczych robi to proces nadrzędny).
+            speculative: Retrieval równolegle z dekompozycją pytania.
+            compress: Kompresja kontekstu do zdań istotnych dla pytania (compression.py).
+            cache_retrieval: Cache wyników hybrid search między pytaniami i restartami (retrieval_cache.py).
+        """
+        self.speculative = speculative
+        self._speculative_pool = ThreadPoolExecutor(
+            max_workers=config.SPECULATIVE_WORKERS, thread_name_prefix="speculative-retrieval"
+        )
+        # aask()/asearch(): BM25, wyszukiwanie wektorowe i pakowanie kontekstu poza pętlą zdarzeń
+        self._cpu_pool = ThreadPoolExecutor(max_workers=config.ASYNC_CPU_WORKERS, thread_name_prefix="async-cpu")
+        # Modele ładują się w tle, równolegle z połączeniem do ChromaDB
+        self.model_manager = OllamaModelManager(base_url)
+        if warm_up:
+            self.model_manager.warm_up_async()
         self._initialize_embeddings()
-        self._initialize_vectorstore()
-        self._initialize_llm()
-        self._initialize_bm25_index()
+        # Pamięć embeddingów zdań przetrwa przeładowanie indeksu (refresh_index)
+        self.compressor = SentenceCompressor(self.embeddings, create_tokenizer()) if compress else None
+        if shared_index is None:
+            self.shared_index = None
+            # Wersja odczytana przed wczytaniem - aktualizacja zatwierdzona w trakcie startu wywoła przeładowanie
+            self._index_version = _version_key(read_version())
+            self._initialize_vectorstore()
+            self._initialize_llm()
+            self._initialize_bm25_index()
+            self._initialize_coarse_index()
+        else:
+            self._attach_shared_index(shared_index)
+            self._initialize_llm()
+        # Cache wyników retrievalu też przetrwa przeładowanie - wpisy są oznaczone wersją indeksu
+        self.result_cache = None
+        if cache_retrieval:
+            # Warstwa dyskowa obok areny korpusu (CHROMA_DB_DIR albo katalog wspólnego indeksu)
+            disk_path = self.store.arena_path.parent / config.RETRIEVAL_CACHE_FILE if config.RETRIEVAL_CACHE_FILE else None
+            self.result_cache = RetrievalCache(path=disk_path)
         self._initialize_qa_chain()
 
     def _initialize_embeddings(self) -> None:
         """Inicjalizuje embeddingi."""
         try:
-            self.embeddings = OllamaEmbeddings(
-                model=config.EMBEDDING_MODEL,
-                base_url=config.OLLAMA_BASE_URL,
-            )
+            self.embeddings = self.model_manager.create_embeddings()
             print(f"{Fore.GREEN}✓ Embeddings zainicjalizowane ({config.EMBEDDING_MODEL})")
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd embeddings: {e}")
@@ -144,9 +465,21 @@ class AdvancedRAGAgent:
             if count == 0:
                 raise ValueError("Baza wektorowa jest pusta.")
             
-            # Pobierz wszystkie dokumenty dla BM25 indexu
-            self.all_documents = collection.get(include=["documents", "metadatas"])
+            # Jedna zwarta kopia korpusu (arena mmap) dla BM25, sąsiadów i atrybucji;
+            # wynik collection.get jest zwalniany od razu po zbudowaniu magazynu
+            include = ["documents", "metadatas"] + (["embeddings"] if config.EMBEDDING_REDUCTION else [])
+            documents = collection.get(include=include)
+            self.store = CorpusStore.build(documents["documents"], documents["metadatas"])
+            # Z redukcją wymiaru wyszukiwanie wektorowe idzie przez DenseIndex zamiast HNSW Chroma
+            # (indeks Chroma ma stały wymiar) - zredukowany pierwszy przebieg + pełne wektory shortlisty
+            self.dense_index = None
+            if config.EMBEDDING_REDUCTION:
+                matrix = np.asarray(documents["embeddings"], dtype=np.float32)
+                self.dense_index = DenseIndex(matrix, EmbeddingReducer.configured(matrix))
+            del documents
             print(f"{Fore.GREEN}✓ ChromaDB połączone ({count} dokumentów)")
+            if self.dense_index is not None:
+                print(f"{Fore.GREEN}✓ Redukcja wymiaru embeddingów: {self.dense_index.reducer}")
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd ChromaDB: {e}")
             raise
@@ -154,26 +487,51 @@ class AdvancedRAGAgent:
     def _initialize_bm25_index(self) -> None:
         """Inicjalizuje BM25 index dla keyword search."""
         try:
-            texts = self.all_documents["documents"]
-            # Tokenizacja: split na słowa
-            tokenized_docs = [doc.lower().split() for doc in texts]
-            self.bm25 = BM25Okapi(tokenized_docs)
-            self.bm25_docs = texts
-            print(f"{Fore.GREEN}✓ BM25 index zbudowany ({len(texts)} dokumentów)")
+            # Indeks zapisany przy ingestii (ta sama tokenizacja i korpus) albo zbudowany od nowa
+            self.sparse_index, cached = SparseIndex.cached(self.store, config.SPARSE_INDEX_DIR, create_tokenizer())
+            # Partycje per źródło dla zapytań z filtrem metadanych
+            self.partitions = SourcePartitions(self.store.records)
+            print(
+                f"{Fore.GREEN}✓ BM25 index {'wczytany z ingestii' if cached else 'zbudowany'} "
+                f"({len(self.store)} dokumentów, tokenizer: {config.TOKENIZER})"
+            )
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd BM25: {e}")
             raise
 
+    def _initialize_coarse_index(self) -> None:
+        """Wczytuje centroidy dokumentów zapisane przez ingestię (wyszukiwanie dwuetapowe)."""
+        self.coarse_index = None
+        if config.COARSE_TOP_DOCS <= 0:
+            return
+        path = config.CHROMA_DB_DIR / config.COARSE_INDEX_FILE
+        if not path.exists():
+            print(f"{Fore.YELLOW}⚠ Brak centroidów dokumentów ({path.name}) - wyszukiwanie płaskie. Uruchom: python ingest.py")
+            return
+        try:
+            self.coarse_index = CoarseIndex.load(path).attach(self.store.records)
+            print(
+                f"{Fore.GREEN}✓ Wyszukiwanie dwuetapowe: {len(self.coarse_index)} centroidów "
+                f"({self.coarse_index.granularity}), top {config.COARSE_TOP_DOCS}"
+            )
+        except Exception as e:
+            print(f"{Fore.YELLOW}⚠ Nie udało się wczytać centroidów, wyszukiwanie płaskie: {e}")
+
+    def _attach_shared_index(self, shared_index) -> None:
+        """Używa indeksu załadowanego wcześniej (np. w procesie nadrzędnym przed fork())."""
+        self.shared_index = shared_index
+        self.vectorstore = None
+        self.dense_index = shared_index.dense_index
+        self.store = shared_index.store
+        self.sparse_index = shared_index.sparse_index
+        self.partitions = shared_index.partitions
+        self.coarse_index = shared_index.coarse_index if config.COARSE_TOP_DOCS > 0 else None
+        print(f"{Fore.GREEN}✓ Wspólny indeks podłączony ({len(self.store)} dokumentów)")
+
     def _initialize_llm(self) -> None:
         """Inicjalizuje LLM."""
         try:
-            self.llm = Ollama(
-                model=config.LLM_MODEL,
-                base_url=config.OLLAMA_BASE_URL,
-                temperature=config.LLM_TEMPERATURE,
-                top_p=config.LLM_TOP_P,
-                num_predict=config.LLM_MAX_TOKENS,
-            )
+            self.llm = self.model_manager.create_llm()
             print(f"{Fore.GREEN}✓ LLM zainicjalizowany ({config.LLM_MODEL})")
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd LLM: {e}")
@@ -181,40 +539,30 @@ class AdvancedRAGAgent:
 
     def _initialize_qa_chain(self) -> None:
         """Inicjalizuje QA chain z Hybrid Search (Vector + BM25)."""
-        # Vector Retriever
-        vector_retriever = self.vectorstore.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": config.RETRIEVER_K, "fetch_k": config.RETRIEVER_FETCH_K}
-        )
+        # Vector Retriever (Chroma albo macierz embeddingów: wspólny indeks lub redukcja wymiaru)
+        if self.dense_index is None:
+            vector_retriever = self.vectorstore.as_retriever(
+                search_type="mmr",
+                search_kwargs={"k": config.RETRIEVER_K, "fetch_k": config.RETRIEVER_FETCH_K}
+            )
+        else:
+            vector_retriever = DenseRetriever(self.dense_index, self.store, self.embeddings)
         print(f"{Fore.GREEN}✓ Vector Retriever zainicjalizowany (MMR)")
 
-        # BM25 Retriever
-        try:
-            documents = [
-                Document(
-                    page_content=text,
-                    metadata=meta if meta else {}
-                )
-                for text, meta in zip(
-                    self.all_documents["documents"],
-                    self.all_documents["metadatas"]
-                )
-            ]
-            bm25_retriever = BM25Retriever.from_documents(
-                documents=documents,
-                k=config.RETRIEVER_K
-            )
-            print(f"{Fore.GREEN}✓ BM25 Retriever zainicjalizowany (Keyword Search)")
-        except Exception as e:
-            print(f"{Fore.RED}✗ Błąd BM25 Retriever: {e}")
-            raise
+        if self.result_cache is not None:
+            self.result_cache.set_version(self._cache_version(vector_retriever))
 
         # Hybrid Retriever - łączy Vector + BM25 z wagami [0.5, 0.5]
         try:
             self.retriever = HybridRetriever(
                 vector_retriever=vector_retriever,
-                bm25_retriever=bm25_retriever,
-                weights=[0.5, 0.5]  # Równoważyć semantic search i keyword search
+                sparse_index=self.sparse_index,
+                store=self.store,
+                weights=[0.5, 0.5],  # Równoważyć semantic search i keyword search
+                partitions=self.partitions,
+                coarse_index=self.coarse_index,
+                embeddings=self.embeddings,
+                cache=self.result_cache,
             )
             print(f"{Fore.GREEN}✓ Hybrid Retriever zainicjalizowany (Vector 0.5 + BM25 0.5)")
         except Exception as e:
@@ -226,101 +574,182 @@ class AdvancedRAGAgent:
             input_variables=["context", "question"]
         )
 
+        # Kontekst jest składany w ask() przez ContextPacker, chain tylko generuje odpowiedź
         self.qa_chain = (
-            {
-                "context": lambda x: self.retriever.invoke(x),
-                "question": RunnablePassthrough()
-            }
-            | self.prompt_template
+            self.prompt_template
             | self.llm
             | StrOutputParser()
         )
+        self.context_packer = ContextPacker(compressor=self.compressor)
         
         print(f"{Fore.GREEN}✓ QA Chain (Hybrid Search) zainicjalizowany")
 
-    def decompose_query(self, question: str) -> List[str]:
+    def _cache_version(self, vector_retriever) -> str:
+        """
+        Wersja wpisów RetrievalCache - wszystko poza zapytaniem, od czego zależy ranking.
+
+        Wersja zatwierdzona przez ingestię i odcisk korpusu (wspólny indeks nie ma
+        pliku wersji), a także ustawienia, których zmiana nie wymaga ingestii:
+        model embeddingów, tokenizer BM25, redukcja wymiaru i parametry MMR.
+        Wpisy na dysku z innymi ustawieniami są po restarcie usuwane.
+        """
+        version, committed_at = getattr(self, "_index_version", (None, None))
+        if self.dense_index is None:
+            vector = f"chroma:{vector_retriever.search_type}:{sorted(vector_retriever.search_kwargs.items())}"
+        else:
+            reducer = self.dense_index.reducer
+            vector = (
+                f"dense:k={vector_retriever.k}:fetch_k={vector_retriever.fetch_k}:"
+                f"reduction={reducer.signature if reducer is not None else 'none'}:rescore={config.EMBEDDING_RESCORE_FACTOR}"
+            )
+        settings = "|".join([
+            self.store.fingerprint(),
+            config.EMBEDDING_MODEL,
+            tokenizer_signature(self.sparse_index.tokenize),
+            vector,
+            f"coarse={len(self.coarse_index) if self.coarse_index is not None else 0}",
+        ])
+        return f"{version}@{committed_at}/{hashlib.blake2b(settings.encode('utf-8'), digest_size=16).hexdigest()}"
+
+    def _context_budget(self, question: str, deadline: Optional[QueryDeadline] = None) -> int:
+        """
+        Wylicza budżet tokenów na kontekst z okna modelu.
+
+        Od LLM_NUM_CTX odejmuje limit odpowiedzi (num_predict), szablon promptu
+        z pytaniem oraz margines bezpieczeństwa. Z budżetem latencji kontekst
+        jest dodatkowo ograniczany do tego, co model zdąży przetworzyć.
+        """
+        prompt_overhead = estimate_tokens(
+            self.prompt_template.format(context="", question=question)
+        )
+        budget = (
+            config.LLM_NUM_CTX
+            - config.LLM_MAX_TOKENS
+            - prompt_overhead
+            - config.CONTEXT_SAFETY_MARGIN
+        )
+        if deadline is not None and deadline.bounded:
+            affordable = max(config.CONTEXT_MIN_BLOCK_TOKENS, deadline.prompt_tokens(budget) - prompt_overhead)
+            if affordable < budget:
+                deadline.degrade(f"shrink_context:{affordable}", f"context limited to ~{affordable} tokens")
+                budget = affordable
+        return budget
+
+    @staticmethod
+    def _parse_subqueries(response: str, question: str, ready: Optional[List[str]] = None) -> List[str]:
+        """
+        Sub-pytania z odpowiedzi JSON dekompozycji.
+
+        Gdy odpowiedzi nie da się sparsować (np. ucięty lub uszkodzony JSON),
+        wynikiem są sub-pytania odczytane już ze strumienia (ready), a bez
+        nich - samo pytanie.
+        """
+        fallback = list(ready) if ready else [question]
+        try:
+            data = json.loads(response)
+            subqueries = data.get("subqueries", fallback)
+        except:
+            # Fallback: sub-pytania ze strumienia albo oryginalne pytanie
+            subqueries = fallback
+        return subqueries if subqueries else fallback
+
+    def decompose_query(self, question: str, on_subquery=None, deadline: Optional[QueryDeadline] = None) -> List[str]:
         """
         Rozbija złożone pytanie na prostsze sub-pytania.
         
         Args:
             question: Pytanie użytkownika
+            on_subquery: Opcjonalna funkcja wołana dla każdego sub-pytania, gdy tylko
+                pojawi się w strumieniu odpowiedzi LLM (tryb spekulatywny)
+            deadline: Opcjonalny QueryDeadline - dekompozycja kończy się z końcem
+                swojego okna, a wynikiem są sub-pytania gotowe do tej chwili
             
         Returns:
             Lista sub-pytań
         """
-        decompose_prompt = f"""Jesteś asystentem specjalizującym się w rozbiciu złożonych pytań na prostsze.
-
-Pytanie użytkownika: "{question}"
+        # Wspólny prefiks z SYSTEM_PROMPT - Ollama ponownie używa KV cache
+        decompose_prompt = config.DECOMPOSE_PROMPT.format(question=question)
+        ready: List[str] = []
 
-Rozbij to pytanie na 2-4 prostsze, konkretne sub-pytania, które razem odpowiadają na oryginalne pytanie.
-Każde sub-pytanie powinno być niezależne i możliwe do udzielenia na podstawie tekstu.
-
-Zwróć odpowiedź jako JSON array:
-{{"subqueries": ["sub-pytanie 1", "sub-pytanie 2", ...]}}
-
-SUBQUERIES:"""
+        def emit(subquery: str) -> None:
+            ready.append(subquery)
+            if on_subquery is not None:
+                on_subquery(subquery)
 
         try:
-            response = self.llm.invoke(decompose_prompt)
-            # Parsuj JSON
-            try:
-                data = json.loads(response)
-                subqueries = data.get("subqueries", [question])
-            except:
-                # Fallback: zwróć oryginalne pytanie
-                subqueries = [question]
-            
-            return subqueries if subqueries else [question]
+            if on_subquery is None and deadline is None:
+                # Krótkie wywołanie - nie czeka w kolejce za długimi odpowiedziami (scheduler.py)
+                with llm_priority(short=True):
+                    response = self.llm.invoke(decompose_prompt)
+            else:
+                stream = SubqueryStream()
+                with deadline.scope("decompose") if deadline is not None else nullcontext(), llm_priority(short=True):
+                    for text in self.llm.stream(decompose_prompt):
+                        for subquery in stream.feed(text):
+                            emit(subquery)
+                response = stream.buffer
+            return self._parse_subqueries(response, question, ready)
+        except OllamaCancelled:
+            raise
+        except OllamaDeadlineExceeded as e:
+            if deadline is None:
+                print(f"{Fore.YELLOW}⚠ Decomposition failed, using original query: {e}")
+                return [question]
+            deadline.degrade(
+                "decomposition_timeout",
+                f"decomposition cut at its window, using {len(ready) or 'the original'} sub-queries",
+            )
+            return ready or [question]
         except Exception as e:
-            print(f"{Fore.YELLOW}⚠ Decomposition failed, using original query: {e}")
-            return [question]
+            print(f"{Fore.YELLOW}⚠ Decomposition failed, using {len(ready) or 'the original'} sub-queries: {e}")
+            return ready or [question]
 
-    def hybrid_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+    def hybrid_search(self, query: str, k: int = 8, filters=None) -> List[Dict[str, Any]]:
         """
         Hybrid Search: BM25 (keywords) + Vector (semantic).
         
         Args:
             query: Zapytanie
             k: Liczba dokumentów do zwrócenia
+            filters: Opcjonalny MetadataFilter - BM25 liczy score tylko w pasujących partycjach
             
         Returns:
             Lista dokumentów z score'ami
         """
         # Vector search
-        vector_results = self.retriever.invoke({"question": query})
+        vector_results = self.retriever.invoke(query, k, filters)
         vector_docs = {doc.page_content: {"doc": doc, "score": 1.0} for doc in vector_results}
 
-        # BM25 search
-        tokenized_query = query.lower().split()
-        bm25_scores = self.bm25.get_scores(tokenized_query)
+        # BM25 search (przy filtrze tylko chunki z pasujących partycji)
+        tokenized_query = self.sparse_index.tokenize(query)
+        if filters is None:
+            indices = range(len(self.store))
+            bm25_scores = self.sparse_index.get_scores(tokenized_query)
+        else:
+            indices = self.partitions.select(filters)
+            bm25_scores = self.sparse_index.get_batch_scores(tokenized_query, indices) if indices else []
         
         bm25_results = []
-        for idx, score in enumerate(bm25_scores):
+        for idx, score in zip(indices, bm25_scores):
             if score > 0:
-                bm25_results.append((self.bm25_docs[idx], score))
+                bm25_results.append((idx, float(score)))
         
         # Normalizuj BM25 scores
         if bm25_results:
             max_score = max(s for _, s in bm25_results)
-            bm25_results = [(doc, s / max_score) for doc, s in bm25_results]
+            bm25_results = [(idx, s / max_score) for idx, s in bm25_results]
 
         # Merge: vector + BM25 (average score)
         merged = {}
         for doc in vector_docs:
             merged[doc] = {"score": vector_docs[doc]["score"], "doc": vector_docs[doc]["doc"]}
         
-        for doc, bm25_score in bm25_results:
+        for idx, bm25_score in bm25_results:
+            doc = self.store.text(idx)
             if doc in merged:
                 merged[doc]["score"] = (merged[doc]["score"] + bm25_score) / 2
             else:
-                # Znajdź metadata
-                try:
-                    idx = self.bm25_docs.index(doc)
-                    meta = self.all_documents["metadatas"][idx] if idx < len(self.all_documents["metadatas"]) else {}
-                    from langchain_core.documents import Document
-                    merged[doc] = {"score": bm25_score, "doc": Document(page_content=doc, metadata=meta)}
-                except:
-                    pass
+                merged[doc] = {"score": bm25_score, "doc": self.store.document(idx)}
 
         # Sort i return top k
         sorted_results = sorted(merged.items(), key=lambda x: x[1]["score"], reverse=True)[:k]
@@ -337,18 +766,273 @@ SUBQUERIES:"""
         Returns:
             Rozszerzony kontekst
         """
-        try:
-            idx = self.bm25_docs.index(doc_content)
-            start = max(0, idx - k)
-            end = min(len(self.bm25_docs), idx + k + 1)
-            
-            expanded = "\n[...]\n".join(self.bm25_docs[start:end])
-            return expanded
-        except ValueError:
+        idx = self.store.find_text(doc_content)
+        if idx is None:
             # Nie znaleziono, zwróć oryginał
             return doc_content
+        start = max(0, idx - k)
+        end = min(len(self.store), idx + k + 1)
+        
+        expanded = "\n[...]\n".join(self.store.text(i) for i in range(start, end))
+        return expanded
+
+    def _retrieve(self, query: str, retrieval_cache=None, filters=None, k: Optional[int] = None, query_embedding=None) -> List:
+        """
+        Hybrid search dla jednego sub-query, opcjonalnie współdzielony między pytaniami.
+
+        Args:
+            query: Sub-query
+            retrieval_cache: Obiekt z metodą get_or_compute(key, fn) (np. batch.SharedRetrievalCache)
+            filters: Opcjonalny MetadataFilter
+            k: Liczba wyników zamiast RETRIEVER_K (budżet latencji)
+            query_embedding: Opcjonalny gotowy embedding zapytania
+
+        Returns:
+            Lista krotek (dokument, hybrid score)
+        """
+        if k is None:
+            search = lambda: self.retriever.invoke_with_scores(query, filters=filters, query_embedding=query_embedding)
+        else:
+            search = lambda: self.retriever.invoke_with_scores(
+                query, k=k, filters=filters, query_embedding=query_embedding, search_k=k
+            )
+        if retrieval_cache is None:
+            return search()
+        key = normalize_query(query)
+        if filters is not None:
+            key = f"{key}|{filters.cache_key()}"
+        if k is not None:
+            key = f"{key}|k={k}"
+        return retrieval_cache.get_or_compute(key, search)
+
+    def _decompose_and_retrieve(
+        self,
+        question: str,
+        retrieval_cache=None,
+        filters=None,
+        deadline: Optional[QueryDeadline] = None,
+        question_embedding=None,
+    ):
+        """
+        Dekompozycja pytania i hybrid search dla każdego sub-query.
+
+        W trybie spekulatywnym retrieval oryginalnego pytania startuje razem
+        z dekompozycją, a retrieval każdego sub-query - gdy tylko pojawi się
+        w strumieniu odpowiedzi LLM. Gdy dekompozycja zwróci samo pytanie albo
+        nie da się jej sparsować, wynik spekulatywny jest już gotowy. Spekulacje
+        dla zapytań spoza końcowej listy sub-queries są anulowane.
+
+        Z budżetem (deadline) dekompozycja jest pomijana, gdy jej okno jest za
+        krótkie, a po przekroczeniu planu retrieval bierze DEADLINE_DEGRADED_K wyników.
+
+        question_embedding (policzony już w ścieżce sesji) jest używany przy
+        wyszukiwaniu samego pytania zamiast ponownego embeddingu.
+
+        Returns:
+            Krotka (sub-queries, content -> [doc, najlepszy hybrid score ze wszystkich sub-queries]).
+        """
+        futures = {}
+        question_key = normalize_query(question)
+
+        def embedding_for(query: str):
+            return question_embedding if normalize_query(query) == question_key else None
+
+        # Kontekst sprzed dekompozycji: wątki dziedziczą deadline pytania i token
+        # anulowania, a nie krótszy deadline etapu dekompozycji
+        context = contextvars.copy_context()
+
+        def submit(query: str) -> None:
+            key = normalize_query(query)
+            if key not in futures:
+                futures[key] = self._speculative_pool.submit(
+                    context.copy().run, self._retrieve, query, retrieval_cache, filters, None, embedding_for(query)
+                )
+
+        wanted = set()
+        try:
+            if self._skip_decomposition(deadline):
+                subqueries = [question]
+            else:
+                print(f"\n{Fore.CYAN}🔍 Decomposing query...")
+                if self.speculative:
+                    submit(question)
+                    subqueries = self.decompose_query(question, on_subquery=submit, deadline=deadline)
+                else:
+                    subqueries = self.decompose_query(question, deadline=deadline)
+            wanted = {normalize_query(q) for q in subqueries}
+            # Spekulacje spoza końcowej listy nie zajmują puli (już trwające kończą się same)
+            discarded = sum(future.cancel() for key, future in futures.items() if key not in wanted)
+            print(f"{Fore.CYAN}Found {len(subqueries)} sub-queries:")
+            for i, sq in enumerate(subqueries, 1):
+                print(f"  {i}. {sq}")
+            if self.speculative:
+                reused = question_key in wanted
+                print(
+                    f"{Fore.CYAN}⚡ Speculative retrieval: {len(futures)} started, {discarded} cancelled, "
+                    f"original question {'used' if reused else 'discarded'}"
+                )
+
+            k = self._degraded_k(deadline)
+
+            # Hybrid search dla każdego sub-query (używa EnsembleRetriever)
+            # content -> [doc, najlepszy hybrid score ze wszystkich sub-queries]
+            candidates = {}
+
+            for subq in subqueries:
+                print(f"\n{Fore.CYAN}  Searching for: {subq} (Hybrid: Vector + BM25)")
+                # EnsembleRetriever łączy wektory i BM25 z wagami [0.5, 0.5]
+                future = futures.get(normalize_query(subq))
+                results = future.result() if future is not None else self._retrieve(subq, retrieval_cache, filters, k, embedding_for(subq))
+                self._merge_candidates(candidates, results[:k])
+            return subqueries, candidates
+        finally:
+            # Po błędzie (np. anulowaniu pytania) żadna spekulacja nie jest już potrzebna
+            for key, future in futures.items():
+                if key not in wanted:
+                    future.cancel()
+
+    @staticmethod
+    def _skip_decomposition(deadline: Optional[QueryDeadline]) -> bool:
+        """Czy okno dekompozycji jest za krótkie (degradacja "skip_decomposition")."""
+        window = deadline.stage_window("decompose") if deadline is not None else None
+        if window is not None and window < config.DEADLINE_MIN_DECOMPOSE_S:
+            deadline.degrade("skip_decomposition", f"{window:.1f}s left for decomposition, searching the question directly")
+            return True
+        return False
+
+    @staticmethod
+    def _degraded_k(deadline: Optional[QueryDeadline]) -> Optional[int]:
+        """Po czasie: mniej wyników na sub-query (szybciej i krótszy prompt generacji); None = bez zmian."""
+        if deadline is not None and deadline.behind("retrieve"):
+            k = config.DEADLINE_DEGRADED_K
+            deadline.degrade(f"shrink_k:{k}", f"retrieval starts {deadline.elapsed():.1f}s in, k reduced to {k}")
+            return k
+        return None
+
+    @staticmethod
+    def _merge_candidates(candidates: Dict[str, list], results) -> None:
+        """Dokłada wyniki sub-query do kandydatów (content -> [doc, najlepszy score])."""
+        for doc, score in results:
+            # Avoid duplicates
+            if doc.page_content in candidates:
+                entry = candidates[doc.page_content]
+                entry[1] = max(entry[1], score)
+            else:
+                candidates[doc.page_content] = [doc, score]
+
+    def _chunk_embeddings(self, positions: List[int]) -> Dict[int, List[float]]:
+        """
+        Embeddingi chunków z indeksu (bez wywołań modelu).
+
+        Args:
+            positions: Pozycje w magazynie korpusu.
+
+        Returns:
+            Pozycja -> embedding (chunki nieznalezione w indeksie są pomijane).
+        """
+        if not positions:
+            return {}
+        if self.dense_index is not None:
+            matrix = self.dense_index.matrix
+            return {p: matrix[p] for p in positions}
+        by_id = {self.store.records[p].chunk_id: p for p in positions}
+        try:
+            data = self.vectorstore._collection.get(
+                where={"chunk_id": {"$in": list(by_id)}},
+                include=["embeddings", "metadatas"],
+            )
+        except Exception:
+            return {}
+        found = {}
+        for meta, embedding in zip(data["metadatas"], data["embeddings"]):
+            position = by_id.get((meta or {}).get("chunk_id"))
+            if position is not None and embedding is not None:
+                found[position] = embedding
+        return found
 
-    def ask(self, question: str) -> Dict[str, Any]:
+    def _session_candidates(self, question: str, embedding: List[float], session, filters=None) -> Dict[str, list]:
+        """
+        Kandydaci dla pytania uzupełniającego: nowy ranking zapamiętanych chunków
+        (wektory + BM25) i małe wyszukiwanie "delta" - bez dekompozycji.
+
+        Args:
+            question: Pytanie uzupełniające.
+            embedding: Embedding pytania (już policzony do porównania z tematem).
+            session: RetrievalSession.
+            filters: Opcjonalny MetadataFilter (taki sam jak w poprzednich turach).
+
+        Returns:
+            content -> [doc, score], jak w zwykłej ścieżce ask().
+        """
+        positions = session.candidate_positions()
+        known, missing = session.cached_embeddings(positions)
+        session.remember_embeddings(self._chunk_embeddings(missing))
+        known, _ = session.cached_embeddings(positions)
+
+        # Ranking zapamiętanych kandydatów: podobieństwo do pytania + BM25 w obrębie kandydatów
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= float(np.linalg.norm(query)) or 1.0
+        vector_order = sorted(known, key=lambda p: float(known[p] @ query), reverse=True)
+        bm25_scores = self.sparse_index.get_batch_scores(self.sparse_index.tokenize(question), positions)
+        bm25_order = [p for p, score in sorted(zip(positions, bm25_scores), key=lambda x: x[1], reverse=True) if score > 0]
+        fused = rank_fusion([vector_order, bm25_order], self.retriever.weights)
+
+        candidates = {}
+        for position, score in sorted(fused.items(), key=lambda x: x[1], reverse=True)[:config.SESSION_RERANK_K]:
+            doc = self.store.document(position)
+            candidates[doc.page_content] = [doc, score]
+
+        # Delta: nowe fragmenty, których nie było w poprzednich turach
+        for doc, score in self.retriever.invoke_with_scores(
+            question, k=config.SESSION_DELTA_K * 2, filters=filters,
+            query_embedding=embedding, search_k=config.SESSION_DELTA_K,
+        ):
+            entry = candidates.setdefault(doc.page_content, [doc, score])
+            entry[1] = max(entry[1], score)
+        return candidates
+
+    @staticmethod
+    def _num_predict(prompt: str, deadline: QueryDeadline) -> int:
+        """Limit tokenów odpowiedzi w pozostałym budżecie (degradacja "cap_num_predict")."""
+        num_predict = deadline.num_predict(estimate_tokens(prompt))
+        if num_predict < config.LLM_MAX_TOKENS:
+            deadline.degrade(
+                f"cap_num_predict:{num_predict}",
+                f"{deadline.remaining():.1f}s left for generation, answer limited to {num_predict} tokens",
+            )
+        return num_predict
+
+    def _generate_answer(self, context: str, question: str, deadline: QueryDeadline) -> str:
+        """
+        Generuje odpowiedź w pozostałym budżecie.
+
+        num_predict jest ograniczany do liczby tokenów, które zdążą się
+        wygenerować; gdy mimo to budżet się skończy, zwracana jest
+        dotychczasowa (ucięta) odpowiedź.
+        """
+        if not deadline.bounded:
+            return self.qa_chain.invoke({"context": context, "question": question})
+        prompt = self.prompt_template.format(context=context, question=question)
+        num_predict = self._num_predict(prompt, deadline)
+        parts: List[str] = []
+        try:
+            for text in self.llm.stream(prompt, options={"num_predict": num_predict}):
+                parts.append(text)
+        except OllamaDeadlineExceeded:
+            if not parts:
+                raise
+            deadline.degrade("truncate_answer", "budget exhausted during generation, answer truncated")
+        return "".join(parts)
+
+    def ask(
+        self,
+        question: str,
+        retrieval_cache=None,
+        filters=None,
+        session=None,
+        budget_s: Optional[float] = config.ASK_BUDGET_S,
+        cancel=None,
+    ) -> Dict[str, Any]:
         """
         Advanced ask z decomposition i Hybrid Search (EnsembleRetriever).
         
@@ -358,72 +1042,366 @@ SUBQUERIES:"""
         
         Args:
             question: Pytanie użytkownika
+            retrieval_cache: Opcjonalny cache wyników retrievalu współdzielony między pytaniami
+            filters: Opcjonalny MetadataFilter - przeszukiwane są tylko pasujące partycje
+            session: Opcjonalna RetrievalSession - pytania uzupełniające używają
+                kandydatów z poprzednich tur zamiast pełnego retrievalu
+            budget_s: Budżet latencji w sekundach (None = bez limitu) - po jego
+                przekroczeniu agent degraduje odpowiedź zamiast czekać (deadline.py)
+            cancel: Opcjonalny ollama_client.CancelToken do anulowania pytania z innego wątku
             
         Returns:
-            Dict z odpowiedzią i źródłami
+            Dict z odpowiedzią, źródłami i zastosowanymi degradacjami ("degradations")
         """
         if not question or not question.strip():
             raise ValueError("Pytanie nie może być puste")
+        if filters is not None and not self.partitions.select(filters):
+            raise ValueError(f"Brak fragmentów pasujących do filtra: {filters}")
 
+        deadline = QueryDeadline(budget_s, cancel)
         try:
-            print(f"\n{Fore.CYAN}🔍 Decomposing query...")
-            subqueries = self.decompose_query(question)
-            print(f"{Fore.CYAN}Found {len(subqueries)} sub-queries:")
-            for i, sq in enumerate(subqueries, 1):
-                print(f"  {i}. {sq}")
+            with deadline.scope(), profiling.stage("ask"):
+                return self._ask(question, retrieval_cache, filters, session, deadline)
+        except KeyboardInterrupt:
+            # Ctrl+C: zamyka gniazda trwających wywołań Ollama (także w wątkach spekulatywnych)
+            deadline.cancel.cancel()
+            raise
 
-            # Hybrid search dla każdego sub-query (używa EnsembleRetriever)
-            all_docs = []
-            doc_contents_seen = set()
+    def _ask(self, question: str, retrieval_cache, filters, session, deadline: QueryDeadline) -> Dict[str, Any]:
+        """Właściwe ask() w zakresie wywołań Ollama z budżetem i tokenem anulowania."""
+        try:
+            if filters is not None:
+                print(f"\n{Fore.CYAN}🔎 Filter: {filters}")
 
-            for subq in subqueries:
-                print(f"\n{Fore.CYAN}  Searching for: {subq} (Hybrid: Vector + BM25)")
-                # EnsembleRetriever łączy wektory i BM25 z wagami [0.5, 0.5]
-                docs = self.retriever.invoke(subq)
-                for doc in docs:
-                    # Avoid duplicates
-                    if doc.page_content not in doc_contents_seen:
-                        all_docs.append(doc)
-                        doc_contents_seen.add(doc.page_content)
+            filter_key = filters.cache_key() if filters is not None else ""
+            question_embedding = self.embeddings.embed_query(question) if session is not None else None
+            session_reuse = session is not None and session.is_follow_up(question_embedding, filter_key)
 
-            # Merge contexts
-            context_str = "\n---\n".join([doc.page_content for doc in all_docs])
+            if session_reuse:
+                print(
+                    f"\n{Fore.CYAN}♻ Follow-up (similarity {session.similarity(question_embedding):.2f}): "
+                    f"re-ranking {len(session.candidate_positions())} session candidates + delta search"
+                )
+                subqueries = [question]
+                candidates = self._session_candidates(question, question_embedding, session, filters)
+                session.reused += 1
+            else:
+                subqueries, candidates = self._decompose_and_retrieve(
+                    question, retrieval_cache, filters, deadline, question_embedding
+                )
+                if session is not None:
+                    # Nowy temat - poprzednie tury nie opisują już kontekstu rozmowy
+                    session.reset()
+                    session.full += 1
+
+            positioned = [
+                (doc, score, self.store.position_of(doc))
+                for doc, score in candidates.values()
+            ]
+            if session is not None:
+                ranked = sorted(positioned, key=lambda c: c[1], reverse=True)
+                session.add_turn(question, question_embedding, [p for _, _, p in ranked if p is not None], filter_key)
+
+            # Pakowanie kontekstu: sklejanie sąsiadów, (kompresja zdań), kolejność wg score, budżet tokenów
+            packed = self.context_packer.pack(
+                positioned,
+                budget_tokens=self._context_budget(question, deadline),
+                question=question,
+                query_embedding=question_embedding if question_embedding is not None else self.retriever.recent_embedding(question),
+            )
+            context_str = packed["context"]
+            all_docs = packed["documents"]
 
-            print(f"\n{Fore.CYAN}📚 Using {len(all_docs)} documents (Hybrid Search result)")
+            print(f"\n{Fore.CYAN}📚 Using {len(all_docs)}/{len(candidates)} documents in {packed['num_blocks']} blocks (Hybrid Search result)")
+            print(
+                f"{Fore.CYAN}📦 Context: ~{packed['tokens_used']} tokens "
+                f"(saved ~{packed['tokens_saved']} of {packed['tokens_naive']})"
+            )
+            compression = packed["compression"]
+            if compression is not None:
+                print(
+                    f"{Fore.CYAN}✂ Compression: {compression['sentences_kept']}/{compression['sentences']} sentences, "
+                    f"~{compression['tokens_before']} → ~{compression['tokens_after']} tokens "
+                    f"in {compression['seconds'] * 1000:.0f} ms ({compression['embedded']} new sentence embeddings)"
+                )
 
             # LLM answer
-            answer = self.qa_chain.invoke({"context": context_str, "question": question})
+            answer = self._generate_answer(context_str, question, deadline)
+            return self._answer_result(answer, packed, subqueries, filters, session_reuse, deadline)
 
-            # Unique sources
-            sources = []
-            seen_sources = set()
-            for doc in all_docs:
-                source = doc.metadata.get("source", "Nieznane źródło")
+        except Exception as e:
+            print(f"{Fore.RED}✗ Error: {e}")
+            raise
+
+    @staticmethod
+    def _answer_result(answer: str, packed: Dict[str, Any], subqueries: List[str], filters, session_reuse: bool, deadline: QueryDeadline) -> Dict[str, Any]:
+        """Wynik ask()/aask(): odpowiedź, unikalne źródła i statystyki kontekstu."""
+        all_docs = packed["documents"]
+        # Unique sources
+        sources = []
+        seen_sources = set()
+        for doc in all_docs:
+            source = doc.metadata.get("source", "Nieznane źródło")
+            # Źródła prawie-duplikatów odrzuconych przy ingestii (dedup.py)
+            duplicates = doc.metadata.get("duplicate_sources", "")
+            for source in [source] + (duplicates.split(";") if duplicates else []):
                 if source not in seen_sources:
                     sources.append(source)
                     seen_sources.add(source)
 
-            return {
-                "answer": answer,
-                "source_documents": all_docs,
-                "sources": sources,
-                "subqueries": subqueries,
-                "num_docs_used": len(all_docs)
-            }
+        return {
+            "answer": answer,
+            "source_documents": all_docs,
+            "sources": sources,
+            "subqueries": subqueries,
+            "num_docs_used": len(all_docs),
+            "context_tokens": packed["tokens_used"],
+            "context_tokens_saved": packed["tokens_saved"],
+            "compression": packed["compression"],
+            "filters": repr(filters) if filters is not None else None,
+            "session_reuse": session_reuse,
+            **deadline.summary(),
+        }
+
+    # ==================== API ASYNCHRONICZNE ====================
+
+    async def _run_cpu(self, fn, *args):
+        """Wykonuje obliczenia (BM25, macierz embeddingów, pakowanie) w puli wątków agenta."""
+        call = functools.partial(contextvars.copy_context().run, fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._cpu_pool, call)
+
+    async def asearch(self, query: str, k: int = config.RETRIEVER_K, filters=None, search_k=None) -> List:
+        """
+        Asynchroniczny hybrid search dla jednego zapytania.
+
+        Embedding zapytania idzie przez asynchroniczny klient Ollama, a fuzja
+        BM25 i wyszukiwania wektorowego - do puli wątków (ASYNC_CPU_WORKERS),
+        więc pętla zdarzeń obsługuje w tym czasie inne pytania. Gdy embedding
+        się nie powiedzie, wynikiem jest samo BM25.
+
+        Args:
+            query: Zapytanie
+            k: Liczba dokumentów do zwrócenia
+            filters: Opcjonalny MetadataFilter
+            search_k: Opcjonalna liczba wyników każdego z retrieverów
 
+        Returns:
+            Lista krotek (dokument, hybrid score)
+        """
+        cached = self.retriever.cached_scores(query, k, filters, search_k)
+        if cached is not None:
+            return cached
+        try:
+            embedding = await self.embeddings.aembed_query(query)
+        except OllamaCancelled:
+            raise
         except Exception as e:
-            print(f"{Fore.RED}✗ Error: {e}")
+            print(f"{Fore.YELLOW}⚠ Query embedding failed, BM25 only: {e}")
+            embedding = None
+        return await self._run_cpu(
+            functools.partial(
+                self.retriever.invoke_with_scores,
+                query, k, filters, embedding, search_k, vector=embedding is not None, cached=False,
+            )
+        )
+
+    async def _adecompose_query(self, question: str, on_subquery=None, deadline: Optional[QueryDeadline] = None) -> List[str]:
+        """Asynchroniczna wersja decompose_query (zawsze strumieniowo)."""
+        decompose_prompt = config.DECOMPOSE_PROMPT.format(question=question)
+        ready: List[str] = []
+        stream = SubqueryStream()
+        try:
+            with deadline.scope("decompose") if deadline is not None else nullcontext(), llm_priority(short=True):
+                async for text in self.llm.astream(decompose_prompt):
+                    for subquery in stream.feed(text):
+                        ready.append(subquery)
+                        if on_subquery is not None:
+                            on_subquery(subquery)
+            return self._parse_subqueries(stream.buffer, question, ready)
+        except OllamaCancelled:
             raise
+        except OllamaDeadlineExceeded as e:
+            if deadline is None:
+                print(f"{Fore.YELLOW}⚠ Decomposition failed, using original query: {e}")
+                return [question]
+            deadline.degrade(
+                "decomposition_timeout",
+                f"decomposition cut at its window, using {len(ready) or 'the original'} sub-queries",
+            )
+            return ready or [question]
+        except Exception as e:
+            print(f"{Fore.YELLOW}⚠ Decomposition failed, using {len(ready) or 'the original'} sub-queries: {e}")
+            return ready or [question]
+
+    async def _adecompose_and_retrieve(self, question: str, filters=None, deadline: Optional[QueryDeadline] = None):
+        """
+        Asynchroniczna wersja _decompose_and_retrieve.
+
+        Spekulatywne wyszukiwania są zadaniami asyncio (z kontekstem sprzed
+        dekompozycji, jak wątki w wersji synchronicznej); sub-queries bez
+        gotowego zadania są wyszukiwane równocześnie.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        def submit(query: str, k: Optional[int] = None) -> None:
+            key = normalize_query(query)
+            if key not in tasks:
+                coro = self.asearch(query, filters=filters) if k is None else self.asearch(query, k, filters, search_k=k)
+                tasks[key] = loop.create_task(coro, context=context.copy())
+
+        try:
+            if self._skip_decomposition(deadline):
+                subqueries = [question]
+            else:
+                if self.speculative:
+                    submit(question)
+                    subqueries = await self._adecompose_query(question, on_subquery=submit, deadline=deadline)
+                else:
+                    subqueries = await self._adecompose_query(question, deadline=deadline)
+
+            k = self._degraded_k(deadline)
+            for subq in subqueries:
+                submit(subq, k)
+            keys = list(dict.fromkeys(normalize_query(q) for q in subqueries))
+            results = await asyncio.gather(*(tasks[key] for key in keys))
+
+            candidates = {}
+            for ranked in results:
+                self._merge_candidates(candidates, ranked[:k])
+            return subqueries, candidates
+        finally:
+            # Odrzucone spekulacje (i reszta po błędzie) nie mogą działać dalej
+            for task in tasks.values():
+                task.cancel()
+
+    async def _agenerate_answer(self, context: str, question: str, deadline: QueryDeadline) -> str:
+        """Asynchroniczna wersja _generate_answer."""
+        if not deadline.bounded:
+            return await self.qa_chain.ainvoke({"context": context, "question": question})
+        prompt = self.prompt_template.format(context=context, question=question)
+        num_predict = self._num_predict(prompt, deadline)
+        parts: List[str] = []
+        try:
+            async for text in self.llm.astream(prompt, options={"num_predict": num_predict}):
+                parts.append(text)
+        except OllamaDeadlineExceeded:
+            if not parts:
+                raise
+            deadline.degrade("truncate_answer", "budget exhausted during generation, answer truncated")
+        return "".join(parts)
+
+    async def aask(
+        self,
+        question: str,
+        filters=None,
+        budget_s: Optional[float] = config.ASK_BUDGET_S,
+        cancel=None,
+    ) -> Dict[str, Any]:
+        """
+        Asynchroniczne ask() - setki pytań równocześnie w jednej pętli zdarzeń.
+
+        Wywołania Ollama (embedding, dekompozycja, generacja) idą przez
+        AsyncOllamaClient, którego semafor (ASYNC_OLLAMA_CONCURRENCY) ogranicza
+        liczbę żądań do serwera; obliczenia CPU działają w puli wątków agenta.
+        Anulowanie zadania asyncio przerywa trwające wywołania. Bez obsługi
+        sesji (RetrievalSession) i współdzielonego cache retrievalu.
+
+        Args:
+            question: Pytanie użytkownika
+            filters: Opcjonalny MetadataFilter
+            budget_s: Budżet latencji w sekundach (None = bez limitu)
+            cancel: Opcjonalny ollama_client.CancelToken
+
+        Returns:
+            Dict jak z ask()
+        """
+        if not question or not question.strip():
+            raise ValueError("Pytanie nie może być puste")
+        if filters is not None and not self.partitions.select(filters):
+            raise ValueError(f"Brak fragmentów pasujących do filtra: {filters}")
+
+        deadline = QueryDeadline(budget_s, cancel)
+        with deadline.scope():
+            subqueries, candidates = await self._adecompose_and_retrieve(question, filters, deadline)
+            positioned = [
+                (doc, score, self.store.position_of(doc))
+                for doc, score in candidates.values()
+            ]
+            packed = await self._run_cpu(
+                functools.partial(
+                    self.context_packer.pack,
+                    positioned,
+                    budget_tokens=self._context_budget(question, deadline),
+                    question=question,
+                    query_embedding=self.retriever.recent_embedding(question),
+                )
+            )
+            answer = await self._agenerate_answer(packed["context"], question, deadline)
+        return self._answer_result(answer, packed, subqueries, filters, False, deadline)
+
+    # ==================== AKTUALIZACJE INDEKSU ====================
+
+    def refresh_index(self) -> bool:
+        """
+        Przeładowuje indeks, jeśli ingestia zatwierdziła nową wersję (index_version.py).
+
+        Wywoływać między pytaniami, gdy żadne ask() nie trwa - pozycje chunków
+        w nowym magazynie korpusu różnią się od starych (sesję trzeba wyczyścić).
+        Agent ze wspólnym indeksem (pre-fork, snapshot) nie jest przeładowywany.
+
+        Returns:
+            True, gdy indeks został przeładowany.
+        """
+        if self.shared_index is not None:
+            return False
+        state = read_version()
+        if _version_key(state) == self._index_version:
+            return False
+        previous = {name: getattr(self, name, None) for name in _INDEX_ATTRIBUTES}
+        previous_version = self._index_version
+        self._index_version = _version_key(state)
+        start = time.perf_counter()
+        try:
+            _reset_chroma_clients()
+            self._initialize_vectorstore()
+            self._initialize_bm25_index()
+            self._initialize_coarse_index()
+            self._initialize_qa_chain()
+        except Exception as e:
+            # Np. ingestia właśnie zapisuje kolejną wersję - spróbujemy przed następnym pytaniem
+            for name, value in previous.items():
+                setattr(self, name, value)
+            self._index_version = previous_version
+            if self.result_cache is not None:
+                self.result_cache.set_version(self._cache_version(self.retriever.vector_retriever))
+            print(f"{Fore.YELLOW}⚠ Nie udało się przeładować indeksu (wersja {state.get('version')}), zostaje poprzedni: {e}")
+            return False
+        message = f"✓ Indeks przeładowany: wersja {state.get('version')} ({len(self.store)} dokumentów) w {time.perf_counter() - start:.1f}s"
+        if state.get("first_event_at"):
+            message += f", od zmiany w docs/ do wyszukiwalności {time.time() - state['first_event_at']:.1f}s"
+        print(f"{Fore.GREEN}{message}")
+        return True
 
     def get_stats(self) -> Dict[str, int]:
         """Zwraca statystyki bazy."""
         try:
-            collection = self.vectorstore._collection
-            count = collection.count()
+            count = len(self.store) if self.vectorstore is None else self.vectorstore._collection.count()
+            scheduler = get_scheduler(self.model_manager.base_url)
             return {
                 "total_documents": count,
                 "collection_name": config.CHROMA_COLLECTION_NAME,
-                "retrieval_type": "Hybrid (BM25 + Vector) + Decomposition"
+                "retrieval_type": "Hybrid (BM25 + Vector) + Decomposition",
+                "corpus_arena_bytes": self.store.arena_bytes,
+                "sparse_index_bytes": self.sparse_index.nbytes,
+                "coarse_groups": len(self.coarse_index) if self.coarse_index is not None else 0,
+                "embedding_reduction": (
+                    self.dense_index.reducer.signature
+                    if self.dense_index is not None and self.dense_index.reducer is not None else "none"
+                ),
+                "llm_queue": scheduler.stats() if scheduler is not None else {},
+                "retrieval_cache": self.result_cache.stats() if self.result_cache is not None else {},
             }
         except Exception as e:
             print(f"{Fore.RED}✗ Error: {e}")
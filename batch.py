@@ -0,0 +1,326 @@
+"""
+Tryb wsadowy: odpowiadanie na pytania z pliku JSONL.
+
+Wejście: jedna linia = {"id": ..., "question": "..."} (id opcjonalne) lub sam tekst JSON.
+Pytanie może zawierać filtry metadanych (@source:, @dir:, @page:, @type:).
+Wyjście: jedna linia na pytanie, zapisywana zaraz po uzyskaniu odpowiedzi.
+
+- identyczne pytania (po normalizacji) są liczone raz,
+- wyniki retrievalu dla powtarzających się sub-queries są współdzielone,
+- liczba równoległych pytań jest ograniczona (concurrency), a do puli trafia
+  najwyżej 2 x concurrency pytań naraz - Ctrl+C przerywa przebieg od razu,
+- ponowne uruchomienie z tym samym plikiem wyjściowym pomija gotowe pytania.
+Professional Local RAG Agent - Initial Release"""
+
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+from colorama import Fore, Style, init
+
+import config
+from ollama_client import CancelToken
+from partitions import MetadataFilter
+from scheduler import llm_priority
+from text_utils import normalize_query
+
+init(autoreset=True)
+
+
+class SharedRetrievalCache:
+    """
+    Wyniki retrievalu współdzielone między pytaniami jednego przebiegu.
+
+    Jeśli dwa wątki szukają tego samego sub-query jednocześnie, drugi czeka
+    na wynik pierwszego zamiast liczyć go ponownie.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._results: Dict[str, Any] = {}
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Zwraca wynik dla klucza, licząc go najwyżej raz.
+
+        Args:
+            key: Znormalizowane sub-query.
+            compute: Funkcja licząca wynik przy braku w cache.
+        """
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                return self._results[key]
+            event = self._pending.get(key)
+            owner = event is None
+            if owner:
+                event = self._pending[key] = threading.Event()
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                if key in self._results:
+                    self.hits += 1
+                    return self._results[key]
+            # Właściciel klucza zakończył się błędem - liczymy sami
+            return compute()
+
+        try:
+            value = compute()
+            with self._lock:
+                self._results[key] = value
+                self.misses += 1
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            event.set()
+
+
+def answer_question(agent, question: str, retrieval_cache=None, cancel=None) -> Dict[str, Any]:
+    """
+    Odpowiada na jedno pytanie; błędy zwraca w wyniku zamiast je rzucać.
+
+    Args:
+        agent: Instancja AdvancedRAGAgent.
+        question: Pytanie (może zawierać filtry @source:, @page: itd.).
+        retrieval_cache: Opcjonalny cache retrievalu współdzielony między pytaniami.
+        cancel: Opcjonalny CancelToken przebiegu (przerwanie zamyka trwające wywołania Ollama).
+
+    Returns:
+        Dict z odpowiedzią (lub 'error') i latency_s.
+    """
+    start = time.perf_counter()
+    try:
+        question, filters = MetadataFilter.parse(question)
+        # Pytania wsadowe ustępują interaktywnym w kolejce generacji (scheduler.py)
+        with llm_priority("batch"):
+            result = agent.ask(question, retrieval_cache=retrieval_cache, filters=filters, cancel=cancel)
+        output = {
+            "answer": result["answer"],
+            "sources": result.get("sources", []),
+            "subqueries": result.get("subqueries", []),
+            "num_docs_used": result.get("num_docs_used", 0),
+        }
+        if result.get("degradations"):
+            output["degradations"] = result["degradations"]
+    except Exception as e:
+        output = {"error": str(e)}
+    output["latency_s"] = round(time.perf_counter() - start, 3)
+    return output
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Percentyl (najbliższy rang) z listy wartości."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class BatchRunner:
+    """Odpowiada wsadowo na pytania z pliku JSONL przy użyciu AdvancedRAGAgent."""
+
+    def __init__(self, agent, concurrency: int = config.BATCH_CONCURRENCY, pool=None) -> None:
+        """
+        Args:
+            agent: Instancja AdvancedRAGAgent (None przy pracy na puli procesów).
+            concurrency: Maksymalna liczba pytań przetwarzanych równolegle (wątki).
+            pool: Opcjonalna serving.PreforkPool - pytania trafiają do procesów roboczych.
+        """
+        self.agent = agent
+        self.pool = pool
+        self.concurrency = pool.workers if pool is not None else max(1, concurrency)
+        self.retrieval_cache = SharedRetrievalCache()
+        self.cancel = CancelToken()
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def load_questions(path: Path) -> List[Dict[str, str]]:
+        """
+        Wczytuje pytania z pliku JSONL.
+
+        Args:
+            path: Plik wejściowy.
+
+        Returns:
+            Lista {"id": ..., "question": ...}; bez id kluczem jest treść pytania.
+
+        Raises:
+            ValueError: Gdy linia nie jest poprawnym JSON-em lub nie zawiera pytania.
+        """
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_no}: niepoprawny JSON ({e})")
+                if isinstance(record, str):
+                    record = {"question": record}
+                question = (record.get("question") or "").strip()
+                if not question:
+                    raise ValueError(f"{path}:{line_no}: brak pola 'question'")
+                records.append({"id": str(record.get("id", question)), "question": question})
+        return records
+
+    @staticmethod
+    def load_done(path: Path) -> Set[str]:
+        """
+        Zwraca id pytań z poprawną odpowiedzią w (częściowym) pliku wyjściowym.
+
+        Linie z błędem i ucięta ostatnia linia są pomijane - te pytania zostaną ponowione.
+        """
+        done: Set[str] = set()
+        if not path.exists():
+            return done
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and "error" not in record and "id" in record:
+                    done.add(str(record["id"]))
+        return done
+
+    def _answer(self, question: str) -> Dict[str, Any]:
+        """Odpowiada na jedno (unikalne) pytanie; błędy zwraca w wyniku."""
+        return answer_question(self.agent, question, retrieval_cache=self.retrieval_cache, cancel=self.cancel)
+
+    def _outputs(self, groups: List[List[Dict[str, str]]]) -> Iterator[Tuple[List[Dict[str, str]], Dict[str, Any]]]:
+        """Wyniki dla grup pytań w kolejności ukończenia (wątki albo procesy pre-fork)."""
+        questions = [group[0]["question"] for group in groups]
+        if self.pool is not None:
+            for idx, output in self.pool.imap_unordered(questions):
+                yield groups[idx], output
+            return
+        # Okno 2 x concurrency: wątki mają zawsze kolejne pytanie, a przerwanie
+        # nie czeka na resztę pliku (shutdown(wait=True) wykonałby całą kolejkę)
+        tasks = iter(zip(questions, groups))
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        futures: Dict[Any, List[Dict[str, str]]] = {}
+
+        def submit(count: int) -> None:
+            for question, group in itertools.islice(tasks, count):
+                futures[executor.submit(self._answer, question)] = group
+
+        try:
+            submit(2 * self.concurrency)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group = futures.pop(future)
+                    submit(1)
+                    yield group, future.result()
+        except BaseException:
+            # Ctrl+C albo przerwany konsument: trwające pytania są anulowane, oczekujące porzucane
+            self.cancel.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    def _write(self, out_file, records: List[Dict[str, str]], output: Dict[str, Any]) -> None:
+        """Dopisuje wynik dla wszystkich rekordów z tym samym pytaniem."""
+        with self._write_lock:
+            for record in records:
+                out_file.write(json.dumps({**record, **output}, ensure_ascii=False) + "\n")
+            out_file.flush()
+
+    def run(self, in_path: Path, out_path: Path) -> Dict[str, Any]:
+        """
+        Przetwarza plik pytań i dopisuje odpowiedzi do pliku wyjściowego.
+
+        Args:
+            in_path: Plik JSONL z pytaniami.
+            out_path: Plik JSONL z odpowiedziami (wznawiany, jeśli istnieje).
+
+        Returns:
+            Dict z podsumowaniem przepustowości.
+        """
+        records = self.load_questions(in_path)
+        done = self.load_done(out_path)
+        pending = [r for r in records if r["id"] not in done]
+
+        # Deduplikacja: jedno wywołanie agenta na znormalizowane pytanie
+        groups: Dict[str, List[Dict[str, str]]] = {}
+        seen_ids: Set[str] = set()
+        for record in pending:
+            if record["id"] in seen_ids:
+                continue
+            seen_ids.add(record["id"])
+            groups.setdefault(normalize_query(record["question"]), []).append(record)
+
+        print(
+            f"{Fore.CYAN}📋 Pytań: {len(records)}, gotowych wcześniej: {len(records) - len(pending)}, "
+            f"do zrobienia: {len(seen_ids)} ({len(groups)} unikalnych), równolegle: {self.concurrency}"
+        )
+
+        latencies: List[float] = []
+        errors = 0
+        completed = 0
+        start = time.perf_counter()
+
+        with open(out_path, "a", encoding="utf-8") as out_file, open(os.devnull, "w") as devnull:
+            # Komunikaty agenta z wielu wątków przeplatałyby się - wyciszamy je,
+            # postęp idzie na stderr
+            with contextlib.redirect_stdout(devnull):
+                for group, output in self._outputs(list(groups.values())):
+                    self._write(out_file, group, output)
+                    completed += 1
+                    if "error" in output:
+                        errors += len(group)
+                    else:
+                        latencies.append(output["latency_s"])
+                    print(
+                        f"[{completed}/{len(groups)}] {group[0]['id']} ({output['latency_s']:.1f}s)"
+                        + (f" BŁĄD: {output['error']}" if "error" in output else ""),
+                        file=sys.stderr,
+                    )
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "questions": len(records),
+            "resumed": len(records) - len(pending),
+            "processed": len(seen_ids),
+            "unique": len(groups),
+            "errors": errors,
+            "elapsed_s": round(elapsed, 2),
+            "questions_per_s": round(len(seen_ids) / elapsed, 3) if elapsed > 0 else 0.0,
+            "latency_p50_s": _percentile(latencies, 0.5),
+            "latency_p95_s": _percentile(latencies, 0.95),
+            "retrieval_cache_hits": self.retrieval_cache.hits,
+            "retrieval_cache_misses": self.retrieval_cache.misses,
+        }
+        return summary
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    """Wyświetla podsumowanie przepustowości przebiegu wsadowego."""
+    print(f"\n{Fore.CYAN}{'─' * 70}")
+    print(f"{Fore.CYAN}{Style.BRIGHT}📈 PODSUMOWANIE TRYBU WSADOWEGO")
+    print(f"{Fore.CYAN}{'─' * 70}")
+    print(f"{Fore.WHITE}  • Pytań w pliku: {Fore.GREEN}{summary['questions']}")
+    print(f"{Fore.WHITE}  • Pominięte (wznowienie): {Fore.GREEN}{summary['resumed']}")
+    print(f"{Fore.WHITE}  • Przetworzone: {Fore.GREEN}{summary['processed']} ({summary['unique']} unikalnych)")
+    print(f"{Fore.WHITE}  • Błędy: {Fore.GREEN if not summary['errors'] else Fore.RED}{summary['errors']}")
+    print(f"{Fore.WHITE}  • Czas: {Fore.GREEN}{summary['elapsed_s']}s ({summary['questions_per_s']} pytań/s)")
+    print(f"{Fore.WHITE}  • Latencja p50 / p95: {Fore.GREEN}{summary['latency_p50_s']}s / {summary['latency_p95_s']}s")
+    print(
+        f"{Fore.WHITE}  • Współdzielony retrieval: {Fore.GREEN}{summary['retrieval_cache_hits']} trafień, "
+        f"{summary['retrieval_cache_misses']} wyszukiwań"
+    )
+    print(f"{Fore.CYAN}{'─' * 70}\n")
@@ -0,0 +1,1247 @@
+"""
+Benchmarki wydajności Local RAG Agent.
+
+Uruchamiane na lokalnym, fałszywym serwerze Ollama (fake_ollama.py),
+więc nie wymagają modeli ani GPU. Czasy "modelu" są raportowane
+w jednostkach symulowanych (jak liczniki *_duration z API Ollama).
+
+Użycie:
+    python benchmark.py prefix [--questions 20] [--time-scale 0.001]
+    python benchmark.py chunking [--docs docs/]
+    python benchmark.py memory [--chunks 5000]
+    python benchmark.py serving [--chunks 10000] [--workers 1,2,4] [--questions 64]
+    python benchmark.py speculative [--chunks 5000] [--questions 20]
+    python benchmark.py coarse [--chunks 2000,5000,10000] [--questions 50] [--top-docs 5,20]
+    python benchmark.py tokenizer [--chunks 5000] [--questions 200]
+    python benchmark.py deadline [--chunks 2000] [--questions 4] [--budgets 20,6,3,1.5]
+    python benchmark.py reduction [--chunks 50000] [--dims 64,128,256,384] [--factors 1,4]
+    python benchmark.py snapshot [--chunks 50000] [--levels 1,6]
+    python benchmark.py --time-scale 0.01 async [--questions 256] [--concurrency 1,16,64,256] [--parallel 4]
+    python benchmark.py --time-scale 0.05 scheduler [--questions 10] [--batch-workers 8] [--parallel 2]
+    python benchmark.py --time-scale 0.1 compression [--chunks 2000] [--questions 20] [--ratios 0.6,0.4,0.25]
+    python benchmark.py --time-scale 0.1 retrieval-cache [--chunks 5000] [--queries 200] [--distinct 40]
+Professional Local RAG Agent - Initial Release"""
+
+import argparse
+import gc
+import importlib
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from colorama import Fore, Style, init
+
+import config
+from chunking import create_text_splitter
+from coarse_index import CoarseIndex, group_key
+from corpus_store import CorpusStore
+from dense_index import DenseIndex, DenseRetriever
+from fake_ollama import FakeOllamaServer
+from ollama_manager import OllamaModelManager
+from partitions import SourcePartitions
+from reduction import EmbeddingReducer
+from serving import PreforkPool, SharedIndex
+from sparse_index import SparseIndex
+from snapshot import read_snapshot, restore_shared, write_snapshot
+from text_utils import estimate_tokens
+from tokenizer import create_tokenizer
+
+init(autoreset=True)
+
+SAMPLE_QUESTIONS: List[str] = [
+    "Jak przebiega proces instalacji modułu?",
+    "Jakie są wymagania sprzętowe systemu?",
+    "Co zmieniło się w wersji 2 dokumentacji?",
+    "Jak skonfigurować kopię zapasową bazy danych?",
+    "Jakie są ograniczenia licencji?",
+]
+
+SAMPLE_CONTEXT: str = "\n---\n".join(
+    f"Fragment {i}: procedura instalacji wymaga uprawnień administratora, "
+    f"konfiguracji sieci oraz pliku licencji numer {i * 17}."
+    for i in range(12)
+)
+
+# Układ promptów sprzed wprowadzenia config.PROMPT_PREFIX (punkt odniesienia)
+LEGACY_SYSTEM_PROMPT: str = """Jesteś asystentem odpowiadającym WYŁĄCZNIE na podstawie dostarczonego kontekstu.
+
+ZASADY:
+1) Używaj wyłącznie informacji z kontekstu; jeśli czegoś brakuje, napisz: "Nie znalazłem tej informacji w dostępnych dokumentach.".
+2) Tekst odpowiedzi powinien być w tym samym języku co zadane pytanie.
+3) Kluczowe liczby, nazwy i terminy cytuj dokładnie jak w tekście (w cudzysłowie, jeśli to dosłowny cytat).
+4) Nie parafrazuj liczb ani jednostek; zachowaj oryginalne brzmienie tam, gdzie to ważne dla precyzji.
+5) Jeśli kontekst zawiera sprzeczne informacje, wskaż to w odpowiedzi.
+6) Odpowiadaj zwięźle, po polsku.
+7) Na końcu podaj krótką listę źródeł (nazwy plików z metadanych), jeśli są dostępne.
+KONTEKST:
+{context}
+
+PYTANIE:
+{question}
+
+ODPOWIEDŹ:"""
+
+LEGACY_DECOMPOSE_PROMPT: str = """Jesteś asystentem specjalizującym się w rozbiciu złożonych pytań na prostsze.
+
+Pytanie użytkownika: "{question}"
+
+Rozbij to pytanie na 2-4 prostsze, konkretne sub-pytania, które razem odpowiadają na oryginalne pytanie.
+Każde sub-pytanie powinno być niezależne i możliwe do udzielenia na podstawie tekstu.
+
+Zwróć odpowiedź jako JSON array:
+{{"subqueries": ["sub-pytanie 1", "sub-pytanie 2", ...]}}
+
+SUBQUERIES:"""
+
+
+def _model_time(stats: Dict[str, Any]) -> float:
+    """Symulowany czas modelu (s) z liczników Ollama."""
+    return (stats["load_duration"] + stats["prompt_eval_duration"] + stats["eval_duration"]) / 1e9
+
+
+def _print_table(title: str, header: List[str], rows: List[List[Any]]) -> None:
+    """Wypisuje prostą tabelę wyników."""
+    print(f"\n{Fore.CYAN}{Style.BRIGHT}{title}")
+    widths = [max(len(str(v)) for v in col) for col in zip(header, *rows)]
+    print(Fore.CYAN + "  ".join(str(h).ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+
+def _run_questions(manager: OllamaModelManager, system_prompt: str, decompose_prompt: str, n: int) -> Dict[str, float]:
+    """Wykonuje n par (dekompozycja, odpowiedź) i sumuje prompt_eval."""
+    totals = {"prompt_eval_s": 0.0, "prompt_eval_tokens": 0, "model_time_s": 0.0}
+    for i in range(n):
+        question = SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]
+        for prompt in (
+            decompose_prompt.format(question=question),
+            system_prompt.format(context=SAMPLE_CONTEXT, question=question),
+        ):
+            stats = manager.generate_stats(prompt, num_predict=8)
+            totals["prompt_eval_s"] += stats["prompt_eval_duration"] / 1e9
+            totals["prompt_eval_tokens"] += stats["prompt_eval_count"]
+            totals["model_time_s"] += _model_time(stats)
+    return totals
+
+
+def bench_prefix(args: argparse.Namespace) -> None:
+    """Rozgrzewanie modeli i reużycie prefiksu promptu: przed vs po."""
+    rows = []
+
+    # 1. Pierwsze pytanie po starcie: bez rozgrzewania vs po rozgrzewaniu w tle
+    for label, warm in (("cold start", False), ("warm-up w tle", True)):
+        with FakeOllamaServer(time_scale=args.time_scale) as server:
+            manager = OllamaModelManager(server.base_url)
+            if warm:
+                manager.warm_up_async()
+                manager.wait_until_warm()
+            totals = _run_questions(manager, config.SYSTEM_PROMPT, config.DECOMPOSE_PROMPT, 1)
+        rows.append([f"1. pytanie ({label})", f"{totals['model_time_s']:.2f}", f"{totals['prompt_eval_s']:.2f}", totals["prompt_eval_tokens"]])
+
+    # 2. Seria pytań: dawne prompty vs wspólny prefiks (model już załadowany)
+    for label, system_prompt, decompose_prompt in (
+        ("dawne prompty", LEGACY_SYSTEM_PROMPT, LEGACY_DECOMPOSE_PROMPT),
+        ("wspólny prefiks", config.SYSTEM_PROMPT, config.DECOMPOSE_PROMPT),
+    ):
+        with FakeOllamaServer(time_scale=args.time_scale) as server:
+            manager = OllamaModelManager(server.base_url)
+            manager.generate_stats("", num_predict=0)  # tylko załadowanie modelu
+            totals = _run_questions(manager, system_prompt, decompose_prompt, args.questions)
+        rows.append([f"{args.questions} pytań ({label})", f"{totals['model_time_s']:.2f}", f"{totals['prompt_eval_s']:.2f}", totals["prompt_eval_tokens"]])
+
+    _print_table(
+        "Rozgrzewanie i reużycie prefiksu (czasy symulowane, s)",
+        ["scenariusz", "czas modelu", "prompt_eval", "tokeny prompt_eval"],
+        rows,
+    )
+
+
+def _load_documents(docs_dir: Path) -> List:
+    """Wczytuje PDF i Markdown z katalogu tak jak ingest.py / ingest_md.py."""
+    from langchain_community.document_loaders import PDFPlumberLoader, TextLoader
+
+    documents = []
+    for path in sorted(docs_dir.glob("**/*")):
+        if path.suffix.lower() == ".pdf":
+            documents.extend(PDFPlumberLoader(str(path)).load())
+        elif path.suffix.lower() == ".md":
+            documents.extend(TextLoader(str(path), encoding="utf-8").load())
+    return documents
+
+
+def _synthetic_documents() -> List:
+    """Przykładowy korpus, gdy katalog dokumentów jest pusty."""
+    from langchain_core.documents import Document
+
+    documents = []
+    for d in range(5):
+        sections = []
+        for s in range(6):
+            body = " ".join(
+                f"Zdanie {i} sekcji {s} opisuje konfigurację modułu {d} oraz parametr numer {i * s}."
+                for i in range(8 + 5 * (s % 3))
+            )
+            sections.append(f"## Sekcja {s}\n\n{body}\n\nKrótka uwaga końcowa.")
+        documents.append(Document(
+            page_content=f"# Dokument {d}\n\n" + "\n\n".join(sections),
+            metadata={"source": f"synthetic_{d}.md"},
+        ))
+    return documents
+
+
+def bench_chunking(args: argparse.Namespace) -> None:
+    """Porównanie chunkerów: liczba fragmentów, rozmiary i czas ingestii (embeddingi na fałszywej Ollama)."""
+    documents = _load_documents(args.docs) if args.docs.exists() else []
+    if not documents:
+        print(f"{Fore.YELLOW}⚠ Brak dokumentów w {args.docs} - używam korpusu syntetycznego")
+        documents = _synthetic_documents()
+
+    rows = []
+    for kind in ("recursive", "structure"):
+        start = time.perf_counter()
+        chunks = create_text_splitter(kind).split_documents(documents)
+        split_time = time.perf_counter() - start
+        sizes = [estimate_tokens(c.page_content) for c in chunks]
+
+        with FakeOllamaServer(time_scale=args.time_scale) as server:
+            embeddings = OllamaModelManager(server.base_url).create_embeddings()
+            embeddings.embed_query("warm-up")
+            start = time.perf_counter()
+            embeddings.embed_documents([c.page_content for c in chunks])
+            embed_time = time.perf_counter() - start
+
+        rows.append([
+            kind,
+            len(chunks),
+            f"{statistics.mean(sizes):.0f}" if sizes else "0",
+            max(sizes, default=0),
+            sum(1 for t in sizes if t < config.CHUNK_MIN_TOKENS),
+            f"{split_time:.2f}",
+            f"{embed_time:.2f}",
+        ])
+
+    _print_table(
+        f"Chunking: {len(documents)} dokumentów (embeddingi: fałszywa Ollama, time-scale {args.time_scale})",
+        ["chunker", "fragmenty", "śr. tokeny", "max tokeny", f"< {config.CHUNK_MIN_TOKENS} tok.", "podział [s]", "embeddingi [s]"],
+        rows,
+    )
+
+
+def _synthetic_chunks(n: int, seed: int = 0):
+    """Korpus ~n chunków po ~200 słów o rozkładzie zbliżonym do Zipfa (jak collection.get)."""
+    rng = random.Random(seed)
+    vocabulary = [f"termin{i}" for i in range(20000)]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    texts, metadatas = [], []
+    for i in range(n):
+        words = rng.choices(vocabulary, weights=weights, k=rng.randint(150, 250))
+        texts.append(" ".join(words).capitalize() + ".")
+        metadatas.append({"source": f"docs/dokument_{i // 40}.pdf", "page": (i % 40) // 4})
+    return {"documents": texts, "metadatas": metadatas}
+
+
+def _fetch(corpus):
+    """Świeża kopia korpusu, jak wynik collection.get (nowe napisy i słowniki)."""
+    return {
+        "documents": [text.encode("utf-8").decode("utf-8") for text in corpus["documents"]],
+        "metadatas": [dict(meta) for meta in corpus["metadatas"]],
+    }
+
+
+def _legacy_corpus(corpus):
+    """Układ sprzed CorpusStore: collection.get + BM25Okapi + BM25Retriever + słownik pozycji."""
+    from langchain_community.retrievers import BM25Retriever
+    from langchain_core.documents import Document
+    from rank_bm25 import BM25Okapi
+
+    all_documents = _fetch(corpus)
+    texts = all_documents["documents"]
+    bm25 = BM25Okapi([doc.lower().split() for doc in texts])
+    chunk_positions = {}
+    for idx, text in enumerate(texts):
+        chunk_positions.setdefault(text, idx)
+    retriever = BM25Retriever.from_documents(
+        documents=[Document(page_content=t, metadata=m or {}) for t, m in zip(texts, all_documents["metadatas"])],
+        k=config.RETRIEVER_K,
+    )
+    return all_documents, bm25, chunk_positions, retriever
+
+
+def _store_corpus(corpus, arena_path: Path):
+    """Układ z CorpusStore: arena mmap + SparseIndex + partycje."""
+    documents = _fetch(corpus)
+    store = CorpusStore.build(documents["documents"], documents["metadatas"], arena_path)
+    del documents
+    return store, SparseIndex(store.iter_texts()), SourcePartitions(store.records)
+
+
+def _traced(build):
+    """Buduje strukturę pod tracemalloc; zwraca (wynik, pamięć po starcie, szczyt, czas)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    """Pamięć korpusu: trzy kopie tekstu w stercie vs CorpusStore (tracemalloc)."""
+    mb = 1024 * 1024
+    rows = []
+
+    # Importy i generowanie korpusu poza pomiarem
+    importlib.import_module("langchain_community.retrievers")
+    corpus = _synthetic_chunks(args.chunks)
+
+    legacy, current, peak, elapsed = _traced(lambda: _legacy_corpus(corpus))
+    query = " ".join(legacy[0]["documents"][0].lower().split()[:5])
+    start = time.perf_counter()
+    legacy[3].invoke(query)
+    legacy_query = time.perf_counter() - start
+    rows.append(["collection.get + BM25Okapi + BM25Retriever", f"{current / mb:.1f}", f"{peak / mb:.1f}", "-", f"{elapsed:.2f}", f"{legacy_query * 1000:.1f}"])
+    legacy_current = current
+    del legacy
+    gc.collect()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (store, index, _), current, peak, elapsed = _traced(lambda: _store_corpus(corpus, Path(tmp) / config.CORPUS_ARENA_FILE))
+        start = time.perf_counter()
+        [store.document(pos) for pos, _ in index.top_k(query, config.RETRIEVER_K)]
+        store_query = time.perf_counter() - start
+        rows.append(["CorpusStore + SparseIndex", f"{current / mb:.1f}", f"{peak / mb:.1f}", f"{store.arena_bytes / mb:.1f}", f"{elapsed:.2f}", f"{store_query * 1000:.1f}"])
+        store_current = current
+        store.close()
+
+    _print_table(
+        f"Pamięć korpusu: {args.chunks} chunków (tracemalloc, sterta Pythona)",
+        ["układ", "po starcie [MB]", "szczyt [MB]", "arena mmap [MB]", "budowa [s]", "zapytanie BM25 [ms]"],
+        rows,
+    )
+    print(f"\n{Fore.GREEN}Sterta po starcie: {legacy_current / max(store_current, 1):.1f}x mniej "
+          f"(arena jest w page cache, współdzielona między procesami)")
+
+
+def bench_serving(args: argparse.Namespace) -> None:
+    """Pre-fork: czas startu, pamięć procesów roboczych i przepustowość vs liczba procesów."""
+    import os
+
+    corpus = _synthetic_chunks(args.chunks)
+    embedder = FakeOllamaServer()
+    embeddings = [embedder.embed(text) for text in corpus["documents"]]
+    rng = random.Random(1)
+    questions = [
+        "Co oznacza " + " i ".join(rng.choice(corpus["documents"]).split()[1:4]) + "?"
+        for _ in range(args.questions)
+    ]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        shared_index = SharedIndex.build(corpus["documents"], corpus["metadatas"], embeddings, Path(tmp))
+        build_time = time.perf_counter() - start
+        del corpus, embeddings
+
+        for workers in args.workers:
+            with FakeOllamaServer(time_scale=args.time_scale) as server:
+                pool = PreforkPool(shared_index, workers=workers, base_url=server.base_url)
+                try:
+                    startup = pool.start()
+                    info = pool.worker_stats()
+                    errors = [i["error"] for i in info if i.get("error")]
+                    if errors:
+                        raise RuntimeError(errors[0])
+                    start = time.perf_counter()
+                    outputs = [output for _, output in pool.imap_unordered(questions)]
+                    elapsed = time.perf_counter() - start
+                finally:
+                    pool.close()
+            failed = sum(1 for o in outputs if "error" in o)
+            rows.append([
+                workers,
+                f"{startup:.2f}",
+                f"{max(i['init_s'] for i in info):.3f}",
+                f"{statistics.mean(i.get('private_mb', 0.0) for i in info):.1f}",
+                f"{sum(i.get('pss_mb', 0.0) for i in info):.1f}",
+                f"{len(questions) / elapsed:.2f}",
+                failed,
+            ])
+
+    _print_table(
+        f"Pre-fork: {args.chunks} chunków, {args.questions} pytań, {os.cpu_count()} CPU "
+        f"(indeks zbudowany raz w {build_time:.2f}s, fałszywa Ollama, time-scale {args.time_scale})",
+        ["procesy", "start puli [s]", "start procesu [s]", "prywatna/proces [MB]", "PSS razem [MB]", "pytania/s", "błędy"],
+        rows,
+    )
+
+
+def bench_speculative(args: argparse.Namespace) -> None:
+    """Latencja ask(): dekompozycja, potem retrieval vs retrieval spekulatywny."""
+    import contextlib
+    import io
+
+    from advanced_rag import AdvancedRAGAgent
+
+    corpus = _synthetic_chunks(args.chunks)
+    embedder = FakeOllamaServer()
+    embeddings = [embedder.embed(text) for text in corpus["documents"]]
+    rng = random.Random(2)
+    questions = [
+        "Co oznacza " + " i ".join(rng.choice(corpus["documents"]).split()[1:4]) + "?"
+        for _ in range(args.questions)
+    ]
+    decompositions = (
+        ("niesparsowana (tekst)", "Nie potrafię rozbić tego pytania."),
+        ("2 sub-queries (JSON)", '{"subqueries": ["Co oznacza termin1?", "Gdzie występuje termin2?"]}'),
+    )
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_index = SharedIndex.build(corpus["documents"], corpus["metadatas"], embeddings, Path(tmp))
+        for label, response_text in decompositions:
+            for speculative in (False, True):
+                with FakeOllamaServer(time_scale=args.time_scale, response_text=response_text) as server, \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    agent = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False, speculative=speculative, cache_retrieval=False)
+                    agent.ask(questions[0])  # załadowanie modeli
+                    latencies = []
+                    for question in questions:
+                        start = time.perf_counter()
+                        agent.ask(question)
+                        latencies.append(time.perf_counter() - start)
+                rows.append([
+                    label,
+                    "tak" if speculative else "nie",
+                    f"{statistics.mean(latencies) * 1000:.1f}",
+                    f"{statistics.median(latencies) * 1000:.1f}",
+                ])
+
+    _print_table(
+        f"Wykonanie spekulatywne: {args.chunks} chunków, {args.questions} pytań (fałszywa Ollama, time-scale {args.time_scale})",
+        ["dekompozycja", "spekulatywnie", "śr. latencja [ms]", "mediana [ms]"],
+        rows,
+    )
+
+
+def _topical_chunks(n: int, chunks_per_doc: int = 40, seed: int = 3):
+    """Korpus ~n chunków w dokumentach o własnym słownictwie tematycznym (+ wspólne słowa Zipfa)."""
+    rng = random.Random(seed)
+    common = [f"termin{i}" for i in range(5000)]
+    weights = [1.0 / (rank + 1) for rank in range(len(common))]
+    cum_weights = list(itertools.accumulate(weights))
+    texts, metadatas = [], []
+    for i in range(n):
+        doc = i // chunks_per_doc
+        topic = [f"temat{doc}x{j}" for j in range(200)]
+        words = rng.choices(common, cum_weights=cum_weights, k=90) + rng.choices(topic, k=60)
+        rng.shuffle(words)
+        texts.append(" ".join(words))
+        metadatas.append({"source": f"docs/dokument_{doc}.pdf", "page": (i % chunks_per_doc) // 4})
+    return {"documents": texts, "metadatas": metadatas}
+
+
+def bench_coarse(args: argparse.Namespace) -> None:
+    """Wyszukiwanie dwuetapowe vs płaskie: latencja i recall@k wraz ze wzrostem korpusu."""
+    from advanced_rag import HybridRetriever
+
+    embedder = FakeOllamaServer()
+    k = config.RETRIEVER_K
+    rows = []
+    for n in args.chunks:
+        corpus = _topical_chunks(n)
+        matrix = np.asarray([embedder.embed(text) for text in corpus["documents"]], dtype=np.float32)
+        rng = random.Random(4)
+        queries = []
+        for _ in range(args.questions):
+            # Pytanie o konkretny fragment: głównie słowa tematyczne dokumentu + kilka ogólnych
+            source = rng.randrange(n)
+            words = corpus["documents"][source].split()
+            topical = [w for w in words if w.startswith("temat")]
+            common = [w for w in words if not w.startswith("temat")]
+            query = " ".join(rng.sample(topical, 4) + rng.sample(common, 2))
+            queries.append((source, query, embedder.embed(query)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CorpusStore.build(corpus["documents"], corpus["metadatas"], Path(tmp) / config.CORPUS_ARENA_FILE)
+            sparse_index = SparseIndex(store.iter_texts())
+            dense = DenseRetriever(DenseIndex(matrix), store, embeddings=None)
+            coarse_index = CoarseIndex.from_vectors(
+                [group_key(r.source, r.heading_path) for r in store.records], matrix
+            ).attach(store.records)
+            retrievers = {"płasko": HybridRetriever(dense, sparse_index, store)}
+            for top in args.top_docs:
+                retrievers[f"top {top} dok."] = HybridRetriever(
+                    dense, sparse_index, store, coarse_index=coarse_index, coarse_top=top
+                )
+
+            flat_results = None
+            for label, retriever in retrievers.items():
+                latencies, results = [], []
+                for _, query, embedding in queries:
+                    start = time.perf_counter()
+                    ranked = retriever.invoke_with_scores(query, k=k, query_embedding=embedding)
+                    latencies.append(time.perf_counter() - start)
+                    results.append([store.position_of(doc) for doc, _ in ranked])
+                if flat_results is None:
+                    flat_results = results
+                recall = statistics.mean(
+                    len(set(found) & set(flat)) / max(len(flat), 1) for found, flat in zip(results, flat_results)
+                )
+                hit = statistics.mean(source in found for (source, _, _), found in zip(queries, results))
+                rows.append([
+                    n, len(coarse_index), label,
+                    f"{statistics.mean(latencies) * 1000:.2f}",
+                    f"{sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000:.2f}",
+                    f"{recall:.3f}", f"{hit:.3f}",
+                ])
+            store.close()
+
+    _print_table(
+        f"Wyszukiwanie dwuetapowe vs płaskie: {args.questions} zapytań, k={k} (embeddingi fałszywej Ollama, bez HTTP)",
+        ["chunki", "dokumenty", "wyszukiwanie", "śr. latencja [ms]", "p95 [ms]", f"recall@{k} vs płaskie", "trafienie chunka źródłowego"],
+        rows,
+    )
+
+
+_ENDINGS = ("a", "i", "ę", "ą", "y", "ami", "ach", "ów", "ie", "om")
+_PUNCTUATION = ("", "", "", ",", ".", ":", ")")
+
+
+def _inflect(stem: str, rng: random.Random, fold: bool = False) -> str:
+    """Słowo z losową końcówką; fold=True zapisuje je bez polskich znaków."""
+    word = stem + rng.choice(_ENDINGS)
+    return word.translate(str.maketrans("ąćęłńóśźż", "acelnoszz")) if fold else word
+
+
+def _inflected_chunks(n: int, seed: int = 5):
+    """Korpus z odmianą, interpunkcją i wielkimi literami (jak tekst PL), słowa o rozkładzie Zipfa."""
+    rng = random.Random(seed)
+    stems = [f"{rng.choice(('pomiar', 'łącz', 'instalacj', 'wymagań', 'moduł'))}{i}" for i in range(8000)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(stems))))
+    texts, chunk_stems = [], []
+    for _ in range(n):
+        chosen = rng.choices(stems, cum_weights=cum_weights, k=rng.randint(120, 200))
+        words = [_inflect(stem, rng) + rng.choice(_PUNCTUATION) for stem in chosen]
+        words = [w.capitalize() if rng.random() < 0.1 else w for w in words]
+        texts.append(" ".join(words))
+        chunk_stems.append(chosen)
+    return texts, chunk_stems
+
+
+def bench_tokenizer(args: argparse.Namespace) -> None:
+    """Tokenizer BM25: lower().split() vs normalizujący - słownik, szybkość, start agenta i trafienia."""
+    texts, chunk_stems = _inflected_chunks(args.chunks)
+    rng = random.Random(6)
+    # Pytanie o fragment innymi formami tych samych słów (czasem bez polskich znaków)
+    queries = []
+    for _ in range(args.questions):
+        source = rng.randrange(len(texts))
+        rare = sorted(set(chunk_stems[source]), key=lambda stem: int("".join(filter(str.isdigit, stem))))[-3:]
+        queries.append((source, " ".join(_inflect(stem, rng, fold=rng.random() < 0.5) for stem in rare)))
+    megabytes = sum(len(t.encode("utf-8")) for t in texts) / (1024 * 1024)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CorpusStore.build(texts, [{"source": "docs/korpus.md"}] * len(texts), Path(tmp) / config.CORPUS_ARENA_FILE)
+        for kind in ("whitespace", "normalized"):
+            tokenize = create_tokenizer(kind)
+            start = time.perf_counter()
+            for text in texts:
+                tokenize(text)
+            tokenize_s = time.perf_counter() - start
+
+            directory = Path(tmp) / kind
+            start = time.perf_counter()
+            index, _ = SparseIndex.cached(store, directory, tokenize, rebuild=True)
+            build_s = time.perf_counter() - start
+            start = time.perf_counter()
+            index, cached = SparseIndex.cached(store, directory, create_tokenizer(kind))
+            load_s = time.perf_counter() - start
+
+            hits = statistics.mean(
+                source in [pos for pos, _ in index.top_k(query, config.RETRIEVER_K)] for source, query in queries
+            )
+            rows.append([
+                kind, len(index.term_hashes), f"{megabytes / tokenize_s:.1f}",
+                f"{build_s:.2f}", f"{load_s * 1000:.1f}" + ("" if cached else " (!)"), f"{hits:.3f}",
+            ])
+        store.close()
+
+    _print_table(
+        f"Tokenizer BM25: {args.chunks} chunków ({megabytes:.1f} MB), {args.questions} zapytań w innych formach słów",
+        ["tokenizer", "termy", "tokenizacja [MB/s]", "budowa indeksu [s]", "start z zapisu [ms]", f"trafienie@{config.RETRIEVER_K}"],
+        rows,
+    )
+
+
+def bench_deadline(args: argparse.Namespace) -> None:
+    """Latencja ask() z budżetem: degradacje i anulowanie trwającego pytania."""
+    import contextlib
+    import io
+    import threading
+
+    from advanced_rag import AdvancedRAGAgent
+    from ollama_client import CancelToken, OllamaCancelled
+
+    corpus = _synthetic_chunks(args.chunks)
+    embedder = FakeOllamaServer()
+    embeddings = [embedder.embed(text) for text in corpus["documents"]]
+    rng = random.Random(4)
+    questions = [
+        "Co oznacza " + " i ".join(rng.choice(corpus["documents"]).split()[1:4]) + "?"
+        for _ in range(args.questions)
+    ]
+    # Tempo fałszywego modelu = tempo zakładane w config (time-scale 1: budżety w prawdziwych sekundach)
+    server_kwargs = dict(
+        load_time=0.0,
+        prompt_eval_per_token=1 / config.DEADLINE_PREFILL_TOKENS_PER_S,
+        eval_per_token=1 / config.DEADLINE_DECODE_TOKENS_PER_S,
+        response_text=" ".join(f"słowo{i}" for i in range(args.answer_tokens)),
+        stream_tokens=True,
+    )
+
+    rows = []
+    cancel_latencies = []
+    aborted = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_index = SharedIndex.build(corpus["documents"], corpus["metadatas"], embeddings, Path(tmp))
+        with FakeOllamaServer(**server_kwargs) as server, contextlib.redirect_stdout(io.StringIO()):
+            agent = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False, cache_retrieval=False)
+            for budget in [None] + args.budgets:
+                latencies, tokens, degradations, errors = [], [], {}, 0
+                for question in questions:
+                    start = time.perf_counter()
+                    try:
+                        result = agent.ask(question, budget_s=budget)
+                    except Exception:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+                    tokens.append(len(result["answer"].split()))
+                    for code in result["degradations"]:
+                        name = code.split(":")[0]
+                        degradations[name] = degradations.get(name, 0) + 1
+                rows.append([
+                    "brak" if budget is None else f"{budget:.1f}",
+                    f"{statistics.mean(latencies):.2f}" if latencies else "-",
+                    f"{max(latencies):.2f}" if latencies else "-",
+                    f"{statistics.mean(tokens):.0f}" if tokens else "-",
+                    ", ".join(f"{name} x{count}" for name, count in sorted(degradations.items())) or "-",
+                    errors,
+                ])
+
+            # Anulowanie w trakcie pytania: czas od cancel() do powrotu z ask()
+            aborted = server.stats.get("cancelled_generations", 0)
+            for question in questions:
+                token = CancelToken()
+                outcome: Dict[str, float] = {}
+
+                def run() -> None:
+                    try:
+                        agent.ask(question, cancel=token)
+                    except OllamaCancelled:
+                        outcome["returned"] = time.perf_counter()
+
+                thread = threading.Thread(target=run)
+                thread.start()
+                time.sleep(args.cancel_after)
+                cancelled_at = time.perf_counter()
+                token.cancel()
+                thread.join()
+                if "returned" in outcome:
+                    cancel_latencies.append(outcome["returned"] - cancelled_at)
+            time.sleep(1.0)  # serwer zauważa rozłączenie przy wysyłce kolejnego tokenu
+            aborted = server.stats.get("cancelled_generations", 0) - aborted
+
+    _print_table(
+        f"Budżet latencji: {args.chunks} chunków, {args.questions} pytań, odpowiedź {args.answer_tokens} tokenów "
+        f"(fałszywa Ollama: {config.DEADLINE_PREFILL_TOKENS_PER_S:.0f} tok/s promptu, "
+        f"{config.DEADLINE_DECODE_TOKENS_PER_S:.0f} tok/s generacji)",
+        ["budżet [s]", "śr. latencja [s]", "maks. [s]", "tokeny odpowiedzi", "degradacje", "błędy"],
+        rows,
+    )
+    if cancel_latencies:
+        print(
+            f"{Fore.CYAN}Anulowanie po {args.cancel_after:.1f}s: powrót z ask() po "
+            f"{statistics.mean(cancel_latencies) * 1000:.1f} ms (maks. {max(cancel_latencies) * 1000:.1f} ms, "
+            f"{len(cancel_latencies)}/{len(questions)} pytań); generacje przerwane przez serwer: {aborted}"
+        )
+
+
+def _spectral_embeddings(n: int, dim: int = 768, topics: int = 200, rotate: bool = True, seed: int = 6) -> np.ndarray:
+    """
+    Syntetyczne embeddingi o malejącym widmie (jak prawdziwe: mała wymiarowość wewnętrzna).
+
+    Chunki skupiają się wokół tematów; wariancja kolejnych osi maleje potęgowo.
+    rotate=False zostawia ją uporządkowaną wg wymiarów (model typu Matryoshka),
+    rotate=True rozprasza ją losowym obrotem (zwykły model - pomaga tylko PCA).
+    """
+    rng = np.random.default_rng(seed)
+    scale = (np.arange(1, dim + 1, dtype=np.float32) ** -0.5).astype(np.float32)
+    centers = rng.standard_normal((topics, dim), dtype=np.float32) * scale
+    vectors = centers[rng.integers(0, topics, n)] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32) * scale
+    if rotate:
+        rotation, _ = np.linalg.qr(rng.standard_normal((dim, dim)))
+        vectors = vectors @ rotation.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_reduction(args: argparse.Namespace) -> None:
+    """Redukcja wymiaru embeddingów: recall@k i latencja wyszukiwania vs pełne wektory."""
+    k = config.RETRIEVER_FETCH_K
+    rows = []
+    for method, rotate in (("pca", True), ("prefix", False)):
+        matrix = _spectral_embeddings(args.chunks, rotate=rotate)
+        rng = np.random.default_rng(7)
+        # Zapytania: zaszumione embeddingi losowych chunków
+        queries = matrix[rng.integers(0, len(matrix), args.questions)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32) / np.sqrt(matrix.shape[1])
+        full = DenseIndex(matrix)
+        exact = [set(full.nearest(q, k)) for q in queries]
+        start = time.perf_counter()
+        for q in queries:
+            full.nearest(q, k)
+        full_ms = (time.perf_counter() - start) / len(queries) * 1000
+        rows.append([method, matrix.shape[1], "-", "1.000", f"{full_ms:.2f}", "1.0x", f"{full.nbytes / 2**20:.0f}", "-"])
+
+        for dim in args.dims:
+            start = time.perf_counter()
+            reducer = EmbeddingReducer.fit(matrix, method, dim)
+            reduced = reducer.transform(matrix)
+            fit_s = time.perf_counter() - start
+            for factor in args.factors:
+                index = DenseIndex(matrix, reducer, reduced, rescore_factor=factor)
+                found = [index.nearest(q, k) for q in queries]
+                start = time.perf_counter()
+                for q in queries:
+                    index.nearest(q, k)
+                ms = (time.perf_counter() - start) / len(queries) * 1000
+                recall = statistics.mean(len(exact[i].intersection(found[i])) / k for i in range(len(queries)))
+                rows.append([
+                    method, dim, factor, f"{recall:.3f}", f"{ms:.2f}", f"{full_ms / ms:.1f}x",
+                    f"{(index.reduced.nbytes + index.reduced_sq_norms.nbytes) / 2**20:.0f} (+pełne)",
+                    f"{reducer.explained:.1%}, dopasowanie {fit_s:.2f}s",
+                ])
+
+    _print_table(
+        f"Redukcja wymiaru: {args.chunks} chunków, {args.questions} zapytań, recall@{k} względem pełnych wektorów "
+        f"(pca: embeddingi z losowym obrotem, prefix: wariancja uporządkowana jak w Matryoshka)",
+        ["metoda", "wymiar", "shortlista x k", f"recall@{k}", "latencja [ms]", "przyspieszenie", "macierz [MB]", "wariancja"],
+        rows,
+    )
+
+
+def bench_snapshot(args: argparse.Namespace) -> None:
+    """Snapshot indeksu: rozmiar, eksport i import vs przebudowa wspólnego indeksu z treści."""
+    corpus = _topical_chunks(args.chunks)
+    matrix = _spectral_embeddings(args.chunks)
+    k = config.RETRIEVER_FETCH_K
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        start = time.perf_counter()
+        built = SharedIndex.build(corpus["documents"], corpus["metadatas"], matrix, tmp / "built")
+        build_s = time.perf_counter() - start
+        rows = [["przebudowa (bez embeddingów)", "-", "-", f"{build_s:.2f}", "-", "-"]]
+        raw_mb = (built.store.arena_bytes + matrix.nbytes + built.sparse_index.nbytes) / 1e6
+
+        for level in args.levels:
+            path = tmp / f"index-{level}.ragsnap"
+            start = time.perf_counter()
+            write_snapshot(path, corpus["documents"], corpus["metadatas"], matrix, built.sparse_index, compresslevel=level)
+            export_s = time.perf_counter() - start
+            start = time.perf_counter()
+            path.read_bytes()
+            read_s = time.perf_counter() - start
+            start = time.perf_counter()
+            restored = restore_shared(read_snapshot(path), tmp / f"restored-{level}")
+            import_s = time.perf_counter() - start
+
+            # Odtworzony indeks musi zwracać te same wyniki co zbudowany
+            rng = np.random.default_rng(level)
+            same = all(
+                built.dense_index.nearest(matrix[i], k) == restored.dense_index.nearest(matrix[i], k)
+                and built.sparse_index.top_k(corpus["documents"][i][:80], k) == restored.sparse_index.top_k(corpus["documents"][i][:80], k)
+                for i in rng.integers(0, args.chunks, 50)
+            )
+            rows.append([
+                f"snapshot zlib {level}", f"{path.stat().st_size / 1e6:.1f}", f"{export_s:.2f}",
+                f"{import_s:.2f}", f"{read_s:.3f}", "tak" if same else "NIE",
+            ])
+
+    _print_table(
+        f"Snapshot indeksu: {args.chunks} chunków, {matrix.shape[1]}D, kolumny {raw_mb:.1f} MB "
+        f"(import = weryfikacja SHA-256 + arena, BM25 i embeddingi przez mmap)",
+        ["wariant", "plik [MB]", "eksport [s]", "odtworzenie [s]", "odczyt pliku [s]", "te same wyniki"],
+        rows,
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Percentyl q (0..1) metodą najbliższego rangą."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def bench_async(args: argparse.Namespace) -> None:
+    """Przepustowość: aask() w jednej pętli zdarzeń vs ask() w wątku na pytanie."""
+    import asyncio
+    import contextlib
+    import io
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from advanced_rag import AdvancedRAGAgent
+    from ollama_client import get_async_client
+
+    corpus = _synthetic_chunks(args.chunks)
+    embedder = FakeOllamaServer()
+    embeddings = [embedder.embed(text) for text in corpus["documents"]]
+    rng = random.Random(5)
+    questions = [
+        "Co oznacza " + " i ".join(rng.choice(corpus["documents"]).split()[1:4]) + "?"
+        for _ in range(args.questions)
+    ]
+    response_text = '{"subqueries": ["Co oznacza termin1?", "Gdzie występuje termin2?"]}'
+
+    def sample_threads(stop: threading.Event, peak: List[int]) -> None:
+        while not stop.wait(0.005):
+            peak[0] = max(peak[0], threading.active_count())
+
+    async def run_async(agent, concurrency: int):
+        slots = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def one(question: str) -> None:
+            async with slots:
+                start = time.perf_counter()
+                await agent.aask(question, budget_s=None)
+                latencies.append(time.perf_counter() - start)
+
+        await agent.aask(questions[0], budget_s=None)  # załadowanie modeli
+        client = get_async_client(agent.model_manager.base_url)
+        throttled = client.stats["throttled"]
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in questions))
+        return time.perf_counter() - start, latencies, client.stats["throttled"] - throttled
+
+    def run_threads(agent, concurrency: int):
+        latencies: List[float] = []
+
+        def one(question: str) -> None:
+            start = time.perf_counter()
+            agent.ask(question, budget_s=None)
+            latencies.append(time.perf_counter() - start)
+
+        agent.ask(questions[0], budget_s=None)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            list(pool.map(one, questions))
+            return time.perf_counter() - start, latencies, 0
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_index = SharedIndex.build(corpus["documents"], corpus["metadatas"], embeddings, Path(tmp))
+        for mode in ("async", "threads"):
+            for concurrency in args.concurrency:
+                with FakeOllamaServer(time_scale=args.time_scale, response_text=response_text, parallel=args.parallel) as server, \
+                        contextlib.redirect_stdout(io.StringIO()):
+                    agent = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False, cache_retrieval=False)
+                    baseline = threading.active_count()
+                    stop, peak = threading.Event(), [baseline]
+                    sampler = threading.Thread(target=sample_threads, args=(stop, peak), daemon=True)
+                    sampler.start()
+                    if mode == "async":
+                        elapsed, latencies, throttled = asyncio.run(run_async(agent, concurrency))
+                    else:
+                        elapsed, latencies, throttled = run_threads(agent, concurrency)
+                    stop.set()
+                    sampler.join()
+                rows.append([
+                    "aask (asyncio)" if mode == "async" else "ask (wątek/pytanie)",
+                    concurrency,
+                    f"{len(questions) / elapsed:.1f}",
+                    f"{_percentile(latencies, 0.5) * 1000:.0f}",
+                    f"{_percentile(latencies, 0.95) * 1000:.0f}",
+                    peak[0] - baseline,
+                    throttled if mode == "async" else "-",
+                ])
+
+    _print_table(
+        f"API asynchroniczne: {args.chunks} chunków, {len(questions)} pytań, fałszywa Ollama "
+        f"(parallel {args.parallel}, time-scale {args.time_scale}), semafor klienta {config.ASYNC_OLLAMA_CONCURRENCY}",
+        ["wariant", "równolegle", "pytania/s", "p50 [ms]", "p95 [ms]", "dodatkowe wątki (z serwerem)", "czekały w kolejce"],
+        rows,
+    )
+
+
+def bench_scheduler(args: argparse.Namespace) -> None:
+    """Pytania interaktywne przy obciążeniu wsadowym: bez kolejki vs LLMScheduler."""
+    import threading
+
+    from ollama_client import OllamaClient
+    from scheduler import LLMScheduler, llm_priority
+
+    words = [f"termin{i}" for i in range(5000)]
+
+    def prompt(tokens: int, seed: int) -> str:
+        # Różne prompty - bez reużycia KV cache między wywołaniami
+        rng = random.Random(seed)
+        return " ".join(rng.choices(words, k=tokens))
+
+    rows = []
+    for label, scheduler in (
+        ("bez kolejki", None),
+        ("LLMScheduler", LLMScheduler(max_concurrent=args.parallel, short_reserved=1)),
+    ):
+        with FakeOllamaServer(time_scale=args.time_scale, load_time=0.0, parallel=args.parallel,
+                              response_text=" ".join(["słowo"] * 200)) as server:
+            client = OllamaClient(server.base_url, scheduler=scheduler)
+            stop = threading.Event()
+            batch_done = [0]
+
+            def batch_worker(worker: int) -> None:
+                with llm_priority("batch"):
+                    for i in itertools.count():
+                        if stop.is_set():
+                            return
+                        client.generate(prompt(800, worker * 100000 + i), options={"num_predict": 200})
+                        batch_done[0] += 1
+
+            workers = [threading.Thread(target=batch_worker, args=(w,), daemon=True) for w in range(args.batch_workers)]
+            for worker in workers:
+                worker.start()
+            time.sleep(1.0)  # kolejka wsadowa zapełniona
+
+            decompose_s, answer_s, total_s = [], [], []
+            start = time.perf_counter()
+            batch_start = batch_done[0]
+            for q in range(args.questions):
+                t0 = time.perf_counter()
+                with llm_priority("interactive", short=True):
+                    client.generate(prompt(200, -q - 1), options={"num_predict": 40})
+                t1 = time.perf_counter()
+                with llm_priority("interactive"):
+                    client.generate(prompt(1500, -q - 1000), options={"num_predict": 200})
+                t2 = time.perf_counter()
+                decompose_s.append(t1 - t0)
+                answer_s.append(t2 - t1)
+                total_s.append(t2 - t0)
+            elapsed = time.perf_counter() - start
+            batch_rate = (batch_done[0] - batch_start) / elapsed
+            stop.set()
+            for worker in workers:
+                worker.join()
+            client.close()
+
+        rows.append([
+            label,
+            f"{statistics.median(decompose_s) * 1000:.0f}",
+            f"{max(decompose_s) * 1000:.0f}",
+            f"{statistics.median(answer_s) * 1000:.0f}",
+            f"{statistics.median(total_s) * 1000:.0f}",
+            f"{max(total_s) * 1000:.0f}",
+            f"{batch_rate:.2f}",
+        ])
+        if scheduler is not None:
+            for name, queue in scheduler.stats().items():
+                if queue["granted"]:
+                    print(
+                        f"{Fore.CYAN}  {name}: {queue['granted']} wywołań, maks. kolejka {queue['max_queued']}, "
+                        f"czekanie śr. {queue['wait_avg_ms']:.0f} ms, p95 {queue['wait_p95_ms']:.0f} ms"
+                    )
+
+    _print_table(
+        f"Kolejka generacji: {args.questions} pytań interaktywnych przy {args.batch_workers} wątkach wsadowych "
+        f"(fałszywa Ollama: parallel {args.parallel}, time-scale {args.time_scale})",
+        ["wariant", "dekompozycja p50 [ms]", "maks. [ms]", "odpowiedź p50 [ms]", "pytanie p50 [ms]", "maks. [ms]", "wsad [wyw./s]"],
+        rows,
+    )
+
+
+def _fact_chunks(n: int, sentences: int = 7, seed: int = 8):
+    """Chunki z kilku zdań tematycznych i jednego zdania-faktu ("Parametr kodN wynosi V jednostek")."""
+    rng = random.Random(seed)
+    common = [f"termin{i}" for i in range(3000)]
+    texts, metadatas, facts = [], [], []
+    for i in range(n):
+        doc = i // 40
+        topic = [f"temat{doc}x{j}" for j in range(100)]
+        parts = [
+            " ".join(rng.choices(common, k=8) + rng.choices(topic, k=6)).capitalize() + "."
+            for _ in range(sentences - 1)
+        ]
+        fact = f"Parametr kod{i} wynosi {rng.randint(10, 999)} jednostek w trybie standardowym."
+        parts.insert(rng.randrange(sentences), fact)
+        texts.append(" ".join(parts))
+        metadatas.append({"source": f"docs/dokument_{doc}.pdf", "page": (i % 40) // 4})
+        facts.append(fact)
+    return {"documents": texts, "metadatas": metadatas}, facts
+
+
+def bench_compression(args: argparse.Namespace) -> None:
+    """Kompresja ekstrakcyjna kontekstu: tokeny promptu, zachowanie faktów i latencja odpowiedzi."""
+    import contextlib
+    import io
+
+    from advanced_rag import AdvancedRAGAgent
+
+    corpus, facts = _fact_chunks(args.chunks)
+    embedder = FakeOllamaServer()
+    embeddings = [embedder.embed(text) for text in corpus["documents"]]
+    rng = random.Random(9)
+    targets = rng.sample(range(args.chunks), args.questions)
+    questions = [(f"Ile wynosi parametr kod{i}?", facts[i]) for i in targets]
+    # Tempo fałszywego modelu jak w config (prompt 250 tok/s, generacja 20 tok/s), skalowane --time-scale
+    server_kwargs = dict(
+        load_time=0.0,
+        prompt_eval_per_token=1 / config.DEADLINE_PREFILL_TOKENS_PER_S,
+        eval_per_token=1 / config.DEADLINE_DECODE_TOKENS_PER_S,
+        time_scale=args.time_scale,
+    )
+
+    rows = []
+    baseline_tokens = None
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_index = SharedIndex.build(corpus["documents"], corpus["metadatas"], embeddings, Path(tmp))
+        with FakeOllamaServer(**server_kwargs) as server, contextlib.redirect_stdout(io.StringIO()):
+            agent = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False, compress=True, cache_retrieval=False)
+            # Płaskie wyszukiwanie: mierzymy kompresję, nie wybór dokumentów po centroidach
+            agent.retriever.coarse_top = 0
+            compressor = agent.compressor
+            generate = agent._generate_answer
+            captured: Dict[str, Any] = {}
+
+            def timed_generate(context, question, deadline):
+                captured["context"] = context
+                start = time.perf_counter()
+                try:
+                    return generate(context, question, deadline)
+                finally:
+                    captured["generate_s"] = time.perf_counter() - start
+
+            agent._generate_answer = timed_generate
+            agent.ask(questions[0][0])  # połączenia i pierwsze wywołania poza pomiarem
+
+            for ratio in [None] + args.ratios:
+                agent.context_packer.compressor = None if ratio is None else compressor
+                if ratio is not None:
+                    compressor.keep_ratio = ratio
+                    compressor._cache.clear()
+                measured = {}
+                for run in ("cold", "warm"):
+                    tokens, recalled, latencies, generation, compress_ms = [], 0, [], [], []
+                    for question, fact in questions:
+                        start = time.perf_counter()
+                        result = agent.ask(question)
+                        latencies.append(time.perf_counter() - start)
+                        generation.append(captured["generate_s"])
+                        tokens.append(result["context_tokens"])
+                        recalled += fact in captured["context"]
+                        if result["compression"] is not None:
+                            compress_ms.append(result["compression"]["seconds"] * 1000)
+                    measured[run] = (tokens, recalled, latencies, generation, compress_ms)
+                    if ratio is None:
+                        break
+                tokens, recalled, latencies, generation, compress_ms = measured.get("warm", measured["cold"])
+                mean_tokens = statistics.mean(tokens)
+                if ratio is None:
+                    baseline_tokens = mean_tokens
+                cold_ms = measured["cold"][4]
+                rows.append([
+                    "bez kompresji" if ratio is None else f"{ratio:.2f}",
+                    f"{mean_tokens:.0f}",
+                    "-" if ratio is None else f"{1 - mean_tokens / baseline_tokens:.0%}",
+                    f"{recalled}/{len(questions)}",
+                    "-" if ratio is None else f"{statistics.mean(cold_ms):.0f} / {statistics.mean(compress_ms):.1f}",
+                    f"{statistics.mean(generation) * 1000:.0f}",
+                    f"{_percentile(latencies, 0.5) * 1000:.0f}",
+                    f"{_percentile(latencies, 0.95) * 1000:.0f}",
+                ])
+
+    _print_table(
+        f"Kompresja kontekstu: {args.chunks} chunków po 7 zdań, {len(questions)} pytań o fakt z jednego zdania "
+        f"(fałszywa Ollama: {config.DEADLINE_PREFILL_TOKENS_PER_S:.0f} tok/s promptu, time-scale {args.time_scale})",
+        ["zostawione tokeny", "kontekst [tok]", "redukcja", "fakt w kontekście", "kompresja zimna/ciepła [ms]",
+         "generacja [ms]", "pytanie p50 [ms]", "p95 [ms]"],
+        rows,
+    )
+
+
+def bench_retrieval_cache(args: argparse.Namespace) -> None:
+    """Cache wyników retrievalu: powtarzające się sub-queries, restart (warstwa dyskowa) i nowa wersja indeksu."""
+    import contextlib
+    import io
+
+    from advanced_rag import AdvancedRAGAgent
+
+    corpus = _synthetic_chunks(args.chunks)
+    embedder = FakeOllamaServer()
+    embeddings = [embedder.embed(text) for text in corpus["documents"]]
+    rng = random.Random(10)
+    distinct = [
+        "Co oznacza " + " i ".join(rng.choice(corpus["documents"]).split()[1:4]) + "?"
+        for _ in range(args.distinct)
+    ]
+    # Rozkład Zipfa: kilka sub-queries wraca bardzo często, reszta rzadko
+    workload = rng.choices(distinct, weights=[1 / (i + 1) for i in range(len(distinct))], k=args.queries)
+    # Zmiana wielkości liter i spacji nie zmienia klucza (normalize_query)
+    workload = [query.upper() if i % 3 == 0 else f"  {query} " for i, query in enumerate(workload)]
+
+    def ranking(results) -> List[Any]:
+        return [(doc.metadata["chunk_id"], round(score, 6)) for doc, score in results]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_index = SharedIndex.build(corpus["documents"], corpus["metadatas"], embeddings, Path(tmp))
+        with FakeOllamaServer(time_scale=args.time_scale) as server, contextlib.redirect_stdout(io.StringIO()):
+            def run(agent, label: str, expected=None) -> Dict[str, List[Any]]:
+                latencies, rankings = [], {}
+                stats_before = agent.result_cache.stats() if agent.result_cache is not None else None
+                for query in workload:
+                    start = time.perf_counter()
+                    results = agent._retrieve(query)
+                    latencies.append(time.perf_counter() - start)
+                    rankings[query.strip().lower()] = ranking(results)
+                if stats_before is None:
+                    hit_ratio = "-"
+                else:
+                    stats = agent.result_cache.stats()
+                    hits = stats["memory_hits"] + stats["disk_hits"] - stats_before["memory_hits"] - stats_before["disk_hits"]
+                    hit_ratio = f"{hits / len(workload):.0%} (dysk {stats['disk_hits'] - stats_before['disk_hits']})"
+                same = "-" if expected is None else f"{sum(rankings[q] == expected[q] for q in rankings)}/{len(rankings)}"
+                rows.append([
+                    label,
+                    hit_ratio,
+                    f"{statistics.mean(latencies) * 1000:.2f}",
+                    f"{_percentile(latencies, 0.5) * 1000:.2f}",
+                    f"{_percentile(latencies, 0.95) * 1000:.2f}",
+                    same,
+                ])
+                return rankings
+
+            agent = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False, cache_retrieval=False)
+            agent._retrieve(distinct[0])  # połączenia poza pomiarem
+            expected = run(agent, "bez cache")
+
+            agent = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False)
+            run(agent, "cache (start od zera)", expected)
+            run(agent, "cache (ponownie)", expected)
+            # Nowy proces: pusta pamięć, wyniki z pliku SQLite obok areny korpusu
+            restarted = AdvancedRAGAgent(shared_index=shared_index, base_url=server.base_url, warm_up=False)
+            run(restarted, "restart (warstwa dyskowa)", expected)
+            # Ingestia zatwierdza nową wersję indeksu - stare wyniki nie mogą zostać użyte
+            restarted.result_cache.set_version(f"{restarted._cache_version(restarted.retriever.vector_retriever)}+ingest")
+            run(restarted, "nowa wersja indeksu", expected)
+
+    _print_table(
+        f"Cache retrievalu: {args.chunks} chunków, {args.queries} wyszukiwań ({args.distinct} różnych sub-queries, Zipf; "
+        f"fałszywa Ollama, time-scale {args.time_scale})",
+        ["przebieg", "trafienia", "śr. [ms]", "p50 [ms]", "p95 [ms]", "ranking jak bez cache"],
+        rows,
+    )
+
+
+def main() -> None:
+    """Parsuje argumenty i uruchamia wybrany benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmarki Local RAG Agent (fałszywy serwer Ollama)")
+    parser.add_argument("--time-scale", type=float, default=0.001, help="Mnożnik czasów symulacji")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    prefix = subparsers.add_parser("prefix", help="Rozgrzewanie modeli i reużycie prefiksu promptu")
+    prefix.add_argument("--questions", type=int, default=20)
+    prefix.set_defaults(func=bench_prefix)
+
+    chunking = subparsers.add_parser("chunking", help="Chunker strukturalny vs RecursiveCharacterTextSplitter")
+    chunking.add_argument("--docs", type=Path, default=config.DOCS_DIR)
+    chunking.set_defaults(func=bench_chunking)
+
+    memory = subparsers.add_parser("memory", help="Pamięć korpusu: dawny układ vs CorpusStore")
+    memory.add_argument("--chunks", type=int, default=5000)
+    memory.set_defaults(func=bench_memory)
+
+    serving = subparsers.add_parser("serving", help="Pre-fork: skalowanie z liczbą procesów roboczych")
+    serving.add_argument("--chunks", type=int, default=10000)
+    serving.add_argument("--questions", type=int, default=64)
+    serving.add_argument("--workers", type=lambda v: [int(n) for n in v.split(",")], default=[1, 2, 4])
+    serving.set_defaults(func=bench_serving)
+
+    speculative = subparsers.add_parser("speculative", help="Retrieval równolegle z dekompozycją pytania")
+    speculative.add_argument("--chunks", type=int, default=5000)
+    speculative.add_argument("--questions", type=int, default=20)
+    speculative.set_defaults(func=bench_speculative)
+
+    coarse = subparsers.add_parser("coarse", help="Wyszukiwanie dwuetapowe (centroidy dokumentów) vs płaskie")
+    coarse.add_argument("--chunks", type=lambda v: [int(n) for n in v.split(",")], default=[2000, 5000, 10000])
+    coarse.add_argument("--questions", type=int, default=50)
+    coarse.add_argument("--top-docs", type=lambda v: [int(n) for n in v.split(",")], default=[config.COARSE_TOP_DOCS, 20])
+    coarse.set_defaults(func=bench_coarse)
+
+    tokenizer = subparsers.add_parser("tokenizer", help="Tokenizer BM25: lower().split() vs normalizujący")
+    tokenizer.add_argument("--chunks", type=int, default=5000)
+    tokenizer.add_argument("--questions", type=int, default=200)
+    tokenizer.set_defaults(func=bench_tokenizer)
+
+    deadline = subparsers.add_parser("deadline", help="Budżet latencji ask(): degradacje i anulowanie")
+    deadline.add_argument("--chunks", type=int, default=2000)
+    deadline.add_argument("--questions", type=int, default=4)
+    deadline.add_argument("--budgets", type=lambda v: [float(n) for n in v.split(",")], default=[20.0, 6.0, 3.0, 1.5])
+    deadline.add_argument("--answer-tokens", type=int, default=60)
+    deadline.add_argument("--cancel-after", type=float, default=0.5)
+    deadline.set_defaults(func=bench_deadline)
+
+    reduction = subparsers.add_parser("reduction", help="Redukcja wymiaru embeddingów (PCA / prefiks) + przeliczenie shortlisty")
+    reduction.add_argument("--chunks", type=int, default=50000)
+    reduction.add_argument("--questions", type=int, default=200)
+    reduction.add_argument("--dims", type=lambda v: [int(n) for n in v.split(",")], default=[64, 128, 256, 384])
+    reduction.add_argument("--factors", type=lambda v: [int(n) for n in v.split(",")], default=[1, config.EMBEDDING_RESCORE_FACTOR])
+    reduction.set_defaults(func=bench_reduction)
+
+    snapshot = subparsers.add_parser("snapshot", help="Eksport/import snapshotu indeksu vs przebudowa")
+    snapshot.add_argument("--chunks", type=int, default=50000)
+    snapshot.add_argument("--levels", type=lambda v: [int(n) for n in v.split(",")], default=[1, 6])
+    snapshot.set_defaults(func=bench_snapshot)
+
+    asynchronous = subparsers.add_parser("async", help="aask() w pętli zdarzeń vs ask() w wątku na pytanie")
+    asynchronous.add_argument("--chunks", type=int, default=2000)
+    asynchronous.add_argument("--questions", type=int, default=256)
+    asynchronous.add_argument("--concurrency", type=lambda v: [int(n) for n in v.split(",")], default=[1, 16, 64, 256])
+    asynchronous.add_argument("--parallel", type=int, default=4)
+    asynchronous.set_defaults(func=bench_async)
+
+    scheduler = subparsers.add_parser("scheduler", help="Priorytety generacji: pytania interaktywne przy obciążeniu wsadowym")
+    scheduler.add_argument("--questions", type=int, default=10)
+    scheduler.add_argument("--batch-workers", type=int, default=8)
+    scheduler.add_argument("--parallel", type=int, default=2)
+    scheduler.set_defaults(func=bench_scheduler)
+
+    compression = subparsers.add_parser("compression", help="Kompresja kontekstu do zdań istotnych dla pytania")
+    compression.add_argument("--chunks", type=int, default=2000)
+    compression.add_argument("--questions", type=int, default=20)
+    compression.add_argument("--ratios", type=lambda v: [float(n) for n in v.split(",")], default=[0.6, config.COMPRESSION_KEEP_RATIO, 0.25])
+    compression.set_defaults(func=bench_compression)
+
+    retrieval_cache = subparsers.add_parser("retrieval-cache", help="Cache wyników retrievalu (pamięć + dysk) dla powtarzających się sub-queries")
+    retrieval_cache.add_argument("--chunks", type=int, default=5000)
+    retrieval_cache.add_argument("--queries", type=int, default=200)
+    retrieval_cache.add_argument("--distinct", type=int, default=40)
+    retrieval_cache.set_defaults(func=bench_retrieval_cache)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
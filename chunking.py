@@ -0,0 +1,306 @@
+"""
+Podział dokumentów na fragmenty z uwzględnieniem struktury i limitu tokenów.
+
+RecursiveCharacterTextSplitter (700 znaków, length_function=len) ignoruje
+nagłówki Markdown i akapity PDF, a przy okazji tworzy wiele małych
+"ogonków", z których każdy kosztuje pełne wywołanie embeddingu.
+StructureAwareChunker:
+- dzieli Markdown po nagłówkach, a strony PDF po blokach układu (akapitach),
+- mierzy długość w tokenach (text_utils.estimate_tokens),
+- pakuje kolejne bloki do rozmiaru bliskiego CHUNK_TARGET_TOKENS,
+- dokleja zbyt małe ogonki do poprzedniego fragmentu,
+- w ostateczności tnie po znakach "słowa" dłuższe od limitu (URL, base64),
+  więc żaden fragment nie przekracza CHUNK_MAX_TOKENS,
+- zapisuje ścieżkę nagłówków w metadanych ('heading_path').
+Professional Local RAG Agent - Initial Release"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import config
+from text_utils import estimate_tokens, split_sentences
+
+HEADING_SEPARATOR = " > "
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_MD_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+([^\d\W].{0,78})$")
+_BLANK_LINE_RE = re.compile(r"\n\s*\n")
+
+
+def _is_upper_heading(line: str) -> bool:
+    """Krótka linia pisana wielkimi literami (typowy nagłówek w PDF)."""
+    letters = [c for c in line if c.isalpha()]
+    return 3 <= len(letters) and len(line) <= 80 and all(c.isupper() for c in letters)
+
+
+class StructureAwareChunker:
+    """
+    Chunker świadomy struktury dokumentu, o interfejsie zgodnym z text splitterami
+    LangChain (split_documents).
+    """
+
+    def __init__(
+        self,
+        target_tokens: int = config.CHUNK_TARGET_TOKENS,
+        max_tokens: int = config.CHUNK_MAX_TOKENS,
+        min_tokens: int = config.CHUNK_MIN_TOKENS,
+        overlap_tokens: int = config.CHUNK_OVERLAP_TOKENS,
+    ) -> None:
+        """
+        Args:
+            target_tokens: Docelowy rozmiar fragmentu (tokeny).
+            max_tokens: Twardy limit fragmentu (musi mieścić się w oknie modelu embeddingów).
+            min_tokens: Fragmenty mniejsze od tego są doklejane do poprzedniego.
+            overlap_tokens: Maksymalna nakładka (końcowe bloki poprzedniego fragmentu).
+        """
+        if max_tokens > config.EMBEDDING_NUM_CTX:
+            raise ValueError(
+                f"CHUNK_MAX_TOKENS ({max_tokens}) przekracza okno modelu embeddingów ({config.EMBEDDING_NUM_CTX})"
+            )
+        self.target_tokens = target_tokens
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.overlap_tokens = overlap_tokens
+
+    # ---------- podział na sekcje i bloki ----------
+
+    def _markdown_sections(self, text: str) -> List[Tuple[List[str], List[str]]]:
+        """Dzieli Markdown na sekcje (ścieżka nagłówków, lista bloków)."""
+        sections: List[Tuple[List[str], List[str]]] = []
+        path: List[Tuple[int, str]] = []
+        lines: List[str] = []
+        in_fence = False
+
+        def flush() -> None:
+            blocks = [b.strip() for b in _BLANK_LINE_RE.split("\n".join(lines)) if b.strip()]
+            if blocks:
+                sections.append(([title for _, title in path], blocks))
+            lines.clear()
+
+        for line in text.splitlines():
+            if _MD_FENCE_RE.match(line):
+                in_fence = not in_fence
+            match = None if in_fence else _MD_HEADING_RE.match(line)
+            if match:
+                flush()
+                level = len(match.group(1))
+                path = [(lvl, title) for lvl, title in path if lvl < level]
+                path.append((level, match.group(2)))
+                lines.append(line)  # Nagłówek zostaje w treści fragmentu
+                continue
+            lines.append(line)
+        flush()
+        return sections
+
+    def _pdf_blocks(self, text: str) -> List[str]:
+        """
+        Dzieli tekst strony PDF na bloki układu (akapity).
+
+        PDFPlumber rzadko zostawia puste linie, więc akapit kończy też linia
+        zakończona znakiem końca zdania i wyraźnie krótsza od najdłuższej.
+        """
+        blocks: List[str] = []
+        for raw_block in _BLANK_LINE_RE.split(text):
+            lines = [l.strip() for l in raw_block.splitlines() if l.strip()]
+            if not lines:
+                continue
+            width = max(len(l) for l in lines)
+            current: List[str] = []
+            for line in lines:
+                if self._pdf_heading(line) and current:
+                    blocks.append(" ".join(current))
+                    current = []
+                current.append(line)
+                if (line[-1] in ".:!?" and len(line) < 0.7 * width) or self._pdf_heading(line):
+                    blocks.append(" ".join(current))
+                    current = []
+            if current:
+                blocks.append(" ".join(current))
+        return blocks
+
+    @staticmethod
+    def _pdf_heading(line: str) -> Optional[Tuple[int, str]]:
+        """Rozpoznaje nagłówek PDF: numerowany ("2.1 Instalacja") lub WIELKIMI LITERAMI."""
+        if line.endswith(".") or len(line) > 80:
+            return None
+        match = _NUMBERED_HEADING_RE.match(line)
+        if match:
+            return match.group(1).count(".") + 1, line
+        if _is_upper_heading(line):
+            return 1, line
+        return None
+
+    def _pdf_sections(self, text: str, path: List[Tuple[int, str]]) -> List[Tuple[List[str], List[str]]]:
+        """Dzieli stronę PDF na sekcje; `path` przechodzi między stronami dokumentu."""
+        sections: List[Tuple[List[str], List[str]]] = []
+        blocks: List[str] = []
+        for block in self._pdf_blocks(text):
+            heading = self._pdf_heading(block)
+            if heading:
+                if blocks:
+                    sections.append(([title for _, title in path], blocks))
+                    blocks = []
+                level, title = heading
+                path[:] = [(lvl, t) for lvl, t in path if lvl < level] + [(level, title)]
+            blocks.append(block)
+        if blocks:
+            sections.append(([title for _, title in path], blocks))
+        return sections
+
+    # ---------- pakowanie ----------
+
+    def _split_word(self, word: str) -> List[str]:
+        """
+        Tnie pojedyncze "słowo" dłuższe od target_tokens (URL, base64, tabela bez spacji) po znakach.
+
+        Ostateczność: długość kawałka jest dobierana wyszukiwaniem binarnym
+        po estimate_tokens, więc żaden kawałek nie przekracza target_tokens.
+        """
+        pieces: List[str] = []
+        while estimate_tokens(word) > self.target_tokens:
+            low, high = 1, len(word)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if estimate_tokens(word[:middle]) <= self.target_tokens:
+                    low = middle
+                else:
+                    high = middle - 1
+            pieces.append(word[:low])
+            word = word[low:]
+        if word:
+            pieces.append(word)
+        return pieces
+
+    def _units(self, block: str) -> List[Tuple[str, int]]:
+        """Rozbija za duży blok na zdania, za długie zdania na słowa, a za długie słowa na znaki."""
+        tokens = estimate_tokens(block)
+        if tokens <= self.max_tokens:
+            return [(block, tokens)]
+
+        units: List[Tuple[str, int]] = []
+        for sentence in split_sentences(block):
+            sentence_tokens = estimate_tokens(sentence)
+            if sentence_tokens <= self.max_tokens:
+                units.append((sentence, sentence_tokens))
+                continue
+            words: List[str] = []
+            for word in sentence.split():
+                if words and estimate_tokens(" ".join(words + [word])) > self.target_tokens:
+                    piece = " ".join(words)
+                    units.append((piece, estimate_tokens(piece)))
+                    words = []
+                if estimate_tokens(word) > self.target_tokens:
+                    units.extend((piece, estimate_tokens(piece)) for piece in self._split_word(word))
+                    continue
+                words.append(word)
+            if words:
+                piece = " ".join(words)
+                units.append((piece, estimate_tokens(piece)))
+        return units
+
+    def _pack(self, blocks: List[str]) -> List[str]:
+        """Pakuje bloki sekcji do fragmentów o rozmiarze ~target_tokens."""
+        units = [unit for block in blocks for unit in self._units(block)]
+        chunks: List[List[Tuple[str, int]]] = []
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+
+        for text, tokens in units:
+            overflow = current_tokens + tokens > self.target_tokens
+            # Nie zostawiamy małego fragmentu, jeśli całość mieści się w twardym limicie
+            if current and overflow and (current_tokens >= self.min_tokens or current_tokens + tokens > self.max_tokens):
+                chunks.append(current)
+                # Nakładka: końcowe jednostki poprzedniego fragmentu
+                carry: List[Tuple[str, int]] = []
+                carry_tokens = 0
+                for unit in reversed(current):
+                    if carry_tokens + unit[1] > self.overlap_tokens:
+                        break
+                    carry.insert(0, unit)
+                    carry_tokens += unit[1]
+                if carry_tokens + tokens > self.max_tokens:
+                    carry, carry_tokens = [], 0
+                current, current_tokens = carry, carry_tokens
+            current.append((text, tokens))
+            current_tokens += tokens
+
+        if current:
+            # Ogonek: dołącz do poprzedniego fragmentu, jeśli się zmieści
+            tail_tokens = sum(t for _, t in current)
+            if chunks and tail_tokens < self.min_tokens:
+                previous = chunks[-1]
+                overlap = len([u for u in current if u in previous])
+                merged = previous + current[overlap:]
+                if sum(t for _, t in merged) <= self.max_tokens:
+                    chunks[-1] = merged
+                    current = []
+            if current:
+                chunks.append(current)
+
+        return ["\n\n".join(text for text, _ in chunk) for chunk in chunks]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Dzieli dokumenty na fragmenty.
+
+        Args:
+            documents: Dokumenty z loaderów (strony PDF lub pliki Markdown).
+
+        Returns:
+            Lista fragmentów z metadanymi oryginału oraz 'heading_path' i 'chunk_tokens'.
+        """
+        chunks: List[Document] = []
+        pdf_paths: Dict[str, List[Tuple[int, str]]] = {}
+
+        for doc in documents:
+            source = str(doc.metadata.get("source", ""))
+            if source.lower().endswith((".md", ".markdown")):
+                sections = self._markdown_sections(doc.page_content)
+            else:
+                sections = self._pdf_sections(doc.page_content, pdf_paths.setdefault(source, []))
+
+            # Mała sekcja (np. sam nagłówek + zdanie wstępu) trafia do następnej sekcji
+            merged_sections: List[Tuple[List[str], List[str]]] = []
+            carried: List[str] = []
+            for i, (path, blocks) in enumerate(sections):
+                blocks = carried + blocks
+                carried = []
+                if i + 1 < len(sections) and sum(estimate_tokens(b) for b in blocks) < self.min_tokens:
+                    carried = blocks
+                    continue
+                merged_sections.append((path, blocks))
+
+            for path, blocks in merged_sections:
+                for text in self._pack(blocks):
+                    metadata = dict(doc.metadata)
+                    metadata["heading_path"] = HEADING_SEPARATOR.join(path)
+                    metadata["chunk_tokens"] = estimate_tokens(text)
+                    chunks.append(Document(page_content=text, metadata=metadata))
+
+        return chunks
+
+
+def create_text_splitter(kind: str = config.CHUNKER):
+    """
+    Zwraca splitter używany przez ingest.
+
+    Args:
+        kind: "structure" (StructureAwareChunker) lub "recursive" (dawny podział po znakach).
+
+    Returns:
+        Obiekt z metodą split_documents.
+    """
+    if kind == "structure":
+        return StructureAwareChunker()
+    if kind == "recursive":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP,
+            length_function=len,
+            is_separator_regex=False,
+        )
+    raise ValueError(f"Nieznany chunker: {kind} (dostępne: structure, recursive)")
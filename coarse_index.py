@@ -0,0 +1,201 @@
+"""
+Wyszukiwanie dwuetapowe (coarse-to-fine): najpierw dokumenty, potem ich chunki.
+
+Płaskie wyszukiwanie porównuje zapytanie z każdym chunkiem - koszt rośnie
+liniowo z korpusem. CoarseIndex trzyma jeden wektor na dokument (albo na
+sekcję: źródło + heading_path) - znormalizowany centroid embeddingów jego
+chunków. HybridRetriever wybiera najpierw COARSE_TOP_DOCS najbliższych
+dokumentów, a wyszukiwanie wektorowe i BM25 liczy tylko dla ich chunków.
+
+Centroidy liczy ingestia (ingest.py, ingest_md.py) z embeddingów zapisanych
+w Chroma, więc nie wymagają dodatkowych wywołań modelu.
+Professional Local RAG Agent - Initial Release"""
+
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+
+GroupKey = Tuple[str, str]
+
+
+def group_key(source: str, heading_path: str = "", granularity: str = config.COARSE_GRANULARITY) -> GroupKey:
+    """
+    Klucz grupy chunków: (źródło, "") dla dokumentu, (źródło, heading_path) dla sekcji.
+
+    Args:
+        source: Plik źródłowy chunka.
+        heading_path: Ścieżka nagłówków chunka (chunker strukturalny).
+        granularity: "document" albo "section".
+    """
+    if granularity not in ("document", "section"):
+        raise ValueError(f"Nieznana granulacja: {granularity} (document lub section)")
+    return (source, heading_path or "") if granularity == "section" else (source, "")
+
+
+class CoarseIndex:
+    """Centroidy embeddingów per dokument (lub sekcja) i mapowanie na pozycje chunków."""
+
+    def __init__(self, keys: List[GroupKey], centroids: np.ndarray, granularity: str = config.COARSE_GRANULARITY) -> None:
+        """
+        Args:
+            keys: Klucze grup (group_key) w kolejności wierszy centroids.
+            centroids: Centroidy (liczba grup x dim), znormalizowane L2.
+            granularity: "document" albo "section".
+        """
+        if len(keys) != len(centroids):
+            raise ValueError("Liczba centroidów nie pasuje do liczby grup")
+        self.keys = keys
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.granularity = granularity
+        self.groups: List[np.ndarray] = []
+        self.group_of: Optional[np.ndarray] = None
+        self._unmapped_sources: List[str] = []
+
+    @classmethod
+    def from_vectors(
+        cls,
+        keys: Sequence[GroupKey],
+        vectors: np.ndarray,
+        granularity: str = config.COARSE_GRANULARITY,
+    ) -> "CoarseIndex":
+        """
+        Liczy centroidy z embeddingów chunków.
+
+        Args:
+            keys: Klucz grupy każdego chunka (group_key).
+            vectors: Embeddingi chunków (n x dim, ta sama kolejność).
+            granularity: Granulacja użyta do wyznaczenia kluczy.
+
+        Returns:
+            CoarseIndex (bez mapowania na pozycje - patrz attach).
+        """
+        numbers: Dict[GroupKey, int] = {}
+        group_ids = np.fromiter((numbers.setdefault(key, len(numbers)) for key in keys), dtype=np.int64, count=len(keys))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        sums = np.zeros((len(numbers), vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+        if len(group_ids):
+            # Centroid kierunków chunków: długie i krótkie chunki ważą tyle samo
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.add.at(sums, group_ids, vectors / np.where(norms > 0, norms, 1.0))
+        lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+        return cls(list(numbers), sums / np.where(lengths > 0, lengths, 1.0), granularity)
+
+    @classmethod
+    def from_collection(cls, collection, granularity: str = config.COARSE_GRANULARITY) -> "CoarseIndex":
+        """
+        Liczy centroidy z kolekcji ChromaDB (embeddingi zapisane przy ingestii).
+
+        Args:
+            collection: Kolekcja Chroma (vectorstore._collection).
+            granularity: "document" albo "section".
+        """
+        data = collection.get(include=["embeddings", "metadatas"])
+        keys = [
+            group_key(str((meta or {}).get("source", "")), (meta or {}).get("heading_path", ""), granularity)
+            for meta in data["metadatas"]
+        ]
+        return cls.from_vectors(keys, np.asarray(data["embeddings"], dtype=np.float32), granularity)
+
+    def save(self, path: Path = config.CHROMA_DB_DIR / config.COARSE_INDEX_FILE) -> None:
+        """
+        Zapisuje centroidy i klucze grup (.npz, podmiana atomowa jak arena korpusu).
+
+        Args:
+            path: Plik docelowy.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                sources=np.asarray([source for source, _ in self.keys], dtype=str),
+                headings=np.asarray([heading for _, heading in self.keys], dtype=str),
+                centroids=self.centroids,
+                granularity=np.asarray(self.granularity),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path = config.CHROMA_DB_DIR / config.COARSE_INDEX_FILE) -> "CoarseIndex":
+        """
+        Otwiera indeks zapisany przez save().
+
+        Raises:
+            FileNotFoundError: Gdy ingestia nie zapisała centroidów.
+        """
+        with np.load(Path(path), allow_pickle=False) as data:
+            keys = list(zip(data["sources"].tolist(), data["headings"].tolist()))
+            return cls(keys, data["centroids"], str(data["granularity"]))
+
+    def attach(self, records: Sequence) -> "CoarseIndex":
+        """
+        Mapuje grupy na pozycje chunków w CorpusStore.
+
+        Chunki bez centroidu (dodane po ostatniej ingestii) dostają własną,
+        zawsze przeszukiwaną grupę, a grupy bez chunków nie są wybierane.
+
+        Args:
+            records: Rekordy chunków z atrybutami source i heading_path (corpus_store.ChunkRecord).
+
+        Returns:
+            self
+        """
+        numbers = {key: idx for idx, key in enumerate(self.keys)}
+        unknown = len(self.keys)
+        group_of = np.empty(len(records), dtype=np.int64)
+        for position, record in enumerate(records):
+            group_of[position] = numbers.get(group_key(record.source, record.heading_path, self.granularity), unknown)
+        order = np.argsort(group_of, kind="stable")
+        bounds = np.searchsorted(group_of[order], np.arange(unknown + 2))
+        self.groups = [order[bounds[g]:bounds[g + 1]] for g in range(unknown + 1)]
+        self.group_of = group_of
+        self._unmapped_sources = sorted({records[int(p)].source for p in self.groups[unknown]})
+        return self
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        """Rozmiar centroidów i mapowania pozycji."""
+        mapping = self.group_of.nbytes * 2 if self.group_of is not None else 0
+        return self.centroids.nbytes + mapping
+
+    def select(self, query_embedding: Sequence[float], top: int, positions: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        Grupy najbliższe zapytaniu (podobieństwo cosinusowe do centroidu).
+
+        Args:
+            query_embedding: Embedding zapytania.
+            top: Liczba grup.
+            positions: Opcjonalne ograniczenie do grup zawierających te pozycje (filtry).
+
+        Returns:
+            Numery grup od najlepszej.
+        """
+        if self.group_of is None:
+            raise ValueError("Najpierw attach(records) - brak mapowania na pozycje")
+        if positions is None:
+            allowed = np.array([g for g in range(len(self.keys)) if len(self.groups[g])], dtype=np.int64)
+        else:
+            allowed = np.unique(self.group_of[np.asarray(positions, dtype=np.int64)])
+            allowed = allowed[allowed < len(self.keys)]
+        if top <= 0 or not len(allowed):
+            return []
+        similarity = self.centroids[allowed] @ np.asarray(query_embedding, dtype=np.float32)
+        top = min(top, len(allowed))
+        best = np.argpartition(-similarity, top - 1)[:top]
+        best = best[np.argsort(-similarity[best], kind="stable")]
+        return [int(allowed[i]) for i in best]
+
+    def positions(self, groups: Sequence[int]) -> np.ndarray:
+        """Pozycje chunków wybranych grup i chunków bez centroidu (rosnąco)."""
+        return np.sort(np.concatenate([self.groups[g] for g in groups] + [self.groups[len(self.keys)]]))
+
+    def sources(self, groups: Sequence[int]) -> List[str]:
+        """Pliki źródłowe wybranych grup i chunków bez centroidu (do klauzuli `where` Chroma)."""
+        return sorted({self.keys[g][0] for g in groups}.union(self._unmapped_sources))
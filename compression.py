@@ -0,0 +1,190 @@
+"""
+Kompresja ekstrakcyjna kontekstu pod kątem pytania (przed generacją odpowiedzi).
+
+Nawet po deduplikacji większość zdań pobranych fragmentów nie dotyczy
+pytania, a llama3 i tak przetwarza każdy token promptu. SentenceCompressor
+dzieli bloki kontekstu (po sklejeniu sąsiednich chunków) na zdania i ocenia
+każde z nich:
+- podobieństwem cosinusowym embeddingu zdania do embeddingu pytania
+  (embedding pytania z retrievalu, embeddingi zdań z pamięci LRU - te same
+  zdania wracają w kolejnych pytaniach),
+- pokryciem termów pytania (tokenizer BM25: bez stopwords, ze stemmingiem).
+Zostają najlepiej ocenione zdania do COMPRESSION_KEEP_RATIO tokenów, w
+oryginalnej kolejności (pominięte zdania między nimi oznacza "[...]"); znacznik
+źródła bloku dodaje dalej ContextPacker. Gdy embeddingi są niedostępne,
+zdania są oceniane samym pokryciem termów.
+Professional Local RAG Agent - Initial Release"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from ollama_client import OllamaCancelled
+from text_utils import estimate_tokens, split_sentences
+
+GAP_MARKER = " [...] "
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class SentenceCompressor:
+    """Wybór zdań kontekstu najbliższych pytaniu (semantycznie i słowami kluczowymi)."""
+
+    def __init__(
+        self,
+        embeddings,
+        tokenize: Callable[[str], List[str]],
+        keep_ratio: float = config.COMPRESSION_KEEP_RATIO,
+        semantic_weight: float = config.COMPRESSION_SEMANTIC_WEIGHT,
+        min_sentence_chars: int = config.COMPRESSION_MIN_SENTENCE_CHARS,
+        cache_size: int = config.COMPRESSION_EMBED_CACHE,
+    ) -> None:
+        """
+        Args:
+            embeddings: Model embeddingów (embed_documents) - ten sam co dla chunków.
+            tokenize: Tokenizer termów (jak w indeksie BM25).
+            keep_ratio: Część tokenów kontekstu, która zostaje po kompresji.
+            semantic_weight: Waga podobieństwa embeddingów (reszta: pokrycie termów).
+            min_sentence_chars: Krótsze zdania (nagłówki, "Tak.") są doklejane do poprzedniego.
+            cache_size: Pojemność pamięci embeddingów zdań.
+        """
+        if not 0 < keep_ratio <= 1:
+            raise ValueError("keep_ratio musi być w zakresie (0, 1]")
+        self.embeddings = embeddings
+        self.tokenize = tokenize
+        self.keep_ratio = keep_ratio
+        self.semantic_weight = semantic_weight
+        self.min_sentence_chars = min_sentence_chars
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def sentences(self, text: str) -> List[str]:
+        """Zdania bloku; za krótkie fragmenty są doklejane do poprzedniego zdania."""
+        sentences: List[str] = []
+        for sentence in split_sentences(text):
+            if sentences and len(sentence) < self.min_sentence_chars:
+                sentences[-1] = f"{sentences[-1]} {sentence}"
+            else:
+                sentences.append(sentence)
+        return sentences
+
+    def _embed(self, sentences: Sequence[str], question: str, query_embedding) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], int]:
+        """
+        Embeddingi zdań (z pamięci albo jednym wywołaniem) i pytania.
+
+        Returns:
+            Krotka (znormalizowany embedding pytania, macierz znormalizowanych
+            embeddingów zdań, liczba nowo policzonych zdań) - (None, None, 0),
+            gdy Ollama zawiedzie (także po przekroczeniu budżetu pytania).
+        """
+        with self._lock:
+            cached = {sentence: self._cache.get(sentence) for sentence in set(sentences)}
+            for sentence, vector in cached.items():
+                if vector is not None:
+                    self._cache.move_to_end(sentence)
+        missing = [sentence for sentence, vector in cached.items() if vector is None]
+        # Pytanie bez gotowego embeddingu idzie w tym samym wywołaniu co brakujące zdania
+        texts = missing + ([question] if query_embedding is None else [])
+        try:
+            vectors = self.embeddings.embed_documents(texts) if texts else []
+        except OllamaCancelled:
+            raise
+        except Exception:
+            return None, None, 0
+        if query_embedding is None:
+            query_embedding = vectors[-1]
+            vectors = vectors[:-1]
+        fresh = _unit(np.asarray(vectors, dtype=np.float32)) if missing else None
+        with self._lock:
+            self.cache_hits += len(cached) - len(missing)
+            self.cache_misses += len(missing)
+            for idx, sentence in enumerate(missing):
+                cached[sentence] = fresh[idx]
+                self._cache[sentence] = fresh[idx]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        matrix = np.stack([cached[sentence] for sentence in sentences])
+        return _unit(np.asarray(query_embedding, dtype=np.float32)), matrix, len(missing)
+
+    def _overlap(self, question_terms: set, sentence: str) -> float:
+        if not question_terms:
+            return 0.0
+        return len(question_terms.intersection(self.tokenize(sentence))) / len(question_terms)
+
+    def compress(self, blocks: List[Dict[str, Any]], question: str, query_embedding=None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Zostawia w blokach najlepiej ocenione zdania (w oryginalnej kolejności).
+
+        Args:
+            blocks: Bloki ContextPacker (klucz "text" jest podmieniany).
+            question: Pytanie użytkownika.
+            query_embedding: Gotowy embedding pytania (None = liczony razem ze zdaniami).
+
+        Returns:
+            Krotka (bloki z co najmniej jednym zdaniem, statystyki: zdania i tokeny
+            przed/po, nowo policzone embeddingi, czas).
+        """
+        start = time.perf_counter()
+        per_block = [self.sentences(block["text"]) for block in blocks]
+        flat = [(b, s, sentence) for b, sentences in enumerate(per_block) for s, sentence in enumerate(sentences)]
+        tokens = np.asarray([estimate_tokens(sentence) for _, _, sentence in flat], dtype=np.float64)
+        stats = {
+            "sentences": len(flat),
+            "sentences_kept": len(flat),
+            "tokens_before": int(tokens.sum()),
+            "tokens_after": int(tokens.sum()),
+            "embedded": 0,
+            "semantic": False,
+            "seconds": 0.0,
+        }
+        if len(flat) <= 1:
+            return blocks, stats
+
+        question_terms = set(self.tokenize(question))
+        scores = np.asarray([self._overlap(question_terms, sentence) for _, _, sentence in flat])
+        query, matrix, stats["embedded"] = self._embed([sentence for _, _, sentence in flat], question, query_embedding)
+        if matrix is not None:
+            stats["semantic"] = True
+            scores = self.semantic_weight * (matrix @ query) + (1.0 - self.semantic_weight) * scores
+
+        # Najlepsze zdania, dopóki nie uzbiera się keep_ratio tokenów (co najmniej jedno)
+        order = np.argsort(-scores, kind="stable")
+        budget = self.keep_ratio * tokens.sum()
+        kept = np.zeros(len(flat), dtype=bool)
+        total = 0.0
+        for idx in order:
+            kept[idx] = True
+            total += tokens[idx]
+            if total >= budget:
+                break
+
+        compressed = []
+        offset = 0
+        for block, sentences in zip(blocks, per_block):
+            mask = kept[offset:offset + len(sentences)]
+            offset += len(sentences)
+            if not mask.any():
+                continue
+            parts: List[str] = []
+            previous = -1
+            for s in np.flatnonzero(mask):
+                if parts:
+                    parts.append(" " if s == previous + 1 else GAP_MARKER)
+                parts.append(sentences[s])
+                previous = s
+            compressed.append({**block, "text": "".join(parts)})
+
+        stats["sentences_kept"] = int(kept.sum())
+        stats["tokens_after"] = int(tokens[kept].sum())
+        stats["seconds"] = round(time.perf_counter() - start, 4)
+        return compressed, stats
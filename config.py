@@ -5,7 +5,7 @@ Agent AI do Retrieval-Augmented Generation z dokumentów.
 Professional Local RAG Agent - Initial Release"""
 
 from pathlib import Path
-from typing import Final
+from typing import Dict, Final, Tuple
 
 # ==================== ŚCIEŻKI ====================
 PROJECT_ROOT: Final[Path] = Path(__file__).parent
@@ -25,23 +25,173 @@ EMBEDDING_MODEL: Final[str] = "nomic-embed-text"
 LLM_TEMPERATURE: Final[float] = 0.1
 LLM_TOP_P: Final[float] = 0.9
 LLM_MAX_TOKENS: Final[int] = 2048
+LLM_NUM_CTX: Final[int] = 8192  # Okno kontekstu llama3 (Ollama domyślnie używa tylko 2048)
+EMBEDDING_NUM_CTX: Final[int] = 2048  # Chunki mają ~700 znaków, większe okno tylko marnuje pamięć
+
+# ==================== KLIENT HTTP OLLAMA ====================
+OLLAMA_MAX_CONNECTIONS: Final[int] = 8  # Rozmiar puli połączeń keep-alive
+OLLAMA_CONNECT_TIMEOUT: Final[float] = 5.0  # Sekundy na nawiązanie połączenia
+OLLAMA_REQUEST_TIMEOUT: Final[float] = 600.0  # Domyślny limit całej generacji (s)
+OLLAMA_EMBED_TIMEOUT: Final[float] = 60.0  # Limit jednego embeddingu (s)
+OLLAMA_RETRY_ATTEMPTS: Final[int] = 4  # Łącznie z pierwszą próbą
+OLLAMA_RETRY_BASE_DELAY: Final[float] = 0.5  # Opóźnienie bazowe (s), rośnie wykładniczo + jitter
+OLLAMA_RETRY_MAX_DELAY: Final[float] = 8.0
+OLLAMA_CIRCUIT_FAILURES: Final[int] = 5  # Kolejne błędy otwierające circuit breaker
+OLLAMA_CIRCUIT_RESET: Final[float] = 15.0  # Po tylu sekundach próbne żądanie
+
+# ==================== ROZGRZEWANIE MODELI ====================
+OLLAMA_KEEP_ALIVE: Final[str] = "30m"  # Jak długo Ollama trzyma modele w pamięci po ostatnim żądaniu
+WARMUP_ENABLED: Final[bool] = True  # Ładuj modele w tle przy starcie agenta
+WARMUP_TIMEOUT: Final[int] = 300  # Sekundy (pierwsze ładowanie llama3 na CPU bywa długie)
 
 # ==================== PARAMETRY TEXT SPLITTER ====================
-CHUNK_SIZE: Final[int] = 700
-CHUNK_OVERLAP: Final[int] = 200
+CHUNKER: Final[str] = "structure"  # "structure" (chunking.py, tokeny + nagłówki) lub "recursive" (znaki)
+CHUNK_SIZE: Final[int] = 700  # Tylko chunker "recursive"
+CHUNK_OVERLAP: Final[int] = 200  # Tylko chunker "recursive"
+CHUNK_TARGET_TOKENS: Final[int] = 300  # Docelowy rozmiar fragmentu (chunker "structure")
+CHUNK_MAX_TOKENS: Final[int] = 450  # Twardy limit, musi być <= EMBEDDING_NUM_CTX
+CHUNK_MIN_TOKENS: Final[int] = 60  # Mniejsze ogonki są doklejane do poprzedniego fragmentu
+CHUNK_OVERLAP_TOKENS: Final[int] = 40  # Nakładka z końcowych zdań/akapitów poprzedniego fragmentu
+
+# ==================== DEDUPLIKACJA CHUNKÓW ====================
+DEDUP_ENABLED: Final[bool] = True
+DEDUP_THRESHOLD: Final[float] = 0.85  # Szacowane podobieństwo Jaccarda (MinHash) uznawane za duplikat
+DEDUP_NUM_PERM: Final[int] = 64  # Długość sygnatury MinHash
+DEDUP_SHINGLE_SIZE: Final[int] = 5  # Shingle = 5 kolejnych słów
+DEDUP_MAP_FILE: Final[str] = "dedup_map.json"  # Mapowanie odrzucony -> kanoniczny (w CHROMA_DB_DIR)
+
+# ==================== MAGAZYN KORPUSU ====================
+CORPUS_ARENA_FILE: Final[str] = "corpus.arena"  # Treść chunków mapowana w pamięć (w CHROMA_DB_DIR)
+
+# ==================== TOKENIZER BM25 ====================
+TOKENIZER: Final[str] = "normalized"  # "normalized" (tokenizer.py) lub "whitespace" (dawne lower().split())
+TOKENIZER_FOLD_DIACRITICS: Final[bool] = True  # "instalację" i "instalacje" to ten sam term
+TOKENIZER_STOPWORDS: Final[tuple] = ("pl", "en")  # Języki pomijanych stopwords
+TOKENIZER_STEMMING: Final[bool] = True  # Lekki stemming: odcięcie jednej końcówki fleksyjnej
+TOKENIZER_MIN_STEM: Final[int] = 3  # Minimalna długość tematu po odcięciu końcówki
+TOKENIZER_TERM_CACHE: Final[int] = 200_000  # Limit zapamiętanych słów -> termów (pamięć tokenizera)
+SPARSE_INDEX_DIR: Final[Path] = CHROMA_DB_DIR / "sparse_index"  # Indeks BM25 zbudowany przy ingestii
 
 # ==================== PARAMETRY RETRIEVERA ====================
 RETRIEVER_K: Final[int] = 8  # Optimal: max tested 20
 RETRIEVER_SEARCH_TYPE: Final[str] = "mmr"  # Maximum Marginal Relevance - więcej diversity
 RETRIEVER_FETCH_K: Final[int] = 16  # Zwiększone dla lepszego MMR diversity
 
+# ==================== WYSZUKIWANIE DWUETAPOWE ====================
+COARSE_TOP_DOCS: Final[int] = 5  # Dokumenty wybierane wg centroidów przed wyszukiwaniem chunków (0 = płasko)
+COARSE_GRANULARITY: Final[str] = "document"  # "document" (plik) lub "section" (plik + heading_path)
+COARSE_INDEX_FILE: Final[str] = "coarse_index.npz"  # Centroidy zapisywane przez ingestię (w CHROMA_DB_DIR)
+
+# ==================== REDUKCJA WYMIARU EMBEDDINGÓW ====================
+EMBEDDING_REDUCTION: Final = None  # None (pełne wektory), "pca" lub "prefix" (Matryoshka, np. nomic-embed-text v1.5)
+EMBEDDING_REDUCED_DIM: Final[int] = 128  # Wymiar wektorów pierwszego przebiegu wyszukiwania
+EMBEDDING_RESCORE_FACTOR: Final[int] = 4  # Shortlista = factor x k kandydatów, przeliczana na pełnych wektorach
+EMBEDDING_PCA_SAMPLE: Final[int] = 20_000  # Embeddingi, na których ingestia dopasowuje PCA
+EMBEDDING_REDUCTION_FILE: Final[str] = "embedding_reduction.npz"  # Projekcja zapisana przez ingestię (w CHROMA_DB_DIR)
+
+# ==================== CACHE RETRIEVALU ====================
+RETRIEVAL_CACHE_ENABLED: Final[bool] = True  # Wyniki hybrid search (pozycje chunków i score) dla powtarzających się zapytań
+RETRIEVAL_CACHE_SIZE: Final[int] = 4096  # Wyniki trzymane w pamięci (LRU)
+RETRIEVAL_CACHE_FILE: Final = "retrieval_cache.sqlite"  # Warstwa dyskowa w CHROMA_DB_DIR, przetrwa restart (None = tylko pamięć)
+RETRIEVAL_CACHE_DISK_MAX: Final[int] = 50_000  # Limit wpisów na dysku (najstarsze są usuwane)
+
+# ==================== WYKONANIE SPEKULATYWNE ====================
+SPECULATIVE_ENABLED: Final[bool] = True  # Retrieval pytania startuje razem z dekompozycją
+SPECULATIVE_WORKERS: Final[int] = 4  # Wątki retrievalu na agenta (pytanie + sub-queries ze streamu)
+
+# ==================== BUDŻET LATENCJI ====================
+ASK_BUDGET_S: Final = None  # Domyślny budżet pytania w sekundach (None = bez limitu, main.py --budget)
+DEADLINE_DECOMPOSE_SHARE: Final[float] = 0.2  # Część budżetu na dekompozycję pytania
+DEADLINE_RETRIEVE_SHARE: Final[float] = 0.15  # Część budżetu na retrieval (reszta: generacja)
+DEADLINE_MIN_DECOMPOSE_S: Final[float] = 2.0  # Krótsze okno dekompozycji = pomijamy ją
+DEADLINE_DEGRADED_K: Final[int] = 4  # Wyniki na sub-query, gdy retrieval zaczyna się po czasie
+DEADLINE_PREFILL_TOKENS_PER_S: Final[float] = 250.0  # Szacowane tempo przetwarzania promptu (tokeny/s)
+DEADLINE_DECODE_TOKENS_PER_S: Final[float] = 20.0  # Szacowane tempo generacji (tokeny/s)
+DEADLINE_CONTEXT_SHARE: Final[float] = 0.5  # Część czasu generacji na przetworzenie promptu (przycina kontekst)
+DEADLINE_MIN_NUM_PREDICT: Final[int] = 64  # Najmniejszy limit odpowiedzi po przycięciu num_predict
+
+# ==================== PAKOWANIE KONTEKSTU ====================
+CHARS_PER_TOKEN: Final[float] = 3.5  # Przybliżenie dla tekstu PL/EN (tokenizer llama3)
+CONTEXT_SAFETY_MARGIN: Final[int] = 256  # Zapas tokenów na szablon i niedokładność estymacji
+CONTEXT_MIN_BLOCK_TOKENS: Final[int] = 64  # Poniżej tego budżetu przestajemy dokładać bloki
+
+# ==================== KOMPRESJA KONTEKSTU ====================
+COMPRESSION_ENABLED: Final[bool] = False  # Zdania kontekstu wybierane pod kątem pytania (compression.py, main.py --compress)
+COMPRESSION_KEEP_RATIO: Final[float] = 0.4  # Część tokenów kontekstu zostawiana po kompresji
+COMPRESSION_SEMANTIC_WEIGHT: Final[float] = 0.7  # Waga podobieństwa embeddingów zdania i pytania (reszta: pokrycie termów)
+COMPRESSION_MIN_SENTENCE_CHARS: Final[int] = 25  # Krótsze zdania (nagłówki, "Tak.") są doklejane do poprzedniego
+COMPRESSION_EMBED_CACHE: Final[int] = 5000  # Zapamiętane embeddingi zdań (~3 KB każdy)
+
+# ==================== TRYB WSADOWY ====================
+BATCH_CONCURRENCY: Final[int] = 4  # Pytania przetwarzane równolegle w main.py --batch
+
+# ==================== SESJA INTERAKTYWNA ====================
+SESSION_MAX_TURNS: Final[int] = 5  # Pamiętane tury rozmowy w main.py
+SESSION_MAX_CANDIDATES: Final[int] = 64  # Limit kandydatów (i embeddingów chunków) w pamięci sesji
+SESSION_TOPIC_THRESHOLD: Final[float] = 0.75  # Podobieństwo cosinusowe pytania do tematu sesji
+SESSION_RERANK_K: Final[int] = 10  # Zapamiętani kandydaci brani po ponownym rankingu
+SESSION_DELTA_K: Final[int] = 4  # Wyniki na retriever w małym wyszukiwaniu "delta"
+
+# ==================== SERWOWANIE WIELOPROCESOWE ====================
+SERVE_WORKERS: Final[int] = 4  # Procesy robocze w main.py --batch --workers (pre-fork)
+SHARED_INDEX_DIR: Final[Path] = CHROMA_DB_DIR / "shared_index"  # Arena, BM25 i embeddingi (mmap)
+
+# ==================== HARMONOGRAM WYWOŁAŃ LLM ====================
+SCHEDULER_ENABLED: Final[bool] = True  # Kolejka priorytetowa generacji (scheduler.py); False = wywołania bez kolejki
+SCHEDULER_MAX_CONCURRENT: Final[int] = 2  # Generacje naraz wysyłane do Ollama (ustaw jak OLLAMA_NUM_PARALLEL serwera)
+SCHEDULER_SHORT_RESERVED: Final[int] = 1  # Miejsca tylko dla krótkich wywołań (dekompozycja nie czeka za odpowiedziami; długie generacje mają o tyle mniej)
+SCHEDULER_SHORT_MAX_TOKENS: Final[int] = 64  # Wywołanie z num_predict do tej wartości jest krótkie
+# Klasa -> (waga w sprawiedliwej kolejce, limit równoległych wywołań)
+SCHEDULER_CLASSES: Final[Dict[str, Tuple[float, int]]] = {
+    "interactive": (8.0, 2),
+    "batch": (2.0, 2),
+    "warmup": (1.0, 1),
+}
+SCHEDULER_WAIT_SAMPLES: Final[int] = 1000  # Ostatnie czasy oczekiwania na klasę (do p95)
+
+# ==================== API ASYNCHRONICZNE ====================
+ASYNC_OLLAMA_CONCURRENCY: Final[int] = OLLAMA_MAX_CONNECTIONS  # Trwające wywołania Ollama z aask()/asearch() na pętlę zdarzeń
+ASYNC_CPU_WORKERS: Final[int] = 4  # Wątki agenta dla BM25, wyszukiwania wektorowego i pakowania kontekstu w aask()
+
+# ==================== PROFILOWANIE ====================
+PROFILE_ENV: Final[str] = "RAG_PROFILE"  # RAG_PROFILE=1 włącza profiler od startu (main.py, ingest.py); wyniki przy wyjściu
+PROFILE_DIR: Final[Path] = PROJECT_ROOT / "profiles"  # Wyniki `profile dump` (.collapsed, .prof, .alloc.txt)
+PROFILE_SAMPLE_INTERVAL_S: Final[float] = 0.005  # Odstęp próbkowania stosów wszystkich wątków
+PROFILE_TOP_N: Final[int] = 15  # Funkcje i miejsca alokacji w raporcie każdego etapu
+
+# ==================== SNAPSHOT INDEKSU ====================
+SNAPSHOT_COMPRESS_LEVEL: Final[int] = 1  # zlib (1-9) w snapshot.py export - wyższy: mniejszy plik, wolniejszy eksport
+SNAPSHOT_CHROMA_BATCH: Final[int] = 4096  # Chunki na collection.add przy imporcie do ChromaDB
+
+# ==================== OBSERWACJA DOCS (ingest.py --watch) ====================
+WATCH_POLL_INTERVAL_S: Final[float] = 1.0  # Odstęp skanowania docs/ (mtime i rozmiar plików)
+WATCH_DEBOUNCE_S: Final[float] = 2.0  # Cisza po ostatniej zmianie, zanim seria zdarzeń trafi do ingestii
+WATCH_MAX_DELAY_S: Final[float] = 30.0  # Najdłuższe odkładanie zmian przy ciągłym strumieniu zdarzeń
+WATCH_STATE_FILE: Final[str] = "watch_state.json"  # Stan zaindeksowanych plików (mtime, rozmiar; w CHROMA_DB_DIR)
+INDEX_VERSION_FILE: Final[str] = "index_version.json"  # Wersja zatwierdzonego indeksu - agenci przeładowują go po zmianie
+
 # ==================== KOLEKCJA CHROMADB ====================
 CHROMA_COLLECTION_NAME: Final[str] = "local_rag_documents"
 
 # ==================== PROMPT SYSTEMOWY ====================
-SYSTEM_PROMPT: Final[str] = """Jesteś asystentem odpowiadającym WYŁĄCZNIE na podstawie dostarczonego kontekstu.
+# Stały prefiks instrukcji - bajtowo identyczny dla promptu dekompozycji i odpowiedzi,
+# dzięki czemu Ollama może ponownie użyć KV cache. Prefiks jest neutralny (rola, bez
+# zasad żadnego z zadań), żeby dekompozycja nie dziedziczyła zasad odpowiedzi (np. listy
+# źródeł); zasady i format wyniku są po prefiksie, a instrukcja formatu dekompozycji - na
+# samym końcu. Zmienne części ({context}, {question}) występują dopiero PO prefiksie.
+# Prefiks nie może zawierać nawiasów klamrowych.
+# Kompromis: prefiks ma ok. 35 tokenów, więc jego reużycie prawie nic nie oszczędza -
+# "python benchmark.py --time-scale 0.01 prefix" (20 pytań): 9512 tokenów prompt_eval
+# (38.05 s) wobec 9378 (37.51 s) dla dawnych promptów, czyli +1.4%. Zasady odpowiedzi
+# w prefiksie dałyby reużycie dalszych ok. 125 tokenów na pytanie, ale dekompozycja czytałaby
+# wtedy zasady innego zadania - poprawność wyniku JSON jest tu ważniejsza.
+PROMPT_PREFIX: Final[str] = """Jesteś asystentem systemu wyszukiwania w lokalnej bazie dokumentów (PDF i Markdown). Poniżej jest opisane jedno zadanie - wykonaj tylko je, stosując wyłącznie podane przy nim zasady i format wyniku.
+
+"""
+
+SYSTEM_PROMPT: Final[str] = PROMPT_PREFIX + """ZADANIE: Odpowiedz na pytanie WYŁĄCZNIE na podstawie dostarczonego kontekstu.
 
-ZASADY:
+ZASADY ODPOWIEDZI:
 1) Używaj wyłącznie informacji z kontekstu; jeśli czegoś brakuje, napisz: "Nie znalazłem tej informacji w dostępnych dokumentach.".
 2) Tekst odpowiedzi powinien być w tym samym języku co zadane pytanie.
 3) Kluczowe liczby, nazwy i terminy cytuj dokładnie jak w tekście (w cudzysłowie, jeśli to dosłowny cytat).
@@ -49,6 +199,7 @@ ZASADY:
 5) Jeśli kontekst zawiera sprzeczne informacje, wskaż to w odpowiedzi.
 6) Odpowiadaj zwięźle, po polsku.
 7) Na końcu podaj krótką listę źródeł (nazwy plików z metadanych), jeśli są dostępne.
+
 KONTEKST:
 {context}
 
@@ -56,3 +207,12 @@ PYTANIE:
 {question}
 
 ODPOWIEDŹ:"""
+
+DECOMPOSE_PROMPT: Final[str] = PROMPT_PREFIX + """ZADANIE: Nie odpowiadaj na pytanie. Rozbij je na 2-4 prostsze, konkretne sub-pytania, które razem odpowiadają na oryginalne pytanie.
+Każde sub-pytanie powinno być niezależne i możliwe do udzielenia na podstawie tekstu.
+
+PYTANIE:
+"{question}"
+
+Zwróć WYŁĄCZNIE obiekt JSON - bez odpowiedzi, listy źródeł, komentarzy i innego tekstu:
+{{"subqueries": ["sub-pytanie 1", "sub-pytanie 2", ...]}}"""
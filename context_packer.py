@@ -0,0 +1,188 @@
+"""
+Pakowanie kontekstu dla LLM w zadanym budżecie tokenów.
+
+Łączy sąsiadujące chunki z tego samego źródła (usuwając powtórzone
+fragmenty CHUNK_OVERLAP), sortuje bloki wg hybrid score i dokłada je
+do promptu, dopóki mieści się w budżecie. Opcjonalnie przed pakowaniem
+bloki są kompresowane do zdań istotnych dla pytania (compression.py).
+Professional Local RAG Agent - Initial Release"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+import config
+from text_utils import estimate_tokens
+
+CONTEXT_SEPARATOR = "\n---\n"
+
+# Minimalna długość nakładki, którą uznajemy za powtórzenie (a nie przypadek)
+_MIN_OVERLAP_CHARS = 16
+
+
+def merge_overlapping(left: str, right: str, max_overlap: int = config.CHUNK_OVERLAP * 2) -> Optional[str]:
+    """
+    Skleja dwa kolejne chunki, usuwając wspólny fragment na styku.
+
+    Args:
+        left: Wcześniejszy chunk.
+        right: Następny chunk.
+        max_overlap: Maksymalna długość szukanej nakładki (w znakach).
+
+    Returns:
+        Sklejony tekst lub None, jeśli chunki się nie nakładają.
+    """
+    probe = right[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return None
+
+    tail_start = max(0, len(left) - max_overlap)
+    tail = left[tail_start:]
+    # Najdłuższa nakładka = najwcześniejsze wystąpienie początku `right` w ogonie `left`
+    pos = tail.find(probe)
+    while pos != -1:
+        if right.startswith(tail[pos:]):
+            return left + right[len(tail) - pos:]
+        pos = tail.find(probe, pos + 1)
+    return None
+
+
+class ContextPacker:
+    """
+    Składa kontekst dla promptu z kandydatów zwróconych przez retrievery.
+
+    Kandydat to krotka (Document, score, position), gdzie position to indeks
+    chunka w kolejności ingestii (None, jeśli nieznany).
+    """
+
+    def __init__(self, separator: str = CONTEXT_SEPARATOR, compressor=None) -> None:
+        """
+        Args:
+            separator: Separator wstawiany między blokami kontekstu.
+            compressor: Opcjonalny compression.SentenceCompressor (wybór zdań pod kątem pytania).
+        """
+        self.separator = separator
+        self.separator_tokens = estimate_tokens(separator)
+        self.compressor = compressor
+
+    def _build_blocks(self, candidates: List[Tuple[Document, float, Optional[int]]]) -> List[Dict[str, Any]]:
+        """Grupuje kolejne chunki tego samego źródła w bloki i skleja nakładki."""
+        positioned = sorted(
+            (c for c in candidates if c[2] is not None),
+            key=lambda c: c[2]
+        )
+        blocks: List[Dict[str, Any]] = []
+
+        for doc, score, position in positioned:
+            source = doc.metadata.get("source")
+            last = blocks[-1] if blocks else None
+            if (
+                last is not None
+                and last["source"] == source
+                and last["last_position"] == position - 1
+            ):
+                merged = merge_overlapping(last["text"], doc.page_content)
+                last["text"] = merged if merged is not None else f"{last['text']}\n{doc.page_content}"
+                last["documents"].append(doc)
+                last["score"] = max(last["score"], score)
+                last["last_position"] = position
+                continue
+
+            blocks.append({
+                "source": source,
+                "text": doc.page_content,
+                "documents": [doc],
+                "score": score,
+                "last_position": position,
+            })
+
+        # Chunki bez pozycji nie mają sąsiadów - każdy jest osobnym blokiem
+        for doc, score, position in candidates:
+            if position is None:
+                blocks.append({
+                    "source": doc.metadata.get("source"),
+                    "text": doc.page_content,
+                    "documents": [doc],
+                    "score": score,
+                    "last_position": None,
+                })
+
+        return blocks
+
+    @staticmethod
+    def _format_block(block: Dict[str, Any]) -> str:
+        """Dodaje do bloku znacznik źródła (nazwa pliku i strona)."""
+        source = block["source"]
+        if not source:
+            return block["text"]
+
+        header = f"[Źródło: {Path(source).name}"
+        page = block["documents"][0].metadata.get("page")
+        if isinstance(page, int):
+            header += f", str. {page + 1}"
+        return f"{header}]\n{block['text']}"
+
+    def pack(
+        self,
+        candidates: List[Tuple[Document, float, Optional[int]]],
+        budget_tokens: int,
+        question: Optional[str] = None,
+        query_embedding=None,
+    ) -> Dict[str, Any]:
+        """
+        Pakuje kandydatów do kontekstu w budżecie tokenów.
+
+        Args:
+            candidates: Lista krotek (Document, score, position).
+            budget_tokens: Maksymalna liczba tokenów kontekstu.
+            question: Pytanie - wymagane do kompresji zdań (bez niego bloki są pełne).
+            query_embedding: Opcjonalny gotowy embedding pytania dla kompresji.
+
+        Returns:
+            Dict zawierający:
+                - 'context': Tekst kontekstu dla promptu
+                - 'documents': Dokumenty, które weszły do kontekstu
+                - 'num_blocks': Liczba bloków w kontekście
+                - 'tokens_used': Szacowana liczba tokenów kontekstu
+                - 'tokens_naive': Tokeny przy naiwnym złączeniu wszystkich chunków
+                - 'tokens_saved': Różnica między powyższymi
+                - 'compression': Statystyki kompresji zdań (None, gdy wyłączona)
+        """
+        naive_context = self.separator.join(doc.page_content for doc, _, _ in candidates)
+        tokens_naive = estimate_tokens(naive_context)
+
+        blocks = self._build_blocks(candidates)
+        compression = None
+        if self.compressor is not None and question:
+            blocks, compression = self.compressor.compress(blocks, question, query_embedding)
+        blocks = sorted(blocks, key=lambda b: b["score"], reverse=True)
+
+        parts: List[str] = []
+        documents: List[Document] = []
+        tokens_used = 0
+
+        for block in blocks:
+            remaining = budget_tokens - tokens_used
+            if remaining < config.CONTEXT_MIN_BLOCK_TOKENS:
+                break
+
+            text = self._format_block(block)
+            cost = estimate_tokens(text) + (self.separator_tokens if parts else 0)
+            if cost > remaining:
+                # Mniejsze bloki dalej w kolejce mogą się jeszcze zmieścić
+                continue
+
+            parts.append(text)
+            documents.extend(block["documents"])
+            tokens_used += cost
+
+        return {
+            "context": self.separator.join(parts),
+            "documents": documents,
+            "num_blocks": len(parts),
+            "tokens_used": tokens_used,
+            "tokens_naive": tokens_naive,
+            "tokens_saved": max(0, tokens_naive - tokens_used),
+            "compression": compression,
+        }
@@ -0,0 +1,241 @@
+"""
+Wspólny, zwarty magazyn korpusu (tekst chunków + podstawowe metadane).
+
+Wcześniej agent trzymał treść każdego chunka kilka razy: w wyniku
+collection.get, jako listy tokenów w BM25Okapi, jako obiekty Document
+w BM25Retriever i jako klucze słownika pozycji. CorpusStore trzyma:
+- treść wszystkich chunków w jednym pliku ("arenie") mapowanym w pamięć
+  (mmap) - strony pliku współdzieli system, nie sterta Pythona,
+- tablicę offsetów (numpy uint64, n + 1 pozycji),
+- rekordy ChunkRecord z __slots__ (id, źródło, strona), z internowanymi
+  napisami źródeł.
+BM25 (sparse_index.py), expand_context, fuzja wyników i atrybucja źródeł
+czytają treść z magazynu po pozycji; obiekty Document powstają dopiero
+dla chunków, które trafiają do wyniku.
+Professional Local RAG Agent - Initial Release"""
+
+import hashlib
+import mmap
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+import config
+from dedup import ChunkOrdinals, chunk_id
+
+
+class ChunkRecord:
+    """Metadane jednego chunka (bez treści)."""
+
+    __slots__ = ("chunk_id", "source", "page", "heading_path", "duplicate_sources")
+
+    def __init__(
+        self,
+        chunk_id: str,
+        source: str,
+        page: Optional[int] = None,
+        heading_path: str = "",
+        duplicate_sources: str = "",
+    ) -> None:
+        self.chunk_id = chunk_id
+        self.source = source
+        self.page = page
+        self.heading_path = heading_path
+        self.duplicate_sources = duplicate_sources
+
+    def metadata(self) -> Dict[str, Any]:
+        """Odtwarza metadane w formacie Chroma / Document."""
+        metadata: Dict[str, Any] = {"source": self.source, "chunk_id": self.chunk_id}
+        if self.page is not None:
+            metadata["page"] = self.page
+        if self.heading_path:
+            metadata["heading_path"] = self.heading_path
+        if self.duplicate_sources:
+            metadata["duplicate_sources"] = self.duplicate_sources
+        return metadata
+
+
+class CorpusStore:
+    """
+    Tekst chunków w arenie mmap + tablica offsetów + rekordy metadanych.
+
+    Pozycje chunków odpowiadają kolejności z collection.get (kolejności ingestii),
+    więc sąsiednie pozycje to sąsiednie fragmenty dokumentu.
+    """
+
+    def __init__(self, arena_path: Path, offsets: np.ndarray, records: List[ChunkRecord]) -> None:
+        """
+        Args:
+            arena_path: Plik areny (treść chunków w UTF-8, jeden za drugim).
+            offsets: Offsety bajtowe początków chunków (n + 1 pozycji).
+            records: Rekordy metadanych w tej samej kolejności.
+        """
+        if len(offsets) != len(records) + 1:
+            raise ValueError("Tablica offsetów nie pasuje do liczby rekordów")
+        self.arena_path = Path(arena_path)
+        self.offsets = offsets
+        self.records = records
+        self._file = open(self.arena_path, "rb")
+        size = int(offsets[-1])
+        self._arena = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._by_id: Dict[str, int] = {}
+        for idx, record in enumerate(records):
+            self._by_id.setdefault(record.chunk_id, idx)
+        self._by_hash: Optional[Dict[int, int]] = None
+
+    @classmethod
+    def build(
+        cls,
+        texts: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+        arena_path: Path = config.CHROMA_DB_DIR / config.CORPUS_ARENA_FILE,
+    ) -> "CorpusStore":
+        """
+        Zapisuje arenę i buduje magazyn z wyniku collection.get.
+
+        Plik jest zapisywany obok i podmieniany atomowo, więc inne procesy
+        z otwartym mmap starej areny czytają dalej swoją wersję.
+
+        Args:
+            texts: Treści chunków.
+            metadatas: Metadane chunków (ta sama kolejność).
+            arena_path: Docelowy plik areny.
+
+        Returns:
+            Gotowy CorpusStore.
+        """
+        arena_path = Path(arena_path)
+        offsets = np.zeros(len(texts) + 1, dtype=np.uint64)
+        records: List[ChunkRecord] = []
+        ordinals = ChunkOrdinals()
+        tmp_path = arena_path.with_name(f"{arena_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            position = 0
+            for idx, (text, meta) in enumerate(zip(texts, metadatas)):
+                data = text.encode("utf-8")
+                f.write(data)
+                position += len(data)
+                offsets[idx + 1] = position
+                records.append(cls._record(meta, text, ordinals))
+        os.replace(tmp_path, arena_path)
+        return cls(arena_path, offsets, records)
+
+    @classmethod
+    def from_arena(
+        cls,
+        arena: bytes,
+        offsets: np.ndarray,
+        metadatas: List[Optional[Dict[str, Any]]],
+        arena_path: Path = config.CHROMA_DB_DIR / config.CORPUS_ARENA_FILE,
+    ) -> "CorpusStore":
+        """
+        Zapisuje gotową arenę (np. ze snapshotu) bez dekodowania i ponownego kodowania tekstów.
+
+        Args:
+            arena: Treści chunków w UTF-8, jedna za drugą.
+            offsets: Offsety bajtowe początków chunków (n + 1 pozycji).
+            metadatas: Metadane chunków (z chunk_id - treść jest dekodowana tylko bez niego).
+            arena_path: Docelowy plik areny.
+        """
+        arena_path = Path(arena_path)
+        offsets = np.asarray(offsets, dtype=np.uint64)
+        tmp_path = arena_path.with_name(f"{arena_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(arena)
+        os.replace(tmp_path, arena_path)
+        view = memoryview(arena)
+        ordinals = ChunkOrdinals()
+        records = [
+            cls._record(
+                meta,
+                None if (meta or {}).get("chunk_id") else bytes(view[int(offsets[i]):int(offsets[i + 1])]).decode("utf-8"),
+                ordinals,
+            )
+            for i, meta in enumerate(metadatas)
+        ]
+        return cls(arena_path, offsets, records)
+
+    @staticmethod
+    def _record(meta: Optional[Dict[str, Any]], text: Optional[str], ordinals: ChunkOrdinals) -> ChunkRecord:
+        """Rekord chunka z metadanych Chroma (chunk_id ze źródła, strony, numeru i treści, gdy go brak)."""
+        meta = meta or {}
+        source = sys.intern(str(meta.get("source", "")))
+        page = meta.get("page")
+        page = page if isinstance(page, int) else None
+        # Numer jest liczony dla każdego chunka, także z gotowym chunk_id - jak w NearDuplicateFilter
+        ordinal = ordinals.next(source, page)
+        return ChunkRecord(
+            chunk_id=meta.get("chunk_id") or chunk_id(source, text or "", page, ordinal),
+            source=source,
+            page=page,
+            heading_path=sys.intern(meta.get("heading_path", "") or ""),
+            duplicate_sources=meta.get("duplicate_sources", "") or "",
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def close(self) -> None:
+        """Zamyka mmap i plik areny."""
+        if isinstance(self._arena, mmap.mmap):
+            self._arena.close()
+        self._file.close()
+
+    def fingerprint(self) -> str:
+        """Odcisk korpusu (identyfikatory chunków w kolejności i rozmiar areny) - do walidacji zapisanych indeksów."""
+        digest = hashlib.blake2b(digest_size=16)
+        for record in self.records:
+            digest.update(record.chunk_id.encode("utf-8"))
+            digest.update(b"\n")
+        digest.update(str(self.arena_bytes).encode("ascii"))
+        return digest.hexdigest()
+
+    @property
+    def arena_bytes(self) -> int:
+        """Rozmiar areny (poza stertą Pythona)."""
+        return int(self.offsets[-1])
+
+    def text(self, position: int) -> str:
+        """Treść chunka na danej pozycji."""
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return self._arena[start:end].decode("utf-8")
+
+    def iter_texts(self) -> Iterator[str]:
+        """Kolejne treści chunków (np. do budowy indeksu BM25)."""
+        for position in range(len(self.records)):
+            yield self.text(position)
+
+    def document(self, position: int) -> Document:
+        """Tworzy Document dla chunka na danej pozycji."""
+        return Document(page_content=self.text(position), metadata=self.records[position].metadata())
+
+    def position_of(self, doc: Document) -> Optional[int]:
+        """
+        Pozycja chunka w magazynie dla dokumentu z Chroma lub z magazynu.
+
+        Args:
+            doc: Dokument z metadanymi (chunk_id; bez niego szukana jest treść).
+
+        Returns:
+            Pozycja albo None, jeśli chunka nie ma w magazynie.
+        """
+        cid = doc.metadata.get("chunk_id")
+        position = self._by_id.get(cid) if cid else None
+        if position is None:
+            position = self.find_text(doc.page_content)
+        return position
+
+    def find_text(self, text: str) -> Optional[int]:
+        """Pozycja pierwszego chunka o dokładnie takiej treści (albo None)."""
+        if self._by_hash is None:
+            self._by_hash = {}
+            for position, chunk in enumerate(self.iter_texts()):
+                self._by_hash.setdefault(hash(chunk), position)
+        position = self._by_hash.get(hash(text))
+        if position is not None and self.text(position) == text:
+            return position
+        return None
@@ -0,0 +1,155 @@
+"""
+Budżet latencji pytania i łagodna degradacja (SLO dla użytkownika interaktywnego).
+
+QueryDeadline dzieli budżet pytania na etapy: dekompozycja, retrieval
+i generacja (reszta czasu). Agent sprawdza plan przed każdym etapem
+i zamiast przekraczać budżet rezygnuje z części pracy:
+- pomija dekompozycję, gdy jej okno jest za krótkie,
+- zmniejsza k, gdy retrieval zaczyna się po czasie (mniej fragmentów to
+  także krótszy prompt),
+- przycina kontekst do liczby tokenów, które model zdąży przetworzyć,
+- ogranicza num_predict do liczby tokenów, które zdążą się wygenerować,
+- zwraca uciętą odpowiedź, gdy generacja nie zmieści się mimo limitu.
+Każda degradacja trafia do wyniku ask() ("degradations").
+
+Wszystkie wywołania Ollama w trakcie pytania dostają deadline budżetu i wspólny
+CancelToken (ollama_client.request_scope), więc Ctrl+C przerywa też trwające
+żądania HTTP, a nie tylko pętlę w main.py.
+Professional Local RAG Agent - Initial Release"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from colorama import Fore, init
+
+import config
+from ollama_client import CancelToken, request_scope
+
+init(autoreset=True)
+
+STAGES = ("decompose", "retrieve", "generate")
+
+
+class QueryDeadline:
+    """Plan czasowy jednego pytania i lista zastosowanych degradacji."""
+
+    def __init__(
+        self,
+        budget_s: Optional[float] = config.ASK_BUDGET_S,
+        cancel: Optional[CancelToken] = None,
+        decompose_share: float = config.DEADLINE_DECOMPOSE_SHARE,
+        retrieve_share: float = config.DEADLINE_RETRIEVE_SHARE,
+    ) -> None:
+        """
+        Args:
+            budget_s: Budżet całego pytania w sekundach (None = bez limitu, tylko anulowanie).
+            cancel: Token anulowania; domyślnie nowy.
+            decompose_share: Część budżetu na dekompozycję.
+            retrieve_share: Część budżetu na retrieval; generacja dostaje resztę.
+        """
+        if budget_s is not None and budget_s <= 0:
+            raise ValueError("Budżet pytania musi być dodatni")
+        if decompose_share < 0 or retrieve_share < 0 or decompose_share + retrieve_share >= 1:
+            raise ValueError("Udziały etapów muszą zostawić czas na generację")
+        self.budget_s = budget_s
+        self.cancel = cancel or CancelToken()
+        self.start = time.monotonic()
+        self.deadline = self.start + budget_s if budget_s is not None else None
+        # Planowany koniec każdego etapu (sekundy od startu)
+        shares = {"decompose": decompose_share, "retrieve": decompose_share + retrieve_share, "generate": 1.0}
+        self._stage_end: Dict[str, float] = {
+            stage: budget_s * share if budget_s is not None else float("inf") for stage, share in shares.items()
+        }
+        self.degradations: List[str] = []
+
+    @property
+    def bounded(self) -> bool:
+        """Czy pytanie ma budżet czasu."""
+        return self.deadline is not None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> Optional[float]:
+        """Sekundy do końca budżetu (None bez budżetu)."""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def stage_window(self, stage: str) -> Optional[float]:
+        """Sekundy do planowanego końca etapu (None bez budżetu, ujemne po czasie)."""
+        if self.deadline is None:
+            return None
+        return self.start + self._stage_end[stage] - time.monotonic()
+
+    def stage_deadline(self, stage: str) -> Optional[float]:
+        """Planowany koniec etapu jako time.monotonic() (dla request_scope)."""
+        return None if self.deadline is None else self.start + self._stage_end[stage]
+
+    def behind(self, stage: str) -> bool:
+        """Czy etap zaczyna się później niż w planie (poprzedni etap przekroczył swoje okno)."""
+        index = STAGES.index(stage)
+        if self.deadline is None or index == 0:
+            return False
+        return self.elapsed() > self._stage_end[STAGES[index - 1]]
+
+    def degrade(self, code: str, reason: str) -> None:
+        """
+        Zapisuje degradację i informuje o niej użytkownika.
+
+        Args:
+            code: Kod do wyniku ask(), np. "skip_decomposition" albo "shrink_k:4".
+            reason: Opis dla użytkownika.
+        """
+        self.degradations.append(code)
+        print(f"{Fore.YELLOW}⏱ Budget: {reason}")
+
+    def prompt_tokens(self, limit: int) -> int:
+        """
+        Długość promptu, którą model zdąży przetworzyć w DEADLINE_CONTEXT_SHARE pozostałego czasu.
+
+        Args:
+            limit: Limit bez budżetu (okno kontekstu).
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        affordable = remaining * config.DEADLINE_CONTEXT_SHARE * config.DEADLINE_PREFILL_TOKENS_PER_S
+        return max(0, min(limit, int(affordable)))
+
+    def num_predict(self, prompt_tokens: int, limit: int = config.LLM_MAX_TOKENS) -> int:
+        """
+        Limit tokenów odpowiedzi, który zmieści się w pozostałym budżecie.
+
+        Args:
+            prompt_tokens: Szacowana długość promptu (czas przetwarzania promptu).
+            limit: Limit bez budżetu (LLM_MAX_TOKENS).
+
+        Returns:
+            Liczba tokenów, najmniej DEADLINE_MIN_NUM_PREDICT.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        decode_s = remaining - prompt_tokens / config.DEADLINE_PREFILL_TOKENS_PER_S
+        affordable = int(decode_s * config.DEADLINE_DECODE_TOKENS_PER_S)
+        return max(config.DEADLINE_MIN_NUM_PREDICT, min(limit, affordable))
+
+    @contextmanager
+    def scope(self, stage: Optional[str] = None) -> Iterator[None]:
+        """
+        Zakres wywołań Ollama z deadline'em budżetu (lub etapu) i tokenem anulowania.
+
+        Args:
+            stage: Etap, którego planowany koniec ogranicza wywołania (None = cały budżet).
+        """
+        deadline = self.stage_deadline(stage) if stage is not None else self.deadline
+        with request_scope(deadline, self.cancel):
+            yield
+
+    def summary(self) -> Dict[str, object]:
+        """Pola do wyniku ask()."""
+        return {
+            "budget_s": self.budget_s,
+            "elapsed_s": round(self.elapsed(), 3),
+            "degradations": list(self.degradations),
+        }
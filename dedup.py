@@ -0,0 +1,304 @@
+"""
+Eliminacja prawie identycznych fragmentów tekstu przed embeddingiem.
+
+Nagłówki, stopki, klauzule prawne i spisy treści powtarzają się na każdej
+stronie PDF-ów. Filtr liczy sygnatury MinHash po shinglach słów, szuka
+kandydatów przez LSH (banding) i odrzuca chunki, których podobieństwo
+Jaccarda do wcześniejszego chunka przekracza próg. Dla każdego odrzuconego
+chunka zapamiętuje chunk kanoniczny, aby zachować atrybucję źródeł.
+Professional Local RAG Agent - Initial Release"""
+
+import hashlib
+import json
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from colorama import Fore, init
+
+import config
+
+init(autoreset=True)
+
+# Liczba pierwsza Mersenne'a 2^31 - 1: a * h mieści się w uint64 dla 32-bitowych hashy
+_MERSENNE_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"\w+")
+_DIGIT_RE = re.compile(r"\d+")
+
+
+def chunk_id(source: str, text: str, page: Optional[int] = None, ordinal: int = 0) -> str:
+    """
+    Zwraca deterministyczny identyfikator chunka (źródło, strona, numer chunka na stronie, treść).
+
+    Strona i numer rozróżniają fragmenty powtarzające się w jednym pliku
+    (stopka na każdej stronie, ten sam akapit dwa razy na stronie).
+
+    Args:
+        source: Ścieżka pliku źródłowego.
+        text: Treść chunka.
+        page: Numer strony (None dla plików bez stron).
+        ordinal: Numer chunka w obrębie źródła i strony (ChunkOrdinals).
+
+    Returns:
+        Skrót SHA-1 w postaci heksadecymalnej.
+    """
+    page_key = page if isinstance(page, int) else ""
+    return hashlib.sha1(f"{source}\x00{page_key}\x00{ordinal}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class ChunkOrdinals:
+    """Numeruje kolejne chunki w obrębie (źródło, strona) - w kolejności ingestii."""
+
+    def __init__(self) -> None:
+        self._counts: Dict[Tuple[str, Any], int] = {}
+
+    def next(self, source: str, page: Any) -> int:
+        """Numer kolejnego chunka danej strony (od 0)."""
+        key = (source, page if isinstance(page, int) else None)
+        ordinal = self._counts.get(key, 0)
+        self._counts[key] = ordinal + 1
+        return ordinal
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Dobiera liczbę pasm LSH tak, aby próg kandydatów leżał nieco poniżej
+    docelowego progu (mniej pominiętych duplikatów; i tak weryfikujemy).
+    """
+    target = max(0.05, threshold - 0.1)
+    best = (num_perm, 1)
+    best_err = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        err = abs((1.0 / bands) ** (1.0 / rows) - target)
+        if err < best_err:
+            best, best_err = (bands, rows), err
+    return best
+
+
+class NearDuplicateFilter:
+    """
+    Filtr prawie-duplikatów oparty o MinHash + LSH.
+
+    Chunkiem kanonicznym jest pierwszy chunk danej grupy (kolejność ingestii).
+    """
+
+    def __init__(
+        self,
+        threshold: float = config.DEDUP_THRESHOLD,
+        num_perm: int = config.DEDUP_NUM_PERM,
+        shingle_size: int = config.DEDUP_SHINGLE_SIZE,
+        seed: int = 42,
+    ) -> None:
+        """
+        Args:
+            threshold: Minimalne (szacowane) podobieństwo Jaccarda uznawane za duplikat.
+            num_perm: Liczba funkcji haszujących w sygnaturze MinHash.
+            shingle_size: Długość shingla w słowach.
+            seed: Ziarno generatora permutacji (stałe = powtarzalne wyniki).
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        # chunk_id odrzuconego -> informacje o chunku kanonicznym
+        self.mapping: Dict[str, Dict[str, Any]] = {}
+        # Indeks LSH kanonicznych chunków (także z seed()) - wspólny dla kolejnych wywołań filter()
+        self._buckets: List[Dict[bytes, int]] = [{} for _ in range(self.bands)]
+        self._canonical: List[Dict[str, Any]] = []
+        self._signatures: List[np.ndarray] = []
+        # Pozycja chunka z seed() -> identyfikator w kolekcji
+        self._seed_ids: Dict[int, str] = {}
+        # Identyfikator chunka z kolekcji -> metadane z dopisanymi duplicate_sources
+        self.updated_seeds: Dict[str, Dict[str, Any]] = {}
+        self._ordinals = ChunkOrdinals()
+
+    def _shingles(self, text: str) -> List[str]:
+        """Normalizuje tekst (wielkość liter, liczby) i tnie na shingle słów."""
+        words = _WORD_RE.findall(_DIGIT_RE.sub("0", text.lower()))
+        if len(words) <= self.shingle_size:
+            return [" ".join(words)]
+        return [
+            " ".join(words[i:i + self.shingle_size])
+            for i in range(len(words) - self.shingle_size + 1)
+        ]
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Liczy sygnaturę MinHash tekstu.
+
+        Args:
+            text: Tekst chunka.
+
+        Returns:
+            Wektor uint64 o długości num_perm.
+        """
+        hashes = np.fromiter(
+            {zlib.crc32(s.encode("utf-8")) & _MERSENNE_PRIME for s in self._shingles(text)},
+            dtype=np.uint64,
+        )
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [sig[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _index(self, metadata: Dict[str, Any], sig: np.ndarray, band_keys: List[bytes]) -> None:
+        """Dopisuje chunk kanoniczny do indeksu LSH."""
+        for band, key in enumerate(band_keys):
+            self._buckets[band].setdefault(key, len(self._canonical))
+        self._canonical.append(metadata)
+        self._signatures.append(sig)
+
+    def seed(
+        self,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        signatures: Optional[Iterable[Optional[np.ndarray]]] = None,
+    ) -> List[np.ndarray]:
+        """
+        Indeksuje chunki już obecne w kolekcji jako kanoniczne (ingestia przyrostowa).
+
+        Nowe chunki podobne do nich są odrzucane przez filter(); ich źródła są
+        dopisywane do 'duplicate_sources' chunka z kolekcji (updated_seeds).
+
+        Args:
+            ids: Identyfikatory chunków w kolekcji.
+            texts: Treści chunków.
+            metadatas: Metadane chunków (z chunk_id).
+            signatures: Sygnatury policzone wcześniej (None = liczone od nowa).
+
+        Returns:
+            Sygnatury chunków (do ponownego użycia przy kolejnej aktualizacji).
+        """
+        known = list(signatures) if signatures is not None else [None] * len(ids)
+        result: List[np.ndarray] = []
+        for chunk_ref, text, metadata, sig in zip(ids, texts, metadatas, known):
+            if sig is None:
+                sig = self.signature(text)
+            self._seed_ids[len(self._canonical)] = chunk_ref
+            self._index(dict(metadata or {}), sig, self._band_keys(sig))
+            result.append(sig)
+        return result
+
+    def filter(self, chunks: List) -> List:
+        """
+        Usuwa prawie-duplikaty z listy chunków.
+
+        Każdy chunk dostaje w metadanych 'chunk_id'; chunki kanoniczne dostają
+        dodatkowo 'duplicate_sources' (źródła odrzuconych kopii, rozdzielone ';').
+
+        Args:
+            chunks: Lista dokumentów (wynik split_documents).
+
+        Returns:
+            Lista chunków kanonicznych w oryginalnej kolejności.
+        """
+        kept: List = []
+
+        for chunk in chunks:
+            source = chunk.metadata.get("source", "")
+            page = chunk.metadata.get("page")
+            chunk.metadata["chunk_id"] = chunk_id(source, chunk.page_content, page, self._ordinals.next(source, page))
+            sig = self.signature(chunk.page_content)
+            band_keys = self._band_keys(sig)
+
+            best_idx, best_sim = -1, 0.0
+            for band, key in enumerate(band_keys):
+                idx = self._buckets[band].get(key)
+                if idx is None:
+                    continue
+                similarity = float(np.mean(self._signatures[idx] == sig))
+                if similarity > best_sim:
+                    best_idx, best_sim = idx, similarity
+
+            if best_idx >= 0 and best_sim >= self.threshold:
+                canonical = self._canonical[best_idx]
+                self.mapping[chunk.metadata["chunk_id"]] = {
+                    "source": source,
+                    "page": page,
+                    "canonical_id": canonical.get("chunk_id", ""),
+                    "canonical_source": canonical.get("source", ""),
+                    "similarity": round(best_sim, 4),
+                }
+                if source and source != canonical.get("source"):
+                    known = canonical.get("duplicate_sources", "")
+                    known_list = known.split(";") if known else []
+                    if source not in known_list:
+                        canonical["duplicate_sources"] = ";".join(known_list + [source])
+                        if best_idx in self._seed_ids:
+                            self.updated_seeds[self._seed_ids[best_idx]] = canonical
+                continue
+
+            self._index(chunk.metadata, sig, band_keys)
+            kept.append(chunk)
+
+        removed = len(chunks) - len(kept)
+        if chunks:
+            print(
+                f"{Fore.GREEN}✓ Deduplikacja: odrzucono {removed}/{len(chunks)} "
+                f"prawie identycznych fragmentów (próg {self.threshold:.2f})"
+            )
+        return kept
+
+    def save_mapping(
+        self,
+        path: Path = config.CHROMA_DB_DIR / config.DEDUP_MAP_FILE,
+        replaced_sources: Iterable[str] = (),
+    ) -> None:
+        """
+        Zapisuje mapowanie odrzucony -> kanoniczny do pliku JSON.
+
+        Istniejący plik jest uzupełniany (ingest_md.py dopisuje do bazy z ingest.py).
+        Wpisy plików przetworzonych od nowa (zmienionych i usuniętych) są
+        usuwane - zarówno ich odrzucone chunki, jak i odwołania do ich chunków
+        kanonicznych.
+
+        Args:
+            path: Ścieżka pliku z mapowaniem.
+            replaced_sources: Źródła, których chunki zostały zastąpione lub usunięte.
+        """
+        replaced = set(replaced_sources)
+        existing = {
+            dropped_id: entry
+            for dropped_id, entry in load_mapping(path).items()
+            if entry.get("source") not in replaced and entry.get("canonical_source") not in replaced
+        }
+        existing.update(self.mapping)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps({"threshold": self.threshold, "dropped": existing}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
+
+
+def load_mapping(path: Path = config.CHROMA_DB_DIR / config.DEDUP_MAP_FILE) -> Dict[str, Dict[str, Any]]:
+    """
+    Wczytuje mapowanie odrzucony -> kanoniczny (pusty słownik, gdy pliku brak lub jest uszkodzony).
+
+    Args:
+        path: Ścieżka pliku z mapowaniem.
+
+    Returns:
+        chunk_id odrzuconego -> informacje o chunku kanonicznym.
+    """
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8")).get("dropped", {})
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,197 @@
+"""
+Wyszukiwanie wektorowe na macierzy embeddingów (numpy, opcjonalnie mmap).
+
+Klient Chroma i jego indeks HNSW są ładowane osobno w każdym procesie.
+DenseIndex trzyma embeddingi chunków w jednej macierzy float32 w kolejności
+CorpusStore, więc w trybie pre-fork (serving.py) wszystkie procesy czytają
+te same strony pliku. Wyszukiwanie odtwarza zachowanie retrievera Chroma
+z search_type="mmr": fetch_k najbliższych w metryce L2, potem MMR
+(maximal_marginal_relevance z LangChain) i wynik w kolejności odległości.
+
+Z redukcją wymiaru (reduction.py) pierwszy przebieg liczy odległości na
+zredukowanej macierzy, a tylko shortlista kandydatów jest przeliczana na
+pełnych wektorach; MMR zawsze używa pełnych wektorów.
+Professional Local RAG Agent - Initial Release"""
+
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+
+import config
+from reduction import EmbeddingReducer
+
+
+class DenseIndex:
+    """Macierz embeddingów chunków z wyszukiwaniem L2 + MMR."""
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        reducer: Optional[EmbeddingReducer] = None,
+        reduced: Optional[np.ndarray] = None,
+        rescore_factor: int = config.EMBEDDING_RESCORE_FACTOR,
+    ) -> None:
+        """
+        Args:
+            matrix: Embeddingi (n x dim, float32), wiersz = pozycja w CorpusStore.
+            reducer: Opcjonalna redukcja wymiaru dla pierwszego przebiegu.
+            reduced: Gotowa macierz reducer.transform(matrix) (np. z mmap); domyślnie liczona.
+            rescore_factor: Shortlista = rescore_factor x k kandydatów z pierwszego przebiegu.
+        """
+        self.matrix = matrix
+        self.sq_norms = self._sq_norms(matrix)
+        self.reducer = reducer
+        if reducer is not None and reduced is None:
+            reduced = reducer.transform(matrix)
+        self.reduced = reduced
+        self.reduced_sq_norms = self._sq_norms(reduced) if reduced is not None else None
+        self.rescore_factor = max(1, rescore_factor)
+
+    @staticmethod
+    def _sq_norms(matrix: np.ndarray) -> np.ndarray:
+        return np.einsum("ij,ij->i", matrix, matrix, dtype=np.float32) if len(matrix) else np.zeros(0, dtype=np.float32)
+
+    @staticmethod
+    def reduced_path(path: Path) -> Path:
+        """Plik zredukowanej macierzy obok pełnej (embeddings.npy -> embeddings.reduced.npy)."""
+        path = Path(path)
+        return path.with_name(f"{path.stem}.reduced{path.suffix}")
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True, reducer: Optional[EmbeddingReducer] = None) -> "DenseIndex":
+        """
+        Otwiera macierz zapisaną przez np.save.
+
+        Args:
+            path: Plik .npy z macierzą embeddingów.
+            mmap: Otwiera macierz przez mmap (tylko do odczytu).
+            reducer: Opcjonalna redukcja - zredukowana macierz jest czytana z reduced_path(path),
+                jeśli pasuje, albo liczona od nowa.
+        """
+        mmap_mode = "r" if mmap else None
+        matrix = np.load(path, mmap_mode=mmap_mode)
+        reduced = None
+        reduced_path = cls.reduced_path(path)
+        if reducer is not None and reduced_path.exists():
+            reduced = np.load(reduced_path, mmap_mode=mmap_mode)
+            if reduced.shape != (len(matrix), reducer.dim):
+                reduced = None
+        return cls(matrix, reducer, reduced)
+
+    @property
+    def nbytes(self) -> int:
+        reduced = self.reduced.nbytes + self.reduced_sq_norms.nbytes if self.reduced is not None else 0
+        return self.matrix.nbytes + self.sq_norms.nbytes + reduced
+
+    @staticmethod
+    def _closest(matrix: np.ndarray, sq_norms: np.ndarray, query: np.ndarray, k: int, candidates: Optional[np.ndarray]) -> np.ndarray:
+        """k pozycji najbliższych w L2 (wszystkie wiersze albo tylko candidates), rosnąco wg odległości."""
+        if candidates is None:
+            candidates = np.arange(len(matrix))
+            distances = sq_norms - 2 * (matrix @ query)
+        else:
+            distances = sq_norms[candidates] - 2 * (matrix[candidates] @ query)
+        k = min(k, len(candidates))
+        top = np.argpartition(distances, k - 1)[:k]
+        return candidates[top[np.argsort(distances[top], kind="stable")]]
+
+    def nearest(self, query_embedding: Sequence[float], k: int, positions: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        k najbliższych chunków w metryce L2 (jak domyślna przestrzeń Chroma).
+
+        Z redukcją wymiaru: shortlista rescore_factor x k z zredukowanych
+        wektorów, potem ranking na pełnych.
+
+        Args:
+            query_embedding: Embedding zapytania.
+            k: Liczba wyników.
+            positions: Opcjonalne ograniczenie do podzbioru pozycji (filtry).
+
+        Returns:
+            Pozycje rosnąco wg odległości.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        candidates = None if positions is None else np.asarray(positions, dtype=np.int64)
+        total = len(self.matrix) if candidates is None else len(candidates)
+        if not total or k <= 0:
+            return []
+        shortlist = k * self.rescore_factor
+        if self.reduced is not None and shortlist < total:
+            candidates = self._closest(
+                self.reduced, self.reduced_sq_norms, self.reducer.transform(query), shortlist, candidates
+            )
+        return self._closest(self.matrix, self.sq_norms, query, k, candidates).tolist()
+
+    def mmr(
+        self,
+        query_embedding: Sequence[float],
+        k: int = config.RETRIEVER_K,
+        fetch_k: int = config.RETRIEVER_FETCH_K,
+        lambda_mult: float = 0.5,
+        positions: Optional[Sequence[int]] = None,
+    ) -> List[int]:
+        """
+        Wyszukiwanie MMR jak Chroma.max_marginal_relevance_search_by_vector.
+
+        Returns:
+            Wybrane pozycje w kolejności odległości od zapytania.
+        """
+        fetched = self.nearest(query_embedding, fetch_k, positions)
+        if not fetched:
+            return []
+        selected = maximal_marginal_relevance(
+            np.asarray(query_embedding, dtype=np.float32),
+            np.asarray(self.matrix[fetched]),
+            k=k,
+            lambda_mult=lambda_mult,
+        )
+        return [fetched[i] for i in sorted(selected)]
+
+
+class DenseRetriever:
+    """
+    Retriever wektorowy na DenseIndex - zamiennik vectorstore.as_retriever("mmr")
+    dla HybridRetriever, z obsługą filtrów przez listę pozycji.
+    """
+
+    supports_positions = True
+
+    def __init__(self, index: DenseIndex, store, embeddings, k: int = config.RETRIEVER_K, fetch_k: int = config.RETRIEVER_FETCH_K) -> None:
+        """
+        Args:
+            index: DenseIndex w kolejności magazynu.
+            store: CorpusStore z treścią chunków.
+            embeddings: Model embeddingów zapytań (embed_query).
+            k: Liczba zwracanych dokumentów.
+            fetch_k: Liczba kandydatów dla MMR.
+        """
+        self.index = index
+        self.store = store
+        self.embeddings = embeddings
+        self.k = k
+        self.fetch_k = fetch_k
+
+    def invoke(
+        self,
+        query: str,
+        positions: Optional[Sequence[int]] = None,
+        embedding: Optional[Sequence[float]] = None,
+        k: Optional[int] = None,
+    ) -> List[Document]:
+        """
+        Zwraca dokumenty dla zapytania.
+
+        Args:
+            query: Zapytanie.
+            positions: Opcjonalne ograniczenie do pozycji z partycji (filtry).
+            embedding: Gotowy embedding zapytania (bez ponownego wywołania modelu).
+            k: Liczba wyników zamiast domyślnej.
+        """
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+        k = k or self.k
+        selected = self.index.mmr(embedding, k, max(self.fetch_k, k), positions=positions)
+        return [self.store.document(pos) for pos in selected]
@@ -0,0 +1,385 @@
+"""
+Tryb obserwacji folderu docs/: przyrostowa ingestia zmienionych plików.
+
+`python ingest.py --watch` skanuje docs/ co WATCH_POLL_INTERVAL_S (mtime
+i rozmiar plików PDF i Markdown - bez dodatkowych zależności, działa też na
+udziałach sieciowych, gdzie powiadomienia systemu plików zawodzą):
+- seria zdarzeń jest zbierana do WATCH_DEBOUNCE_S ciszy (kopiowanie dużego
+  PDF-a albo zapis wielu plików naraz to jedna aktualizacja), najdłużej
+  WATCH_MAX_DELAY_S przy ciągłym strumieniu zmian,
+- przez potok (wczytanie, chunking, deduplikacja, embeddingi) przechodzą
+  tylko dodane i zmienione pliki; chunki zmienionych i usuniętych plików są
+  usuwane z kolekcji po źródle,
+- indeksy pochodne (BM25, centroidy) są przebudowywane z kolekcji bez
+  ponownego liczenia embeddingów, a na końcu podbijana jest wersja indeksu
+  (index_version.py) - uruchomieni agenci przeładowują go przed kolejnym
+  pytaniem,
+- nowe chunki są dodawane przed usunięciem starych, a seria, której
+  aktualizacja się nie powiodła (np. Ollama niedostępna), wraca do
+  debouncera i jest ponawiana po kolejnym okresie ciszy,
+- dla każdej aktualizacji raportowane jest opóźnienie od zdarzenia (mtime
+  pliku) do zatwierdzenia i przepustowość (fragmenty/s), a przy wyjściu
+  podsumowanie (p50/p95).
+Deduplikacja działa względem całej kolekcji (filtr jest zasilany sygnaturami
+chunków niezmienionych plików); pliki, których chunki odrzucono jako kopie
+chunków zmienionego pliku, są przetwarzane razem z nim, a ich wpisy
+w mapowaniu duplikatów są zastępowane.
+Stan zaindeksowanych plików jest zapisywany w WATCH_STATE_FILE, więc po
+restarcie obserwator nadrabia tylko zmiany z czasu przerwy.
+Professional Local RAG Agent - Initial Release"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from colorama import Fore, init
+
+import config
+from dedup import NearDuplicateFilter, load_mapping
+from index_version import commit_version
+
+init(autoreset=True)
+
+# Plik -> (mtime_ns, rozmiar)
+FileState = Tuple[int, int]
+
+
+def scan_docs(docs_dir: Path = config.DOCS_DIR) -> Dict[str, FileState]:
+    """
+    Stan plików do ingestii (PDF w docs/ jak ingest.py, Markdown rekurencyjnie jak ingest_md.py).
+
+    Returns:
+        Ścieżka (jak w metadanych "source") -> (mtime_ns, rozmiar).
+    """
+    files: Dict[str, FileState] = {}
+    for pattern in ("*.pdf", "**/*.md"):
+        for path in Path(docs_dir).glob(pattern):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Plik usunięty między glob a stat - zobaczymy to w kolejnym skanie
+                continue
+            if path.is_file():
+                files[str(path)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class ChangeDebouncer:
+    """Zbiera zmienione pliki do chwili ciszy (albo maksymalnego opóźnienia)."""
+
+    def __init__(
+        self,
+        debounce_s: float = config.WATCH_DEBOUNCE_S,
+        max_delay_s: float = config.WATCH_MAX_DELAY_S,
+    ) -> None:
+        """
+        Args:
+            debounce_s: Czas bez nowych zmian, po którym seria jest gotowa.
+            max_delay_s: Najdłuższy czas od pierwszej zmiany serii.
+        """
+        self.debounce_s = debounce_s
+        self.max_delay_s = max_delay_s
+        # Plik -> czas zdarzenia (time.time) najwcześniejszej zmiany w serii
+        self.pending: Dict[str, float] = {}
+        self._first_seen = 0.0
+        self._last_seen = 0.0
+
+    def add(self, source: str, event_at: float, now: float) -> None:
+        """
+        Dopisuje zmianę pliku do bieżącej serii.
+
+        Args:
+            source: Ścieżka pliku.
+            event_at: Czas zdarzenia (mtime pliku albo chwila wykrycia usunięcia).
+            now: Bieżący czas monotoniczny.
+        """
+        if not self.pending:
+            self._first_seen = now
+        self._last_seen = now
+        self.pending[source] = min(self.pending.get(source, event_at), event_at)
+
+    def ready(self, now: float) -> Dict[str, float]:
+        """Zwraca (i zeruje) serię, jeśli minęła cisza albo maksymalne opóźnienie; inaczej pusty słownik."""
+        if not self.pending:
+            return {}
+        if now - self._last_seen < self.debounce_s and now - self._first_seen < self.max_delay_s:
+            return {}
+        batch, self.pending = self.pending, {}
+        return batch
+
+
+class DocsWatcher:
+    """Obserwator docs/ z przyrostową ingestią i zatwierdzaniem wersji indeksu."""
+
+    def __init__(
+        self,
+        ingestor,
+        docs_dir: Path = config.DOCS_DIR,
+        poll_interval_s: float = config.WATCH_POLL_INTERVAL_S,
+        debouncer: Optional[ChangeDebouncer] = None,
+        state_path: Path = config.CHROMA_DB_DIR / config.WATCH_STATE_FILE,
+    ) -> None:
+        """
+        Args:
+            ingestor: ingest.DocumentIngestor (embeddingi, chunker, budowa indeksów pochodnych).
+            docs_dir: Obserwowany folder.
+            poll_interval_s: Odstęp skanowania.
+            debouncer: Zbieranie serii zdarzeń (domyślnie wg config).
+            state_path: Plik stanu zaindeksowanych plików.
+        """
+        from langchain_community.vectorstores import Chroma
+
+        self.ingestor = ingestor
+        self.docs_dir = Path(docs_dir)
+        self.poll_interval_s = poll_interval_s
+        self.debouncer = debouncer or ChangeDebouncer()
+        self.state_path = Path(state_path)
+        self.vectorstore = Chroma(
+            persist_directory=str(config.CHROMA_DB_DIR),
+            embedding_function=ingestor.embeddings,
+            collection_name=config.CHROMA_COLLECTION_NAME,
+        )
+        # Pliki, których chunki są w kolekcji -> stan z chwili ingestii
+        self.indexed: Dict[str, FileState] = {}
+        self._last_scan: Dict[str, FileState] = {}
+        self.updates = 0
+        self.files_done = 0
+        self.chunks_added = 0
+        self.chunks_removed = 0
+        self.busy_s = 0.0
+        self.latencies: List[float] = []
+        # Identyfikator chunka w kolekcji -> sygnatura MinHash (z poprzedniej aktualizacji)
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    # ==================== STAN I WYKRYWANIE ZMIAN ====================
+
+    def _load_state(self) -> Dict[str, FileState]:
+        try:
+            return {source: tuple(state) for source, state in json.loads(self.state_path.read_text(encoding="utf-8")).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path.with_name(f"{self.state_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.indexed, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.state_path)
+
+    def _event_time(self, state: Optional[FileState], wall_now: float) -> float:
+        """Czas zdarzenia: mtime pliku, jeśli jest świeży (skopiowane pliki mogą mieć stary mtime)."""
+        if state is not None:
+            mtime = state[0] / 1e9
+            if wall_now - 2 * self.poll_interval_s <= mtime <= wall_now:
+                return mtime
+        return wall_now
+
+    def reconcile(self) -> Dict[str, float]:
+        """
+        Porównuje docs/ z kolekcją i zapisanym stanem (zmiany z czasu, gdy obserwator nie działał).
+
+        Returns:
+            Pliki do przetworzenia -> czas wykrycia.
+        """
+        metadatas = self.vectorstore._collection.get(include=["metadatas"])["metadatas"]
+        in_collection = {str((meta or {}).get("source", "")) for meta in metadatas}
+        saved = self._load_state()
+        current = scan_docs(self.docs_dir)
+        wall_now = time.time()
+        changed: Dict[str, float] = {}
+        for source, state in current.items():
+            if source not in in_collection:
+                changed[source] = wall_now
+                continue
+            # Bez zapisanego stanu (pełna ingestia) plik z kolekcji uznajemy za aktualny
+            self.indexed[source] = saved.get(source, state)
+            if self.indexed[source] != state:
+                changed[source] = wall_now
+        docs_prefix = str(self.docs_dir)
+        for source in in_collection:
+            if source.startswith(docs_prefix) and source not in current:
+                self.indexed[source] = saved.get(source, (0, 0))
+                changed[source] = wall_now
+        self._last_scan = current
+        return changed
+
+    def poll(self) -> None:
+        """Jeden skan docs/: różnice względem poprzedniego skanu trafiają do bieżącej serii."""
+        current = scan_docs(self.docs_dir)
+        now, wall_now = time.monotonic(), time.time()
+        for source in current.keys() | self._last_scan.keys():
+            state = current.get(source)
+            if state != self._last_scan.get(source):
+                self.debouncer.add(source, self._event_time(state, wall_now), now)
+        self._last_scan = current
+
+    # ==================== PRZYROSTOWA INGESTIA ====================
+
+    def apply(self, changes: Dict[str, float], catch_up: bool = False) -> None:
+        """
+        Przetwarza serię zmian i zatwierdza nową wersję indeksu.
+
+        Args:
+            changes: Zmienione pliki -> czas zdarzenia.
+            catch_up: Nadrabianie po starcie (bez pomiaru opóźnienia).
+        """
+        start = time.perf_counter()
+        collection = self.vectorstore._collection
+        if config.DEDUP_ENABLED:
+            # Chunki odrzucone jako kopie chunków zmienianego pliku nie są w kolekcji -
+            # ich pliki przetwarzamy od nowa, żeby treść nie zniknęła razem z kanonicznym
+            for entry in load_mapping().values():
+                dependent = entry.get("source")
+                if entry.get("canonical_source") in changes and dependent in self.indexed and dependent not in changes:
+                    changes[dependent] = changes[entry["canonical_source"]]
+        current = {source: state for source in changes if (state := _stat(source)) is not None}
+        added = sum(1 for source in current if source not in self.indexed)
+
+        # 1. Nowe wersje plików są wczytywane, zanim usuniemy stare chunki -
+        #    plik, który nie daje się wczytać (np. niedokończony PDF), zostaje w starej wersji
+        chunks: List = []
+        failed = []
+        for source in sorted(current):
+            try:
+                documents = self.ingestor.load_file(Path(source))
+                chunks.extend(self.ingestor.text_splitter.split_documents(documents))
+            except Exception as e:
+                print(f"{Fore.RED}✗ Błąd ładowania {Path(source).name}: {e} - pominięto (spróbuję przy kolejnej zmianie)")
+                failed.append(source)
+        for source in failed:
+            del current[source]
+            del changes[source]
+        if not changes:
+            return
+        # Filtr powstaje także bez nowych chunków - save_mapping() usuwa wpisy usuniętych plików
+        dedup_filter = NearDuplicateFilter() if config.DEDUP_ENABLED else None
+        if dedup_filter is not None and chunks:
+            data = collection.get(include=["documents", "metadatas"])
+            seeded = [
+                i for i, meta in enumerate(data["metadatas"])
+                if str((meta or {}).get("source", "")) not in changes
+            ]
+            ids = [data["ids"][i] for i in seeded]
+            signatures = dedup_filter.seed(
+                ids,
+                [data["documents"][i] for i in seeded],
+                [data["metadatas"][i] for i in seeded],
+                [self._signatures.get(chunk_ref) for chunk_ref in ids],
+            )
+            self._signatures = dict(zip(ids, signatures))
+            chunks = dedup_filter.filter(chunks)
+
+        # 2. Embeddingi tylko dla nowych chunków - dodawane przed usunięciem starych,
+        #    więc błąd Ollama w trakcie nie zostawia pliku bez chunków w kolekcji
+        old_ids: List[str] = []
+        for source in changes:
+            old_ids.extend(collection.get(where={"source": source}, include=[])["ids"])
+        if chunks:
+            self.vectorstore.add_documents(chunks)
+        if dedup_filter is not None:
+            if dedup_filter.updated_seeds:
+                # Nowe kopie chunków z kolekcji - atrybucja źródeł w metadanych kanonicznych
+                collection.update(
+                    ids=list(dedup_filter.updated_seeds),
+                    metadatas=list(dedup_filter.updated_seeds.values()),
+                )
+            dedup_filter.save_mapping(replaced_sources=changes)
+
+        # 3. Stare chunki zmienionych i usuniętych plików znikają z kolekcji
+        #    (także chunki z przerwanej wcześniej próby - są w old_ids)
+        if old_ids:
+            collection.delete(ids=old_ids)
+        removed = len(old_ids)
+
+        # 4. Indeksy pochodne z kolekcji (bez Ollama) i zatwierdzenie wersji
+        if collection.count():
+            self.ingestor.build_coarse_index()
+            self.ingestor.build_sparse_index()
+            if config.EMBEDDING_REDUCTION and not (config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE).exists():
+                self.ingestor.build_embedding_reduction()
+        else:
+            print(f"{Fore.YELLOW}⚠ Kolekcja jest pusta - agenci nie mają czego przeszukiwać")
+        for source in changes:
+            if source in current:
+                self.indexed[source] = current[source]
+            else:
+                self.indexed.pop(source, None)
+        self._save_state()
+        version = commit_version(changes, min(changes.values()))
+        elapsed = time.perf_counter() - start
+
+        deleted = len(changes) - len(current)
+        self.updates += 1
+        self.files_done += len(changes)
+        self.chunks_added += len(chunks)
+        self.chunks_removed += removed
+        self.busy_s += elapsed
+        line = (
+            f"{Fore.GREEN}✓ Wersja {version['version']}: +{added} ~{len(current) - added} -{deleted} plików, "
+            f"{len(chunks)} nowych / {removed} usuniętych fragmentów w {elapsed:.1f}s "
+            f"({len(chunks) / elapsed if elapsed > 0 else 0.0:.1f} fragm./s)"
+        )
+        if not catch_up:
+            latencies = [version["committed_at"] - event_at for event_at in changes.values()]
+            self.latencies.extend(latencies)
+            line += f" | zdarzenie → wyszukiwalne: śr. {sum(latencies) / len(latencies):.1f}s, maks. {max(latencies):.1f}s"
+        print(line)
+
+    def run(self) -> None:
+        """Pętla obserwacji (Ctrl+C kończy i wypisuje podsumowanie)."""
+        print(f"{Fore.CYAN}👁 Obserwuję {self.docs_dir} (skan co {self.poll_interval_s:.1f}s, cisza {self.debouncer.debounce_s:.1f}s)")
+        missed = self.reconcile()
+        if missed:
+            print(f"{Fore.CYAN}Nadrabianie {len(missed)} zmian z czasu, gdy obserwator nie działał...")
+            self._apply_or_retry(missed, catch_up=True)
+        else:
+            self._save_state()
+        try:
+            while True:
+                time.sleep(self.poll_interval_s)
+                self.poll()
+                batch = self.debouncer.ready(time.monotonic())
+                if batch:
+                    self._apply_or_retry(batch)
+        except KeyboardInterrupt:
+            self.print_summary()
+
+    def _apply_or_retry(self, batch: Dict[str, float], catch_up: bool = False) -> None:
+        """
+        Przetwarza serię; błąd (np. Ollama niedostępna, zablokowana baza) nie kończy obserwacji -
+        pliki serii wracają do debouncera i są ponawiane po kolejnym okresie ciszy.
+        """
+        try:
+            self.apply(dict(batch), catch_up=catch_up)
+        except Exception as e:
+            print(f"{Fore.RED}✗ Aktualizacja {len(batch)} plików nie powiodła się: {e} - ponowię po {self.debouncer.debounce_s:.1f}s ciszy")
+            now = time.monotonic()
+            for source, event_at in batch.items():
+                self.debouncer.add(source, event_at, now)
+
+    def print_summary(self) -> None:
+        """Podsumowanie pracy obserwatora: aktualizacje, przepustowość, opóźnienia."""
+        print(f"\n{Fore.CYAN}{'─' * 60}")
+        print(f"{Fore.CYAN}Aktualizacje: {self.updates}, pliki: {self.files_done}, "
+              f"fragmenty: +{self.chunks_added} / -{self.chunks_removed}")
+        if self.busy_s > 0:
+            print(f"{Fore.CYAN}Przepustowość: {self.chunks_added / self.busy_s:.1f} fragm./s, "
+                  f"{self.files_done / self.busy_s:.2f} plików/s (czas pracy {self.busy_s:.1f}s)")
+        if self.latencies:
+            print(f"{Fore.CYAN}Zdarzenie → wyszukiwalne: p50 {_percentile(self.latencies, 0.5):.1f}s, "
+                  f"p95 {_percentile(self.latencies, 0.95):.1f}s, maks. {max(self.latencies):.1f}s")
+        print(f"{Fore.CYAN}{'─' * 60}\n")
+
+
+def _stat(source: str) -> Optional[FileState]:
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
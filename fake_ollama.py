@@ -0,0 +1,310 @@
+"""
+Lokalny, fałszywy serwer Ollama do benchmarków (bez GPU i bez modeli).
+
+Emuluje zachowanie istotne dla wydajności:
+- ładowanie modelu przy pierwszym żądaniu i wygasanie po keep_alive,
+- jednoslotowy KV cache na model (prompt_eval liczy tylko tokeny po wspólnym prefiksie),
+- obsługę jednej generacji naraz na model (albo `parallel` naraz, jak
+  OLLAMA_NUM_PARALLEL),
+- opcjonalnie strumieniowanie tokenów w tempie generacji i przerwanie
+  generacji po rozłączeniu klienta (stream_tokens),
+- deterministyczne embeddingi (hashowany bag-of-words), podobne teksty = bliskie wektory.
+
+Czasy są skalowane przez time_scale, aby benchmarki trwały sekundy.
+Professional Local RAG Agent - Initial Release"""
+
+import itertools
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+_FAKE_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_KEEP_ALIVE_RE = re.compile(r"^(\d+(?:\.\d+)?)([smh]?)$")
+
+
+def _parse_keep_alive(value: Any, default: float = 300.0) -> float:
+    """Zamienia keep_alive Ollama ("30m", "10s", 0, -1) na sekundy."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return math.inf if value < 0 else float(value)
+    match = _KEEP_ALIVE_RE.match(str(value).strip())
+    if not match:
+        return math.inf if str(value).startswith("-") else default
+    number, unit = float(match.group(1)), match.group(2)
+    return number * {"": 1, "s": 1, "m": 60, "h": 3600}[unit]
+
+
+def _common_prefix_len(a: List[str], b: List[str]) -> int:
+    """Długość wspólnego prefiksu dwóch list tokenów."""
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class FakeOllamaServer:
+    """
+    Serwer HTTP emulujący API Ollama (/api/generate, /api/embeddings, /api/embed, /api/tags).
+
+    Użycie:
+        with FakeOllamaServer(time_scale=0.01) as server:
+            manager = OllamaModelManager(server.base_url)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        load_time: float = 8.0,
+        prompt_eval_per_token: float = 0.004,
+        eval_per_token: float = 0.05,
+        embed_per_token: float = 0.0005,
+        embedding_dim: int = 768,
+        time_scale: float = 1.0,
+        response_text: str = "To jest odpowiedź testowa na podstawie kontekstu.",
+        stream_tokens: bool = False,
+        parallel: int = 1,
+    ) -> None:
+        """
+        Args:
+            host: Adres nasłuchu.
+            port: Port (0 = wolny port wybrany przez system).
+            load_time: Czas ładowania modelu (s, przed skalowaniem).
+            prompt_eval_per_token: Czas przetwarzania tokenu promptu (s).
+            eval_per_token: Czas generowania tokenu odpowiedzi (s).
+            embed_per_token: Czas embeddingu tokenu (s).
+            embedding_dim: Wymiar zwracanych embeddingów.
+            time_scale: Mnożnik wszystkich czasów (np. 0.01 dla szybkich testów).
+            response_text: Tekst zwracany przez /api/generate.
+            stream_tokens: Wysyła każdy token zaraz po jego "wygenerowaniu" (jak Ollama)
+                zamiast całej odpowiedzi na końcu; rozłączenie klienta przerywa generację.
+            parallel: Liczba żądań obsługiwanych naraz przez jeden model (OLLAMA_NUM_PARALLEL).
+        """
+        self.load_time = load_time
+        self.prompt_eval_per_token = prompt_eval_per_token
+        self.eval_per_token = eval_per_token
+        self.embed_per_token = embed_per_token
+        self.embedding_dim = embedding_dim
+        self.time_scale = time_scale
+        self.response_text = response_text
+        self.stream_tokens = stream_tokens
+        self.parallel = parallel
+
+        self.stats: Dict[str, int] = {}
+        self._loaded: Dict[str, float] = {}  # model -> czas wygaśnięcia
+        self._kv_cache: Dict[str, List[str]] = {}  # model -> tokeny ostatniego promptu
+        self._model_locks: Dict[str, threading.BoundedSemaphore] = {}
+        self._state_lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """Adres serwera w formacie config.OLLAMA_BASE_URL."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        """Uruchamia serwer w wątku w tle."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Zatrzymuje serwer."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    # ---------- emulacja modelu ----------
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def _count(self, key: str) -> None:
+        with self._state_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _model_lock(self, model: str) -> threading.BoundedSemaphore:
+        with self._state_lock:
+            if model not in self._model_locks:
+                self._model_locks[model] = threading.BoundedSemaphore(self.parallel)
+            return self._model_locks[model]
+
+    def _ensure_loaded(self, model: str, keep_alive: Any) -> int:
+        """Ładuje model jeśli trzeba; zwraca load_duration w ns."""
+        now = time.monotonic()
+        with self._state_lock:
+            expiry = self._loaded.get(model)
+            loaded = expiry is not None and expiry > now
+        load_ns = 0
+        if not loaded:
+            self._count("model_loads")
+            self._sleep(self.load_time)
+            load_ns = int(self.load_time * 1e9)
+            with self._state_lock:
+                self._kv_cache.pop(model, None)
+        with self._state_lock:
+            self._loaded[model] = time.monotonic() + _parse_keep_alive(keep_alive) * max(self.time_scale, 1e-9)
+        return load_ns
+
+    def embed(self, text: str) -> List[float]:
+        """Deterministyczny embedding: hashowany bag-of-words, znormalizowany L2."""
+        vector = [0.0] * self.embedding_dim
+        for token in _FAKE_TOKEN_RE.findall(text.lower()):
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.embedding_dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def generate(self, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Emuluje /api/generate; zwraca listę ramek NDJSON (ostatnia z done=True)."""
+        return list(self.iter_generate(payload, incremental=False))
+
+    def iter_generate(self, payload: Dict[str, Any], incremental: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Emuluje /api/generate ramka po ramce.
+
+        Args:
+            payload: Żądanie /api/generate.
+            incremental: Czas generacji rozłożony na tokeny (ramka po każdym tokenie);
+                False = cała generacja przed pierwszą ramką. Zamknięcie generatora
+                (rozłączony klient) przerywa generację i zwalnia model.
+        """
+        model = payload.get("model", "")
+        options = payload.get("options") or {}
+        prompt_tokens = _FAKE_TOKEN_RE.findall(payload.get("prompt") or "")
+        response_tokens = self.response_text.split(" ")
+        num_predict = options.get("num_predict")
+        if isinstance(num_predict, int) and num_predict >= 0:
+            response_tokens = response_tokens[:num_predict]
+
+        with self._model_lock(model):
+            start = time.perf_counter()
+            load_ns = self._ensure_loaded(model, payload.get("keep_alive"))
+            with self._state_lock:
+                reused = _common_prefix_len(self._kv_cache.get(model, []), prompt_tokens)
+                self._kv_cache[model] = prompt_tokens
+            evaluated = len(prompt_tokens) - reused
+            self._sleep(evaluated * self.prompt_eval_per_token)
+            if not incremental:
+                self._sleep(len(response_tokens) * self.eval_per_token)
+            for token in response_tokens:
+                if incremental:
+                    self._sleep(self.eval_per_token)
+                yield {"model": model, "response": token + " ", "done": False}
+
+        yield {
+            "model": model,
+            "response": "",
+            "done": True,
+            "load_duration": load_ns,
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": int(evaluated * self.prompt_eval_per_token * 1e9),
+            "eval_count": len(response_tokens),
+            "eval_duration": int(len(response_tokens) * self.eval_per_token * 1e9),
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+        }
+
+    def embeddings(self, payload: Dict[str, Any], texts: List[str]) -> List[List[float]]:
+        """Emuluje /api/embeddings i /api/embed."""
+        model = payload.get("model", "")
+        with self._model_lock(model):
+            self._ensure_loaded(model, payload.get("keep_alive"))
+            self._sleep(sum(len(_FAKE_TOKEN_RE.findall(t)) for t in texts) * self.embed_per_token)
+        return [self.embed(t) for t in texts]
+
+    # ---------- HTTP ----------
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send_json(self, data: Any, status: int = 200) -> None:
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream_frames(self, frames: Iterator[Dict[str, Any]]) -> None:
+                """Wysyła ramki NDJSON (chunked) w miarę generacji; rozłączenie przerywa generację."""
+                try:
+                    first = next(frames)  # nagłówki dopiero po przetworzeniu promptu, jak w Ollama
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for frame in itertools.chain([first], frames):
+                        data = json.dumps(frame).encode("utf-8") + b"\n"
+                        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    frames.close()
+                    server._count("cancelled_generations")
+                    self.close_connection = True
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") == "/api/tags":
+                    with server._state_lock:
+                        models = [{"name": m} for m in server._loaded]
+                    self._send_json({"models": models})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.rstrip("/")
+                server._count(path)
+
+                if path == "/api/generate":
+                    if server.stream_tokens and payload.get("stream", True):
+                        self._stream_frames(server.iter_generate(payload))
+                        return
+                    frames = server.generate(payload)
+                    if payload.get("stream", True):
+                        body = b"".join(json.dumps(f).encode("utf-8") + b"\n" for f in frames)
+                        self.send_response(200)
+                        self.send_header("Content-Type", "application/x-ndjson")
+                        self.send_header("Content-Length", str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                    else:
+                        final = dict(frames[-1])
+                        final["response"] = "".join(f["response"] for f in frames).strip()
+                        self._send_json(final)
+                elif path == "/api/embeddings":
+                    vector = server.embeddings(payload, [payload.get("prompt") or ""])[0]
+                    self._send_json({"embedding": vector})
+                elif path == "/api/embed":
+                    inputs = payload.get("input") or []
+                    if isinstance(inputs, str):
+                        inputs = [inputs]
+                    self._send_json({"model": payload.get("model"), "embeddings": server.embeddings(payload, inputs)})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+        return Handler
@@ -0,0 +1,65 @@
+"""
+Wersja zatwierdzonego indeksu (plik INDEX_VERSION_FILE w CHROMA_DB_DIR).
+
+Ingestia (ingest.py, ingest_md.py, ingest.py --watch, snapshot.py import)
+zapisuje najpierw wszystkie pliki indeksu (kolekcja, arena, BM25, centroidy),
+a na końcu podbija wersję - to jest moment "zatwierdzenia" aktualizacji.
+Uruchomiony agent porównuje wersję między pytaniami i przeładowuje indeks,
+gdy się zmieniła (AdvancedRAGAgent.refresh_index). Plik zawiera też czas
+najwcześniejszej zmiany w docs/, którą obejmuje aktualizacja, więc agent może
+podać opóźnienie od zdarzenia do wyszukiwalności.
+Professional Local RAG Agent - Initial Release"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import config
+
+VERSION_PATH = config.CHROMA_DB_DIR / config.INDEX_VERSION_FILE
+
+
+def read_version(path: Path = VERSION_PATH) -> Dict[str, Any]:
+    """
+    Odczytuje wersję indeksu.
+
+    Returns:
+        Słownik z kluczami "version", "committed_at", "first_event_at", "sources"
+        (wersja 0, gdy indeks nie był jeszcze zatwierdzony).
+    """
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"version": 0, "committed_at": None, "first_event_at": None, "sources": []}
+
+
+def commit_version(
+    sources: Iterable[str] = (),
+    first_event_at: Optional[float] = None,
+    path: Path = VERSION_PATH,
+) -> Dict[str, Any]:
+    """
+    Podbija wersję indeksu (podmiana atomowa, jak arena korpusu).
+
+    Args:
+        sources: Zmienione pliki (pusta lista = pełna ingestia).
+        first_event_at: Czas (time.time) najwcześniejszej zmiany objętej aktualizacją.
+        path: Plik wersji.
+
+    Returns:
+        Zapisany stan wersji.
+    """
+    path = Path(path)
+    state = {
+        "version": int(read_version(path).get("version", 0)) + 1,
+        "committed_at": time.time(),
+        "first_event_at": first_event_at,
+        "sources": sorted(sources),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return state
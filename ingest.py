@@ -3,19 +3,30 @@ Skrypt do ingestii dokumentów PDF do bazy wektorowej ChromaDB.
 
 Wczytuje pliki PDF z folderu /docs, dzieli je na fragmenty
 i zapisuje embeddingi w /chroma_db.
+Tryb obserwacji: python ingest.py --watch (docs_watcher.py) - tylko zmienione pliki.
 Professional Local RAG Agent - Initial Release"""
 
+import argparse
 import sys
 from pathlib import Path
 from typing import List
 
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PDFPlumberLoader, TextLoader
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
 from colorama import Fore, Style, init
 
 import config
+from chunking import create_text_splitter
+from coarse_index import CoarseIndex
+from corpus_store import CorpusStore
+from dedup import NearDuplicateFilter
+from docs_watcher import DocsWatcher
+from index_version import commit_version
+from ollama_manager import OllamaModelManager
+import profiling
+from reduction import EmbeddingReducer
+from sparse_index import SparseIndex
+from tokenizer import create_tokenizer
 
 # Inicjalizacja kolorowego outputu
 init(autoreset=True)
@@ -30,18 +41,10 @@ class DocumentIngestor:
         """Inicjalizacja ingestora dokumentów."""
         self.docs_dir: Path = config.DOCS_DIR
         self.chroma_dir: Path = config.CHROMA_DB_DIR
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP,
-            length_function=len,
-            is_separator_regex=False,
-        )
+        self.text_splitter = create_text_splitter()
         
         try:
-            self.embeddings = OllamaEmbeddings(
-                model=config.EMBEDDING_MODEL,
-                base_url=config.OLLAMA_BASE_URL,
-            )
+            self.embeddings = OllamaModelManager().create_embeddings()
             print(f"{Fore.GREEN}✓ Połączono z Ollama Embeddings ({config.EMBEDDING_MODEL})")
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd połączenia z Ollama: {e}")
@@ -85,6 +88,20 @@ class DocumentIngestor:
 
         return all_documents
 
+    def load_file(self, path: Path) -> List:
+        """
+        Wczytuje jeden plik PDF albo Markdown (tryb --watch).
+
+        Args:
+            path: Ścieżka pliku w folderze docs.
+
+        Returns:
+            List: Strony (PDF) albo jeden dokument (Markdown).
+        """
+        if path.suffix.lower() == ".pdf":
+            return PDFPlumberLoader(str(path)).load()
+        return TextLoader(str(path), encoding="utf-8").load()
+
     def split_documents(self, documents: List) -> List:
         """
         Dzieli dokumenty na mniejsze fragmenty.
@@ -100,6 +117,23 @@ class DocumentIngestor:
         print(f"{Fore.GREEN}✓ Utworzono {len(chunks)} fragmentów tekstu")
         return chunks
 
+    def deduplicate_chunks(self, chunks: List) -> List:
+        """
+        Odrzuca prawie identyczne fragmenty (nagłówki, stopki, disclaimery).
+
+        Args:
+            chunks: Lista fragmentów po podziale.
+
+        Returns:
+            List: Fragmenty kanoniczne (bez prawie-duplikatów).
+        """
+        if not config.DEDUP_ENABLED:
+            return chunks
+
+        print(f"\n{Fore.CYAN}Wykrywanie prawie identycznych fragmentów (MinHash)...")
+        self.dedup_filter = NearDuplicateFilter()
+        return self.dedup_filter.filter(chunks)
+
     def create_vector_store(self, chunks: List) -> None:
         """
         Tworzy bazę wektorową ChromaDB z fragmentów dokumentów.
@@ -173,6 +207,45 @@ class DocumentIngestor:
             traceback.print_exc()
             sys.exit(1)
 
+    def build_coarse_index(self) -> None:
+        """Zapisuje centroidy embeddingów per dokument (wyszukiwanie dwuetapowe)."""
+        print(f"\n{Fore.CYAN}Obliczanie centroidów dokumentów ({config.COARSE_GRANULARITY})...")
+        collection = Chroma(
+            persist_directory=str(self.chroma_dir),
+            collection_name=config.CHROMA_COLLECTION_NAME,
+        )._collection
+        coarse_index = CoarseIndex.from_collection(collection)
+        coarse_index.save(self.chroma_dir / config.COARSE_INDEX_FILE)
+        print(f"{Fore.GREEN}✓ Zapisano {len(coarse_index)} centroidów ({config.COARSE_INDEX_FILE})")
+
+    def build_sparse_index(self) -> None:
+        """Tokenizuje korpus raz i zapisuje indeks BM25 - agent wczytuje go przy starcie."""
+        print(f"\n{Fore.CYAN}Budowa indeksu BM25 (tokenizer: {config.TOKENIZER})...")
+        collection = Chroma(
+            persist_directory=str(self.chroma_dir),
+            collection_name=config.CHROMA_COLLECTION_NAME,
+        )._collection
+        documents = collection.get(include=["documents", "metadatas"])
+        store = CorpusStore.build(documents["documents"], documents["metadatas"])
+        del documents
+        sparse_index, _ = SparseIndex.cached(store, config.SPARSE_INDEX_DIR, create_tokenizer(), rebuild=True)
+        store.close()
+        print(f"{Fore.GREEN}✓ Zapisano indeks BM25 ({len(sparse_index.term_hashes)} termów)")
+
+    def build_embedding_reduction(self) -> None:
+        """Dopasowuje i zapisuje projekcję embeddingów (gdy EMBEDDING_REDUCTION jest włączone)."""
+        if not config.EMBEDDING_REDUCTION:
+            return
+        print(f"\n{Fore.CYAN}Dopasowanie redukcji wymiaru ({config.EMBEDDING_REDUCTION}, {config.EMBEDDING_REDUCED_DIM} wymiarów)...")
+        collection = Chroma(
+            persist_directory=str(self.chroma_dir),
+            collection_name=config.CHROMA_COLLECTION_NAME,
+        )._collection
+        data = collection.get(include=["embeddings"])
+        reducer = EmbeddingReducer.fit(data["embeddings"], config.EMBEDDING_REDUCTION, config.EMBEDDING_REDUCED_DIM)
+        reducer.save(self.chroma_dir / config.EMBEDDING_REDUCTION_FILE)
+        print(f"{Fore.GREEN}✓ Zapisano projekcję {reducer.signature} (zachowana wariancja {reducer.explained:.1%})")
+
     def run(self) -> None:
         """Wykonuje pełny proces ingestii dokumentów."""
         print(f"\n{Fore.MAGENTA}{'=' * 60}")
@@ -186,8 +259,25 @@ class DocumentIngestor:
             # 2. Podziel na fragmenty
             chunks = self.split_documents(documents)
 
-            # 3. Utwórz bazę wektorową
+            # 3. Usuń prawie-duplikaty (mniej embeddingów, mniejszy indeks)
+            chunks = self.deduplicate_chunks(chunks)
+
+            # 4. Utwórz bazę wektorową
             self.create_vector_store(chunks)
+            if config.DEDUP_ENABLED:
+                self.dedup_filter.save_mapping()
+
+            # 5. Centroidy dokumentów dla wyszukiwania dwuetapowego
+            self.build_coarse_index()
+
+            # 6. Indeks BM25 (tokenizacja raz, przy ingestii)
+            self.build_sparse_index()
+
+            # 7. Redukcja wymiaru embeddingów (opcjonalna)
+            self.build_embedding_reduction()
+
+            # 8. Nowa wersja indeksu - uruchomieni agenci przeładują go przed kolejnym pytaniem
+            commit_version()
 
             print(f"\n{Fore.GREEN}{'=' * 60}")
             print(f"{Fore.GREEN}{'✓ INGESTIA ZAKOŃCZONA POMYŚLNIE':^60}")
@@ -203,8 +293,17 @@ class DocumentIngestor:
 
 def main() -> None:
     """Główna funkcja uruchamiająca proces ingestii."""
-    ingestor = DocumentIngestor()
-    ingestor.run()
+    parser = argparse.ArgumentParser(description="Ingestia dokumentów do bazy ChromaDB")
+    parser.add_argument("--watch", action="store_true",
+                        help="Obserwuj folder docs i przetwarzaj tylko dodane, zmienione i usunięte pliki PDF/MD")
+    args = parser.parse_args()
+
+    if args.watch:
+        DocsWatcher(DocumentIngestor()).run()
+        return
+    with profiling.stage("ingest"):
+        ingestor = DocumentIngestor()
+        ingestor.run()
 
 
 if __name__ == "__main__":
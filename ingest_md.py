@@ -6,11 +6,18 @@ import sys
 from pathlib import Path
 
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 import config
+from chunking import create_text_splitter
+from coarse_index import CoarseIndex
+from corpus_store import CorpusStore
+from dedup import NearDuplicateFilter
+from index_version import commit_version
+from ollama_manager import OllamaModelManager
+from reduction import EmbeddingReducer
+from sparse_index import SparseIndex
+from tokenizer import create_tokenizer
 
 print("\n[+] Ingestion Markdown dokumentow...")
 
@@ -29,19 +36,19 @@ if not docs:
 
 print(f"[OK] Zaladowano {len(docs)} dokumentow")
 
-# Text splitter
-splitter = RecursiveCharacterTextSplitter(
-    chunk_size=config.CHUNK_SIZE,
-    chunk_overlap=config.CHUNK_OVERLAP
-)
+# Text splitter (config.CHUNKER)
+splitter = create_text_splitter()
 chunks = splitter.split_documents(docs)
 print(f"[OK] Podzielono na {len(chunks)} fragmentow")
 
+# Deduplikacja prawie identycznych fragmentow
+dedup_filter = None
+if config.DEDUP_ENABLED:
+    dedup_filter = NearDuplicateFilter()
+    chunks = dedup_filter.filter(chunks)
+
 # Embeddings
-embeddings = OllamaEmbeddings(
-    model=config.EMBEDDING_MODEL,
-    base_url=config.OLLAMA_BASE_URL
-)
+embeddings = OllamaModelManager().create_embeddings()
 print(f"[OK] Polaczono z Ollama Embeddings ({config.EMBEDDING_MODEL})")
 
 # ChromaDB
@@ -52,4 +59,31 @@ vectorstore = Chroma.from_documents(
     persist_directory=str(config.CHROMA_DB_DIR)
 )
 print(f"[OK] Zapisano do ChromaDB ({config.CHROMA_DB_DIR})")
+if dedup_filter is not None:
+    dedup_filter.save_mapping()
+
+# Centroidy dokumentow (cala kolekcja) dla wyszukiwania dwuetapowego
+coarse_index = CoarseIndex.from_collection(vectorstore._collection)
+coarse_index.save(config.CHROMA_DB_DIR / config.COARSE_INDEX_FILE)
+print(f"[OK] Zapisano {len(coarse_index)} centroidow ({config.COARSE_INDEX_FILE})")
+
+# Indeks BM25 (cala kolekcja) - agent wczytuje go zamiast tokenizowac korpus przy starcie
+collection_data = vectorstore._collection.get(include=["documents", "metadatas"])
+store = CorpusStore.build(collection_data["documents"], collection_data["metadatas"])
+del collection_data
+sparse_index, _ = SparseIndex.cached(store, config.SPARSE_INDEX_DIR, create_tokenizer(), rebuild=True)
+store.close()
+print(f"[OK] Zapisano indeks BM25 ({len(sparse_index.term_hashes)} termow, tokenizer: {config.TOKENIZER})")
+
+# Redukcja wymiaru embeddingow (opcjonalna) - projekcja dopasowana do calej kolekcji
+if config.EMBEDDING_REDUCTION:
+    reducer = EmbeddingReducer.fit(
+        vectorstore._collection.get(include=["embeddings"])["embeddings"],
+        config.EMBEDDING_REDUCTION,
+        config.EMBEDDING_REDUCED_DIM,
+    )
+    reducer.save(config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE)
+    print(f"[OK] Zapisano projekcje embeddingow {reducer.signature} (wariancja {reducer.explained:.1%})")
+# Nowa wersja indeksu - uruchomieni agenci przeladuja go przed kolejnym pytaniem
+commit_version()
 print(f"[SUCCESS] Sukces! Zaindeksowano {len(chunks)} fragmentow\n")
@@ -2,19 +2,36 @@
 Interfejs CLI dla systemu Advanced Local RAG.
 
 Prosty interfejs wiersza poleceń z Query Decomposition, Hybrid Search i Context Expansion.
+Tryb wsadowy: python main.py --batch questions.jsonl --out answers.jsonl [--workers 4]
+Filtry w pytaniu: "@source:manual.pdf @page:3-10 Jak zainstalować moduł?"
+Węzeł zapytań bez ChromaDB: python main.py --snapshot index.ragsnap (snapshot.py export)
+Profilowanie: komendy `profile on|off|dump` albo RAG_PROFILE=1 python main.py (profiling.py)
+Kompresja kontekstu do zdań istotnych dla pytania: python main.py --compress
+Aktualizacje docs/ (python ingest.py --watch) są wczytywane przed kolejnym pytaniem.
 Professional Local RAG Agent - Initial Release"""
 
+import argparse
+import re
 import sys
+import time
 from pathlib import Path
 
 from colorama import Fore, Style, init
 
 from advanced_rag import AdvancedRAGAgent
+from batch import BatchRunner, print_summary
 import config
+from ollama_manager import OllamaModelManager
+from partitions import MetadataFilter
+import profiling
+from serving import PreforkPool, SharedIndex, print_worker_stats
+from session import RetrievalSession
 
 # Inicjalizacja kolorowego outputu
 init(autoreset=True)
 
+PROFILE_COMMAND_RE = re.compile(r"profile(?:\s+(?:on|off|dump))?")
+
 
 def print_header() -> None:
     """Wyświetla nagłówek aplikacji."""
@@ -28,8 +45,12 @@ def print_instructions() -> None:
     """Wyświetla instrukcje użytkowania."""
     print(f"{Fore.CYAN}Instrukcje:")
     print(f"  • Wpisz pytanie i naciśnij Enter")
+    print(f"  • Zawęź wyszukiwanie filtrami: {Fore.YELLOW}@source:manual.pdf @dir:docs/manuals @page:3-10 @type:pdf")
     print(f"  • Wpisz {Fore.YELLOW}'exit'{Fore.CYAN}, {Fore.YELLOW}'quit'{Fore.CYAN} lub {Fore.YELLOW}'q'{Fore.CYAN} aby zakończyć")
     print(f"  • Wpisz {Fore.YELLOW}'stats'{Fore.CYAN} aby zobaczyć statystyki bazy")
+    print(f"  • Wpisz {Fore.YELLOW}'new'{Fore.CYAN} aby zacząć nowy temat (pytania uzupełniające używają wyników poprzednich)")
+    print(f"  • {Fore.YELLOW}Ctrl+C{Fore.CYAN} w trakcie odpowiedzi anuluje pytanie")
+    print(f"  • Wpisz {Fore.YELLOW}'profile on'{Fore.CYAN}, {Fore.YELLOW}'profile off'{Fore.CYAN} lub {Fore.YELLOW}'profile dump'{Fore.CYAN} aby profilować pytania (CPU i pamięć)")
     print(f"  • Wpisz {Fore.YELLOW}'help'{Fore.CYAN} aby wyświetlić tę pomoc\n")
 
 
@@ -49,6 +70,20 @@ def print_stats(agent: AdvancedRAGAgent) -> None:
     print(f"{Fore.WHITE}  • Tryb wyszukiwania: {Fore.GREEN}{stats.get('retrieval_type', 'N/A')}")
     print(f"{Fore.WHITE}  • Model LLM: {Fore.GREEN}{config.LLM_MODEL}")
     print(f"{Fore.WHITE}  • Model Embeddings: {Fore.GREEN}{config.EMBEDDING_MODEL}")
+    cache = stats.get('retrieval_cache')
+    if cache:
+        print(
+            f"{Fore.WHITE}  • Cache retrievalu: {Fore.GREEN}trafienia {cache['hit_ratio']:.0%} "
+            f"(pamięć {cache['memory_hits']}, dysk {cache['disk_hits']}, wyszukiwania {cache['misses']})"
+        )
+    # Kolejka generacji (scheduler.py): głębokość i czas oczekiwania na klasę priorytetu
+    for name, queue in stats.get('llm_queue', {}).items():
+        if queue['granted'] or queue['queued']:
+            print(
+                f"{Fore.WHITE}  • Kolejka LLM ({name}): {Fore.GREEN}{queue['granted']} wywołań, "
+                f"w kolejce {queue['queued']} (maks. {queue['max_queued']}), "
+                f"czekanie śr. {queue['wait_avg_ms']:.0f} ms / p95 {queue['wait_p95_ms']:.0f} ms"
+            )
     print(f"{Fore.CYAN}{'─' * 70}\n")
 
 
@@ -71,6 +106,11 @@ def print_answer(result: dict) -> None:
     if "num_docs_used" in result:
         print(f"\n{Fore.CYAN}📚 Documents used: {result['num_docs_used']}")
 
+    # Budżet latencji: czas pytania i ograniczenia zastosowane, by się w nim zmieścić
+    if result.get("budget_s") is not None:
+        degradations = ", ".join(result.get("degradations") or []) or "brak"
+        print(f"{Fore.CYAN}⏱ {result['elapsed_s']:.1f}s / budżet {result['budget_s']:.1f}s (degradacje: {degradations})")
+
     # Odpowiedź
     print(f"\n{Fore.GREEN}{'─' * 70}")
     print(f"{Fore.GREEN}{Style.BRIGHT}💡 ODPOWIEDŹ:")
@@ -88,13 +128,14 @@ def print_answer(result: dict) -> None:
         print()
 
 
-def handle_command(command: str, agent: AdvancedRAGAgent) -> bool:
+def handle_command(command: str, agent: AdvancedRAGAgent, session: RetrievalSession = None) -> bool:
     """
     Obsługuje specjalne komendy użytkownika.
 
     Args:
         command: Komenda wprowadzona przez użytkownika.
         agent: Instancja AdvancedRAGAgent.
+        session: Stan sesji (komenda 'new' go czyści).
 
     Returns:
         True jeśli aplikacja powinna kontynuować, False jeśli zakończyć.
@@ -109,10 +150,30 @@ def handle_command(command: str, agent: AdvancedRAGAgent) -> bool:
         print_stats(agent)
         return True
     
+    elif command_lower == 'new':
+        if session is not None:
+            session.reset()
+        print(f"{Fore.GREEN}✓ Nowy temat - następne pytanie przejdzie pełny retrieval\n")
+        return True
+    
     elif command_lower == 'help':
         print_instructions()
         return True
     
+    elif command_lower.startswith('profile'):
+        action = command_lower.split()[1] if len(command_lower.split()) > 1 else ''
+        if action == 'on':
+            profiling.PROFILER.enable()
+            print(f"{Fore.GREEN}✓ Profilowanie włączone (CPU, stosy wątków, tracemalloc) - 'profile dump' zapisze wyniki\n")
+        elif action == 'off':
+            profiling.PROFILER.disable()
+            print(f"{Fore.GREEN}✓ Profilowanie wyłączone (zebrane dane zostają do 'profile dump')\n")
+        elif action == 'dump':
+            profiling.PROFILER.dump()
+        else:
+            print(f"{Fore.YELLOW}Użycie: profile on|off|dump\n")
+        return True
+    
     elif command_lower == 'clear':
         import os
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -122,43 +183,153 @@ def handle_command(command: str, agent: AdvancedRAGAgent) -> bool:
     return True
 
 
+def parse_args() -> argparse.Namespace:
+    """Parsuje argumenty wiersza poleceń."""
+    parser = argparse.ArgumentParser(description="Advanced Local RAG - interfejs CLI")
+    parser.add_argument("--batch", type=Path, metavar="QUESTIONS.jsonl",
+                        help="Plik JSONL z pytaniami do przetworzenia wsadowo")
+    parser.add_argument("--out", type=Path, metavar="ANSWERS.jsonl",
+                        help="Plik JSONL z odpowiedziami (wznawiany, jeśli istnieje)")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY,
+                        help=f"Liczba pytań przetwarzanych równolegle (domyślnie {config.BATCH_CONCURRENCY})")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Tryb wsadowy w N procesach ze wspólnym indeksem (pre-fork, Linux/macOS); "
+                             f"np. --workers {config.SERVE_WORKERS}")
+    parser.add_argument("--budget", type=float, default=config.ASK_BUDGET_S, metavar="SECONDS",
+                        help="Budżet latencji pytania w trybie interaktywnym - po jego przekroczeniu "
+                             "odpowiedź jest degradowana (krótsza dekompozycja, mniej fragmentów, krótsza odpowiedź)")
+    parser.add_argument("--snapshot", type=Path, metavar="INDEX.ragsnap",
+                        help="Indeks ze snapshotu (python snapshot.py export) zamiast bazy ChromaDB - "
+                             "bez ingestii i bez przebudowy BM25")
+    parser.add_argument("--compress", action="store_true", default=config.COMPRESSION_ENABLED,
+                        help="Kompresja kontekstu: do modelu trafiają tylko zdania istotne dla pytania "
+                             "(krótszy prompt, szybsza odpowiedź; procesy --workers używają COMPRESSION_ENABLED)")
+    args = parser.parse_args()
+    if args.snapshot and not args.snapshot.exists():
+        parser.error(f"Plik nie istnieje: {args.snapshot}")
+    if args.workers and not args.batch:
+        parser.error("--workers działa tylko z --batch")
+    if args.budget is not None and args.budget <= 0:
+        parser.error("--budget musi być dodatni")
+    if args.batch and not args.out:
+        parser.error("--batch wymaga --out")
+    if args.batch and not args.batch.exists():
+        parser.error(f"Plik nie istnieje: {args.batch}")
+    return args
+
+
+def run_batch(agent: AdvancedRAGAgent, args: argparse.Namespace) -> None:
+    """
+    Uruchamia tryb wsadowy i wyświetla podsumowanie.
+
+    Args:
+        agent: Instancja AdvancedRAGAgent.
+        args: Argumenty z parse_args().
+    """
+    print(f"{Fore.CYAN}⚙ Tryb wsadowy: {args.batch} → {args.out}\n")
+    try:
+        summary = BatchRunner(agent, concurrency=args.concurrency).run(args.batch, args.out)
+    except (OSError, ValueError) as e:
+        print(f"\n{Fore.RED}✗ Błąd trybu wsadowego: {e}\n")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"\n\n{Fore.YELLOW}Przerwano. Uruchom ponownie z tym samym --out, aby wznowić.\n")
+        sys.exit(1)
+    print_summary(summary)
+
+
+def run_prefork_batch(args: argparse.Namespace) -> None:
+    """
+    Tryb wsadowy w wielu procesach: indeks ładowany raz, procesy robocze po fork().
+
+    Args:
+        args: Argumenty z parse_args() (batch, out, workers).
+    """
+    try:
+        print(f"{Fore.CYAN}Ładowanie wspólnego indeksu...\n")
+        start = time.perf_counter()
+        shared_index = SharedIndex.from_snapshot(args.snapshot) if args.snapshot else SharedIndex.from_chroma()
+        print(f"{Fore.GREEN}✓ Wspólny indeks gotowy w {time.perf_counter() - start:.2f}s ({len(shared_index.store)} dokumentów)")
+        pool = PreforkPool(shared_index, workers=args.workers)
+        pool.start()
+    except Exception as e:
+        print(f"\n{Fore.RED}✗ Błąd inicjalizacji: {e}\n")
+        sys.exit(1)
+
+    try:
+        print_worker_stats(pool)
+        # Modele rozgrzewa raz proces nadrzędny (po fork, aby nie dzielić połączeń)
+        OllamaModelManager().warm_up_async()
+        print(f"\n{Fore.CYAN}⚙ Tryb wsadowy: {args.batch} → {args.out}\n")
+        summary = BatchRunner(None, pool=pool).run(args.batch, args.out)
+    except (OSError, ValueError) as e:
+        print(f"\n{Fore.RED}✗ Błąd trybu wsadowego: {e}\n")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"\n\n{Fore.YELLOW}Przerwano. Uruchom ponownie z tym samym --out, aby wznowić.\n")
+        sys.exit(1)
+    finally:
+        pool.close()
+    print_summary(summary)
+
+
 def main() -> None:
     """Główna funkcja uruchamiająca interfejs CLI."""
+    args = parse_args()
     print_header()
     
-    # Sprawdź czy folder docs istnieje
-    if not config.DOCS_DIR.exists() or (not list(config.DOCS_DIR.glob("*.pdf")) and not list(config.DOCS_DIR.glob("*.md"))):
-        print(f"{Fore.RED}✗ Brak dokumentów w folderze {config.DOCS_DIR}")
-        print(f"{Fore.YELLOW}1. Dodaj pliki PDF lub Markdown do folderu 'docs'")
-        print(f"{Fore.YELLOW}2. Uruchom: python ingest.py lub python ingest_md.py")
-        print(f"{Fore.YELLOW}3. Uruchom ponownie: python main.py\n")
-        sys.exit(1)
+    # Węzeł zapytań ze snapshotem nie potrzebuje dokumentów ani bazy ChromaDB
+    if not args.snapshot:
+        # Sprawdź czy folder docs istnieje
+        if not config.DOCS_DIR.exists() or (not list(config.DOCS_DIR.glob("*.pdf")) and not list(config.DOCS_DIR.glob("*.md"))):
+            print(f"{Fore.RED}✗ Brak dokumentów w folderze {config.DOCS_DIR}")
+            print(f"{Fore.YELLOW}1. Dodaj pliki PDF lub Markdown do folderu 'docs'")
+            print(f"{Fore.YELLOW}2. Uruchom: python ingest.py lub python ingest_md.py")
+            print(f"{Fore.YELLOW}3. Uruchom ponownie: python main.py\n")
+            sys.exit(1)
+
+        # Sprawdź czy baza ChromaDB istnieje
+        if not config.CHROMA_DB_DIR.exists():
+            print(f"{Fore.RED}✗ Baza ChromaDB nie została utworzona")
+            print(f"{Fore.YELLOW}Uruchom najpierw: python ingest.py\n")
+            sys.exit(1)
     
-    # Sprawdź czy baza ChromaDB istnieje
-    if not config.CHROMA_DB_DIR.exists():
-        print(f"{Fore.RED}✗ Baza ChromaDB nie została utworzona")
-        print(f"{Fore.YELLOW}Uruchom najpierw: python ingest.py\n")
-        sys.exit(1)
+    if args.batch and args.workers:
+        run_prefork_batch(args)
+        return
     
     # Inicjalizacja Advanced RAG
     try:
         print(f"{Fore.CYAN}Inicjalizacja Advanced RAG...\n")
-        agent = AdvancedRAGAgent()
+        with profiling.stage("startup"):
+            if args.snapshot:
+                start = time.perf_counter()
+                shared_index = SharedIndex.from_snapshot(args.snapshot)
+                print(f"{Fore.GREEN}✓ Snapshot {args.snapshot} wczytany w {time.perf_counter() - start:.2f}s ({len(shared_index.store)} dokumentów)")
+                agent = AdvancedRAGAgent(shared_index=shared_index, compress=args.compress)
+            else:
+                agent = AdvancedRAGAgent(compress=args.compress)
         print(f"\n{Fore.GREEN}✓ System gotowy do pracy!\n")
         
-        # Wyświetl statystyki na start
-        print_stats(agent)
-        
-        # Wyświetl instrukcje
-        print_instructions()
+        if not args.batch:
+            # Wyświetl statystyki na start
+            print_stats(agent)
+            
+            # Wyświetl instrukcje
+            print_instructions()
         
     except Exception as e:
         print(f"\n{Fore.RED}✗ Błąd inicjalizacji: {e}")
         print(f"{Fore.YELLOW}Sprawdź czy Ollama jest uruchomiona\n")
         sys.exit(1)
     
+    if args.batch:
+        run_batch(agent, args)
+        return
+    
     # Główna pętla CLI
     print(f"{Fore.MAGENTA}{'=' * 70}\n")
+    session = RetrievalSession()
     
     while True:
         try:
@@ -168,15 +339,26 @@ def main() -> None:
                 continue
             
             # Obsłuż specjalne komendy
-            if question.lower() in ['exit', 'quit', 'q', 'stats', 'help', 'clear']:
-                if not handle_command(question, agent):
+            if question.lower() in ['exit', 'quit', 'q', 'stats', 'help', 'clear', 'new'] or PROFILE_COMMAND_RE.fullmatch(question.lower()):
+                if not handle_command(question, agent, session):
                     break
                 continue
             
             # Zadaj pytanie do Advanced RAG
             print(f"\n{Fore.CYAN}⚙ Przetwarzam pytanie...\n")
             
-            result = agent.ask(question)
+            # Ingestia (np. ingest.py --watch) zatwierdziła nową wersję indeksu
+            if agent.refresh_index():
+                session.reset()
+
+            question, filters = MetadataFilter.parse(question)
+            try:
+                result = agent.ask(question, filters=filters, session=session, budget_s=args.budget)
+            except KeyboardInterrupt:
+                # Ctrl+C w trakcie pytania anuluje tylko to pytanie (i żądania do Ollama)
+                print(f"\n{Fore.YELLOW}⏹ Anulowano pytanie\n")
+                print(f"{Fore.MAGENTA}{'=' * 70}\n")
+                continue
             print_answer(result)
             
             print(f"{Fore.MAGENTA}{'=' * 70}\n")
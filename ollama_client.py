@@ -0,0 +1,920 @@
+"""
+Wspólny klient HTTP dla całego ruchu do Ollama.
+
+Jedna warstwa dla embeddingów i generacji (agent, ingest, benchmarki):
+- pula połączeń keep-alive (httpx), współdzielona w procesie,
+- limit czasu (deadline) na całe wywołanie, a nie na pojedynczy odczyt,
+- ponawianie z losowym opóźnieniem (full jitter) przy błędach przejściowych
+  ("connection refused", restart Ollama, 502/503/504),
+- circuit breaker: po serii błędów szybka odmowa zamiast czekania na timeouty,
+- zakres żądań (request_scope): wspólny deadline i CancelToken dla wszystkich
+  wywołań jednego pytania - anulowanie (Ctrl+C) zamyka gniazda trwających
+  żądań, więc Ollama widzi rozłączenie i przerywa generację,
+- warianty synchroniczny (OllamaClient) i asynchroniczny (AsyncOllamaClient);
+  wariant asynchroniczny ogranicza liczbę trwających wywołań semaforem
+  (ASYNC_OLLAMA_CONCURRENCY na pętlę zdarzeń), więc setki pytań w jednej
+  pętli czekają w kolejce zamiast otwierać setki połączeń,
+- generacje przechodzą przez wspólny dla serwera LLMScheduler (scheduler.py):
+  klasy priorytetu, sprawiedliwa kolejka i miejsca dla krótkich wywołań.
+Professional Local RAG Agent - Initial Release"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+import httpcore
+import httpx
+
+import config
+from scheduler import LLMScheduler, Ticket, current_priority
+from text_utils import estimate_tokens
+
+# Kody HTTP, po których warto ponowić żądanie (Ollama restartuje / przeładowuje model)
+_RETRYABLE_STATUS = {502, 503, 504}
+# Błędy transportu, przy których żądanie nie dotarło lub połączenie zostało zerwane
+_RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.RemoteProtocolError,
+    httpx.ReadError,
+    httpx.WriteError,
+)
+
+
+class OllamaError(RuntimeError):
+    """Błąd wywołania API Ollama (np. brak modelu, błędny payload)."""
+
+
+class OllamaUnavailableError(OllamaError, ConnectionError):
+    """Ollama nie odpowiada (po ponowieniach lub przy otwartym circuit breakerze)."""
+
+
+class OllamaDeadlineExceeded(OllamaError, TimeoutError):
+    """Wywołanie przekroczyło swój limit czasu."""
+
+
+class OllamaCancelled(OllamaError):
+    """Wywołanie anulowane (CancelToken, np. Ctrl+C w main.py)."""
+
+
+class CancelToken:
+    """
+    Anulowanie wywołań Ollama z innego wątku.
+
+    cancel() zamyka (shutdown) gniazda, na których wątki z tym tokenem czekają
+    na odpowiedź - blokujący odczyt kończy się od razu, także przed nadejściem
+    nagłówków (długie przetwarzanie promptu), a Ollama przerywa generację.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets: Set[socket.socket] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """Anuluje trwające i przyszłe wywołania z tym tokenem."""
+        with self._lock:
+            self._event.set()
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise OllamaCancelled("Wywołanie Ollama anulowane")
+
+    def wait(self, timeout: float) -> bool:
+        """Czeka timeout sekund albo do anulowania; zwraca True po anulowaniu."""
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def watch(self, sock: socket.socket) -> Iterator[None]:
+        """Rejestruje gniazdo na czas blokującego odczytu."""
+        with self._lock:
+            self.raise_if_cancelled()
+            self._sockets.add(sock)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sockets.discard(sock)
+
+
+class RequestScope:
+    """Deadline i token anulowania wspólne dla wszystkich wywołań w zakresie."""
+
+    __slots__ = ("deadline", "cancel")
+
+    def __init__(self, deadline: Optional[float], cancel: Optional[CancelToken]) -> None:
+        self.deadline = deadline
+        self.cancel = cancel
+
+
+_scope: ContextVar[Optional[RequestScope]] = ContextVar("ollama_request_scope", default=None)
+
+
+@contextmanager
+def request_scope(deadline: Optional[float] = None, cancel: Optional[CancelToken] = None) -> Iterator[RequestScope]:
+    """
+    Ustawia deadline (time.monotonic()) i CancelToken dla wywołań Ollama w bieżącym kontekście.
+
+    Wątki pomocnicze dziedziczą zakres, gdy zadanie jest uruchamiane przez
+    contextvars.copy_context().run (jak w AdvancedRAGAgent).
+
+    Args:
+        deadline: Chwila (time.monotonic()), po której wywołania kończą się OllamaDeadlineExceeded.
+        cancel: Token anulowania.
+    """
+    scope = RequestScope(deadline, cancel)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+class _CancellableStream(httpcore.NetworkStream):
+    """Strumień sieciowy, którego blokujący odczyt może przerwać CancelToken z zakresu."""
+
+    def __init__(self, stream: httpcore.NetworkStream) -> None:
+        self._stream = stream
+        self._socket = stream.get_extra_info("socket")
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        scope = _scope.get()
+        if scope is None or scope.cancel is None or self._socket is None:
+            return self._stream.read(max_bytes, timeout)
+        with scope.cancel.watch(self._socket):
+            return self._stream.read(max_bytes, timeout)
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, *args: Any, **kwargs: Any) -> httpcore.NetworkStream:
+        return self._stream.start_tls(*args, **kwargs)
+
+    def get_extra_info(self, info: str) -> Any:
+        return self._stream.get_extra_info(info)
+
+
+class _CancellableBackend(httpcore.NetworkBackend):
+    """Backend httpcore zwracający strumienie _CancellableStream."""
+
+    def __init__(self, backend: httpcore.NetworkBackend) -> None:
+        self._backend = backend
+
+    def connect_tcp(self, *args: Any, **kwargs: Any) -> httpcore.NetworkStream:
+        return _CancellableStream(self._backend.connect_tcp(*args, **kwargs))
+
+    def connect_unix_socket(self, *args: Any, **kwargs: Any) -> httpcore.NetworkStream:
+        return _CancellableStream(self._backend.connect_unix_socket(*args, **kwargs))
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+class _CancellableTransport(httpx.HTTPTransport):
+    """
+    HTTPTransport z własną pulą httpcore na _CancellableBackend.
+
+    Backend jest przekazywany publicznym parametrem ConnectionPool(network_backend=...),
+    a nie podmieniany w puli utworzonej przez httpx.
+    """
+
+    def __init__(self, limits: httpx.Limits) -> None:
+        super().__init__(limits=limits)
+        self._pool.close()
+        self._pool = httpcore.ConnectionPool(
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=_CancellableBackend(httpcore.SyncBackend()),
+        )
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker dla jednego serwera Ollama.
+
+    closed -> (failure_threshold kolejnych błędów) -> open
+    open -> (po reset_timeout) -> half-open: przepuszcza jedno próbne żądanie
+    half-open -> sukces: closed / błąd: open
+    Próba zakończona bez wyniku (anulowanie, deadline klienta) zwalnia miejsce
+    przez release_trial() - obwód zostaje half-open i przepuści kolejną próbę.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = config.OLLAMA_CIRCUIT_FAILURES,
+        reset_timeout: float = config.OLLAMA_CIRCUIT_RESET,
+    ) -> None:
+        """
+        Args:
+            failure_threshold: Liczba kolejnych błędów otwierająca obwód.
+            reset_timeout: Czas (s), po którym dopuszczamy próbne żądanie.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    def admit(self) -> Optional[int]:
+        """
+        Dopuszcza żądanie.
+
+        Returns:
+            None (odmowa), 0 (obwód zamknięty) albo numer próbnego żądania half-open
+            (do przekazania w release_trial()).
+        """
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                self._trial_in_flight = False
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._trials += 1
+                return self._trials
+            return None
+
+    def allow(self) -> bool:
+        """Zwraca True, jeśli żądanie może zostać wysłane."""
+        return self.admit() is not None
+
+    def release_trial(self, trial: int) -> None:
+        """Zwalnia próbę half-open zakończoną bez sukcesu i bez błędu serwera (no-op po record_*)."""
+        with self._lock:
+            if trial and self._trial_in_flight and trial == self._trials:
+                self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        """Rejestruje udane żądanie (zamyka obwód)."""
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Rejestruje błąd transportu (może otworzyć obwód)."""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """Ponawianie z wykładniczym opóźnieniem i pełnym jitterem."""
+
+    def __init__(
+        self,
+        max_attempts: int = config.OLLAMA_RETRY_ATTEMPTS,
+        base_delay: float = config.OLLAMA_RETRY_BASE_DELAY,
+        max_delay: float = config.OLLAMA_RETRY_MAX_DELAY,
+    ) -> None:
+        """
+        Args:
+            max_attempts: Maksymalna liczba prób (łącznie z pierwszą).
+            base_delay: Opóźnienie bazowe (s) dla drugiej próby.
+            max_delay: Górna granica opóźnienia (s).
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Losowe opóźnienie przed próbą nr attempt + 1 (full jitter)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class _RetryableStatus(Exception):
+    """Wewnętrzny sygnał: odpowiedź 502/503/504, warto ponowić."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+
+
+class _BaseOllamaClient:
+    """Logika wspólna dla klienta synchronicznego i asynchronicznego."""
+
+    def __init__(self, base_url: str, breaker: CircuitBreaker, retry: Optional[RetryPolicy] = None, scheduler: Optional[LLMScheduler] = None) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.breaker = breaker
+        self.retry = retry or RetryPolicy()
+        self.scheduler = scheduler
+        self.stats: Dict[str, int] = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> float:
+        deadline = time.monotonic() + (timeout if timeout is not None else config.OLLAMA_REQUEST_TIMEOUT)
+        scope = _scope.get()
+        if scope is not None and scope.deadline is not None:
+            deadline = min(deadline, scope.deadline)
+        return deadline
+
+    @staticmethod
+    def _server_limited(path: str, timeout: Optional[float], deadline: float) -> bool:
+        """
+        Czy limit wywołania to skonfigurowany limit serwera (OLLAMA_REQUEST_TIMEOUT / OLLAMA_EMBED_TIMEOUT).
+
+        Przekroczenie krótszego limitu wywołującego (budżet pytania, okno etapu,
+        krótki timeout) świadczy o budżecie, a nie o awarii serwera - nie liczy
+        się do circuit breakera.
+        """
+        limit = timeout if timeout is not None else config.OLLAMA_REQUEST_TIMEOUT
+        server_limit = config.OLLAMA_EMBED_TIMEOUT if path in ("/api/embeddings", "/api/embed") else config.OLLAMA_REQUEST_TIMEOUT
+        scope = _scope.get()
+        scoped = scope is not None and scope.deadline is not None and scope.deadline <= deadline
+        return limit >= server_limit and not scoped
+
+    @staticmethod
+    def _cancel_token() -> Optional[CancelToken]:
+        scope = _scope.get()
+        return scope.cancel if scope is not None else None
+
+    @staticmethod
+    def _check_cancelled(cancel: Optional[CancelToken], error: Optional[Exception] = None) -> None:
+        """Po anulowaniu błąd transportu (zamknięte gniazdo) zamienia na OllamaCancelled."""
+        if cancel is not None and cancel.cancelled:
+            raise OllamaCancelled("Wywołanie Ollama anulowane") from error
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise OllamaDeadlineExceeded("Przekroczono limit czasu wywołania Ollama")
+        return remaining
+
+    def _timeout(self, deadline: float) -> httpx.Timeout:
+        remaining = self._remaining(deadline)
+        return httpx.Timeout(remaining, connect=min(remaining, config.OLLAMA_CONNECT_TIMEOUT))
+
+    def _slot_request(self, path: str, payload: Dict[str, Any]) -> Optional[Tuple[str, bool, float]]:
+        """Klasa priorytetu, flaga "krótkie" i szacowany koszt generacji (None = bez kolejki)."""
+        if self.scheduler is None or path != "/api/generate":
+            return None
+        priority, short = current_priority()
+        num_predict = (payload.get("options") or {}).get("num_predict")
+        if not isinstance(num_predict, int) or num_predict < 0:
+            num_predict = config.LLM_MAX_TOKENS
+        short = short or num_predict <= config.SCHEDULER_SHORT_MAX_TOKENS
+        cost = (
+            estimate_tokens(payload.get("prompt") or "") / config.DEADLINE_PREFILL_TOKENS_PER_S
+            + num_predict / config.DEADLINE_DECODE_TOKENS_PER_S
+        )
+        return priority, short, cost
+
+    def _release_slot(self, ticket: Optional[Ticket]) -> None:
+        if ticket is not None:
+            self.scheduler.release(ticket)
+
+    def _check_breaker(self) -> int:
+        """Odmawia przy otwartym obwodzie; zwraca numer próby half-open (0 = zwykłe żądanie)."""
+        trial = self.breaker.admit()
+        if trial is None:
+            self._count("rejected")
+            raise OllamaUnavailableError(
+                f"Ollama ({self.base_url}) nie odpowiada - circuit breaker otwarty. "
+                "Uruchom ponownie Ollama i sprawdź: ollama list"
+            )
+        return trial
+
+    @staticmethod
+    def _raise_for_status(status_code: int, text: str, model: str) -> None:
+        if status_code == 200:
+            return
+        try:
+            detail = json.loads(text).get("error", text)
+        except (ValueError, AttributeError):
+            detail = text
+        if status_code in _RETRYABLE_STATUS:
+            raise _RetryableStatus(status_code, detail)
+        if status_code == 404:
+            raise OllamaError(
+                f"Ollama zwróciła 404 ({detail}). Pobierz model: ollama pull {model}"
+            )
+        raise OllamaError(f"Ollama zwróciła HTTP {status_code}: {detail}")
+
+    def _give_up(self, error: Exception) -> OllamaUnavailableError:
+        self._count("failures")
+        return OllamaUnavailableError(
+            f"Nie można połączyć się z Ollama ({self.base_url}) po "
+            f"{self.retry.max_attempts} próbach: {error}"
+        )
+
+    @staticmethod
+    def _embed_payload(model: str, text: str, options: Optional[Dict[str, Any]], keep_alive: Optional[str]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "prompt": text}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    @staticmethod
+    def _generate_payload(
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]],
+        keep_alive: Optional[str],
+        stream: bool,
+    ) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = {k: v for k, v in options.items() if v is not None}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+
+class OllamaClient(_BaseOllamaClient):
+    """Synchroniczny klient Ollama z pulą połączeń, ponawianiem i circuit breakerem."""
+
+    def __init__(
+        self,
+        base_url: str = config.OLLAMA_BASE_URL,
+        breaker: Optional[CircuitBreaker] = None,
+        retry: Optional[RetryPolicy] = None,
+        scheduler: Optional[LLMScheduler] = None,
+    ) -> None:
+        """
+        Args:
+            base_url: Adres serwera Ollama.
+            breaker: Circuit breaker (domyślnie wspólny dla base_url).
+            retry: Polityka ponawiania.
+            scheduler: Kolejka generacji (None = generacje bez kolejki).
+        """
+        super().__init__(base_url, breaker or _shared_breaker(base_url), retry, scheduler)
+        # Odczyty z gniazd przez _CancellableBackend - CancelToken przerywa czekanie na Ollama
+        transport = _CancellableTransport(
+            limits=httpx.Limits(
+                max_connections=config.OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=config.OLLAMA_MAX_CONNECTIONS,
+            ),
+        )
+        self._http = httpx.Client(base_url=self.base_url, transport=transport)
+
+    def close(self) -> None:
+        """Zamyka pulę połączeń."""
+        self._http.close()
+
+    def _stream_frames(self, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> Iterator[Dict[str, Any]]:
+        """Wysyła żądanie z ponawianiem i zwraca kolejne ramki NDJSON odpowiedzi."""
+        deadline = self._deadline(timeout)
+        server_limited = self._server_limited(path, timeout, deadline)
+        cancel = self._cancel_token()
+        attempt = 0
+        trial = 0
+        try:
+            while True:
+                attempt += 1
+                self._check_cancelled(cancel)
+                request_timeout = self._timeout(deadline)
+                trial = self._check_breaker()
+                self._count("requests")
+                delivered = False
+                ticket = self._acquire_slot(path, payload, deadline, cancel)
+                try:
+                    # Czas w kolejce generacji liczy się do deadline'u wywołania
+                    request_timeout = self._timeout(deadline)
+                    with self._http.stream("POST", path, json=payload, timeout=request_timeout) as response:
+                        if response.status_code != 200:
+                            response.read()
+                        if response.status_code not in _RETRYABLE_STATUS:
+                            # Serwer odpowiada - nawet błąd 4xx zamyka obwód
+                            self.breaker.record_success()
+                        self._raise_for_status(response.status_code, response.text if response.status_code != 200 else "", payload.get("model", ""))
+                        for line in response.iter_lines():
+                            if not line:
+                                continue
+                            self._check_cancelled(cancel)
+                            self._remaining(deadline)
+                            delivered = True
+                            yield json.loads(line)
+                    return
+                except httpx.TimeoutException as e:
+                    self._check_cancelled(cancel, e)
+                    if isinstance(e, httpx.ConnectTimeout) and not delivered:
+                        error: Exception = e
+                    else:
+                        if server_limited:
+                            self.breaker.record_failure()
+                        # Limit wywołującego: próba half-open jest zwalniana w finally
+                        raise OllamaDeadlineExceeded(f"Przekroczono limit czasu wywołania Ollama: {e}") from e
+                except (_RETRYABLE_ERRORS + (_RetryableStatus,)) as e:
+                    # Gniazdo zamknięte przez CancelToken - to nie jest awaria serwera
+                    self._check_cancelled(cancel, e)
+                    error = e
+                finally:
+                    # Miejsce w kolejce jest zwalniane przed odczekaniem na ponowienie
+                    self._release_slot(ticket)
+                if delivered:
+                    # Część odpowiedzi już przekazana - ponowienie zdublowałoby tekst
+                    self.breaker.record_failure()
+                    raise self._give_up(error)
+
+                self.breaker.record_failure()
+                if attempt >= self.retry.max_attempts:
+                    raise self._give_up(error) from error
+                delay = self.retry.delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise OllamaDeadlineExceeded(f"Brak czasu na ponowienie wywołania Ollama: {error}") from error
+                self._count("retries")
+                if cancel is not None:
+                    cancel.wait(delay)
+                else:
+                    time.sleep(delay)
+        finally:
+            # Próba half-open przerwana bez wyniku (anulowanie, deadline, porzucony strumień) nie blokuje obwodu
+            self.breaker.release_trial(trial)
+
+    def _acquire_slot(self, path: str, payload: Dict[str, Any], deadline: float, cancel: Optional[CancelToken]) -> Optional[Ticket]:
+        """Czeka na miejsce w kolejce generacji (deadline i anulowanie obowiązują też w kolejce)."""
+        request = self._slot_request(path, payload)
+        if request is None:
+            return None
+        ticket = self.scheduler.acquire(
+            *request, timeout=self._remaining(deadline), cancelled=lambda: cancel is not None and cancel.cancelled
+        )
+        if ticket is None:
+            self._check_cancelled(cancel)
+            raise OllamaDeadlineExceeded("Przekroczono limit czasu w kolejce generacji Ollama")
+        return ticket
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Wysyła żądanie JSON i zwraca (ostatnią) ramkę odpowiedzi.
+
+        Args:
+            path: Ścieżka API, np. "/api/embeddings".
+            payload: Treść żądania.
+            timeout: Limit czasu całego wywołania w sekundach.
+
+        Returns:
+            Zdekodowana odpowiedź JSON.
+        """
+        result: Dict[str, Any] = {}
+        for frame in self._stream_frames(path, payload, timeout):
+            result = frame
+        return result
+
+    def embed(
+        self,
+        texts: List[str],
+        model: str = config.EMBEDDING_MODEL,
+        options: Optional[Dict[str, Any]] = None,
+        keep_alive: Optional[str] = config.OLLAMA_KEEP_ALIVE,
+        timeout: Optional[float] = config.OLLAMA_EMBED_TIMEOUT,
+    ) -> List[List[float]]:
+        """
+        Liczy embeddingi tekstów (jedno żądanie na tekst, po wspólnym połączeniu).
+
+        Args:
+            texts: Teksty do osadzenia.
+            model: Model embeddingów.
+            options: Opcje modelu (np. num_ctx).
+            keep_alive: Czas utrzymania modelu w pamięci.
+            timeout: Limit czasu na jeden tekst (s).
+
+        Returns:
+            Lista wektorów.
+        """
+        return [
+            self.post("/api/embeddings", self._embed_payload(model, text, options, keep_alive), timeout)["embedding"]
+            for text in texts
+        ]
+
+    def stream_generate(
+        self,
+        prompt: str,
+        model: str = config.LLM_MODEL,
+        options: Optional[Dict[str, Any]] = None,
+        keep_alive: Optional[str] = config.OLLAMA_KEEP_ALIVE,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Strumieniuje ramki /api/generate (pole 'response' = kolejny fragment tekstu).
+
+        Args:
+            prompt: Prompt.
+            model: Model generujący.
+            options: Opcje modelu (temperature, num_ctx, num_predict, ...).
+            keep_alive: Czas utrzymania modelu w pamięci.
+            timeout: Limit czasu całego wywołania (s).
+        """
+        payload = self._generate_payload(model, prompt, options, keep_alive, stream=True)
+        yield from self._stream_frames("/api/generate", payload, timeout)
+
+    def generate(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Generuje pełną odpowiedź; zwraca ostatnią ramkę z polem 'response' = cały tekst.
+
+        Args:
+            prompt: Prompt.
+            **kwargs: Jak w stream_generate.
+        """
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        for frame in self.stream_generate(prompt, **kwargs):
+            parts.append(frame.get("response", ""))
+            final = frame
+        final = dict(final)
+        final["response"] = "".join(parts)
+        return final
+
+
+class AsyncOllamaClient(_BaseOllamaClient):
+    """Asynchroniczny odpowiednik OllamaClient (jedna instancja na pętlę zdarzeń)."""
+
+    def __init__(
+        self,
+        base_url: str = config.OLLAMA_BASE_URL,
+        breaker: Optional[CircuitBreaker] = None,
+        retry: Optional[RetryPolicy] = None,
+        max_concurrency: int = config.ASYNC_OLLAMA_CONCURRENCY,
+        scheduler: Optional[LLMScheduler] = None,
+    ) -> None:
+        """
+        Args:
+            base_url: Adres serwera Ollama.
+            breaker: Circuit breaker (domyślnie wspólny dla base_url).
+            retry: Polityka ponawiania.
+            max_concurrency: Najwięcej jednocześnie trwających wywołań (reszta czeka w kolejce).
+            scheduler: Kolejka generacji (None = generacje bez kolejki).
+        """
+        super().__init__(base_url, breaker or _shared_breaker(base_url), retry, scheduler)
+        self.stats["throttled"] = 0
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        connections = max(config.OLLAMA_MAX_CONNECTIONS, max_concurrency)
+        self._http = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Liczba trwających wywołań (zajętych miejsc semafora)."""
+        return self.max_concurrency - self._slots._value
+
+    async def aclose(self) -> None:
+        """Zamyka pulę połączeń."""
+        await self._http.aclose()
+
+    async def _stream_frames(self, path: str, payload: Dict[str, Any], timeout: Optional[float]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Asynchroniczna wersja OllamaClient._stream_frames.
+
+        CancelToken jest sprawdzany przed każdą próbą i ramką; czekanie na
+        nagłówki przerywa się przez anulowanie zadania asyncio. Każda próba
+        zajmuje miejsce semafora do końca odpowiedzi (także strumieniowanej).
+        """
+        deadline = self._deadline(timeout)
+        server_limited = self._server_limited(path, timeout, deadline)
+        cancel = self._cancel_token()
+        attempt = 0
+        trial = 0
+        try:
+            while True:
+                attempt += 1
+                self._check_cancelled(cancel)
+                request_timeout = self._timeout(deadline)
+                trial = self._check_breaker()
+                self._count("requests")
+                delivered = False
+                # Najpierw kolejka generacji (wspólna dla serwera), potem semafor pętli
+                ticket = await self._aacquire_slot(path, payload, deadline)
+                if self._slots.locked():
+                    self._count("throttled")
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self._remaining(deadline))
+                except BaseException as e:
+                    self._release_slot(ticket)
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise OllamaDeadlineExceeded("Przekroczono limit czasu w kolejce wywołań Ollama") from e
+                    raise
+                try:
+                    # Czas w kolejce liczy się do deadline'u wywołania
+                    request_timeout = self._timeout(deadline)
+                    async with self._http.stream("POST", path, json=payload, timeout=request_timeout) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                        if response.status_code not in _RETRYABLE_STATUS:
+                            # Serwer odpowiada - nawet błąd 4xx zamyka obwód
+                            self.breaker.record_success()
+                        self._raise_for_status(response.status_code, response.text if response.status_code != 200 else "", payload.get("model", ""))
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            self._check_cancelled(cancel)
+                            self._remaining(deadline)
+                            delivered = True
+                            yield json.loads(line)
+                    return
+                except httpx.TimeoutException as e:
+                    if isinstance(e, httpx.ConnectTimeout) and not delivered:
+                        error: Exception = e
+                    else:
+                        if server_limited:
+                            self.breaker.record_failure()
+                        # Limit wywołującego: próba half-open jest zwalniana w finally
+                        raise OllamaDeadlineExceeded(f"Przekroczono limit czasu wywołania Ollama: {e}") from e
+                except (_RETRYABLE_ERRORS + (_RetryableStatus,)) as e:
+                    error = e
+                finally:
+                    # Miejsca są zwalniane przed odczekaniem na ponowienie
+                    self._slots.release()
+                    self._release_slot(ticket)
+                if delivered:
+                    self.breaker.record_failure()
+                    raise self._give_up(error)
+
+                self.breaker.record_failure()
+                if attempt >= self.retry.max_attempts:
+                    raise self._give_up(error) from error
+                delay = self.retry.delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise OllamaDeadlineExceeded(f"Brak czasu na ponowienie wywołania Ollama: {error}") from error
+                self._count("retries")
+                await asyncio.sleep(delay)
+        finally:
+            # Próba half-open przerwana bez wyniku (anulowanie, deadline, porzucony strumień) nie blokuje obwodu
+            self.breaker.release_trial(trial)
+
+    async def _aacquire_slot(self, path: str, payload: Dict[str, Any], deadline: float) -> Optional[Ticket]:
+        """Asynchroniczna wersja OllamaClient._acquire_slot."""
+        request = self._slot_request(path, payload)
+        if request is None:
+            return None
+        ticket = await self.scheduler.aacquire(*request, timeout=self._remaining(deadline))
+        if ticket is None:
+            raise OllamaDeadlineExceeded("Przekroczono limit czasu w kolejce generacji Ollama")
+        return ticket
+
+    async def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Asynchroniczna wersja OllamaClient.post."""
+        result: Dict[str, Any] = {}
+        async for frame in self._stream_frames(path, payload, timeout):
+            result = frame
+        return result
+
+    async def embed(
+        self,
+        texts: List[str],
+        model: str = config.EMBEDDING_MODEL,
+        options: Optional[Dict[str, Any]] = None,
+        keep_alive: Optional[str] = config.OLLAMA_KEEP_ALIVE,
+        timeout: Optional[float] = config.OLLAMA_EMBED_TIMEOUT,
+    ) -> List[List[float]]:
+        """Asynchroniczna wersja OllamaClient.embed (teksty wysyłane równolegle)."""
+        responses = await asyncio.gather(*(
+            self.post("/api/embeddings", self._embed_payload(model, text, options, keep_alive), timeout)
+            for text in texts
+        ))
+        return [response["embedding"] for response in responses]
+
+    async def stream_generate(
+        self,
+        prompt: str,
+        model: str = config.LLM_MODEL,
+        options: Optional[Dict[str, Any]] = None,
+        keep_alive: Optional[str] = config.OLLAMA_KEEP_ALIVE,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Asynchroniczna wersja OllamaClient.stream_generate."""
+        payload = self._generate_payload(model, prompt, options, keep_alive, stream=True)
+        async for frame in self._stream_frames("/api/generate", payload, timeout):
+            yield frame
+
+    async def generate(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        """Asynchroniczna wersja OllamaClient.generate."""
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        async for frame in self.stream_generate(prompt, **kwargs):
+            parts.append(frame.get("response", ""))
+            final = frame
+        final = dict(final)
+        final["response"] = "".join(parts)
+        return final
+
+
+# ==================== WSPÓŁDZIELONE INSTANCJE ====================
+
+_registry_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_clients: Dict[str, OllamaClient] = {}
+# Pętla zdarzeń -> (base_url -> klient); klucz to sama pętla (nie id(), które wraca po zwolnieniu pętli)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncOllamaClient]]" = weakref.WeakKeyDictionary()
+_schedulers: Dict[str, LLMScheduler] = {}
+
+
+def _reset_after_fork() -> None:
+    """
+    Proces potomny (serving.py, pre-fork) nie może używać połączeń rodzica -
+    gniazda puli byłyby współdzielone przez dwa procesy. Zaczynamy od zera.
+    """
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    _breakers.clear()
+    _clients.clear()
+    _async_clients.clear()
+    _schedulers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _shared_breaker(base_url: str) -> CircuitBreaker:
+    """Jeden circuit breaker na serwer - wspólny dla klienta sync i async."""
+    key = base_url.rstrip("/")
+    with _registry_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker()
+        return _breakers[key]
+
+
+def get_scheduler(base_url: str = config.OLLAMA_BASE_URL) -> Optional[LLMScheduler]:
+    """
+    Zwraca kolejkę generacji wspólną dla serwera (klient sync i async) albo None,
+    gdy SCHEDULER_ENABLED jest wyłączone.
+
+    Args:
+        base_url: Adres serwera Ollama.
+    """
+    if not config.SCHEDULER_ENABLED:
+        return None
+    key = base_url.rstrip("/")
+    with _registry_lock:
+        if key not in _schedulers:
+            _schedulers[key] = LLMScheduler()
+        return _schedulers[key]
+
+
+def get_client(base_url: str = config.OLLAMA_BASE_URL) -> OllamaClient:
+    """
+    Zwraca współdzielony (w procesie) synchroniczny klient dla base_url.
+
+    Args:
+        base_url: Adres serwera Ollama.
+    """
+    key = base_url.rstrip("/")
+    breaker = _shared_breaker(key)
+    scheduler = get_scheduler(key)
+    with _registry_lock:
+        if key not in _clients:
+            _clients[key] = OllamaClient(key, breaker=breaker, scheduler=scheduler)
+        return _clients[key]
+
+
+def get_async_client(base_url: str = config.OLLAMA_BASE_URL) -> AsyncOllamaClient:
+    """
+    Zwraca współdzielony asynchroniczny klient dla base_url i bieżącej pętli zdarzeń.
+
+    httpx.AsyncClient jest związany z pętlą, więc każda pętla ma własną pulę.
+    Klienci zamkniętych pętli (np. po asyncio.run) są usuwani z rejestru.
+
+    Args:
+        base_url: Adres serwera Ollama.
+    """
+    loop = asyncio.get_running_loop()
+    key = base_url.rstrip("/")
+    breaker = _shared_breaker(key)
+    scheduler = get_scheduler(key)
+    with _registry_lock:
+        for closed in [other for other in list(_async_clients) if other.is_closed()]:
+            _async_clients.pop(closed, None)
+        clients = _async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = AsyncOllamaClient(key, breaker=breaker, scheduler=scheduler)
+        return clients[key]
@@ -0,0 +1,281 @@
+"""
+Zarządzanie modelami Ollama: rozgrzewanie, keep_alive i num_ctx.
+
+Pierwsze pytanie po starcie main.py płaciło pełne ładowanie llama3.
+OllamaModelManager ładuje model embeddingów i model generujący w tle
+(podczas budowy indeksu BM25), ustawia jawnie keep_alive oraz num_ctx
+i wypełnia KV cache stałym prefiksem promptu (config.PROMPT_PREFIX).
+Wszystkie żądania idą przez współdzielony klient z ollama_client.py.
+Professional Local RAG Agent - Initial Release"""
+
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from colorama import Fore, init
+
+import config
+from ollama_client import get_async_client, get_client
+from scheduler import llm_priority
+
+init(autoreset=True)
+
+
+class PooledOllama(LLM):
+    """
+    LLM Ollama dla LangChain, wysyłający żądania przez współdzielony OllamaClient
+    (pula połączeń, deadline, ponawianie, circuit breaker).
+    """
+
+    model: str = config.LLM_MODEL
+    base_url: str = config.OLLAMA_BASE_URL
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    num_predict: Optional[int] = None
+    num_ctx: Optional[int] = None
+    keep_alive: Optional[str] = None
+    timeout: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-pooled"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "base_url": self.base_url, **self._options()}
+
+    def _options(self, stop: Optional[List[str]] = None, **overrides: Any) -> Dict[str, Any]:
+        options = {
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "num_predict": self.num_predict,
+            "num_ctx": self.num_ctx,
+        }
+        if stop:
+            options["stop"] = stop
+        options.update(overrides)
+        return options
+
+    def _request_kwargs(self, stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "options": self._options(stop, **kwargs.get("options", {})),
+            "keep_alive": self.keep_alive,
+            "timeout": kwargs.get("timeout", self.timeout),
+        }
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for frame in get_client(self.base_url).stream_generate(prompt, **self._request_kwargs(stop, **kwargs)):
+            text = frame.get("response", "")
+            if text:
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        async for frame in get_async_client(self.base_url).stream_generate(prompt, **self._request_kwargs(stop, **kwargs)):
+            text = frame.get("response", "")
+            if text:
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    await run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        parts = [chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)]
+        return "".join(parts)
+
+
+class PooledOllamaEmbeddings(Embeddings):
+    """Embeddingi Ollama dla LangChain/Chroma przez współdzielony OllamaClient."""
+
+    def __init__(
+        self,
+        model: str = config.EMBEDDING_MODEL,
+        base_url: str = config.OLLAMA_BASE_URL,
+        num_ctx: Optional[int] = None,
+        keep_alive: Optional[str] = None,
+        timeout: float = config.OLLAMA_EMBED_TIMEOUT,
+    ) -> None:
+        """
+        Args:
+            model: Model embeddingów.
+            base_url: Adres serwera Ollama.
+            num_ctx: Okno kontekstu modelu embeddingów.
+            keep_alive: Czas utrzymania modelu w pamięci.
+            timeout: Limit czasu jednego embeddingu (s).
+        """
+        self.model = model
+        self.base_url = base_url
+        self.options = {"num_ctx": num_ctx} if num_ctx else None
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+
+    def _kwargs(self) -> Dict[str, Any]:
+        return {"model": self.model, "options": self.options, "keep_alive": self.keep_alive, "timeout": self.timeout}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_client(self.base_url).embed(texts, **self._kwargs())
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await get_async_client(self.base_url).embed(texts, **self._kwargs())
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class OllamaModelManager:
+    """
+    Tworzy klientów Ollama ze spójnymi opcjami i rozgrzewa modele w tle.
+
+    Opcje wpływające na ładowanie modelu (num_ctx) muszą być identyczne
+    w rozgrzewce i w zwykłych żądaniach - inaczej Ollama przeładuje model.
+    """
+
+    def __init__(self, base_url: str = config.OLLAMA_BASE_URL) -> None:
+        """
+        Args:
+            base_url: Adres serwera Ollama.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.warmup_stats: Dict[str, Dict[str, Any]] = {}
+        self._warmup_thread: Optional[threading.Thread] = None
+        self._warm = threading.Event()
+
+    def create_embeddings(self) -> PooledOllamaEmbeddings:
+        """Zwraca model embeddingów z jawnym num_ctx i keep_alive."""
+        return PooledOllamaEmbeddings(
+            model=config.EMBEDDING_MODEL,
+            base_url=self.base_url,
+            num_ctx=config.EMBEDDING_NUM_CTX,
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+        )
+
+    def create_llm(self) -> PooledOllama:
+        """Zwraca LLM z parametrami z config oraz jawnym num_ctx i keep_alive."""
+        return PooledOllama(
+            model=config.LLM_MODEL,
+            base_url=self.base_url,
+            temperature=config.LLM_TEMPERATURE,
+            top_p=config.LLM_TOP_P,
+            num_predict=config.LLM_MAX_TOKENS,
+            num_ctx=config.LLM_NUM_CTX,
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+        )
+
+    def generate_stats(self, prompt: str, num_predict: int = 1, timeout: float = config.WARMUP_TIMEOUT) -> Dict[str, Any]:
+        """
+        Wysyła żądanie /api/generate i zwraca liczniki Ollama z ostatniej ramki.
+
+        Args:
+            prompt: Prompt do wysłania.
+            num_predict: Limit generowanych tokenów.
+            timeout: Limit czasu żądania w sekundach.
+
+        Returns:
+            Dict z polami load_duration, prompt_eval_count, prompt_eval_duration,
+            eval_duration, total_duration (ns, jak w API Ollama) oraz wall_time (s).
+        """
+        start = time.perf_counter()
+        data = get_client(self.base_url).generate(
+            prompt,
+            model=config.LLM_MODEL,
+            options={
+                "num_ctx": config.LLM_NUM_CTX,
+                "num_predict": num_predict,
+                "temperature": config.LLM_TEMPERATURE,
+            },
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+            timeout=timeout,
+        )
+        stats = {
+            key: data.get(key, 0)
+            for key in ("load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_duration", "total_duration")
+        }
+        stats["wall_time"] = time.perf_counter() - start
+        return stats
+
+    def _warm_embeddings(self) -> None:
+        """Ładuje model embeddingów jednym krótkim żądaniem."""
+        start = time.perf_counter()
+        get_client(self.base_url).embed(
+            ["warm-up"],
+            model=config.EMBEDDING_MODEL,
+            options={"num_ctx": config.EMBEDDING_NUM_CTX},
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+            timeout=config.WARMUP_TIMEOUT,
+        )
+        self.warmup_stats["embeddings"] = {"wall_time": time.perf_counter() - start}
+
+    def _warm_llm(self) -> None:
+        """Ładuje LLM i wypełnia KV cache wspólnym prefiksem promptów."""
+        self.warmup_stats["llm"] = self.generate_stats(config.PROMPT_PREFIX)
+
+    def _run_warmup(self) -> None:
+        """Rozgrzewa oba modele; błędy tylko raportuje (agent działa dalej)."""
+        for name, warm in (("embeddings", self._warm_embeddings), ("llm", self._warm_llm)):
+            try:
+                with llm_priority("warmup"):
+                    warm()
+            except Exception as e:
+                self.warmup_stats[name] = {"error": str(e)}
+                print(f"{Fore.YELLOW}⚠ Rozgrzewanie modelu ({name}) nie powiodło się: {e}")
+        self._warm.set()
+
+    def warm_up_async(self) -> None:
+        """Startuje rozgrzewanie modeli w wątku w tle (jeśli włączone w config)."""
+        if not config.WARMUP_ENABLED:
+            self._warm.set()
+            return
+        if self._warmup_thread is not None:
+            return
+        self._warmup_thread = threading.Thread(target=self._run_warmup, name="ollama-warmup", daemon=True)
+        self._warmup_thread.start()
+        print(f"{Fore.GREEN}✓ Rozgrzewanie modeli w tle (keep_alive={config.OLLAMA_KEEP_ALIVE})")
+
+    def wait_until_warm(self, timeout: Optional[float] = None) -> bool:
+        """
+        Czeka na zakończenie rozgrzewania.
+
+        Args:
+            timeout: Maksymalny czas oczekiwania w sekundach (None = bez limitu).
+
+        Returns:
+            True jeśli rozgrzewanie się zakończyło.
+        """
+        return self._warm.wait(timeout)
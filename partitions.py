@@ -0,0 +1,189 @@
+"""
+Filtry metadanych i partycje korpusu per plik źródłowy.
+
+Użytkownik zwykle wie, o który dokument pyta. Zamiast oceniać cały korpus,
+zapytanie z filtrem (plik, katalog, zakres stron, typ pliku) jest kierowane
+tylko do pasujących partycji: BM25 liczy score wyłącznie dla ich chunków,
+a Chroma dostaje klauzulę `where` z listą pasujących źródeł.
+
+Składnia w pytaniu (main.py):
+    @source:manual.pdf   @source:instr*.pdf,faq.md
+    @dir:docs/manuals    @page:3-10   @page:7   @type:pdf
+Professional Local RAG Agent - Initial Release"""
+
+import fnmatch
+import re
+from pathlib import PurePath
+from typing import Any, Dict, List, Optional, Tuple
+
+_FILTER_TOKEN_RE = re.compile(r"(?<!\S)@(source|dir|page|type):(\S+)", re.IGNORECASE)
+_PAGE_RANGE_RE = re.compile(r"^(\d+)?(?:-(\d+)?)?$")
+
+
+class MetadataFilter:
+    """
+    Filtr chunków po metadanych.
+
+    Strony podawane są od 1 (jak w czytniku PDF); w metadanych PDFPlumber
+    strony są numerowane od 0.
+    """
+
+    def __init__(
+        self,
+        sources: Optional[List[str]] = None,
+        directories: Optional[List[str]] = None,
+        page_min: Optional[int] = None,
+        page_max: Optional[int] = None,
+        file_types: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Args:
+            sources: Nazwy plików (wzorce fnmatch, bez rozróżniania wielkości liter).
+            directories: Katalogi (dopasowanie końcówki ścieżki katalogu).
+            page_min: Pierwsza strona (od 1, włącznie).
+            page_max: Ostatnia strona (od 1, włącznie).
+            file_types: Rozszerzenia plików, np. ["pdf", "md"].
+        """
+        self.sources = [s.lower() for s in sources or []]
+        self.directories = [d.replace("\\", "/").strip("/").lower() for d in directories or []]
+        self.page_min = page_min
+        self.page_max = page_max
+        self.file_types = [t.lower().lstrip(".") for t in file_types or []]
+
+    def __repr__(self) -> str:
+        parts = []
+        if self.sources:
+            parts.append(f"source={','.join(self.sources)}")
+        if self.directories:
+            parts.append(f"dir={','.join(self.directories)}")
+        if self.page_min is not None or self.page_max is not None:
+            parts.append(f"page={self.page_min or ''}-{self.page_max or ''}")
+        if self.file_types:
+            parts.append(f"type={','.join(self.file_types)}")
+        return f"MetadataFilter({' '.join(parts)})"
+
+    @property
+    def has_page_range(self) -> bool:
+        return self.page_min is not None or self.page_max is not None
+
+    def cache_key(self) -> str:
+        """Stała reprezentacja tekstowa (do kluczy cache)."""
+        return repr(self)
+
+    @classmethod
+    def parse(cls, text: str) -> Tuple[str, Optional["MetadataFilter"]]:
+        """
+        Wyciąga z pytania tokeny filtrów (@source:, @dir:, @page:, @type:).
+
+        Args:
+            text: Pytanie użytkownika z opcjonalnymi filtrami.
+
+        Returns:
+            Krotka (pytanie bez filtrów, filtr lub None).
+
+        Raises:
+            ValueError: Gdy zakres stron jest niepoprawny.
+        """
+        found: Dict[str, List[str]] = {}
+        for key, value in _FILTER_TOKEN_RE.findall(text):
+            found.setdefault(key.lower(), []).extend(v for v in value.split(",") if v)
+        if not found:
+            return text, None
+
+        page_min = page_max = None
+        for value in found.get("page", []):
+            match = _PAGE_RANGE_RE.match(value)
+            if not match or not any(match.groups()):
+                raise ValueError(f"Niepoprawny zakres stron: @page:{value} (np. @page:3-10)")
+            low, high = match.group(1), match.group(2)
+            page_min = int(low) if low else None
+            page_max = int(high) if high else (page_min if "-" not in value else None)
+
+        question = _FILTER_TOKEN_RE.sub("", text)
+        question = re.sub(r"\s+", " ", question).strip()
+        return question, cls(
+            sources=found.get("source"),
+            directories=found.get("dir"),
+            page_min=page_min,
+            page_max=page_max,
+            file_types=found.get("type"),
+        )
+
+    def matches_source(self, source: str) -> bool:
+        """Sprawdza warunki zależne tylko od ścieżki pliku (plik, katalog, typ)."""
+        path = PurePath(source.replace("\\", "/"))
+        name = path.name.lower()
+        if self.sources and not any(fnmatch.fnmatch(name, pattern) for pattern in self.sources):
+            return False
+        if self.file_types and path.suffix.lower().lstrip(".") not in self.file_types:
+            return False
+        if self.directories:
+            parent = str(path.parent).replace("\\", "/").strip("/").lower()
+            if not any(parent == d or parent.endswith("/" + d) for d in self.directories):
+                return False
+        return True
+
+    def matches_page(self, page: Any) -> bool:
+        """Sprawdza zakres stron (chunki bez numeru strony odpadają przy filtrze stron)."""
+        if not self.has_page_range:
+            return True
+        if not isinstance(page, int):
+            return False
+        if self.page_min is not None and page + 1 < self.page_min:
+            return False
+        if self.page_max is not None and page + 1 > self.page_max:
+            return False
+        return True
+
+    def chroma_where(self, sources: List[str]) -> Dict[str, Any]:
+        """
+        Buduje klauzulę `where` dla Chroma.
+
+        Args:
+            sources: Pasujące źródła (wynik SourcePartitions.matching_sources).
+        """
+        conditions: List[Dict[str, Any]] = [{"source": {"$in": sources}}]
+        if self.page_min is not None:
+            conditions.append({"page": {"$gte": self.page_min - 1}})
+        if self.page_max is not None:
+            conditions.append({"page": {"$lte": self.page_max - 1}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class SourcePartitions:
+    """
+    Partycje korpusu: źródło -> pozycje chunków w CorpusStore.
+
+    Budowane raz przy starcie agenta; filtr jest rozwiązywany najpierw na
+    poziomie źródeł, a dopiero potem (tylko dla pasujących) na poziomie stron.
+    """
+
+    def __init__(self, records: List[Any]) -> None:
+        """
+        Args:
+            records: Rekordy chunków z atrybutami source i page
+                (corpus_store.ChunkRecord), w kolejności magazynu korpusu.
+        """
+        self.records = records
+        self.by_source: Dict[str, List[int]] = {}
+        for idx, record in enumerate(records):
+            self.by_source.setdefault(record.source, []).append(idx)
+
+    def matching_sources(self, filters: MetadataFilter) -> List[str]:
+        """Źródła spełniające warunki filtra dotyczące ścieżki."""
+        return [source for source in self.by_source if filters.matches_source(source)]
+
+    def select(self, filters: MetadataFilter) -> List[int]:
+        """
+        Indeksy chunków spełniających filtr (posortowane rosnąco).
+
+        Args:
+            filters: Filtr metadanych.
+        """
+        indices: List[int] = []
+        for source in self.matching_sources(filters):
+            partition = self.by_source[source]
+            if filters.has_page_range:
+                partition = [i for i in partition if filters.matches_page(self.records[i].page)]
+            indices.extend(partition)
+        return sorted(indices)
@@ -0,0 +1,270 @@
+"""
+Wbudowane profilowanie CPU i pamięci (bez zmian w kodzie agenta).
+
+Włączane komendą `profile on` w main.py albo zmienną środowiskową
+RAG_PROFILE=1 (wtedy profilowany jest też start agenta i ingestia).
+Każdy etap (`startup`, `ask`, `ingest`) w trakcie profilowania:
+- próbkuje stosy wszystkich wątków co PROFILE_SAMPLE_INTERVAL_S (czas
+  zegarowy, więc widać też czekanie na Ollama i wątki spekulatywne),
+- zbiera cProfile wątku, który wywołał etap (czasy funkcji, plik .prof),
+- porównuje migawki tracemalloc z początku i końca etapu.
+`profile dump` zapisuje do PROFILE_DIR/<czas>/ pliki `<etap>.collapsed`
+(format collapsed-stack dla flamegraph.pl / speedscope), `<etap>.prof`
+(pstats / snakeviz) i `<etap>.alloc.txt`, wypisuje top-N funkcji i alokacji
+każdego etapu, po czym zeruje zebrane dane.
+Professional Local RAG Agent - Initial Release"""
+
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from colorama import Fore, init
+
+import config
+
+init(autoreset=True)
+
+_TRUE_VALUES = {"1", "on", "true", "yes"}
+
+
+def _idle_worker(frame) -> bool:
+    """Czy wątek puli (ThreadPoolExecutor) czeka na zadanie - takich próbek nie liczymy."""
+    code = frame.f_code
+    return code.co_name == "_worker" and code.co_filename.endswith(os.path.join("concurrent", "futures", "thread.py"))
+
+
+class StageProfile:
+    """Dane zebrane dla jednego etapu (sumowane po wszystkich wywołaniach)."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.wall_s = 0.0
+        self.samples: Counter = Counter()
+        self.stats: Optional[pstats.Stats] = None
+        # "plik:linia" -> [bajty, liczba bloków] zaalokowane (netto) w trakcie etapu
+        self.allocations: Dict[str, List[int]] = {}
+
+    def add_profile(self, profile: cProfile.Profile) -> None:
+        if self.stats is None:
+            self.stats = pstats.Stats(profile, stream=io.StringIO())
+        else:
+            self.stats.add(profile)
+
+    def add_allocations(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> None:
+        # Bez alokacji samego profilera (migawki, liczniki próbek)
+        own = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        for diff in after.filter_traces(own).compare_to(before.filter_traces(own), "lineno"):
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            entry = self.allocations.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+            entry[0] += diff.size_diff
+            entry[1] += diff.count_diff
+
+    def top_allocations(self, n: int) -> List[tuple]:
+        """n miejsc alokacji z największym przyrostem pamięci: (miejsce, bajty, bloki)."""
+        ranked = sorted(self.allocations.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [(where, size, count) for where, (size, count) in ranked]
+
+
+class Profiler:
+    """
+    Profiler etapów CLI; jedna instancja na proces (PROFILER).
+
+    Etapy mogą trwać równocześnie w wielu wątkach (tryb wsadowy) - próbki
+    stosów i przyrost pamięci są wtedy przypisywane wszystkim aktywnym etapom.
+    """
+
+    def __init__(
+        self,
+        directory: Path = config.PROFILE_DIR,
+        interval_s: float = config.PROFILE_SAMPLE_INTERVAL_S,
+        top_n: int = config.PROFILE_TOP_N,
+    ) -> None:
+        """
+        Args:
+            directory: Katalog na wyniki `profile dump`.
+            interval_s: Odstęp między próbkami stosów.
+            top_n: Liczba funkcji i miejsc alokacji w raporcie.
+        """
+        self.directory = Path(directory)
+        self.interval_s = interval_s
+        self.top_n = top_n
+        self.enabled = False
+        self.stages: Dict[str, StageProfile] = {}
+        self._lock = threading.Lock()
+        self._active: Counter = Counter()
+        self._local = threading.local()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def enable(self) -> None:
+        """Włącza profilowanie kolejnych etapów."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Wyłącza profilowanie (zebrane dane zostają do `dump`)."""
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Profiluje blok kodu jako etap `name` (bez narzutu, gdy profilowanie jest wyłączone).
+
+        Args:
+            name: Nazwa etapu, np. "ask".
+        """
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            profile = self.stages.setdefault(name, StageProfile(name))
+            self._active[name] += 1
+            if self._sampler is None:
+                self._stop.clear()
+                self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        # cProfile tylko dla najbardziej zewnętrznego etapu wątku
+        owner = not getattr(self._local, "profiling", False)
+        cprofile = cProfile.Profile() if owner else None
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        start = time.perf_counter()
+        if cprofile is not None:
+            self._local.profiling = True
+            cprofile.enable()
+        try:
+            yield
+        finally:
+            if cprofile is not None:
+                cprofile.disable()
+                self._local.profiling = False
+            wall_s = time.perf_counter() - start
+            after = tracemalloc.take_snapshot() if before is not None and tracemalloc.is_tracing() else None
+            with self._lock:
+                profile.calls += 1
+                profile.wall_s += wall_s
+                if cprofile is not None:
+                    profile.add_profile(cprofile)
+                if after is not None:
+                    profile.add_allocations(before, after)
+                self._active[name] -= 1
+                if self._active[name] <= 0:
+                    del self._active[name]
+                sampler = self._sampler if not self._active else None
+                if sampler is not None:
+                    self._sampler = None
+                    self._stop.set()
+            if sampler is not None:
+                sampler.join()
+
+    def _sample(self) -> None:
+        """Wątek próbkujący: stosy wszystkich wątków -> liczniki collapsed-stack aktywnych etapów."""
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval_s):
+            frames = sys._current_frames()
+            if len(frames) != len(names):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in frames.items():
+                if ident == me or _idle_worker(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stacks.append(";".join(reversed(stack)))
+            with self._lock:
+                for name in self._active:
+                    self.stages[name].samples.update(stacks)
+
+    def report(self, stages: Optional[Dict[str, StageProfile]] = None) -> str:
+        """
+        Tekstowy raport: czasy etapów, top-N funkcji (cumtime) i top-N alokacji.
+
+        Args:
+            stages: Etapy do opisania (domyślnie zebrane od ostatniego `dump`).
+        """
+        lines = []
+        for profile in (self.stages if stages is None else stages).values():
+            lines.append(
+                f"== {profile.name}: {profile.calls} wywołań, {profile.wall_s:.2f}s, "
+                f"{sum(profile.samples.values())} próbek stosu"
+            )
+            if profile.stats is not None:
+                stream = io.StringIO()
+                profile.stats.stream = stream
+                profile.stats.sort_stats("cumulative").print_stats(self.top_n)
+                body = stream.getvalue()
+                # Bez nagłówka pstats (liczba wywołań i "Ordered by")
+                lines.append(body[body.find("   ncalls"):].rstrip() if "   ncalls" in body else body.rstrip())
+            allocations = profile.top_allocations(self.top_n)
+            if allocations:
+                lines.append(f"   Top {len(allocations)} alokacji (przyrost netto):")
+                for where, size, count in allocations:
+                    lines.append(f"   {size / 1024:10.1f} KiB {count:8d} bloków  {where}")
+            lines.append("")
+        return "\n".join(lines)
+
+    def dump(self) -> Optional[Path]:
+        """
+        Zapisuje wyniki wszystkich etapów, wypisuje raport i zeruje dane.
+
+        Returns:
+            Katalog z wynikami albo None, gdy nic nie zebrano.
+        """
+        with self._lock:
+            stages, self.stages = self.stages, {}
+        if not stages:
+            print(f"{Fore.YELLOW}⚠ Profiler: brak danych (włącz: profile on)")
+            return None
+        target = self.directory / time.strftime("%Y%m%d-%H%M%S")
+        target.mkdir(parents=True, exist_ok=True)
+        for profile in stages.values():
+            with open(target / f"{profile.name}.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in profile.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            if profile.stats is not None:
+                profile.stats.dump_stats(str(target / f"{profile.name}.prof"))
+            with open(target / f"{profile.name}.alloc.txt", "w", encoding="utf-8") as f:
+                for where, size, count in profile.top_allocations(len(profile.allocations)):
+                    f.write(f"{size}\t{count}\t{where}\n")
+        report = self.report(stages)
+        (target / "report.txt").write_text(report, encoding="utf-8")
+        print(f"\n{Fore.CYAN}{report}")
+        print(f"{Fore.GREEN}✓ Profil zapisany w {target} (flamegraph: flamegraph.pl {target}/<etap>.collapsed > etap.svg)")
+        return target
+
+
+def _from_environment() -> Profiler:
+    """Profiler włączony od startu procesu, gdy ustawiono PROFILE_ENV (zapis przy wyjściu)."""
+    profiler = Profiler()
+    if os.environ.get(config.PROFILE_ENV, "").strip().lower() in _TRUE_VALUES:
+        profiler.enable()
+        atexit.register(lambda: profiler.stages and profiler.dump())
+    return profiler
+
+
+PROFILER = _from_environment()
+
+
+def stage(name: str):
+    """Skrót: PROFILER.stage(name)."""
+    return PROFILER.stage(name)
@@ -5,18 +5,18 @@ Zawiera klasę RAGAgent odpowiedzialną za pobieranie kontekstu
 i generowanie odpowiedzi przy użyciu lokalnego LLM.
 Professional Local RAG Agent - Initial Release"""
 
+import asyncio
 import sys
 from typing import Optional, Dict, Any
 
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.llms import Ollama
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from colorama import Fore, Style, init
 
 import config
+from ollama_manager import OllamaModelManager
 
 # Inicjalizacja kolorowego outputu
 init(autoreset=True)
@@ -36,6 +36,9 @@ class RAGAgent:
             ConnectionError: Gdy nie można połączyć się z Ollama.
             FileNotFoundError: Gdy baza ChromaDB nie istnieje.
         """
+        # Modele ładują się w tle, równolegle z połączeniem do ChromaDB
+        self.model_manager = OllamaModelManager()
+        self.model_manager.warm_up_async()
         self._initialize_embeddings()
         self._initialize_vectorstore()
         self._initialize_llm()
@@ -44,10 +47,7 @@ class RAGAgent:
     def _initialize_embeddings(self) -> None:
         """Inicjalizuje model embeddingów Ollama."""
         try:
-            self.embeddings = OllamaEmbeddings(
-                model=config.EMBEDDING_MODEL,
-                base_url=config.OLLAMA_BASE_URL,
-            )
+            self.embeddings = self.model_manager.create_embeddings()
             print(f"{Fore.GREEN}✓ Embeddings zainicjalizowane ({config.EMBEDDING_MODEL})")
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd inicjalizacji embeddingów: {e}")
@@ -87,13 +87,7 @@ class RAGAgent:
     def _initialize_llm(self) -> None:
         """Inicjalizuje lokalny model LLM przez Ollama."""
         try:
-            self.llm = Ollama(
-                model=config.LLM_MODEL,
-                base_url=config.OLLAMA_BASE_URL,
-                temperature=config.LLM_TEMPERATURE,
-                top_p=config.LLM_TOP_P,
-                num_predict=config.LLM_MAX_TOKENS,
-            )
+            self.llm = self.model_manager.create_llm()
             print(f"{Fore.GREEN}✓ LLM zainicjalizowany ({config.LLM_MODEL})")
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd inicjalizacji LLM: {e}")
@@ -161,25 +155,76 @@ class RAGAgent:
             # Użyj chain'a do wygenerowania odpowiedzi (LLM z promptem z config)
             answer = self.qa_chain.invoke({"context": context_str, "question": question})
             
-            # Wyciągnij unikalne źródła
-            sources = []
-            seen_sources = set()
-            for doc in docs:
-                source = doc.metadata.get("source", "Nieznane źródło")
-                if source not in seen_sources:
-                    sources.append(source)
-                    seen_sources.add(source)
+            return {
+                "answer": answer,
+                "source_documents": docs,
+                "sources": self._sources(docs)
+            }
+
+        except Exception as e:
+            print(f"{Fore.RED}✗ Błąd podczas generowania odpowiedzi: {e}")
+            raise RuntimeError(f"Nie udało się wygenerować odpowiedzi: {e}")
+
+    async def aask(self, question: str) -> Dict[str, Any]:
+        """
+        Asynchroniczna wersja ask().
+
+        Embedding pytania i generacja idą przez asynchroniczny klient Ollama
+        (z limitem równoległych wywołań), a wyszukiwanie w ChromaDB - do puli
+        wątków pętli zdarzeń.
+
+        Args:
+            question: Pytanie użytkownika.
+
+        Returns:
+            Dict jak z ask().
+
+        Raises:
+            ValueError: Gdy pytanie jest puste.
+            RuntimeError: Gdy wystąpi błąd podczas generowania odpowiedzi.
+        """
+        if not question or not question.strip():
+            raise ValueError("Pytanie nie może być puste")
+
+        try:
+            embedding = await self.embeddings.aembed_query(question)
+            if config.RETRIEVER_SEARCH_TYPE == "mmr":
+                search = lambda: self.vectorstore.max_marginal_relevance_search_by_vector(
+                    embedding, k=config.RETRIEVER_K, fetch_k=config.RETRIEVER_FETCH_K
+                )
+            else:
+                search = lambda: self.vectorstore.similarity_search_by_vector(embedding, k=config.RETRIEVER_K)
+            docs = await asyncio.get_running_loop().run_in_executor(None, search)
+
+            context_str = "\n---\n".join([doc.page_content for doc in docs])
+            prompt = self.prompt_template.format(context=context_str, question=question)
+            answer = await self.llm.ainvoke(prompt)
 
             return {
                 "answer": answer,
                 "source_documents": docs,
-                "sources": sources
+                "sources": self._sources(docs)
             }
 
         except Exception as e:
             print(f"{Fore.RED}✗ Błąd podczas generowania odpowiedzi: {e}")
             raise RuntimeError(f"Nie udało się wygenerować odpowiedzi: {e}")
 
+    @staticmethod
+    def _sources(docs) -> list:
+        """Unikalne nazwy plików źródłowych (z plikami prawie-duplikatów)."""
+        sources = []
+        seen_sources = set()
+        for doc in docs:
+            source = doc.metadata.get("source", "Nieznane źródło")
+            # Źródła prawie-duplikatów odrzuconych przy ingestii (dedup.py)
+            duplicates = doc.metadata.get("duplicate_sources", "")
+            for source in [source] + (duplicates.split(";") if duplicates else []):
+                if source not in seen_sources:
+                    sources.append(source)
+                    seen_sources.add(source)
+        return sources
+
     def get_stats(self) -> Dict[str, int]:
         """
         Zwraca statystyki bazy wektorowej.
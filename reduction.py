@@ -0,0 +1,178 @@
+"""
+Redukcja wymiaru embeddingów dla pierwszego przebiegu wyszukiwania wektorowego.
+
+nomic-embed-text zwraca wektory 768-wymiarowe, a koszt porównania zapytania
+z macierzą embeddingów rośnie liniowo z wymiarem. EmbeddingReducer rzutuje
+embeddingi na EMBEDDING_REDUCED_DIM wymiarów:
+- "pca": projekcja na główne składowe, dopasowana przy ingestii na próbce
+  embeddingów korpusu (odległości L2 w projekcji przybliżają pełne),
+- "prefix": pierwsze wymiary wektora (Matryoshka) - tylko dla modeli
+  trenowanych w ten sposób, np. nomic-embed-text v1.5.
+DenseIndex szuka najpierw na zredukowanych wektorach, a shortlistę
+(EMBEDDING_RESCORE_FACTOR x k kandydatów) przelicza na pełnych.
+Projekcja jest zapisywana obok indeksu, a zapytania są rzutowane tak samo.
+Professional Local RAG Agent - Initial Release"""
+
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+import config
+
+METHODS = ("pca", "prefix")
+
+
+class EmbeddingReducer:
+    """Projekcja embeddingów (PCA albo prefiks) na mniejszy wymiar."""
+
+    def __init__(
+        self,
+        method: str,
+        dim: int,
+        mean: Optional[np.ndarray] = None,
+        components: Optional[np.ndarray] = None,
+        explained: float = 0.0,
+    ) -> None:
+        """
+        Args:
+            method: "pca" albo "prefix".
+            dim: Wymiar po redukcji.
+            mean: Średnia embeddingów (PCA).
+            components: Główne składowe (dim x pełny wymiar, PCA).
+            explained: Część wariancji zachowana przez projekcję (do raportu).
+        """
+        if method not in METHODS:
+            raise ValueError(f"Nieznana redukcja: {method} (dostępne: {', '.join(METHODS)})")
+        if method == "pca" and (mean is None or components is None or len(components) != dim):
+            raise ValueError("PCA wymaga średniej i dim głównych składowych")
+        self.method = method
+        self.dim = dim
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.ascontiguousarray(components, dtype=np.float32)
+        self.explained = explained
+
+    @classmethod
+    def fit(
+        cls,
+        vectors: np.ndarray,
+        method: str = config.EMBEDDING_REDUCTION or "pca",
+        dim: int = config.EMBEDDING_REDUCED_DIM,
+        sample: int = config.EMBEDDING_PCA_SAMPLE,
+        seed: int = 0,
+    ) -> "EmbeddingReducer":
+        """
+        Dopasowuje redukcję do embeddingów korpusu.
+
+        Args:
+            vectors: Embeddingi chunków (n x pełny wymiar).
+            method: "pca" albo "prefix".
+            dim: Wymiar po redukcji (nie większy niż pełny).
+            sample: Najwyżej tyle losowych wierszy do dopasowania PCA.
+            seed: Ziarno losowania próbki.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            raise ValueError("Brak embeddingów do dopasowania redukcji")
+        if not 0 < dim <= vectors.shape[1]:
+            raise ValueError(f"Wymiar redukcji musi być w zakresie 1..{vectors.shape[1]}")
+        if method == "prefix":
+            total = float(np.einsum("ij,ij->", vectors, vectors))
+            kept = float(np.einsum("ij,ij->", vectors[:, :dim], vectors[:, :dim]))
+            return cls("prefix", dim, explained=kept / total if total else 0.0)
+
+        if len(vectors) > sample:
+            rows = np.random.default_rng(seed).choice(len(vectors), sample, replace=False)
+            vectors = vectors[np.sort(rows)]
+        mean = vectors.mean(axis=0)
+        centered = (vectors - mean).astype(np.float64)
+        # Macierz kowariancji (pełny wymiar x pełny wymiar) jest mała - eigh zamiast SVD próbki
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        order = np.argsort(eigenvalues)[::-1][:dim]
+        total = float(eigenvalues.sum())
+        explained = float(eigenvalues[order].sum()) / total if total > 0 else 0.0
+        return cls("pca", dim, mean, eigenvectors[:, order].T, explained)
+
+    @property
+    def signature(self) -> str:
+        """Opis projekcji (np. "pca:256")."""
+        return f"{self.method}:{self.dim}"
+
+    def __repr__(self) -> str:
+        return f"EmbeddingReducer({self.signature}, explained={self.explained:.3f})"
+
+    def transform(self, vectors: Sequence) -> np.ndarray:
+        """
+        Rzutuje embeddingi (macierz albo pojedynczy wektor zapytania).
+
+        Returns:
+            Tablica float32 z ostatnim wymiarem równym dim.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.method == "prefix":
+            return np.ascontiguousarray(vectors[..., :self.dim])
+        return (vectors - self.mean) @ self.components.T
+
+    def save(self, path: Path = config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE) -> None:
+        """
+        Zapisuje projekcję (.npz, podmiana atomowa jak centroidy dokumentów).
+
+        Args:
+            path: Plik docelowy.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        arrays = {
+            "method": np.asarray(self.method),
+            "dim": np.asarray(self.dim),
+            "explained": np.asarray(self.explained),
+        }
+        if self.method == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path = config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE) -> "EmbeddingReducer":
+        """
+        Otwiera projekcję zapisaną przez save().
+
+        Raises:
+            FileNotFoundError: Gdy ingestia nie zapisała projekcji.
+        """
+        with np.load(Path(path), allow_pickle=False) as data:
+            return cls(
+                str(data["method"]),
+                int(data["dim"]),
+                data["mean"] if "mean" in data else None,
+                data["components"] if "components" in data else None,
+                float(data["explained"]),
+            )
+
+    @classmethod
+    def configured(cls, vectors: Optional[np.ndarray] = None, path: Path = config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE) -> Optional["EmbeddingReducer"]:
+        """
+        Redukcja zgodna z config: zapisana przez ingestię albo dopasowana do vectors.
+
+        Args:
+            vectors: Embeddingi korpusu do dopasowania, gdy zapisanej projekcji brak
+                albo ma inne ustawienia.
+            path: Plik projekcji.
+
+        Returns:
+            EmbeddingReducer albo None, gdy EMBEDDING_REDUCTION jest wyłączone
+            (lub nie ma ani pliku, ani wektorów).
+        """
+        if not config.EMBEDDING_REDUCTION:
+            return None
+        expected = f"{config.EMBEDDING_REDUCTION}:{config.EMBEDDING_REDUCED_DIM}"
+        if Path(path).exists():
+            reducer = cls.load(path)
+            fits = vectors is None or reducer.components is None or reducer.components.shape[1] == np.shape(vectors)[1]
+            if reducer.signature == expected and fits:
+                return reducer
+        if vectors is None:
+            return None
+        return cls.fit(vectors, config.EMBEDDING_REDUCTION, config.EMBEDDING_REDUCED_DIM)
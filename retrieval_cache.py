@@ -0,0 +1,213 @@
+"""
+Cache wyników retrievalu (hybrid search) między pytaniami i restartami.
+
+Te same sub-queries (zwłaszcza z dekompozycji pytań) wracają u wielu
+użytkowników, a każde wyszukiwanie to embedding zapytania w Ollama, wyszukiwanie
+wektorowe i BM25. RetrievalCache zapamiętuje wynik jako listę (pozycja chunka
+w CorpusStore, hybrid score) pod kluczem: znormalizowane zapytanie + parametry
+wyszukiwania (k, filtry, wagi, ...), w obrębie wersji indeksu:
+- warstwa w pamięci (LRU, RETRIEVAL_CACHE_SIZE wpisów),
+- opcjonalna warstwa na dysku (SQLite w CHROMA_DB_DIR) - przetrwa restart
+  i jest współdzielona przez procesy robocze; trafienie z dysku trafia też
+  do pamięci.
+Wersja to zatwierdzona wersja indeksu (index_version.py), odcisk korpusu i
+ustawienia wyszukiwania (model embeddingów, tokenizer, redukcja, MMR), więc po
+ingestii albo zmianie config stare wyniki przestają pasować; set_version() usuwa
+je z obu warstw.
+Professional Local RAG Agent - Initial Release"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from colorama import Fore, init
+
+import config
+from text_utils import normalize_query
+
+init(autoreset=True)
+
+# Co tyle zapisów warstwa dyskowa jest przycinana do RETRIEVAL_CACHE_DISK_MAX
+_PRUNE_EVERY = 256
+
+Results = List[Tuple[int, float]]
+
+
+def cache_key(query: str, **params: Any) -> str:
+    """Klucz wyniku: znormalizowane zapytanie i parametry wyszukiwania (kolejność bez znaczenia)."""
+    return f"{normalize_query(query)}|{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+
+class RetrievalCache:
+    """Dwuwarstwowy (pamięć LRU + SQLite) cache rankingów chunków, bezpieczny dla wątków."""
+
+    def __init__(
+        self,
+        size: int = config.RETRIEVAL_CACHE_SIZE,
+        path: Optional[Path] = None,
+        disk_max: int = config.RETRIEVAL_CACHE_DISK_MAX,
+    ) -> None:
+        """
+        Args:
+            size: Pojemność warstwy w pamięci.
+            path: Plik SQLite warstwy dyskowej (None = tylko pamięć).
+            disk_max: Limit wpisów na dysku.
+        """
+        self.size = size
+        self.path = Path(path) if path is not None else None
+        self.disk_max = disk_max
+        self.version = ""
+        self._memory: "OrderedDict[Tuple[str, str], Results]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ==================== WARSTWA DYSKOWA ====================
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Połączenie SQLite tego procesu (po fork() otwierane od nowa) albo None bez warstwy dyskowej."""
+        if self.path is None:
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "version TEXT NOT NULL, key TEXT NOT NULL, ranking TEXT NOT NULL, "
+                "PRIMARY KEY (version, key))"
+            )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _disk_failed(self, error: Exception) -> None:
+        """Błąd dysku (zablokowana lub uszkodzona baza) wyłącza warstwę dyskową - zostaje pamięć."""
+        print(f"{Fore.YELLOW}⚠ Cache retrievalu na dysku wyłączony ({self.path}): {error}")
+        self.path = None
+        self._connection = None
+
+    def _disk_get(self, version: str, key: str) -> Optional[Results]:
+        try:
+            db = self._db()
+            if db is None:
+                return None
+            row = db.execute("SELECT ranking FROM results WHERE version = ? AND key = ?", (version, key)).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            self._disk_failed(e)
+            return None
+        return [(int(position), float(score)) for position, score in json.loads(row[0])] if row else None
+
+    def _disk_put(self, version: str, key: str, results: Results) -> None:
+        try:
+            db = self._db()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO results (version, key, ranking) VALUES (?, ?, ?)",
+                (version, key, json.dumps(results)),
+            )
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY == 0:
+                # rowid rośnie z każdym zapisem - usuwamy najstarsze wpisy ponad limit
+                db.execute(
+                    "DELETE FROM results WHERE rowid NOT IN (SELECT rowid FROM results ORDER BY rowid DESC LIMIT ?)",
+                    (self.disk_max,),
+                )
+        except (sqlite3.Error, OSError) as e:
+            self._disk_failed(e)
+
+    # ==================== API ====================
+
+    def set_version(self, version: str) -> None:
+        """
+        Ustawia wersję indeksu; wyniki innych wersji są usuwane z pamięci i z dysku.
+
+        Args:
+            version: Identyfikator wersji indeksu (np. wersja zatwierdzona + odcisk korpusu).
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            if self._connection is not None and not self.path.exists():
+                # Pełna ingestia usunęła CHROMA_DB_DIR razem z plikiem cache
+                self._connection = None
+            for stale in [entry for entry in self._memory if entry[0] != version]:
+                del self._memory[stale]
+            try:
+                db = self._db()
+                if db is not None:
+                    db.execute("DELETE FROM results WHERE version != ?", (version,))
+            except (sqlite3.Error, OSError) as e:
+                self._disk_failed(e)
+
+    def get(self, key: str, version: Optional[str] = None) -> Optional[Results]:
+        """
+        Ranking zapisany dla klucza (najpierw pamięć, potem dysk).
+
+        Args:
+            key: Klucz z cache_key().
+            version: Wersja indeksu, dla której szukano (domyślnie bieżąca).
+
+        Returns:
+            Lista (pozycja, score) albo None przy braku wyniku.
+        """
+        version = self.version if version is None else version
+        with self._lock:
+            results = self._memory.get((version, key))
+            if results is not None:
+                self._memory.move_to_end((version, key))
+                self.memory_hits += 1
+                return results
+            results = self._disk_get(version, key)
+            if results is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(version, key, results)
+            return results
+
+    def put(self, key: str, results: Results, version: Optional[str] = None) -> None:
+        """
+        Zapisuje ranking w obu warstwach.
+
+        Wynik policzony dla wersji, która w międzyczasie przestała być bieżąca
+        (przeładowanie indeksu w trakcie wyszukiwania), jest pomijany.
+        """
+        version = self.version if version is None else version
+        results = [(int(position), float(score)) for position, score in results]
+        with self._lock:
+            if version != self.version:
+                return
+            self._remember(version, key, results)
+            self._disk_put(version, key, results)
+
+    def _remember(self, version: str, key: str, results: Results) -> None:
+        """Wpis w warstwie pamięci (pod blokadą)."""
+        self._memory[(version, key)] = results
+        self._memory.move_to_end((version, key))
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Trafienia (pamięć, dysk), chybienia, współczynnik trafień i liczba wpisów w pamięci."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "entries": len(self._memory),
+                "disk": self.path is not None,
+            }
@@ -0,0 +1,272 @@
+"""
+Harmonogram wywołań LLM do jednego serwera Ollama (priorytety i sprawiedliwa kolejka).
+
+Ollama generuje zwykle jedną (albo OLLAMA_NUM_PARALLEL) odpowiedź naraz, więc
+bez harmonogramu pytanie interaktywne czeka za zadaniem wsadowym, a krótka
+dekompozycja - za długimi odpowiedziami. LLMScheduler przepuszcza do serwera
+najwyżej SCHEDULER_MAX_CONCURRENT generacji:
+- klasy priorytetu (SCHEDULER_CLASSES): "interactive" (domyślna), "batch"
+  i "warmup", każda z wagą i własnym limitem równoległych wywołań,
+- sprawiedliwa kolejka SFQ (start-time fair queuing): klasa dostaje część
+  przepustowości proporcjonalną do wagi, a koszt wywołania to szacowany czas
+  modelu (prompt + num_predict), więc długie odpowiedzi "zużywają" więcej,
+- wywołania krótkie (dekompozycja, num_predict <= SCHEDULER_SHORT_MAX_TOKENS)
+  mają osobną kolejkę w każdej klasie i SCHEDULER_SHORT_RESERVED miejsc,
+  których długie generacje nie zajmują - nie czekają za trwającymi odpowiedziami,
+- liczniki: głębokość kolejki i czas oczekiwania (średni, p95, maks.) na klasę.
+Klasę ustawia zakres `llm_priority()` (contextvar - dziedziczą go zadania asyncio).
+Harmonogram działa w obrębie procesu (procesy robocze pre-fork mają własne).
+Professional Local RAG Agent - Initial Release"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+import config
+
+# Odstęp sprawdzania anulowania w czasie czekania w kolejce (wątki)
+_CANCEL_POLL_S = 0.05
+
+_priority: ContextVar[Tuple[str, bool]] = ContextVar("llm_priority", default=("interactive", False))
+
+
+@contextmanager
+def llm_priority(priority: Optional[str] = None, short: Optional[bool] = None) -> Iterator[None]:
+    """
+    Zakres wywołań LLM z klasą priorytetu (i oznaczeniem krótkich wywołań).
+
+    Args:
+        priority: Klasa z SCHEDULER_CLASSES (None = bez zmiany).
+        short: True dla krótkich wywołań, np. dekompozycji (None = bez zmiany).
+    """
+    current_priority, current_short = _priority.get()
+    if priority is not None and priority not in config.SCHEDULER_CLASSES:
+        raise ValueError(f"Nieznana klasa priorytetu: {priority} (dostępne: {', '.join(config.SCHEDULER_CLASSES)})")
+    token = _priority.set((priority or current_priority, current_short if short is None else short))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Tuple[str, bool]:
+    """Klasa priorytetu i flaga "krótkie" bieżącego zakresu."""
+    return _priority.get()
+
+
+class Ticket:
+    """Miejsce w kolejce jednego wywołania."""
+
+    __slots__ = ("priority", "short", "cost", "start", "seq", "enqueued", "granted", "event", "future")
+
+    def __init__(self, priority: str, short: bool, cost: float, start: float, seq: int) -> None:
+        self.priority = priority
+        self.short = short
+        self.cost = cost
+        self.start = start
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event: Optional[threading.Event] = None
+        self.future: Optional[asyncio.Future] = None
+
+
+class _ClassStats:
+    """Liczniki jednej klasy priorytetu."""
+
+    def __init__(self) -> None:
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.granted = 0
+        self.abandoned = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self.waits: Deque[float] = deque(maxlen=config.SCHEDULER_WAIT_SAMPLES)
+
+    def as_dict(self) -> Dict[str, float]:
+        waits = sorted(self.waits)
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "granted": self.granted,
+            "abandoned": self.abandoned,
+            "wait_avg_ms": round(self.wait_total_s / self.granted * 1000, 1) if self.granted else 0.0,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000, 1) if waits else 0.0,
+            "wait_max_ms": round(self.wait_max_s * 1000, 1),
+        }
+
+
+class LLMScheduler:
+    """Kolejka priorytetowa wywołań LLM do jednego serwera (bezpieczna dla wątków i asyncio)."""
+
+    def __init__(
+        self,
+        max_concurrent: int = config.SCHEDULER_MAX_CONCURRENT,
+        short_reserved: int = config.SCHEDULER_SHORT_RESERVED,
+        classes: Dict[str, Tuple[float, int]] = config.SCHEDULER_CLASSES,
+    ) -> None:
+        """
+        Args:
+            max_concurrent: Najwięcej generacji naraz (jak OLLAMA_NUM_PARALLEL serwera).
+            short_reserved: Miejsca tylko dla krótkich wywołań.
+            classes: Klasa -> (waga, limit równoległych wywołań).
+        """
+        if max_concurrent < 1 or not 0 <= short_reserved < max_concurrent:
+            raise ValueError("Harmonogram wymaga co najmniej jednego miejsca dla długich wywołań")
+        self.max_concurrent = max_concurrent
+        self.short_reserved = short_reserved
+        self.classes = dict(classes)
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._virtual = 0.0
+        # Kolejka (FIFO) i ostatni znacznik końca dla każdego przepływu (klasa, krótkie)
+        self._flows: Dict[Tuple[str, bool], Deque[Ticket]] = {
+            (name, short): deque() for name in self.classes for short in (True, False)
+        }
+        self._last_finish: Dict[Tuple[str, bool], float] = {flow: 0.0 for flow in self._flows}
+        self._in_flight = 0
+        self._long_in_flight = 0
+        self._stats: Dict[str, _ClassStats] = {name: _ClassStats() for name in self.classes}
+
+    def _enqueue(self, priority: str, short: bool, cost: float) -> Ticket:
+        """Dodaje wywołanie do kolejki przepływu (pod blokadą)."""
+        if priority not in self.classes:
+            raise ValueError(f"Nieznana klasa priorytetu: {priority}")
+        flow = (priority, short)
+        weight = self.classes[priority][0]
+        start = max(self._virtual, self._last_finish[flow])
+        self._last_finish[flow] = start + max(cost, 1e-6) / weight
+        ticket = Ticket(priority, short, cost, start, next(self._seq))
+        self._flows[flow].append(ticket)
+        stats = self._stats[priority]
+        stats.queued += 1
+        stats.max_queued = max(stats.max_queued, stats.queued)
+        return ticket
+
+    def _eligible(self, priority: str, short: bool) -> bool:
+        if self._in_flight >= self.max_concurrent:
+            return False
+        if self._stats[priority].in_flight >= self.classes[priority][1]:
+            return False
+        return short or self._long_in_flight < self.max_concurrent - self.short_reserved
+
+    def _dispatch(self) -> None:
+        """Przydziela wolne miejsca wywołaniom o najmniejszym znaczniku startu (pod blokadą)."""
+        while self._in_flight < self.max_concurrent:
+            best: Optional[Ticket] = None
+            for (priority, short), queue in self._flows.items():
+                if queue and self._eligible(priority, short):
+                    head = queue[0]
+                    if best is None or (head.start, head.seq) < (best.start, best.seq):
+                        best = head
+            if best is None:
+                return
+            self._flows[(best.priority, best.short)].popleft()
+            self._grant(best)
+
+    def _grant(self, ticket: Ticket) -> None:
+        ticket.granted = True
+        self._virtual = max(self._virtual, ticket.start)
+        self._in_flight += 1
+        if not ticket.short:
+            self._long_in_flight += 1
+        wait_s = time.monotonic() - ticket.enqueued
+        stats = self._stats[ticket.priority]
+        stats.queued -= 1
+        stats.in_flight += 1
+        stats.granted += 1
+        stats.wait_total_s += wait_s
+        stats.wait_max_s = max(stats.wait_max_s, wait_s)
+        stats.waits.append(wait_s)
+        if ticket.event is not None:
+            ticket.event.set()
+        elif ticket.future is not None:
+            loop = ticket.future.get_loop()
+            loop.call_soon_threadsafe(_resolve, ticket.future)
+
+    def _abandon(self, ticket: Ticket) -> None:
+        """Rezygnacja z czekania (deadline, anulowanie); przydzielone miejsce jest zwalniane."""
+        with self._lock:
+            if not ticket.granted:
+                self._flows[(ticket.priority, ticket.short)].remove(ticket)
+                stats = self._stats[ticket.priority]
+                stats.queued -= 1
+                stats.abandoned += 1
+                self._dispatch()
+                return
+        self.release(ticket)
+
+    def acquire(self, priority: str, short: bool, cost: float, timeout: float, cancelled: Callable[[], bool] = lambda: False) -> Optional[Ticket]:
+        """
+        Czeka (w wątku) na miejsce dla wywołania.
+
+        Args:
+            priority: Klasa priorytetu.
+            short: Krótkie wywołanie (osobna kolejka i zarezerwowane miejsca).
+            cost: Szacowany czas modelu (s) - koszt w sprawiedliwej kolejce.
+            timeout: Najdłuższy czas czekania (s).
+            cancelled: Funkcja sprawdzająca anulowanie pytania.
+
+        Returns:
+            Ticket do zwolnienia przez release() albo None po timeout/anulowaniu.
+        """
+        with self._lock:
+            ticket = self._enqueue(priority, short, cost)
+            ticket.event = threading.Event()
+            self._dispatch()
+        deadline = time.monotonic() + timeout
+        while not ticket.event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or cancelled():
+                self._abandon(ticket)
+                return None
+            ticket.event.wait(min(remaining, _CANCEL_POLL_S))
+        return ticket
+
+    async def aacquire(self, priority: str, short: bool, cost: float, timeout: float) -> Optional[Ticket]:
+        """
+        Asynchroniczna wersja acquire() (anulowanie = anulowanie zadania asyncio).
+
+        Returns:
+            Ticket albo None po przekroczeniu timeout.
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            ticket = self._enqueue(priority, short, cost)
+            ticket.future = future
+            self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._abandon(ticket)
+            return None
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """Zwalnia miejsce po zakończeniu wywołania."""
+        with self._lock:
+            self._in_flight -= 1
+            if not ticket.short:
+                self._long_in_flight -= 1
+            self._stats[ticket.priority].in_flight -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Głębokość kolejki, trwające wywołania i czasy oczekiwania dla każdej klasy."""
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
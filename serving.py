@@ -0,0 +1,327 @@
+"""
+Obsługa pytań w wielu procesach ze wspólnym indeksem tylko do odczytu (pre-fork).
+
+Każdy proces z własnym AdvancedRAGAgent powtarza collection.get, budowę BM25
+i trzyma własną kopię korpusu. Tutaj proces nadrzędny raz:
+- pobiera z Chroma treść, metadane i embeddingi,
+- zapisuje arenę tekstu, tablicę offsetów, indeks BM25 i macierz embeddingów
+  (z redukcją wymiaru: także macierz zredukowaną) do SHARED_INDEX_DIR
+  i otwiera je przez mmap,
+a potem forkuje N procesów roboczych. Procesy robocze dostają gotowe obiekty
+(bez ponownego ładowania), a tablice czytają z tych samych stron page cache,
+więc czas startu i pamięć nie rosną z liczbą procesów.
+Professional Local RAG Agent - Initial Release"""
+
+import gc
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from colorama import Fore, init
+
+import config
+from batch import answer_question
+from coarse_index import CoarseIndex, group_key
+from corpus_store import CorpusStore
+from dense_index import DenseIndex
+from partitions import SourcePartitions
+from reduction import EmbeddingReducer
+from sparse_index import SparseIndex
+from tokenizer import create_tokenizer
+
+init(autoreset=True)
+
+
+def _save_array(path: Path, array: np.ndarray) -> None:
+    """np.save do pliku obok i atomowa podmiana - procesy z mmap poprzedniej wersji czytają dalej swoją kopię."""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class SharedIndex:
+    """Korpus, indeks BM25 i embeddingi otwarte przez mmap (+ centroidy dokumentów) - do współdzielenia po fork()."""
+
+    def __init__(self, store: CorpusStore, sparse_index: SparseIndex, dense_index: DenseIndex) -> None:
+        """
+        Args:
+            store: Magazyn korpusu.
+            sparse_index: Indeks BM25 w kolejności magazynu.
+            dense_index: Embeddingi w kolejności magazynu.
+        """
+        if len(dense_index.matrix) != len(store):
+            raise ValueError("Liczba embeddingów nie pasuje do liczby chunków")
+        self.store = store
+        self.sparse_index = sparse_index
+        self.dense_index = dense_index
+        self.partitions = SourcePartitions(store.records)
+        # Centroidy dokumentów z macierzy embeddingów (wyszukiwanie dwuetapowe)
+        self.coarse_index = CoarseIndex.from_vectors(
+            [group_key(r.source, r.heading_path) for r in store.records], dense_index.matrix
+        ).attach(store.records)
+
+    @classmethod
+    def build(
+        cls,
+        texts: List[str],
+        metadatas: List[Optional[Dict[str, Any]]],
+        embeddings: Sequence[Sequence[float]],
+        directory: Path = config.SHARED_INDEX_DIR,
+        reducer: Optional[EmbeddingReducer] = None,
+    ) -> "SharedIndex":
+        """
+        Zapisuje indeks do katalogu i otwiera go przez mmap.
+
+        Args:
+            texts: Treści chunków.
+            metadatas: Metadane chunków.
+            embeddings: Embeddingi chunków (ta sama kolejność).
+            directory: Katalog plików indeksu.
+            reducer: Redukcja wymiaru; domyślnie wg config (zapisana przez ingestię
+                albo dopasowana tutaj, gdy EMBEDDING_REDUCTION jest włączone).
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        store = CorpusStore.build(texts, metadatas, directory / config.CORPUS_ARENA_FILE)
+        return cls.persist(store, embeddings, directory, reducer=reducer)
+
+    @classmethod
+    def persist(
+        cls,
+        store: CorpusStore,
+        embeddings: Sequence[Sequence[float]],
+        directory: Path = config.SHARED_INDEX_DIR,
+        sparse_index: Optional[SparseIndex] = None,
+        reducer: Optional[EmbeddingReducer] = None,
+    ) -> "SharedIndex":
+        """
+        Zapisuje offsety, BM25 i embeddingi obok areny magazynu i otwiera je przez mmap.
+
+        Pliki są podmieniane atomowo (jak arena i BM25), więc działające procesy
+        robocze nie widzą w pół zapisanych tablic.
+
+        Args:
+            store: Magazyn z areną zapisaną w directory.
+            embeddings: Embeddingi chunków (kolejność magazynu).
+            directory: Katalog plików indeksu.
+            sparse_index: Gotowy indeks BM25 (np. ze snapshotu); domyślnie budowany z areny.
+            reducer: Redukcja wymiaru; domyślnie wg config.
+        """
+        directory = Path(directory)
+        _save_array(directory / "offsets.npy", store.offsets)
+        store.offsets = np.load(directory / "offsets.npy", mmap_mode="r")
+
+        tokenize = sparse_index.tokenize if sparse_index is not None else create_tokenizer()
+        if sparse_index is None:
+            sparse_index = SparseIndex(store.iter_texts(), tokenize=tokenize)
+        sparse_index.save(directory / "sparse")
+        sparse_index = SparseIndex.load(directory / "sparse", tokenize=tokenize)
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        _save_array(directory / "embeddings.npy", matrix)
+        reducer = reducer or EmbeddingReducer.configured(matrix)
+        if reducer is not None:
+            _save_array(DenseIndex.reduced_path(directory / "embeddings.npy"), reducer.transform(matrix))
+        del matrix
+        dense_index = DenseIndex.load(directory / "embeddings.npy", reducer=reducer)
+        return cls(store, sparse_index, dense_index)
+
+    @classmethod
+    def from_chroma(cls, directory: Path = config.SHARED_INDEX_DIR) -> "SharedIndex":
+        """
+        Buduje indeks z kolekcji ChromaDB (bez wywołań Ollama).
+
+        Raises:
+            FileNotFoundError: Gdy baza ChromaDB nie istnieje.
+            ValueError: Gdy kolekcja jest pusta.
+        """
+        from langchain_community.vectorstores import Chroma
+
+        if not config.CHROMA_DB_DIR.exists():
+            raise FileNotFoundError("Uruchom najpierw: python ingest.py")
+        collection = Chroma(
+            persist_directory=str(config.CHROMA_DB_DIR),
+            collection_name=config.CHROMA_COLLECTION_NAME,
+        )._collection
+        data = collection.get(include=["documents", "metadatas", "embeddings"])
+        if not data["documents"]:
+            raise ValueError("Baza wektorowa jest pusta.")
+        return cls.build(data["documents"], data["metadatas"], data["embeddings"], directory)
+
+    @classmethod
+    def from_snapshot(cls, path: Path, directory: Path = config.SHARED_INDEX_DIR) -> "SharedIndex":
+        """
+        Odtwarza indeks ze snapshotu (snapshot.py) - bez ChromaDB i bez wywołań Ollama.
+
+        Args:
+            path: Plik snapshotu.
+            directory: Katalog plików indeksu.
+
+        Raises:
+            snapshot.SnapshotError: Gdy plik jest uszkodzony albo w nieznanym formacie.
+        """
+        from snapshot import read_snapshot, restore_shared
+
+        return restore_shared(read_snapshot(path), directory)
+
+
+def process_memory() -> Dict[str, float]:
+    """
+    Pamięć bieżącego procesu (MB) z /proc/self/smaps_rollup (Linux).
+
+    Returns:
+        Dict z rss_mb, pss_mb (udział we współdzielonych stronach) i private_mb;
+        pusty, gdy system nie udostępnia tych danych.
+    """
+    try:
+        text = Path("/proc/self/smaps_rollup").read_text()
+    except OSError:
+        return {}
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        key, _, rest = line.partition(":")
+        if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+            values[key] = int(rest.split()[0]) / 1024
+    return {
+        "rss_mb": round(values.get("Rss", 0.0), 1),
+        "pss_mb": round(values.get("Pss", 0.0), 1),
+        "private_mb": round(values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0), 1),
+    }
+
+
+# ==================== PROCESY ROBOCZE ====================
+
+# Ustawiane w procesie nadrzędnym przed fork(); procesy robocze dziedziczą je bez kopiowania
+_SHARED_INDEX: Optional[SharedIndex] = None
+_worker_agent = None
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(base_url: str, ready, info_barrier) -> None:
+    """Tworzy agenta na odziedziczonym indeksie i zgłasza gotowość."""
+    global _worker_agent
+    start = time.perf_counter()
+    # Komunikaty agentów z wielu procesów przeplatałyby się
+    sys.stdout = open(os.devnull, "w")
+    _worker_state["info_barrier"] = info_barrier
+    try:
+        from advanced_rag import AdvancedRAGAgent
+
+        _worker_agent = AdvancedRAGAgent(shared_index=_SHARED_INDEX, base_url=base_url, warm_up=False)
+    except Exception as e:
+        _worker_state["error"] = str(e)
+    _worker_state["init_s"] = time.perf_counter() - start
+    ready.wait()
+
+
+def _worker_answer(task: Tuple[int, str]) -> Tuple[int, Dict[str, Any]]:
+    """Odpowiada na pytanie w procesie roboczym."""
+    idx, question = task
+    if _worker_agent is None:
+        return idx, {"error": f"Proces roboczy nie wystartował: {_worker_state.get('error')}", "latency_s": 0.0}
+    return idx, answer_question(_worker_agent, question)
+
+
+def _worker_info(_: int) -> Dict[str, Any]:
+    """Czas startu i pamięć procesu roboczego (bariera: każdy proces raportuje raz)."""
+    _worker_state["info_barrier"].wait()
+    return {
+        "pid": os.getpid(),
+        "init_s": round(_worker_state.get("init_s", 0.0), 3),
+        "error": _worker_state.get("error"),
+        **process_memory(),
+    }
+
+
+class PreforkPool:
+    """Pula procesów roboczych forkowanych po załadowaniu wspólnego indeksu."""
+
+    def __init__(self, shared_index: SharedIndex, workers: int = config.SERVE_WORKERS, base_url: str = config.OLLAMA_BASE_URL) -> None:
+        """
+        Args:
+            shared_index: Indeks załadowany w procesie nadrzędnym.
+            workers: Liczba procesów roboczych.
+            base_url: Adres serwera Ollama.
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Tryb pre-fork wymaga systemu z fork() (Linux, macOS)")
+        self.shared_index = shared_index
+        self.workers = max(1, workers)
+        self.base_url = base_url
+        self.startup_s = 0.0
+        self._pool = None
+
+    def start(self, timeout: float = config.WARMUP_TIMEOUT) -> float:
+        """
+        Forkuje procesy robocze i czeka, aż wszystkie będą gotowe.
+
+        Returns:
+            Czas startu puli w sekundach.
+        """
+        global _SHARED_INDEX
+        context = multiprocessing.get_context("fork")
+        ready = context.Barrier(self.workers + 1)
+        info_barrier = context.Barrier(self.workers)
+        _SHARED_INDEX = self.shared_index
+
+        start = time.perf_counter()
+        # Obiekty sprzed fork() poza GC - zbieranie nie dotyka (i nie kopiuje) ich stron
+        gc.collect()
+        gc.freeze()
+        try:
+            self._pool = context.Pool(
+                processes=self.workers,
+                initializer=_init_worker,
+                initargs=(self.base_url, ready, info_barrier),
+            )
+            ready.wait(timeout)
+        finally:
+            gc.unfreeze()
+        self.startup_s = time.perf_counter() - start
+        return self.startup_s
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """Czas startu i pamięć każdego procesu roboczego."""
+        return self._pool.map(_worker_info, range(self.workers), chunksize=1)
+
+    def imap_unordered(self, questions: Sequence[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Odpowiada na pytania w procesach roboczych.
+
+        Args:
+            questions: Pytania (mogą zawierać filtry @source: itd.).
+
+        Yields:
+            Krotki (indeks pytania, wynik jak batch.answer_question) w kolejności ukończenia.
+        """
+        return self._pool.imap_unordered(_worker_answer, enumerate(questions), chunksize=1)
+
+    def close(self) -> None:
+        """Kończy procesy robocze."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> "PreforkPool":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def print_worker_stats(pool: PreforkPool) -> None:
+    """Wyświetla czas startu i pamięć procesów roboczych."""
+    print(f"{Fore.GREEN}✓ {pool.workers} procesów roboczych gotowych w {pool.startup_s:.2f}s")
+    for info in pool.worker_stats():
+        if info.get("error"):
+            print(f"{Fore.RED}  ✗ PID {info['pid']}: {info['error']}")
+            continue
+        memory = f", prywatna {info['private_mb']} MB, PSS {info['pss_mb']} MB" if "pss_mb" in info else ""
+        print(f"{Fore.WHITE}  • PID {info['pid']}: start {info['init_s']}s{memory}")
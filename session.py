@@ -0,0 +1,142 @@
+"""
+Stan sesji interaktywnej: ponowne użycie wyników retrievalu dla pytań uzupełniających.
+
+Pytanie w rodzaju "a co z wersją 2?" dotyczy zwykle tych samych fragmentów,
+które agent pobrał chwilę wcześniej. RetrievalSession pamięta kilka ostatnich
+tur (embedding pytania i pozycje kandydatów w CorpusStore). Jeśli embedding
+nowego pytania jest blisko tematu sesji, agent przelicza ranking zapamiętanych
+kandydatów i dokłada małe wyszukiwanie "delta" zamiast pełnej dekompozycji
+i retrievalu. Pamięć sesji jest ograniczona (liczba tur, kandydatów i
+zapamiętanych embeddingów chunków).
+Professional Local RAG Agent - Initial Release"""
+
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    """Wektor float32 o normie 1 (wektor zerowy bez zmian)."""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
+
+
+class SessionTurn:
+    """Jedna tura sesji: pytanie, jego embedding i pozycje kandydatów."""
+
+    __slots__ = ("question", "embedding", "positions", "filter_key")
+
+    def __init__(self, question: str, embedding: np.ndarray, positions: List[int], filter_key: str) -> None:
+        self.question = question
+        self.embedding = embedding
+        self.positions = positions
+        self.filter_key = filter_key
+
+
+class RetrievalSession:
+    """Ostatnie tury rozmowy i kandydaci do ponownego użycia."""
+
+    def __init__(
+        self,
+        max_turns: int = config.SESSION_MAX_TURNS,
+        max_candidates: int = config.SESSION_MAX_CANDIDATES,
+        threshold: float = config.SESSION_TOPIC_THRESHOLD,
+    ) -> None:
+        """
+        Args:
+            max_turns: Liczba pamiętanych tur.
+            max_candidates: Limit unikalnych pozycji kandydatów (i embeddingów chunków).
+            threshold: Minimalne podobieństwo cosinusowe do tematu sesji.
+        """
+        self.max_turns = max_turns
+        self.max_candidates = max_candidates
+        self.threshold = threshold
+        self.turns: deque = deque(maxlen=max_turns)
+        self.chunk_embeddings: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self.reused = 0
+        self.full = 0
+
+    def reset(self) -> None:
+        """Nowy temat: zapomina tury i embeddingi chunków."""
+        self.turns.clear()
+        self.chunk_embeddings.clear()
+
+    @property
+    def nbytes(self) -> int:
+        """Przybliżony rozmiar stanu sesji (embeddingi + pozycje)."""
+        embeddings = sum(t.embedding.nbytes for t in self.turns) + sum(e.nbytes for e in self.chunk_embeddings.values())
+        return embeddings + 8 * sum(len(t.positions) for t in self.turns)
+
+    def topic(self) -> Optional[np.ndarray]:
+        """Temat sesji: znormalizowana średnia embeddingów ostatnich tur."""
+        if not self.turns:
+            return None
+        return _unit(np.mean([t.embedding for t in self.turns], axis=0))
+
+    def similarity(self, embedding: Sequence[float]) -> float:
+        """Podobieństwo pytania do tematu sesji lub ostatniej tury (większe z dwóch)."""
+        topic = self.topic()
+        if topic is None:
+            return 0.0
+        query = _unit(embedding)
+        return max(float(query @ topic), float(query @ self.turns[-1].embedding))
+
+    def is_follow_up(self, embedding: Sequence[float], filter_key: str = "") -> bool:
+        """
+        Czy pytanie kontynuuje temat sesji (z tym samym filtrem metadanych).
+
+        Args:
+            embedding: Embedding nowego pytania.
+            filter_key: MetadataFilter.cache_key() albo "" bez filtra.
+        """
+        if not self.turns or self.turns[-1].filter_key != filter_key:
+            return False
+        return self.similarity(embedding) >= self.threshold
+
+    def candidate_positions(self) -> List[int]:
+        """Unikalne pozycje kandydatów, od najnowszej tury."""
+        seen: Dict[int, None] = {}
+        for turn in reversed(self.turns):
+            for position in turn.positions:
+                seen.setdefault(position, None)
+        return list(seen)
+
+    def add_turn(self, question: str, embedding: Sequence[float], positions: Iterable[int], filter_key: str = "") -> None:
+        """
+        Zapamiętuje turę; najstarsze tury i kandydaci wypadają po przekroczeniu limitów.
+
+        Args:
+            question: Pytanie.
+            embedding: Embedding pytania.
+            positions: Pozycje kandydatów (od najlepszego).
+            filter_key: Klucz filtra metadanych.
+        """
+        positions = list(dict.fromkeys(positions))[:self.max_candidates]
+        self.turns.append(SessionTurn(question, _unit(embedding), positions, filter_key))
+        while len(self.candidate_positions()) > self.max_candidates and len(self.turns) > 1:
+            self.turns.popleft()
+        live = set(self.candidate_positions())
+        for position in [p for p in self.chunk_embeddings if p not in live]:
+            del self.chunk_embeddings[position]
+
+    def cached_embeddings(self, positions: Sequence[int]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Zapamiętane embeddingi chunków.
+
+        Returns:
+            Krotka (pozycja -> embedding, pozycje bez embeddingu).
+        """
+        found = {p: self.chunk_embeddings[p] for p in positions if p in self.chunk_embeddings}
+        return found, [p for p in positions if p not in found]
+
+    def remember_embeddings(self, embeddings: Dict[int, Sequence[float]]) -> None:
+        """Zapamiętuje embeddingi chunków (najwyżej max_candidates, najstarsze wypadają)."""
+        for position, embedding in embeddings.items():
+            self.chunk_embeddings[position] = _unit(embedding)
+            self.chunk_embeddings.move_to_end(position)
+        while len(self.chunk_embeddings) > self.max_candidates:
+            self.chunk_embeddings.popitem(last=False)
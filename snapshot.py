@@ -0,0 +1,450 @@
+"""
+Przenośny snapshot indeksu: eksport i import bez ponownego liczenia embeddingów.
+
+Nowy węzeł zapytań nie musi kopiować chroma_db/ i przebudowywać BM25, a zmiana
+wersji ChromaDB nie wymaga ponownej ingestii. Snapshot to jeden plik ZIP,
+w którym każda kolumna jest osobną, skompresowaną tablicą .npy:
+- treść chunków (arena UTF-8 + offsety, jak w CorpusStore),
+- metadane (JSON z listą wartości dla każdego klucza),
+- embeddingi (float32; bajty liczb przeplecione płaszczyznami - zlib lepiej
+  kompresuje płaszczyznę wykładników niż wymieszane bajty),
+- tablice indeksu BM25 i jego parametry (sygnatura tokenizera),
+- projekcja redukcji wymiaru, jeśli ingestia ją zapisała.
+Manifest (manifest.json) zawiera wersję formatu, liczbę chunków, model
+embeddingów oraz typ, kształt i skrót SHA-256 każdej kolumny. read_snapshot()
+sprawdza je (oprócz CRC32 archiwum) przed odtworzeniem indeksu.
+
+Import odtwarza:
+- wspólny indeks (serving.SharedIndex) - arena, BM25 i embeddingi przez mmap,
+  bez ChromaDB (main.py --snapshot),
+- albo kolekcję ChromaDB z plikami ingestii (BM25, centroidy, projekcja).
+Żaden z trybów nie wywołuje Ollama.
+
+Użycie:
+    python snapshot.py export index.ragsnap
+    python snapshot.py import index.ragsnap [--force]
+    python snapshot.py verify index.ragsnap
+Professional Local RAG Agent - Initial Release"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+from colorama import Fore, init
+
+import config
+from coarse_index import CoarseIndex, group_key
+from corpus_store import CorpusStore
+from dedup import ChunkOrdinals, chunk_id
+from index_version import commit_version
+from reduction import EmbeddingReducer
+from serving import SharedIndex
+from sparse_index import SparseIndex
+from tokenizer import create_tokenizer
+
+init(autoreset=True)
+
+FORMAT = "local-rag-snapshot/1"
+MANIFEST = "manifest.json"
+
+
+class SnapshotError(ValueError):
+    """Snapshot uszkodzony (skróty, CRC) albo w nieobsługiwanym formacie."""
+
+
+def _digest(array: np.ndarray) -> str:
+    """Skrót SHA-256 bajtów tablicy (po zdekodowaniu kolumny; sprzętowo przyspieszany na x86/ARM)."""
+    data = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+    return hashlib.sha256(data).hexdigest()
+
+
+def _shuffle(array: np.ndarray) -> np.ndarray:
+    """float32 -> płaszczyzny bajtów (4 x n): bajt k każdej liczby obok bajtu k następnej."""
+    data = np.ascontiguousarray(array, dtype=np.float32).reshape(-1).view(np.uint8)
+    planes = np.empty((4, data.size // 4), dtype=np.uint8)
+    # Kopia co czwartego bajtu jest kilka razy szybsza niż transpozycja (n x 4)
+    for k in range(4):
+        planes[k] = data[k::4]
+    return planes
+
+
+def _unshuffle(planes: np.ndarray, shape: Sequence[int]) -> np.ndarray:
+    """Odwrotność _shuffle."""
+    data = np.empty(planes.size, dtype=np.uint8)
+    for k in range(4):
+        data[k::4] = planes[k]
+    return data.view(np.float32).reshape(shape)
+
+
+class Snapshot:
+    """Zawartość snapshotu wczytana do pamięci (kolumny po weryfikacji skrótów)."""
+
+    def __init__(
+        self,
+        manifest: Dict[str, Any],
+        arena: np.ndarray,
+        offsets: np.ndarray,
+        metadatas: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        sparse_arrays: Dict[str, np.ndarray],
+        reducer: Optional[EmbeddingReducer] = None,
+    ) -> None:
+        """
+        Args:
+            manifest: Manifest snapshotu.
+            arena: Treści chunków w UTF-8 (uint8).
+            offsets: Offsety chunków w arenie (n + 1).
+            metadatas: Metadane chunków (z chunk_id).
+            embeddings: Embeddingi (n x dim, float32).
+            sparse_arrays: Tablice indeksu BM25 (SparseIndex.arrays()).
+            reducer: Projekcja redukcji wymiaru zapisana w snapshocie.
+        """
+        self.manifest = manifest
+        self.arena = arena
+        self.offsets = offsets
+        self.metadatas = metadatas
+        self.embeddings = embeddings
+        self.sparse_arrays = sparse_arrays
+        self.reducer = reducer
+
+    def __len__(self) -> int:
+        return len(self.metadatas)
+
+    def text(self, idx: int) -> str:
+        """Treść chunka idx."""
+        return self.arena[int(self.offsets[idx]):int(self.offsets[idx + 1])].tobytes().decode("utf-8")
+
+    def iter_texts(self) -> Iterator[str]:
+        """Treści chunków po kolei."""
+        for idx in range(len(self)):
+            yield self.text(idx)
+
+    def sparse_index(self, tokenize=None) -> SparseIndex:
+        """
+        Indeks BM25 ze snapshotu albo - gdy tokenizer w config jest inny - przebudowany z treści.
+
+        Args:
+            tokenize: Tokenizer zapytań; domyślnie create_tokenizer().
+        """
+        tokenize = tokenize or create_tokenizer()
+        try:
+            return SparseIndex.from_arrays(self.sparse_arrays, self.manifest["sparse"], tokenize)
+        except ValueError as e:
+            print(f"{Fore.YELLOW}⚠ {e} - przebudowa BM25 z treści snapshotu")
+            return SparseIndex(self.iter_texts(), tokenize=tokenize)
+
+    def configured_reducer(self) -> Optional[EmbeddingReducer]:
+        """Projekcja ze snapshotu, jeśli zgadza się z EMBEDDING_REDUCTION; inaczej wg config."""
+        if not config.EMBEDDING_REDUCTION:
+            return None
+        if self.reducer is not None and self.reducer.signature == f"{config.EMBEDDING_REDUCTION}:{config.EMBEDDING_REDUCED_DIM}":
+            return self.reducer
+        return EmbeddingReducer.fit(self.embeddings, config.EMBEDDING_REDUCTION, config.EMBEDDING_REDUCED_DIM)
+
+
+def write_snapshot(
+    path: Path,
+    texts: Sequence[str],
+    metadatas: Sequence[Optional[Dict[str, Any]]],
+    embeddings: Sequence[Sequence[float]],
+    sparse_index: Optional[SparseIndex] = None,
+    reducer: Optional[EmbeddingReducer] = None,
+    compresslevel: int = config.SNAPSHOT_COMPRESS_LEVEL,
+) -> Dict[str, Any]:
+    """
+    Zapisuje snapshot (plik tymczasowy podmieniany atomowo).
+
+    Args:
+        path: Plik docelowy.
+        texts: Treści chunków.
+        metadatas: Metadane chunków (ta sama kolejność).
+        embeddings: Embeddingi chunków (ta sama kolejność).
+        sparse_index: Indeks BM25 w tej kolejności; domyślnie budowany z texts.
+        reducer: Projekcja redukcji wymiaru do dołączenia.
+        compresslevel: Poziom zlib (1-9).
+
+    Returns:
+        Manifest zapisanego snapshotu.
+    """
+    path = Path(path)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if not (len(texts) == len(metadatas) == len(matrix)):
+        raise ValueError("Liczby treści, metadanych i embeddingów muszą być równe")
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    metadatas = [dict(meta or {}) for meta in metadatas]
+    ordinals = ChunkOrdinals()
+    for meta, text in zip(metadatas, texts):
+        # Import nie dekoduje treści, żeby policzyć identyfikator chunka
+        source, page = str(meta.get("source", "")), meta.get("page")
+        ordinal = ordinals.next(source, page)
+        meta.setdefault("chunk_id", chunk_id(source, text, page, ordinal))
+    keys = sorted(set().union(*metadatas)) if metadatas else []
+    columns_json = {key: [meta.get(key) for meta in metadatas] for key in keys}
+    if sparse_index is None:
+        sparse_index = SparseIndex(texts, tokenize=create_tokenizer())
+
+    columns: Dict[str, np.ndarray] = {
+        "text.arena": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "text.offsets": offsets,
+        "metadata": np.frombuffer(json.dumps(columns_json, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+        "embeddings": matrix,
+    }
+    del encoded
+    columns.update({f"sparse.{name}": array for name, array in sparse_index.arrays().items()})
+    if reducer is not None and reducer.method == "pca":
+        columns.update({"reduction.mean": reducer.mean, "reduction.components": reducer.components})
+
+    manifest: Dict[str, Any] = {
+        "format": FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "chunks": len(texts),
+        "embedding_dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "embedding_model": config.EMBEDDING_MODEL,
+        "sparse": {**sparse_index.params(), "fingerprint": ""},
+        "reduction": (
+            {"method": reducer.method, "dim": reducer.dim, "explained": reducer.explained} if reducer is not None else None
+        ),
+        "columns": {},
+    }
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            shuffled = array.dtype == np.float32
+            manifest["columns"][name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "encoding": "shuffle" if shuffled else "raw",
+                "sha256": _digest(array),
+            }
+            with archive.open(f"{name}.npy", "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, _shuffle(array) if shuffled else array, allow_pickle=False)
+        archive.writestr(MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2))
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path: Path) -> Dict[str, Any]:
+    """
+    Manifest snapshotu (bez wczytywania kolumn).
+
+    Raises:
+        SnapshotError: Gdy plik nie jest snapshotem w obsługiwanym formacie.
+    """
+    try:
+        with zipfile.ZipFile(Path(path)) as archive:
+            manifest = json.loads(archive.read(MANIFEST))
+    except (zipfile.BadZipFile, KeyError, json.JSONDecodeError) as e:
+        raise SnapshotError(f"{path} nie jest snapshotem indeksu: {e}") from e
+    if manifest.get("format") != FORMAT:
+        raise SnapshotError(f"Nieobsługiwany format snapshotu: {manifest.get('format')} (oczekiwano {FORMAT})")
+    return manifest
+
+
+def read_snapshot(path: Path, verify: bool = True) -> Snapshot:
+    """
+    Wczytuje i weryfikuje snapshot.
+
+    Args:
+        path: Plik snapshotu.
+        verify: Sprawdza skróty SHA-256 kolumn (CRC32 archiwum jest sprawdzane zawsze).
+
+    Raises:
+        SnapshotError: Gdy plik jest uszkodzony albo w nieobsługiwanym formacie.
+    """
+    manifest = read_manifest(path)
+    columns: Dict[str, np.ndarray] = {}
+    try:
+        with zipfile.ZipFile(Path(path)) as archive:
+            for name, spec in manifest["columns"].items():
+                with archive.open(f"{name}.npy") as f:
+                    array = np.lib.format.read_array(f, allow_pickle=False)
+                if spec["encoding"] == "shuffle":
+                    array = _unshuffle(array, spec["shape"])
+                if array.dtype.str != spec["dtype"] or list(array.shape) != spec["shape"]:
+                    raise SnapshotError(f"Kolumna {name}: {array.dtype.str}{list(array.shape)} zamiast {spec['dtype']}{spec['shape']}")
+                if verify and _digest(array) != spec["sha256"]:
+                    raise SnapshotError(f"Kolumna {name}: niezgodny skrót SHA-256")
+                columns[name] = array
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+        if isinstance(e, SnapshotError):
+            raise
+        raise SnapshotError(f"Uszkodzony snapshot {path}: {e}") from e
+
+    columns_json = json.loads(columns["metadata"].tobytes().decode("utf-8"))
+    metadatas: List[Dict[str, Any]] = [{} for _ in range(manifest["chunks"])]
+    for key, values in columns_json.items():
+        for meta, value in zip(metadatas, values):
+            if value is not None:
+                meta[key] = value
+
+    reducer = None
+    if manifest.get("reduction"):
+        spec = manifest["reduction"]
+        reducer = EmbeddingReducer(
+            spec["method"], spec["dim"], columns.get("reduction.mean"), columns.get("reduction.components"), spec["explained"]
+        )
+    sparse_arrays = {name[len("sparse."):]: array for name, array in columns.items() if name.startswith("sparse.")}
+    return Snapshot(
+        manifest, columns["text.arena"], columns["text.offsets"], metadatas, columns["embeddings"], sparse_arrays, reducer
+    )
+
+
+# ==================== EKSPORT I IMPORT ====================
+
+def export_chroma(path: Path) -> Dict[str, Any]:
+    """
+    Eksportuje kolekcję ChromaDB z indeksem BM25 z ingestii (albo zbudowanym teraz).
+
+    Raises:
+        FileNotFoundError: Gdy baza ChromaDB nie istnieje.
+        ValueError: Gdy kolekcja jest pusta.
+    """
+    from langchain_community.vectorstores import Chroma
+
+    if not config.CHROMA_DB_DIR.exists():
+        raise FileNotFoundError("Uruchom najpierw: python ingest.py")
+    collection = Chroma(
+        persist_directory=str(config.CHROMA_DB_DIR),
+        collection_name=config.CHROMA_COLLECTION_NAME,
+    )._collection
+    data = collection.get(include=["documents", "metadatas", "embeddings"])
+    if not data["documents"]:
+        raise ValueError("Baza wektorowa jest pusta.")
+    store = CorpusStore.build(data["documents"], data["metadatas"])
+    sparse_index, _ = SparseIndex.cached(store, config.SPARSE_INDEX_DIR, create_tokenizer())
+    reduction_path = config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE
+    reducer = EmbeddingReducer.load(reduction_path) if reduction_path.exists() else None
+    manifest = write_snapshot(path, data["documents"], data["metadatas"], data["embeddings"], sparse_index, reducer)
+    store.close()
+    return manifest
+
+
+def restore_shared(snapshot: Snapshot, directory: Path = config.SHARED_INDEX_DIR) -> SharedIndex:
+    """
+    Odtwarza wspólny indeks (arena, BM25, embeddingi przez mmap) bez ChromaDB.
+
+    Args:
+        snapshot: Wczytany snapshot.
+        directory: Katalog plików indeksu.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    store = CorpusStore.from_arena(snapshot.arena, snapshot.offsets, snapshot.metadatas, directory / config.CORPUS_ARENA_FILE)
+    return SharedIndex.persist(
+        store, snapshot.embeddings, directory, sparse_index=snapshot.sparse_index(), reducer=snapshot.configured_reducer()
+    )
+
+
+def _unique_ids(metadatas: Sequence[Dict[str, Any]]) -> List[str]:
+    """Identyfikatory Chroma z chunk_id (powtórzenia dostają sufiks #n)."""
+    seen: Dict[str, int] = {}
+    ids = []
+    for meta in metadatas:
+        base = meta["chunk_id"]
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}#{count}")
+    return ids
+
+
+def restore_chroma(snapshot: Snapshot, force: bool = False) -> None:
+    """
+    Odtwarza kolekcję ChromaDB i pliki ingestii (BM25, centroidy, projekcja).
+
+    Chunki są dodawane z zapisanymi embeddingami w kolejności snapshotu, więc
+    odcisk korpusu agenta zgadza się z zapisanym indeksem BM25.
+
+    Args:
+        snapshot: Wczytany snapshot.
+        force: Zastępuje niepustą kolekcję.
+
+    Raises:
+        ValueError: Gdy kolekcja nie jest pusta, a force=False.
+    """
+    from langchain_community.vectorstores import Chroma
+
+    config.CHROMA_DB_DIR.mkdir(parents=True, exist_ok=True)
+    vectorstore = Chroma(persist_directory=str(config.CHROMA_DB_DIR), collection_name=config.CHROMA_COLLECTION_NAME)
+    if vectorstore._collection.count():
+        if not force:
+            raise ValueError(f"Kolekcja {config.CHROMA_COLLECTION_NAME} nie jest pusta (użyj --force, aby ją zastąpić)")
+        vectorstore.delete_collection()
+        vectorstore = Chroma(persist_directory=str(config.CHROMA_DB_DIR), collection_name=config.CHROMA_COLLECTION_NAME)
+    collection = vectorstore._collection
+
+    ids = _unique_ids(snapshot.metadatas)
+    batch = config.SNAPSHOT_CHROMA_BATCH
+    for start in range(0, len(snapshot), batch):
+        end = min(start + batch, len(snapshot))
+        collection.add(
+            ids=ids[start:end],
+            embeddings=snapshot.embeddings[start:end].tolist(),
+            metadatas=snapshot.metadatas[start:end],
+            documents=[snapshot.text(idx) for idx in range(start, end)],
+        )
+        print(f"{Fore.CYAN}  ChromaDB: {end}/{len(snapshot)} chunków", end="\r", flush=True)
+    print()
+
+    store = CorpusStore.from_arena(snapshot.arena, snapshot.offsets, snapshot.metadatas)
+    snapshot.sparse_index().save(config.SPARSE_INDEX_DIR, store.fingerprint())
+    CoarseIndex.from_vectors(
+        [group_key(record.source, record.heading_path) for record in store.records], snapshot.embeddings
+    ).save(config.CHROMA_DB_DIR / config.COARSE_INDEX_FILE)
+    if snapshot.reducer is not None:
+        snapshot.reducer.save(config.CHROMA_DB_DIR / config.EMBEDDING_REDUCTION_FILE)
+    store.close()
+    commit_version()
+
+
+def _describe(path: Path, manifest: Dict[str, Any]) -> str:
+    size_mb = Path(path).stat().st_size / 1e6
+    raw_mb = sum(np.dtype(c["dtype"]).itemsize * int(np.prod(c["shape"])) for c in manifest["columns"].values()) / 1e6
+    return (
+        f"{manifest['chunks']} chunków, embeddingi {manifest['embedding_dim']}D ({manifest['embedding_model']}), "
+        f"{size_mb:.1f} MB (kolumny {raw_mb:.1f} MB)"
+    )
+
+
+def main() -> None:
+    """CLI: export / import / verify."""
+    parser = argparse.ArgumentParser(description="Snapshot indeksu - eksport i import bez ponownego liczenia embeddingów")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Zapisuje kolekcję ChromaDB i indeks BM25 do snapshotu")
+    export.add_argument("path", type=Path)
+    restore = subparsers.add_parser("import", help="Odtwarza kolekcję ChromaDB i pliki ingestii ze snapshotu")
+    restore.add_argument("path", type=Path)
+    restore.add_argument("--force", action="store_true", help="Zastępuje istniejącą kolekcję")
+    verify = subparsers.add_parser("verify", help="Sprawdza skróty kolumn snapshotu")
+    verify.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        if args.command == "export":
+            manifest = export_chroma(args.path)
+            print(f"{Fore.GREEN}✓ Snapshot zapisany: {args.path} - {_describe(args.path, manifest)}")
+        else:
+            snapshot = read_snapshot(args.path)
+            print(f"{Fore.GREEN}✓ Snapshot poprawny: {args.path} - {_describe(args.path, snapshot.manifest)}")
+            if args.command == "import":
+                restore_chroma(snapshot, force=args.force)
+                print(f"{Fore.GREEN}✓ Zaimportowano do {config.CHROMA_DB_DIR}")
+    except (OSError, ValueError) as e:
+        print(f"{Fore.RED}✗ {e}")
+        sys.exit(1)
+    print(f"{Fore.CYAN}⏱ {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Zwarty indeks BM25 (Okapi) na tablicach numpy.
+
+BM25Okapi z rank_bm25 trzyma dla każdego dokumentu osobny słownik
+częstości, a BM25Retriever buduje drugi taki indeks razem z kopią
+wszystkich obiektów Document. SparseIndex trzyma jedną listę postingów
+w układzie CSR (term -> [doc_id], [tf]) i liczy score wektorowo;
+wzór i parametry (k1, b, epsilon) są takie jak w BM25Okapi, więc
+ranking się nie zmienia.
+
+Słownik termów to posortowana tablica 64-bitowych skrótów (bez obiektów
+str), więc cały indeks można zapisać (save) i otworzyć przez mmap (load)
+- np. współdzielić między procesami w trybie pre-fork (serving.py).
+Ingestia zapisuje indeks do SPARSE_INDEX_DIR, a agent wczytuje go przy
+starcie (cached), zamiast tokenizować cały korpus od nowa.
+Professional Local RAG Agent - Initial Release"""
+
+import hashlib
+import json
+import math
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_ARRAYS = ("term_hashes", "postings_docs", "postings_tf", "term_offsets", "length_norm", "idf")
+# Podzbiór mniejszy niż num_docs / _SUBSET_RATIO jest oceniany bez pełnej tablicy score
+_SUBSET_RATIO = 8
+
+
+def default_tokenize(text: str) -> List[str]:
+    """Tokenizacja używana dotąd przez agenta: małe litery + podział po białych znakach."""
+    return text.lower().split()
+
+
+def tokenizer_signature(tokenize: Callable[[str], List[str]]) -> str:
+    """Identyfikator tokenizacji zapisywany z indeksem (tokenizer.Tokenizer.signature albo nazwa funkcji)."""
+    return getattr(tokenize, "signature", None) or getattr(tokenize, "__name__", repr(tokenize))
+
+
+def term_hash(term: str) -> int:
+    """Stabilny (między procesami) 64-bitowy skrót termu."""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SparseIndex:
+    """Indeks BM25 z postingami w tablicach numpy."""
+
+    def __init__(
+        self,
+        documents: Iterable[str],
+        tokenize: Callable[[str], List[str]] = default_tokenize,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> None:
+        """
+        Args:
+            documents: Treści dokumentów (np. CorpusStore.iter_texts()).
+            tokenize: Funkcja tokenizująca (ta sama dla indeksu i zapytań).
+            k1, b, epsilon: Parametry BM25Okapi.
+        """
+        self.tokenize = tokenize
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = ""
+        vocabulary: Dict[str, int] = {}
+
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        freqs: List[int] = []
+        doc_lengths: List[int] = []
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                freqs.append(tf)
+
+        # Numer termu = pozycja jego skrótu w posortowanej tablicy term_hashes
+        hashes = np.fromiter((term_hash(term) for term in vocabulary), dtype=np.uint64, count=len(vocabulary))
+        hash_order = np.argsort(hashes, kind="stable")
+        self.term_hashes = hashes[hash_order]
+        rank = np.empty(len(vocabulary), dtype=np.int32)
+        rank[hash_order] = np.arange(len(vocabulary), dtype=np.int32)
+
+        self.num_docs = len(doc_lengths)
+        terms = rank[np.asarray(term_ids, dtype=np.int64)] if term_ids else np.zeros(0, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        self.postings_docs = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.postings_tf = np.asarray(freqs, dtype=np.float32)[order]
+        self.term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=self.term_offsets[1:])
+
+        lengths = np.asarray(doc_lengths, dtype=np.float32)
+        avgdl = float(lengths.mean()) if self.num_docs and lengths.sum() else 1.0
+        # Mianownik BM25 bez tf: k1 * (1 - b + b * dl / avgdl)
+        self.length_norm = (k1 * (1 - b + b * lengths / avgdl)).astype(np.float32)
+
+        # IDF jak w BM25Okapi: ujemne wartości zastępuje epsilon * średnie IDF
+        doc_freq = np.diff(self.term_offsets).astype(np.float64)
+        idf = np.log(self.num_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        average_idf = float(idf.mean()) if len(idf) else 0.0
+        idf[idf < 0] = epsilon * average_idf
+        self.idf = idf.astype(np.float32)
+
+    def save(self, directory: Path, fingerprint: str = "") -> None:
+        """
+        Zapisuje tablice indeksu (.npy) i parametry do katalogu.
+
+        Pliki są zapisywane obok i podmieniane atomowo, więc procesy z otwartym
+        mmap poprzedniej wersji czytają dalej swoją kopię. params.json jest
+        podmieniany na końcu.
+
+        Args:
+            directory: Katalog docelowy (tworzony, jeśli nie istnieje).
+            fingerprint: Odcisk korpusu (CorpusStore.fingerprint), z którego zbudowano indeks.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        for name in _ARRAYS:
+            with open(directory / f"{name}.npy{suffix}", "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(directory / f"{name}.npy{suffix}", directory / f"{name}.npy")
+        params = {**self.params(), "fingerprint": fingerprint}
+        (directory / f"params.json{suffix}").write_text(json.dumps(params), encoding="utf-8")
+        os.replace(directory / f"params.json{suffix}", directory / "params.json")
+
+    @classmethod
+    def load(
+        cls,
+        directory: Path,
+        tokenize: Callable[[str], List[str]] = default_tokenize,
+        mmap: bool = True,
+    ) -> "SparseIndex":
+        """
+        Otwiera indeks zapisany przez save().
+
+        Args:
+            directory: Katalog z plikami indeksu.
+            tokenize: Funkcja tokenizująca - musi być ta sama co przy budowie.
+            mmap: Otwiera tablice przez mmap (tylko do odczytu, współdzielone strony).
+
+        Returns:
+            SparseIndex gotowy do zapytań.
+
+        Raises:
+            ValueError: Gdy indeks zbudowano z inną tokenizacją.
+        """
+        directory = Path(directory)
+        params = json.loads((directory / "params.json").read_text(encoding="utf-8"))
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r" if mmap else None) for name in _ARRAYS}
+        return cls.from_arrays(arrays, params, tokenize)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        arrays: Dict[str, np.ndarray],
+        params: Dict[str, Any],
+        tokenize: Callable[[str], List[str]] = default_tokenize,
+    ) -> "SparseIndex":
+        """
+        Indeks z gotowych tablic (save()/load() albo snapshot.py).
+
+        Args:
+            arrays: Tablice z nazwami jak w arrays().
+            params: Parametry jak w params.json (k1, b, num_docs, tokenizer, fingerprint).
+            tokenize: Funkcja tokenizująca - musi być ta sama co przy budowie.
+
+        Raises:
+            ValueError: Gdy indeks zbudowano z inną tokenizacją.
+        """
+        signature = tokenizer_signature(tokenize)
+        if params.get("tokenizer", default_tokenize.__name__) != signature:
+            raise ValueError(f"Indeks BM25 zbudowano tokenizerem {params.get('tokenizer')}, a nie {signature}")
+        index = cls.__new__(cls)
+        index.tokenize = tokenize
+        index.k1 = params["k1"]
+        index.b = params["b"]
+        index.num_docs = params["num_docs"]
+        index.fingerprint = params.get("fingerprint", "")
+        for name in _ARRAYS:
+            setattr(index, name, arrays[name])
+        return index
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Tablice indeksu (postingi, IDF, normalizacja długości) po nazwie."""
+        return {name: getattr(self, name) for name in _ARRAYS}
+
+    def params(self) -> Dict[str, Any]:
+        """Parametry zapisywane w params.json."""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "num_docs": self.num_docs,
+            "tokenizer": tokenizer_signature(self.tokenize),
+            "fingerprint": self.fingerprint,
+        }
+
+    @classmethod
+    def cached(
+        cls,
+        store,
+        directory: Path,
+        tokenize: Callable[[str], List[str]] = default_tokenize,
+        rebuild: bool = False,
+    ) -> Tuple["SparseIndex", bool]:
+        """
+        Indeks zapisany przy ingestii albo - gdy brak go lub jest nieaktualny - zbudowany i zapisany.
+
+        Args:
+            store: CorpusStore (treść chunków i odcisk korpusu).
+            directory: Katalog indeksu.
+            tokenize: Tokenizer (indeks z inną tokenizacją jest budowany od nowa).
+            rebuild: Buduje indeks bez względu na zapisany (ingestia).
+
+        Returns:
+            Krotka (indeks, czy wczytany z dysku).
+        """
+        fingerprint = store.fingerprint()
+        if not rebuild and (Path(directory) / "params.json").exists():
+            try:
+                index = cls.load(directory, tokenize)
+                if index.fingerprint == fingerprint and index.num_docs == len(store):
+                    return index, True
+            except (OSError, ValueError):
+                pass
+        index = cls(store.iter_texts(), tokenize=tokenize)
+        index.fingerprint = fingerprint
+        try:
+            index.save(directory, fingerprint)
+        except OSError:
+            pass
+        return index, False
+
+    def _term(self, token: str) -> Optional[int]:
+        """Numer termu w indeksie albo None."""
+        h = np.uint64(term_hash(token))
+        position = int(np.searchsorted(self.term_hashes, h))
+        if position < len(self.term_hashes) and self.term_hashes[position] == h:
+            return position
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Rozmiar tablic numpy indeksu."""
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+    def get_scores(self, query_tokens: Sequence[str]) -> np.ndarray:
+        """
+        Score BM25 wszystkich dokumentów.
+
+        Args:
+            query_tokens: Tokeny zapytania (po tokenize).
+
+        Returns:
+            Tablica float32 długości num_docs.
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for token in query_tokens:
+            term = self._term(token)
+            if term is None:
+                continue
+            start, end = self.term_offsets[term], self.term_offsets[term + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+        return scores
+
+    def get_batch_scores(self, query_tokens: Sequence[str], doc_ids: Sequence[int]) -> np.ndarray:
+        """
+        Score BM25 tylko dla wskazanych dokumentów (kolejność jak doc_ids).
+
+        Postingi termu są posortowane wg doc_id, więc dla małego podzbioru
+        (filtry, wyszukiwanie dwuetapowe, kandydaci sesji) dokumenty są
+        wyszukiwane binarnie - koszt zależy od rozmiaru podzbioru, a nie
+        od długości list postingów.
+        """
+        candidates = np.asarray(doc_ids, dtype=np.int64)
+        if len(candidates) * _SUBSET_RATIO >= self.num_docs:
+            return self.get_scores(query_tokens)[candidates]
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        length_norm = self.length_norm[candidates]
+        for token in query_tokens:
+            term = self._term(token)
+            if term is None:
+                continue
+            start, end = self.term_offsets[term], self.term_offsets[term + 1]
+            docs = self.postings_docs[start:end]
+            found = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+            hit = docs[found] == candidates
+            tf = self.postings_tf[start:end][found[hit]]
+            scores[hit] += self.idf[term] * tf * (self.k1 + 1) / (tf + length_norm[hit])
+        return scores
+
+    def top_k(self, query: str, k: int, doc_ids: Optional[Sequence[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Najlepsze dokumenty dla zapytania.
+
+        Args:
+            query: Zapytanie (tokenizowane tą samą funkcją co indeks).
+            k: Liczba wyników.
+            doc_ids: Opcjonalne ograniczenie do podzbioru dokumentów (filtry).
+
+        Returns:
+            Lista (doc_id, score) malejąco; dokumenty bez trafień są pomijane.
+        """
+        if doc_ids is not None:
+            candidates = np.asarray(doc_ids, dtype=np.int64)
+            scores = self.get_batch_scores(self.tokenize(query), candidates)
+        else:
+            candidates = None
+            scores = self.get_scores(self.tokenize(query))
+        if k <= 0 or not len(scores):
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = []
+        for i in top:
+            score = float(scores[i])
+            if score <= 0 or math.isnan(score):
+                break
+            results.append((int(candidates[i]) if candidates is not None else int(i), score))
+        return results
@@ -0,0 +1,21 @@
+"""
+Wspólna konfiguracja testów (pytest uruchamiany z katalogu projektu).
+
+Moduły projektu leżą w katalogu głównym, więc dodajemy go do sys.path.
+Professional Local RAG Agent - Initial Release"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_ollama import FakeOllamaServer  # noqa: E402
+
+
+@pytest.fixture
+def slow_server():
+    """Fałszywa Ollama z odczuwalnym czasem generacji (ok. 0.5 s na odpowiedź)."""
+    with FakeOllamaServer(load_time=0.0, prompt_eval_per_token=0.0, eval_per_token=0.05, embed_per_token=0.0) as server:
+        yield server
@@ -0,0 +1,62 @@
+"""
+Testy trybu wsadowego: ograniczone okno pytań i szybkie przerwanie przebiegu.
+Professional Local RAG Agent - Initial Release"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from batch import BatchRunner
+
+
+class SlowAgent:
+    """Agent odpowiadający po `delay` s (wcześniej, gdy przebieg zostanie anulowany)."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def ask(self, question, retrieval_cache=None, filters=None, cancel=None):
+        with self._lock:
+            self.started += 1
+        if cancel is not None and cancel.wait(self.delay):
+            raise RuntimeError("anulowane")
+        return {"answer": f"odpowiedź: {question}", "sources": []}
+
+
+def _questions(path, n):
+    path.write_text("\n".join(json.dumps({"id": str(i), "question": f"pytanie {i}"}) for i in range(n)), encoding="utf-8")
+
+
+def test_run_answers_every_question(tmp_path):
+    _questions(tmp_path / "in.jsonl", 12)
+    summary = BatchRunner(SlowAgent(0.01), concurrency=3).run(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+    lines = (tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()
+    assert summary["processed"] == 12 and summary["errors"] == 0
+    assert sorted(json.loads(line)["id"] for line in lines) == sorted(str(i) for i in range(12))
+
+
+def test_interrupt_stops_without_running_the_backlog(tmp_path):
+    _questions(tmp_path / "in.jsonl", 40)
+    agent = SlowAgent(0.3)
+    runner = BatchRunner(agent, concurrency=2)
+    original_write = runner._write
+
+    def write_then_interrupt(out_file, records, output):
+        original_write(out_file, records, output)
+        raise KeyboardInterrupt
+
+    runner._write = write_then_interrupt
+    start = time.perf_counter()
+    with pytest.raises(KeyboardInterrupt):
+        runner.run(tmp_path / "in.jsonl", tmp_path / "out.jsonl")
+    elapsed = time.perf_counter() - start
+
+    # Pierwsza odpowiedź po ~0.3 s; reszta kolejki nie jest wykonywana
+    assert elapsed < 1.0
+    assert agent.started <= 2 * runner.concurrency
+    assert runner.cancel.cancelled
+    assert len((tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()) == 1
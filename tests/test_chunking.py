@@ -0,0 +1,36 @@
+"""
+Testy StructureAwareChunker: twardy limit tokenów także dla tekstu bez spacji.
+Professional Local RAG Agent - Initial Release"""
+
+import pytest
+from langchain_core.documents import Document
+
+import config
+from chunking import StructureAwareChunker
+from text_utils import estimate_tokens
+
+TEXTS = {
+    "long_word": "Wstęp do dokumentu. " + "a" * 12000 + " Koniec dokumentu.",
+    "long_urls": " ".join("https://example.com/" + "/".join(["ab", "c.d", "e-f"] * 300) for _ in range(3)),
+    "punctuation": "-.,;:" * 2000,
+    "prose": " ".join(["Zdanie testowe numer", "siedem ma kilka słów."] * 1500),
+}
+
+
+@pytest.mark.parametrize("source", ["docs/a.md", "docs/a.pdf"])
+@pytest.mark.parametrize("name", sorted(TEXTS))
+def test_no_chunk_exceeds_max_tokens(name, source):
+    text = TEXTS[name]
+    chunks = StructureAwareChunker().split_documents([Document(page_content=text, metadata={"source": source})])
+    assert chunks
+    assert max(estimate_tokens(chunk.page_content) for chunk in chunks) <= config.CHUNK_MAX_TOKENS
+    assert all(chunk.metadata["chunk_tokens"] <= config.CHUNK_MAX_TOKENS for chunk in chunks)
+    # Cięcie po znakach nie gubi treści
+    assert sum(len("".join(chunk.page_content.split())) for chunk in chunks) >= len("".join(text.split()))
+
+
+def test_split_word_respects_target():
+    chunker = StructureAwareChunker(target_tokens=50, max_tokens=80)
+    pieces = chunker._split_word("x" * 1000)
+    assert "".join(pieces) == "x" * 1000
+    assert all(estimate_tokens(piece) <= 50 for piece in pieces)
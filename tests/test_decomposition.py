@@ -0,0 +1,77 @@
+"""
+Testy dekompozycji: sub-pytania ze strumienia przy niepoprawnym JSON
+i anulowanie spekulacji spoza końcowej listy.
+Professional Local RAG Agent - Initial Release"""
+
+import contextlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fake_ollama import FakeOllamaServer
+
+SUBQUERIES = ["Kiedy startuje kopia zapasowa?", "Który serwer ją wykonuje?"]
+# Poprawna lista, ale model dopisał komentarz po JSON - json.loads się nie powiedzie
+RESPONSE = '{"subqueries": ["' + '", "'.join(SUBQUERIES) + '"]} Mam nadzieję, że to pomoże.'
+
+
+@pytest.fixture
+def agent(tmp_path):
+    from advanced_rag import AdvancedRAGAgent
+    from serving import SharedIndex
+
+    texts = [f"Fragment {i}: kopia zapasowa serwera numer {i} startuje o północy." for i in range(30)]
+    metadatas = [{"source": f"docs/plik_{i // 10}.pdf", "page": i % 10} for i in range(30)]
+    embedder = FakeOllamaServer()
+    index = SharedIndex.build(texts, metadatas, [embedder.embed(t) for t in texts], tmp_path)
+    with FakeOllamaServer(time_scale=0.0, response_text=RESPONSE) as server, contextlib.redirect_stdout(io.StringIO()):
+        agent = AdvancedRAGAgent(
+            shared_index=index, base_url=server.base_url, warm_up=False, speculative=True, cache_retrieval=False
+        )
+        yield agent
+
+
+def test_unparsable_response_keeps_streamed_subqueries(agent):
+    from advanced_rag import AdvancedRAGAgent
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert agent.decompose_query("Pytanie?", on_subquery=lambda subquery: None) == SUBQUERIES
+    assert AdvancedRAGAgent._parse_subqueries("{", "Pytanie?", SUBQUERIES) == SUBQUERIES
+    assert AdvancedRAGAgent._parse_subqueries("{", "Pytanie?") == ["Pytanie?"]
+
+
+def test_discarded_speculation_is_cancelled(agent, monkeypatch):
+    question = "Jak działa kopia zapasowa serwera?"
+    searched = []
+    retrieve = agent._retrieve
+    degraded_k = agent._degraded_k
+
+    def recording_retrieve(query, *args):
+        searched.append(query)
+        return retrieve(query, *args)
+
+    # Jedyny wątek puli jest zajęty do końca dekompozycji - spekulacje czekają w kolejce
+    pool = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    blocker = pool.submit(release.wait, 5.0)
+
+    def releasing_degraded_k(deadline):
+        release.set()
+        return degraded_k(deadline)
+
+    monkeypatch.setattr(agent, "_retrieve", recording_retrieve)
+    monkeypatch.setattr(agent, "_speculative_pool", pool)
+    monkeypatch.setattr(agent, "_degraded_k", releasing_degraded_k)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            subqueries, candidates = agent._decompose_and_retrieve(question)
+    finally:
+        release.set()
+        pool.shutdown()
+    assert blocker.result()
+    assert subqueries == SUBQUERIES and candidates
+    # Spekulacja samego pytania nie trafiła do końcowej listy i nie wystartowała
+    assert question not in searched
+    assert sorted(searched) == sorted(SUBQUERIES)
@@ -0,0 +1,99 @@
+"""
+Testy NearDuplicateFilter: odrzucanie kopii, zasilanie kolekcją i mapowanie duplikatów.
+Professional Local RAG Agent - Initial Release"""
+
+import json
+
+from langchain_core.documents import Document
+
+from corpus_store import CorpusStore
+from dedup import NearDuplicateFilter, load_mapping
+
+FOOTER = "Poufne. Dokument stanowi własność firmy i nie może być rozpowszechniany bez zgody zarządu spółki."
+BODY_A = "Procedura zwrotu towaru obejmuje zgłoszenie reklamacji w ciągu czternastu dni od daty zakupu."
+BODY_B = "Serwer raportów uruchamia eksport danych co noc o godzinie drugiej i wysyła podsumowanie mailem."
+
+
+def _chunk(source, text, page=0):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_filter_drops_copies_and_records_sources():
+    dedup = NearDuplicateFilter()
+    kept = dedup.filter([_chunk("a.pdf", FOOTER), _chunk("a.pdf", BODY_A), _chunk("b.pdf", FOOTER)])
+    assert [chunk.page_content for chunk in kept] == [FOOTER, BODY_A]
+    assert kept[0].metadata["duplicate_sources"] == "b.pdf"
+    (entry,) = dedup.mapping.values()
+    assert (entry["source"], entry["canonical_source"]) == ("b.pdf", "a.pdf")
+    assert entry["canonical_id"] == kept[0].metadata["chunk_id"]
+
+
+def test_boilerplate_on_every_page_gets_own_mapping_entry():
+    chunks = [_chunk("a.pdf", FOOTER, page) for page in range(3)] + [_chunk("a.pdf", FOOTER, 2)]
+    dedup = NearDuplicateFilter()
+    kept = dedup.filter(chunks)
+    assert len(kept) == 1
+    assert len({chunk.metadata["chunk_id"] for chunk in chunks}) == 4
+    assert sorted(entry["page"] for entry in dedup.mapping.values()) == [1, 2, 2]
+
+
+def test_corpus_store_ids_match_filter_ids(tmp_path):
+    chunks = [_chunk("a.pdf", BODY_A, 0), _chunk("a.pdf", BODY_A, 1), _chunk("a.pdf", BODY_A, 1)]
+    expected = [chunk.metadata["chunk_id"] for chunk in NearDuplicateFilter(threshold=1.1).filter(chunks)]
+    # Kolekcja bez chunk_id (deduplikacja wyłączona) - identyfikatory liczone przy budowie magazynu
+    store = CorpusStore.build(
+        [BODY_A] * 3, [{"source": "a.pdf", "page": page} for page in (0, 1, 1)], tmp_path / "arena.bin"
+    )
+    try:
+        assert [record.chunk_id for record in store.records] == expected
+        assert store.position_of(store.document(2)) == 2
+    finally:
+        store.close()
+
+
+def test_seeded_collection_chunks_are_canonical():
+    seed_meta = {"source": "a.pdf", "chunk_id": "seed-1"}
+    dedup = NearDuplicateFilter()
+    dedup.seed(["id-1"], [FOOTER], [seed_meta])
+    kept = dedup.filter([_chunk("b.pdf", FOOTER), _chunk("b.pdf", BODY_B)])
+    assert [chunk.page_content for chunk in kept] == [BODY_B]
+    assert dedup.updated_seeds == {"id-1": {"source": "a.pdf", "chunk_id": "seed-1", "duplicate_sources": "b.pdf"}}
+    # Metadane z kolekcji nie są modyfikowane w miejscu
+    assert "duplicate_sources" not in seed_meta
+    (entry,) = dedup.mapping.values()
+    assert entry["canonical_id"] == "seed-1"
+
+
+def test_seed_reuses_signatures():
+    dedup = NearDuplicateFilter()
+    (signature,) = dedup.seed(["id-1"], [FOOTER], [{"source": "a.pdf"}])
+    again = NearDuplicateFilter()
+    again.seed(["id-1"], ["(treść nieużywana)"], [{"source": "a.pdf"}], [signature])
+    assert again.filter([_chunk("b.pdf", FOOTER)]) == []
+
+
+def test_save_mapping_replaces_entries_of_changed_sources(tmp_path):
+    path = tmp_path / "dedup_map.json"
+    path.write_text(json.dumps({"threshold": 0.85, "dropped": {
+        "old-b": {"source": "b.pdf", "canonical_source": "a.pdf"},
+        "old-c": {"source": "c.pdf", "canonical_source": "b.pdf"},
+        "old-d": {"source": "d.pdf", "canonical_source": "a.pdf"},
+    }}), encoding="utf-8")
+
+    dedup = NearDuplicateFilter()
+    dedup.filter([_chunk("a.pdf", FOOTER), _chunk("b.pdf", FOOTER)])
+    dedup.save_mapping(path, replaced_sources={"b.pdf"})
+
+    mapping = load_mapping(path)
+    assert "old-b" not in mapping and "old-c" not in mapping
+    assert mapping["old-d"]["source"] == "d.pdf"
+    assert [entry["source"] for entry in dedup.mapping.values()] == ["b.pdf"]
+    assert set(dedup.mapping) <= set(mapping)
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_load_mapping_tolerates_missing_and_corrupt_file(tmp_path):
+    path = tmp_path / "dedup_map.json"
+    assert load_mapping(path) == {}
+    path.write_text("{", encoding="utf-8")
+    assert load_mapping(path) == {}
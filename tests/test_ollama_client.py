@@ -0,0 +1,176 @@
+"""
+Testy klienta Ollama: próba half-open przerwana bez wyniku, limity wywołującego
+a circuit breaker i rejestr klientów asynchronicznych.
+Professional Local RAG Agent - Initial Release"""
+
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+import config
+from ollama_client import (
+    AsyncOllamaClient,
+    CancelToken,
+    CircuitBreaker,
+    OllamaCancelled,
+    OllamaClient,
+    OllamaDeadlineExceeded,
+    RetryPolicy,
+    get_async_client,
+    request_scope,
+)
+from scheduler import LLMScheduler
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    """Obwód otwarty po jednym błędzie, z natychmiastowym przejściem w half-open."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_breaker_admits_single_trial_and_releases_it():
+    breaker = _half_open_breaker()
+    trial = breaker.admit()
+    assert trial
+    assert breaker.admit() is None
+    breaker.release_trial(trial)
+    assert breaker.state == "half-open"
+    assert breaker.admit()
+
+
+def test_stale_release_does_not_free_newer_trial():
+    breaker = _half_open_breaker()
+    first = breaker.admit()
+    breaker.record_failure()
+    second = breaker.admit()
+    breaker.release_trial(first)
+    assert breaker.admit() is None
+    breaker.release_trial(second)
+    assert breaker.admit()
+
+
+def test_cancelled_trial_does_not_leave_breaker_open(slow_server):
+    breaker = _half_open_breaker()
+    client = OllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1))
+    try:
+        cancel = CancelToken()
+        threading.Timer(0.1, cancel.cancel).start()
+        with request_scope(cancel=cancel), pytest.raises(OllamaCancelled):
+            client.generate("pytanie", model="llama3")
+        # Anulowanie to nie awaria serwera - kolejna próba musi zostać przepuszczona
+        assert client.generate("pytanie", model="llama3")["response"]
+        assert breaker.state == "closed"
+    finally:
+        client.close()
+
+
+def test_queue_deadline_trial_does_not_leave_breaker_open(slow_server):
+    breaker = _half_open_breaker()
+    scheduler = LLMScheduler(max_concurrent=1, short_reserved=0)
+    client = OllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1), scheduler=scheduler)
+    try:
+        held = scheduler.acquire("interactive", False, 1.0, timeout=1.0)
+        with pytest.raises(OllamaDeadlineExceeded):
+            client.generate("pytanie", model="llama3", timeout=0.2)
+        scheduler.release(held)
+        assert client.generate("pytanie", model="llama3")["response"]
+        assert breaker.state == "closed"
+    finally:
+        client.close()
+
+
+def test_caller_timeouts_do_not_open_breaker(slow_server):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    client = OllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1))
+    try:
+        # Krótki timeout wywołania i deadline zakresu (budżet pytania) - serwer działa, tylko wolno
+        for _ in range(2):
+            with pytest.raises(OllamaDeadlineExceeded):
+                client.generate("pytanie", model="llama3", timeout=0.2)
+        with request_scope(deadline=time.monotonic() + 0.2), pytest.raises(OllamaDeadlineExceeded):
+            client.generate("pytanie", model="llama3")
+        assert breaker.state == "closed" and breaker.allow()
+    finally:
+        client.close()
+
+
+def test_caller_timeout_releases_half_open_trial(slow_server):
+    breaker = _half_open_breaker()
+    client = OllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1))
+    try:
+        with pytest.raises(OllamaDeadlineExceeded):
+            client.generate("pytanie", model="llama3", timeout=0.2)
+        assert breaker.state == "half-open"
+        assert client.generate("pytanie", model="llama3")["response"]
+        assert breaker.state == "closed"
+    finally:
+        client.close()
+
+
+def test_async_caller_timeouts_do_not_open_breaker(slow_server):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+
+    async def scenario():
+        client = AsyncOllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1))
+        try:
+            for _ in range(2):
+                with pytest.raises(OllamaDeadlineExceeded):
+                    await client.generate("pytanie", model="llama3", timeout=0.2)
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_server_timeout_still_counts_as_failure(slow_server, monkeypatch):
+    monkeypatch.setattr(config, "OLLAMA_REQUEST_TIMEOUT", 0.2)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    client = OllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1))
+    try:
+        for _ in range(2):
+            with pytest.raises(OllamaDeadlineExceeded):
+                client.generate("pytanie", model="llama3")
+        assert breaker.state == "open"
+    finally:
+        client.close()
+
+
+def test_async_cancelled_trial_does_not_leave_breaker_open(slow_server):
+    breaker = _half_open_breaker()
+
+    async def scenario():
+        client = AsyncOllamaClient(slow_server.base_url, breaker=breaker, retry=RetryPolicy(max_attempts=1))
+        try:
+            task = asyncio.create_task(client.generate("pytanie", model="llama3"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return await client.generate("pytanie", model="llama3")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario())["response"]
+    assert breaker.state == "closed"
+
+
+def test_async_clients_of_closed_loops_are_dropped():
+    import ollama_client
+
+    async def client():
+        first = get_async_client("http://127.0.0.1:9")
+        assert get_async_client("http://127.0.0.1:9") is first
+        return first
+
+    clients = [asyncio.run(client()) for _ in range(50)]
+    # Każda pętla dostaje własny klient - także gdy nowa pętla trafi pod adres zwolnionej
+    assert len(set(clients)) == len(clients)
+    del clients
+    gc.collect()
+    assert len(ollama_client._async_clients) <= 1
@@ -0,0 +1,21 @@
+"""
+Testy układu promptów: wspólny, neutralny prefiks i instrukcja JSON na końcu dekompozycji.
+Professional Local RAG Agent - Initial Release"""
+
+import config
+
+
+def test_prompts_share_prefix_without_placeholders():
+    assert config.SYSTEM_PROMPT.startswith(config.PROMPT_PREFIX)
+    assert config.DECOMPOSE_PROMPT.startswith(config.PROMPT_PREFIX)
+    assert "{" not in config.PROMPT_PREFIX and "}" not in config.PROMPT_PREFIX
+
+
+def test_decomposition_does_not_inherit_answer_rules():
+    prompt = config.DECOMPOSE_PROMPT.format(question="Jak skonfigurować kopię zapasową?")
+    assert "ZASADY ODPOWIEDZI" not in prompt
+    assert "listę źródeł" not in prompt
+    # Format wyniku jest ostatnią instrukcją, po pytaniu
+    tail = prompt[prompt.index('"Jak skonfigurować kopię zapasową?"'):]
+    assert "JSON" in tail
+    assert prompt.rstrip().endswith('{"subqueries": ["sub-pytanie 1", "sub-pytanie 2", ...]}')
@@ -0,0 +1,107 @@
+"""
+Testy RetrievalCache: warstwy pamięci i dysku oraz unieważnianie po zmianie wersji.
+Professional Local RAG Agent - Initial Release"""
+
+import contextlib
+import io
+
+import pytest
+
+import config
+from fake_ollama import FakeOllamaServer
+from retrieval_cache import RetrievalCache, cache_key
+
+
+def test_key_ignores_case_spacing_and_param_order():
+    assert cache_key("  Co to JEST? ", k=8, search_k=None) == cache_key("co to jest?", search_k=None, k=8)
+    assert cache_key("co to jest?", k=8) != cache_key("co to jest?", k=4)
+
+
+def test_memory_hit_and_version_change():
+    cache = RetrievalCache(size=2)
+    cache.set_version("v1")
+    cache.put("a", [(3, 0.9), (1, 0.5)])
+    assert cache.get("a") == [(3, 0.9), (1, 0.5)]
+    cache.set_version("v2")
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["entries"]) == (1, 1, 0)
+
+
+def test_lru_evicts_oldest():
+    cache = RetrievalCache(size=2)
+    cache.set_version("v1")
+    for key in ("a", "b", "c"):
+        cache.put(key, [(0, 1.0)])
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+
+def test_result_for_outdated_version_is_not_stored():
+    cache = RetrievalCache()
+    cache.set_version("v1")
+    cache.set_version("v2")
+    cache.put("a", [(0, 1.0)], version="v1")
+    assert cache.get("a", "v1") is None
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart_and_is_invalidated(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    first = RetrievalCache(path=path)
+    first.set_version("v1")
+    first.put("a", [(7, 0.25)])
+
+    restarted = RetrievalCache(path=path)
+    restarted.set_version("v1")
+    assert restarted.get("a") == [(7, 0.25)]
+    assert restarted.stats()["disk_hits"] == 1
+
+    # Nowa wersja (ingestia, zmiana ustawień) usuwa stare wpisy także z pliku
+    after_ingest = RetrievalCache(path=path)
+    after_ingest.set_version("v2")
+    reopened = RetrievalCache(path=path)
+    reopened.set_version("v1")
+    assert reopened.get("a") is None
+
+
+@pytest.fixture(scope="module")
+def agent(tmp_path_factory):
+    from advanced_rag import AdvancedRAGAgent
+    from serving import SharedIndex
+
+    texts = [f"Fragment {i}: instalacja modułu numer {i} wymaga konfiguracji sieci." for i in range(50)]
+    metadatas = [{"source": f"docs/plik_{i // 10}.pdf", "page": i % 10} for i in range(50)]
+    embedder = FakeOllamaServer()
+    index = SharedIndex.build(texts, metadatas, [embedder.embed(t) for t in texts], tmp_path_factory.mktemp("index"))
+    with FakeOllamaServer(time_scale=0.0) as server, contextlib.redirect_stdout(io.StringIO()):
+        yield AdvancedRAGAgent(shared_index=index, base_url=server.base_url, warm_up=False)
+
+
+@pytest.mark.parametrize("setting, value", [
+    ("EMBEDDING_MODEL", "inny-model"),
+    ("EMBEDDING_RESCORE_FACTOR", config.EMBEDDING_RESCORE_FACTOR + 1),
+])
+def test_version_covers_settings_outside_the_index(agent, monkeypatch, setting, value):
+    vector_retriever = agent.retriever.vector_retriever
+    before = agent._cache_version(vector_retriever)
+    monkeypatch.setattr(config, setting, value)
+    assert agent._cache_version(vector_retriever) != before
+
+
+def test_version_covers_retriever_and_tokenizer(agent, monkeypatch):
+    vector_retriever = agent.retriever.vector_retriever
+    before = agent._cache_version(vector_retriever)
+    monkeypatch.setattr(vector_retriever, "fetch_k", vector_retriever.fetch_k + 1)
+    assert agent._cache_version(vector_retriever) != before
+    monkeypatch.undo()
+    monkeypatch.setattr(agent.sparse_index, "tokenize", str.split)
+    assert agent._cache_version(vector_retriever) != before
+
+
+def test_repeated_search_is_served_from_cache(agent):
+    first = agent.retriever.invoke_with_scores("instalacja modułu numer 7")
+    hits = agent.result_cache.stats()["memory_hits"]
+    second = agent.retriever.invoke_with_scores("Instalacja  modułu numer 7")
+    assert agent.result_cache.stats()["memory_hits"] == hits + 1
+    assert [(d.page_content, s) for d, s in first] == [(d.page_content, s) for d, s in second]
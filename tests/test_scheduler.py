@@ -0,0 +1,114 @@
+"""
+Testy LLMScheduler: udział klas proporcjonalny do wag, miejsca dla krótkich wywołań
+i kolejność generacji w kliencie Ollama.
+Professional Local RAG Agent - Initial Release"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ollama_client import OllamaClient, RetryPolicy
+from scheduler import LLMScheduler, llm_priority
+
+# Wagi 4:1 - znaczniki startu są dokładne w arytmetyce zmiennoprzecinkowej
+CLASSES = {"interactive": (4.0, 1), "batch": (1.0, 1)}
+
+
+async def _grant_order(scheduler, requests):
+    """Kolejność przydziału miejsc dla (klasa, krótkie) zgłoszonych, gdy jedyne miejsce jest zajęte."""
+    order = []
+    holder = await scheduler.aacquire("batch", False, 1.0, timeout=1.0)
+
+    async def call(priority, short):
+        ticket = await scheduler.aacquire(priority, short, 1.0, timeout=5.0)
+        order.append(priority)
+        await asyncio.sleep(0)
+        scheduler.release(ticket)
+
+    tasks = []
+    for priority, short in requests:
+        tasks.append(asyncio.create_task(call(priority, short)))
+        await asyncio.sleep(0)
+    scheduler.release(holder)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_classes_share_slots_by_weight():
+    scheduler = LLMScheduler(max_concurrent=1, short_reserved=0, classes=CLASSES)
+    # Zadania wsadowe zgłoszone pierwsze nie blokują interaktywnych
+    requests = [("batch", False)] * 8 + [("interactive", False)] * 8
+    order = asyncio.run(_grant_order(scheduler, requests))
+    assert order[:10].count("interactive") == 8
+    assert sorted(order) == sorted(priority for priority, _ in requests)
+    stats = scheduler.stats()
+    assert stats["interactive"]["granted"] == 8 and stats["batch"]["granted"] == 9
+    assert stats["batch"]["queued"] == stats["interactive"]["queued"] == 0
+
+
+def test_single_class_keeps_fifo_order():
+    scheduler = LLMScheduler(max_concurrent=1, short_reserved=0, classes=CLASSES)
+    order = []
+    holder = scheduler.acquire("batch", False, 1.0, timeout=1.0)
+
+    def call(name):
+        ticket = scheduler.acquire("batch", False, 1.0, timeout=5.0)
+        order.append(name)
+        scheduler.release(ticket)
+
+    threads = []
+    for name in range(5):
+        threads.append(threading.Thread(target=call, args=(name,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    scheduler.release(holder)
+    for thread in threads:
+        thread.join()
+    assert order == list(range(5))
+
+
+def test_short_calls_use_reserved_slot():
+    scheduler = LLMScheduler(max_concurrent=2, short_reserved=1, classes={"interactive": (1.0, 2)})
+    long_call = scheduler.acquire("interactive", False, 10.0, timeout=1.0)
+    assert long_call is not None
+    # Drugie długie wywołanie czeka (miejsce zarezerwowane), krótkie dostaje je od razu
+    assert scheduler.acquire("interactive", False, 10.0, timeout=0.05) is None
+    short_call = scheduler.acquire("interactive", True, 0.1, timeout=0.05)
+    assert short_call is not None
+    scheduler.release(short_call)
+    scheduler.release(long_call)
+    assert scheduler.stats()["interactive"]["abandoned"] == 1
+
+
+def test_invalid_configuration_is_rejected():
+    with pytest.raises(ValueError):
+        LLMScheduler(max_concurrent=1, short_reserved=1, classes=CLASSES)
+
+
+def test_interactive_generation_overtakes_batch_backlog(slow_server):
+    scheduler = LLMScheduler(max_concurrent=1, short_reserved=0, classes=CLASSES)
+    client = OllamaClient(slow_server.base_url, retry=RetryPolicy(max_attempts=1), scheduler=scheduler)
+    finished = []
+    lock = threading.Lock()
+
+    def generate(priority):
+        with llm_priority(priority):
+            client.generate("pytanie", model="llama3", options={"num_predict": 256})
+        with lock:
+            finished.append(priority)
+
+    try:
+        batch = [threading.Thread(target=generate, args=("batch",)) for _ in range(3)]
+        for thread in batch:
+            thread.start()
+        time.sleep(0.1)
+        interactive = threading.Thread(target=generate, args=("interactive",))
+        interactive.start()
+        for thread in batch + [interactive]:
+            thread.join(timeout=10.0)
+    finally:
+        client.close()
+    # Trwa jedna generacja wsadowa; interaktywna jest następna, przed resztą zaległości
+    assert finished == ["batch", "interactive", "batch", "batch"]
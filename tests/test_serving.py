@@ -0,0 +1,32 @@
+"""
+Testy SharedIndex: ponowny zapis indeksu nie narusza tablic otwartych przez mmap.
+Professional Local RAG Agent - Initial Release"""
+
+import numpy as np
+
+from reduction import EmbeddingReducer
+from serving import SharedIndex
+
+
+def _build(directory, scale):
+    texts = [f"Fragment {i} opisuje konfigurację usługi numer {i}." * int(scale) for i in range(40)]
+    metadatas = [{"source": f"docs/plik_{i // 8}.pdf", "page": i % 8} for i in range(40)]
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(40, 16)).astype(np.float32) * scale
+    reducer = EmbeddingReducer.fit(embeddings, "pca", 4)
+    return SharedIndex.build(texts, metadatas, embeddings, directory, reducer=reducer), embeddings
+
+
+def test_rebuild_keeps_mapped_arrays_of_running_index(tmp_path):
+    old_index, old_embeddings = _build(tmp_path, 1.0)
+    old_offsets = np.array(old_index.store.offsets)
+    old_reduced = np.array(old_index.dense_index.reduced)
+
+    new_index, new_embeddings = _build(tmp_path, 2.0)
+
+    # Stary proces czyta dalej swoją wersję plików, nowy - nową
+    np.testing.assert_array_equal(old_index.dense_index.matrix, old_embeddings)
+    np.testing.assert_array_equal(old_index.dense_index.reduced, old_reduced)
+    np.testing.assert_array_equal(old_index.store.offsets, old_offsets)
+    np.testing.assert_array_equal(new_index.dense_index.matrix, new_embeddings)
+    assert not list(tmp_path.glob("*.tmp"))
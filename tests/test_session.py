@@ -0,0 +1,40 @@
+"""
+Testy ścieżki sesji w ask(): embedding pytania liczony raz na turę.
+Professional Local RAG Agent - Initial Release"""
+
+import contextlib
+import io
+
+import pytest
+
+from fake_ollama import FakeOllamaServer
+from session import RetrievalSession
+
+
+@pytest.fixture
+def agent(tmp_path):
+    from advanced_rag import AdvancedRAGAgent
+    from serving import SharedIndex
+
+    texts = [f"Fragment {i}: kopia zapasowa serwera numer {i} startuje o północy." for i in range(30)]
+    metadatas = [{"source": f"docs/plik_{i // 10}.pdf", "page": i % 10} for i in range(30)]
+    embedder = FakeOllamaServer()
+    index = SharedIndex.build(texts, metadatas, [embedder.embed(t) for t in texts], tmp_path)
+    with FakeOllamaServer(time_scale=0.0) as server, contextlib.redirect_stdout(io.StringIO()):
+        yield AdvancedRAGAgent(shared_index=index, base_url=server.base_url, warm_up=False, cache_retrieval=False)
+
+
+def test_new_topic_reuses_question_embedding(agent, monkeypatch):
+    calls = []
+    embed_query = agent.embeddings.embed_query
+
+    def counting_embed_query(text):
+        calls.append(text)
+        return embed_query(text)
+
+    monkeypatch.setattr(agent.embeddings, "embed_query", counting_embed_query)
+    question = "Kiedy startuje kopia zapasowa serwera numer 3?"
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = agent.ask(question, session=RetrievalSession(), budget_s=None)
+    assert result["answer"]
+    assert calls.count(question) == 1
@@ -0,0 +1,65 @@
+"""
+Pomocnicze funkcje tekstowe współdzielone przez ingest i agenta.
+
+Zawiera szybką estymację liczby tokenów (bez ładowania tokenizera modelu),
+normalizację zapytań i podział na zdania.
+Professional Local RAG Agent - Initial Release"""
+
+import math
+import re
+from typing import List
+
+import config
+
+# Słowa i pojedyncze znaki interpunkcyjne - dolna granica liczby tokenów
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Koniec zdania: znak końca + odstęp + początek kolejnego zdania (wielka litera, cyfra, cudzysłów)
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[.!?…])\s+(?=[\"„(\dA-ZĄĆĘŁŃÓŚŹŻ])")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Szacuje liczbę tokenów tekstu dla modeli Ollama.
+
+    Bierze większą z dwóch wartości: liczbę słów/znaków interpunkcyjnych
+    oraz długość w znakach podzieloną przez config.CHARS_PER_TOKEN.
+
+    Args:
+        text: Tekst do oszacowania.
+
+    Returns:
+        Przybliżona liczba tokenów.
+    """
+    if not text:
+        return 0
+    pieces = len(_TOKEN_PIECE_RE.findall(text))
+    return max(pieces, math.ceil(len(text) / config.CHARS_PER_TOKEN))
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizuje pytanie / sub-query do porównań i kluczy cache.
+
+    Małe litery, pojedyncze spacje, bez końcowej interpunkcji ("?", ".", "!").
+
+    Args:
+        text: Tekst zapytania.
+
+    Returns:
+        Znormalizowany tekst.
+    """
+    return _WHITESPACE_RE.sub(" ", text.lower()).strip().rstrip("?!. ")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Dzieli tekst na zdania (kropka/wykrzyknik/pytajnik + wielka litera lub cyfra).
+
+    Args:
+        text: Tekst do podziału.
+
+    Returns:
+        Lista niepustych zdań (bez zewnętrznych białych znaków).
+    """
+    return [s.strip() for s in _SENTENCE_BOUNDARY_RE.split(text) if s.strip()]
@@ -0,0 +1,159 @@
+"""
+Normalizujący tokenizer dla indeksu BM25 (sparse_index.py).
+
+Dawna tokenizacja `text.lower().split()` zostawia interpunkcję przy słowach,
+a odmiany ("instalacja", "instalacji", "instalację") i warianty bez polskich
+znaków są różnymi termami - słownik puchnie, a recall spada. Tokenizer:
+- wyciąga słowa jednym prekompilowanym wyrażeniem (bez interpunkcji),
+- opcjonalnie usuwa znaki diakrytyczne (tablica str.translate liczona raz),
+- pomija polskie i angielskie stopwords,
+- lekko stemuje: odcina jedną końcówkę fleksyjną z listy (PL/EN),
+  zostawiając co najmniej TOKENIZER_MIN_STEM znaków.
+Ten sam obiekt tokenizuje indeks (ingestia) i zapytania (agent); jego
+`signature` jest zapisywana z indeksem, żeby nie pomieszać tokenizacji.
+Professional Local RAG Agent - Initial Release"""
+
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List
+
+import config
+from sparse_index import default_tokenize
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+STOPWORDS_PL: FrozenSet[str] = frozenset("""
+a aby ale bo by być czy dla do gdy gdzie go i ich ile im in jak jaki jakie
+jako je jego jej jest jeszcze jeśli już ją kiedy kto która które którego
+który których ku lub ma mi mnie może na nad nie nich nim niż o od oraz po
+pod przez przy się są ta tak tam te tego tej ten też to tu tylko tym u w we
+więc z za ze że żeby
+""".split())
+
+STOPWORDS_EN: FrozenSet[str] = frozenset("""
+a an and are as at be been but by can do does for from has have how if in
+into is it its not of on or so such that the their then there these they
+this to was were what when where which who why will with you your
+""".split())
+
+_STOPWORDS: Dict[str, FrozenSet[str]] = {"pl": STOPWORDS_PL, "en": STOPWORDS_EN}
+
+# Końcówki fleksyjne PL i EN; odcinana jest najdłuższa pasująca
+_SUFFIXES = (
+    "owaniami owaniach owania owanie owaniu ościami ościach ością ości ość "
+    "ingly edly ments ment ings ing ies ed es ly "
+    "ami ach ych ich ego emu ymi imi owi ów ow om ej ym im ie ia iu ii "
+    "a e i o u y ę ą s"
+).split()
+
+
+def _fold_table() -> Dict[int, str]:
+    """Tablica str.translate: litery łacińskie z diakrytykami -> litery bazowe."""
+    table: Dict[int, str] = {}
+    for code in range(0xC0, 0x250):  # Latin-1 Supplement, Latin Extended-A/B
+        decomposed = unicodedata.normalize("NFKD", chr(code))
+        if decomposed != chr(code) and decomposed[0].isascii():
+            table[code] = decomposed[0]
+    # Litery bez rozkładu NFKD
+    table.update({ord("ł"): "l", ord("Ł"): "L", ord("đ"): "d", ord("ø"): "o", ord("ß"): "ss"})
+    return table
+
+
+_FOLD_TABLE = _fold_table()
+
+
+class Tokenizer:
+    """Tokenizer z normalizacją - wywoływany jak funkcja: tokenizer(text) -> lista termów."""
+
+    def __init__(
+        self,
+        fold_diacritics: bool = config.TOKENIZER_FOLD_DIACRITICS,
+        stopwords: Iterable[str] = config.TOKENIZER_STOPWORDS,
+        stemming: bool = config.TOKENIZER_STEMMING,
+        min_stem: int = config.TOKENIZER_MIN_STEM,
+    ) -> None:
+        """
+        Args:
+            fold_diacritics: Usuwa znaki diakrytyczne ("instalację" -> "instalacje").
+            stopwords: Języki list stopwords ("pl", "en"); pusta = bez filtrowania.
+            stemming: Odcina jedną końcówkę fleksyjną.
+            min_stem: Minimalna długość tematu po odcięciu końcówki.
+        """
+        self.fold_diacritics = fold_diacritics
+        self.languages = tuple(sorted(stopwords))
+        self.stemming = stemming
+        self.min_stem = min_stem
+        unknown = set(self.languages) - set(_STOPWORDS)
+        if unknown:
+            raise ValueError(f"Nieznane języki stopwords: {sorted(unknown)} (dostępne: pl, en)")
+        words = set().union(*(_STOPWORDS[lang] for lang in self.languages))
+        self.stopwords = frozenset(self._fold(w) for w in words) if fold_diacritics else frozenset(words)
+        suffixes = sorted({self._fold(s) if fold_diacritics else s for s in _SUFFIXES}, key=len, reverse=True)
+        self._suffix_re = re.compile(rf"(?<=\w{{{min_stem}}})(?:{'|'.join(suffixes)})$")
+        # Słowa się powtarzają - term każdego słowa (po normalizacji i stemmingu) liczony raz
+        self._terms: Dict[str, str] = {}
+
+    @staticmethod
+    def _fold(text: str) -> str:
+        return text.translate(_FOLD_TABLE)
+
+    @property
+    def signature(self) -> str:
+        """Opis ustawień zapisywany z indeksem (indeks i zapytania muszą mieć ten sam)."""
+        return (
+            f"normalized:fold={int(self.fold_diacritics)},stop={'+'.join(self.languages) or '-'},"
+            f"stem={int(self.stemming)},min_stem={self.min_stem}"
+        )
+
+    def __repr__(self) -> str:
+        return f"Tokenizer({self.signature})"
+
+    def term(self, word: str) -> str:
+        """
+        Term dla słowa (małymi literami, bez interpunkcji).
+
+        Returns:
+            Słowo po usunięciu diakrytyków i końcówki albo "" dla stopwords.
+        """
+        term = self._terms.get(word)
+        if term is None:
+            term = self._fold(word) if self.fold_diacritics else word
+            if term in self.stopwords:
+                term = ""
+            elif self.stemming and not term.isdigit():
+                term = self._suffix_re.sub("", term, count=1)
+            if len(self._terms) < config.TOKENIZER_TERM_CACHE:
+                self._terms[word] = term
+        return term
+
+    def __call__(self, text: str) -> List[str]:
+        """
+        Tokenizuje tekst.
+
+        Args:
+            text: Treść chunka albo zapytanie.
+
+        Returns:
+            Termy w kolejności wystąpienia (z powtórzeniami - potrzebne dla tf).
+        """
+        terms = self._terms
+        found = [terms.get(w) or self.term(w) for w in _WORD_RE.findall(text.lower())]
+        return [t for t in found if t]
+
+
+def create_tokenizer(kind: str = config.TOKENIZER):
+    """
+    Zwraca tokenizer BM25 używany przez ingest i agenta.
+
+    Args:
+        kind: "normalized" (Tokenizer z ustawieniami z config) lub "whitespace"
+            (dawne text.lower().split()).
+
+    Returns:
+        Funkcja text -> lista termów.
+    """
+    if kind == "normalized":
+        return Tokenizer()
+    if kind == "whitespace":
+        return default_tokenize
+    raise ValueError(f"Nieznany tokenizer: {kind} (dostępne: normalized, whitespace)")